@@ -1,15 +1,34 @@
 # admin_seller_views.py (Final Version with all features)
+from datetime import datetime, timedelta
+
+from catalog_cache import get_categories, print_cache_stats
+from db_connector import print_pool_stats
+from fulfilment import print_pipeline_metrics
+from inventory_import import import_inventory
+from pagination import iter_pages, print_paged
+from queries import print_registry_stats
+from query_stats import dump_json, print_query_stats, track_action
+from read_routing import print_routing_stats
+from sales_rollups import (MOVING_AVERAGE_DAYS, catch_up_rollups, daily_sales, month_to_date, rollup_status,
+                           seller_revenue, top_products)
+from services import (add_listing, add_product, create_user, delete_user, get_seller_listings, list_orders,
+                      list_products, list_users, remove_listing, update_listing)
+
+# Menu choice -> action name used by the query stats for round trips per action
+ADMIN_ACTIONS = {'1': "admin.users", '2': "admin.products", '3': "admin.orders", '4': "admin.add_product",
+                 '5': "admin.add_user", '6': "admin.remove_user", '10': "admin.sales_analytics",
+                 '11': "admin.fulfilment"}
+SELLER_ACTIONS = {'1': "seller.view_listings", '2': "seller.add_listing", '3': "seller.update_listing",
+                  '4': "seller.remove_listing", '5': "seller.bulk_import"}
 
 # NEW FUNCTION to add a product to the master catalog
 def add_new_product(connection):
     """ Helper function for admin to add a new product to the Products table. """
-    cursor = connection.cursor()
     try:
         print("\n--- Add New Product to Catalog ---")
         
         # First, show the available categories so the admin knows which ID to use
-        cursor.execute("SELECT category_id, category_name FROM Categories")
-        categories = cursor.fetchall()
+        categories = get_categories(connection)
         print("Available Categories:")
         for cat_id, cat_name in categories:
             print(f"  ID: {cat_id}, Name: {cat_name}")
@@ -22,21 +41,15 @@ def add_new_product(connection):
             print("All fields are required.")
             return
 
-        query = "INSERT INTO Products (product_name, brand, category_id) VALUES (%s, %s, %s)"
-        cursor.execute(query, (product_name, brand, int(category_id)))
-        connection.commit()
+        add_product(connection, product_name, brand, int(category_id))
         print(f"✅ Product '{product_name}' added to the catalog successfully.")
 
     except Exception as e:
         print(f"❌ Error adding product: {e}")
-        connection.rollback()
-    finally:
-        cursor.close()
 
 
 def add_new_user(connection):
     """ Helper function for admin to add a new user. """
-    cursor = connection.cursor()
     try:
         print("\n--- Add New User ---")
         first_name = input("Enter first name: ")
@@ -53,39 +66,144 @@ def add_new_user(connection):
             print("All fields are required.")
             return
 
-        query = "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)"
-        cursor.execute(query, (first_name, last_name, email, password, role))
-        connection.commit()
+        create_user(connection, first_name, last_name, email, password, role)
         print(f"✅ User '{email}' created successfully as a '{role}'.")
 
     except Exception as e:
         print(f"❌ Error adding user: {e}")
-        connection.rollback()
-    finally:
-        cursor.close()
 
 def remove_user(connection):
     """ Helper function for admin to remove a user. """
-    cursor = connection.cursor()
     try:
         print("\n--- Remove User ---")
         user_id_to_remove = input("Enter the user_id to remove: ")
-        
-        query = "DELETE FROM Users WHERE user_id = %s"
-        cursor.execute(query, (int(user_id_to_remove),))
 
-        if cursor.rowcount > 0:
-            connection.commit()
+        if delete_user(connection, int(user_id_to_remove)):
             print(f"✅ User with ID {user_id_to_remove} has been removed.")
+            print("  Their cart, listings and addresses are cleared in the background.")
         else:
             print("User ID not found.")
 
     except Exception as e:
         print(f"❌ Error removing user: {e}")
-        print("  (Note: You cannot remove a user who has existing orders or inventory listings.)")
-        connection.rollback()
-    finally:
-        cursor.close()
+
+
+def _ask(prompt, convert=str):
+    """ Reads an optional filter value. Blank means no filter. """
+    raw = input(prompt).strip()
+    return convert(raw) if raw else None
+
+
+def view_all_users(connection):
+    """ Streams the Users table page by page, optionally filtered by role. """
+    try:
+        role = _ask("Filter by role (customer/seller/admin, blank for all): ", str.lower)
+    except ValueError:
+        print("Invalid filter.")
+        return
+    try:
+        pages = iter_pages(lambda after: list_users(connection, role, after))
+        print_paged(pages, lambda r: f"ID: {r[0]}, Name: {r[1]} {r[2]}, Email: {r[3]}, Role: {r[4]}", "All Users")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def view_all_products(connection):
+    """ Streams the master catalog page by page, optionally filtered by category and brand. """
+    try:
+        category_id = _ask("Filter by category ID (blank for all): ", int)
+        brand = _ask("Filter by brand (blank for all): ")
+    except ValueError:
+        print("Invalid filter.")
+        return
+    try:
+        pages = iter_pages(lambda after: list_products(connection, category_id, brand, after))
+        print_paged(pages, lambda r: f"ID: {r[0]}, Name: {r[1]}, Brand: {r[2]}, Category ID: {r[3]}", "All Products")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def view_all_orders(connection):
+    """ Streams the Orders table page by page with status, customer and date-range filters. """
+    try:
+        status = _ask("Filter by status (e.g. Placed, blank for all): ")
+        customer_id = _ask("Filter by customer ID (blank for all): ", int)
+        date_from = _ask("From date (YYYY-MM-DD, blank for no limit): ", lambda d: datetime.strptime(d, "%Y-%m-%d"))
+        date_to = _ask("To date (YYYY-MM-DD, blank for no limit): ", lambda d: datetime.strptime(d, "%Y-%m-%d"))
+    except ValueError:
+        print("Invalid filter.")
+        return
+    try:
+        pages = iter_pages(lambda after: list_orders(connection, status, customer_id, date_from, date_to, after))
+        print_paged(pages, lambda r: f"ID: {r[0]}, CustomerID: {r[1]}, Total: ${r[2]:.2f}, Status: {r[3]}, Date: {r[4]}",
+                    "All Orders")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def view_query_stats():
+    """ Shows statement latencies and round trips per action, with an optional JSON dump. """
+    print_query_stats()
+    print_registry_stats()
+    path = input("\nSave full stats as JSON? Enter a file path (blank to skip): ").strip()
+    if path:
+        try:
+            dump_json(path)
+            print(f"✅ Saved query stats to {path}")
+        except OSError as e:
+            print(f"❌ Could not write the file: {e}")
+
+
+def view_sales_analytics(connection):
+    """ Revenue per seller, top products and a daily revenue trend, all read from the sales rollups. """
+    try:
+        default_from, default_to = month_to_date()
+        date_from = _ask(f"From date (YYYY-MM-DD, blank for {default_from}): ",
+                         lambda d: datetime.strptime(d, "%Y-%m-%d").date()) or default_from
+        date_to = _ask(f"To date (YYYY-MM-DD, blank for {default_to}): ",
+                       lambda d: datetime.strptime(d, "%Y-%m-%d").date()) or default_to
+    except ValueError:
+        print("Invalid date. Please use YYYY-MM-DD.")
+        return
+    if date_from > date_to:
+        print("The start date is after the end date.")
+        return
+
+    try:
+        catch_up_rollups(connection)
+        status = rollup_status(connection)
+        print(f"\n(Rollups current through order item #{status.last_order_item_id}; "
+              f"{status.pending_items} newer item(s) are still settling.)")
+
+        print(f"\n--- 💰 Revenue per Seller, {date_from} to {date_to} ---")
+        sellers = seller_revenue(connection, date_from, date_to)
+        if not sellers:
+            print("No sales in this period.")
+        for i, seller in enumerate(sellers):
+            print(f"{i+1}. {seller.first_name or '(removed)'} {seller.last_name or ''} (ID: {seller.seller_id}) | "
+                  f"Units: {seller.units} | Revenue: ${seller.revenue:.2f}")
+
+        print(f"\n--- 🏆 Top Products by Units, {date_from} to {date_to} ---")
+        for i, p in enumerate(top_products(connection, date_from, date_to)):
+            print(f"{i+1}. {p.product_name or '(removed)'} ({p.brand or '-'}) | Units: {p.units} | "
+                  f"Revenue: ${p.revenue:.2f}")
+
+        # Keep the trend readable: at most the last 31 days of the period.
+        trend_from = max(date_from, date_to - timedelta(days=30))
+        print(f"\n--- 📈 Daily Revenue ({MOVING_AVERAGE_DAYS}-day moving average), {trend_from} to {date_to} ---")
+        for day in daily_sales(connection, trend_from, date_to):
+            average = f"${day.revenue_avg:,.2f}" if day.revenue_avg is not None else "-"
+            print(f"{day.sale_date} | Units: {day.units:>5} | Revenue: ${day.revenue:>12,.2f} | Avg: {average}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def view_fulfilment_pipeline(connection):
+    """ Queue depth and lag of the payment and fulfilment jobs. """
+    try:
+        print_pipeline_metrics(connection)
+    except Exception as e:
+        print(f"An error occurred: {e}")
 
 
 def show_admin_menu(connection):
@@ -98,44 +216,70 @@ def show_admin_menu(connection):
         print("4. Add New Product to Catalog")    # NEW
         print("5. Add New User")                  # Re-numbered
         print("6. Remove User")                   # Re-numbered
-        print("7. Logout")                        # Re-numbered
+        print("7. View Connection Pool Stats")
+        print("8. View Catalog Cache Stats")
+        print("9. View Query Stats")
+        print("10. View Sales Analytics")
+        print("11. View Fulfilment Pipeline")
+        print("12. Logout")                       # Re-numbered
         choice = input("Enter your choice: ")
         
-        if choice == '1':
-            cursor = connection.cursor()
-            cursor.execute("SELECT user_id, first_name, last_name, email, user_role FROM Users")
-            users = cursor.fetchall()
-            print("\n--- All Users ---")
-            for uid, fname, lname, email, role in users:
-                print(f"ID: {uid}, Name: {fname} {lname}, Email: {email}, Role: {role}")
-            cursor.close()
-        elif choice == '2':
-            cursor = connection.cursor()
-            cursor.execute("SELECT product_id, product_name, brand, category_id FROM Products")
-            products = cursor.fetchall()
-            print("\n--- All Products ---")
-            for pid, name, brand, cid in products:
-                print(f"ID: {pid}, Name: {name}, Brand: {brand}, Category ID: {cid}")
-            cursor.close()
-        elif choice == '3':
-            cursor = connection.cursor()
-            cursor.execute("SELECT order_id, customer_id, total_amount, order_status, order_date FROM Orders")
-            orders = cursor.fetchall()
-            print("\n--- All Orders ---")
-            for oid, cid, total, status, date in orders:
-                print(f"ID: {oid}, CustomerID: {cid}, Total: ${total:.2f}, Status: {status}, Date: {date}")
-            cursor.close()
-        elif choice == '4':
-            add_new_product(connection)
-        elif choice == '5':
-            add_new_user(connection)
-        elif choice == '6':
-            remove_user(connection)
-        elif choice == '7':
-            print("Logging out...")
-            break
-        else:
-            print("Invalid choice.")
+        with track_action(ADMIN_ACTIONS.get(choice)):
+            if choice == '1':
+                view_all_users(connection)
+            elif choice == '2':
+                view_all_products(connection)
+            elif choice == '3':
+                view_all_orders(connection)
+            elif choice == '4':
+                add_new_product(connection)
+            elif choice == '5':
+                add_new_user(connection)
+            elif choice == '6':
+                remove_user(connection)
+            elif choice == '7':
+                print_pool_stats()
+                print_routing_stats()
+            elif choice == '8':
+                print_cache_stats()
+            elif choice == '9':
+                view_query_stats()
+            elif choice == '10':
+                view_sales_analytics(connection)
+            elif choice == '11':
+                view_fulfilment_pipeline(connection)
+            elif choice == '12':
+                print("Logging out...")
+                break
+            else:
+                print("Invalid choice.")
+
+
+def bulk_import_listings(connection, user_id):
+    """ Lets a seller create or update many listings at once from a file. """
+    print("\n--- Bulk Import Listings ---")
+    print("CSV files need a header row: product_id,price,stock")
+    print('JSON-lines files need one object per line: {"product_id": 1, "price": 199.99, "stock": 5}')
+    path = input("Enter the file path: ").strip()
+    if not path:
+        print("No file given.")
+        return
+    try:
+        report = import_inventory(connection, user_id, path)
+    except OSError as e:
+        print(f"❌ Could not read the file: {e}")
+        return
+    except Exception as e:
+        print(f"❌ Import stopped: {e}")
+        return
+
+    rate = report.rows_read / report.elapsed if report.elapsed else 0
+    print(f"✅ Read {report.rows_read} rows in {report.elapsed:.2f}s ({rate:,.0f} rows/sec): "
+          f"{report.inserted} new listings, {report.updated} updated, {len(report.errors)} rejected.")
+    for line_number, message in report.errors[:20]:
+        print(f"  Line {line_number}: {message}")
+    if len(report.errors) > 20:
+        print(f"  ... and {len(report.errors) - 20} more.")
 
 
 def show_seller_menu(connection, user_id):
@@ -146,89 +290,66 @@ def show_seller_menu(connection, user_id):
         print("2. Add New Listing")
         print("3. Update a Listing (Stock/Price)")
         print("4. Remove a Listing")
-        print("5. Logout")
+        print("5. Bulk Import Listings (CSV / JSON lines)")
+        print("6. Logout")
         choice = input("Enter your choice: ")
 
-        if choice == '1':
-            cursor = connection.cursor()
-            try:
-                query = """
-                SELECT i.inventory_id, p.product_name, i.price, i.stock_quantity
-                FROM Inventory AS i
-                JOIN Products AS p ON i.product_id = p.product_id
-                WHERE i.seller_id = %s;
-                """
-                cursor.execute(query, (user_id,))
-                listings = cursor.fetchall()
-                print("\n--- My Listings ---")
-                for inv_id, name, price, stock in listings:
-                    print(f"Inventory ID: {inv_id} | {name} | Price: ${price:.2f} | Stock: {stock}")
-            except Exception as e:
-                print(f"An error occurred: {e}")
-            finally:
-                cursor.close()
-
-        elif choice == '2':
-            cursor = connection.cursor()
-            try:
-                prod_id = input("Enter the Master Product ID to list: ")
-                price = input("Enter your price: ")
-                stock = input("Enter stock quantity: ")
-                cursor.execute(
-                    "INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
-                    (user_id, int(prod_id), float(price), int(stock))
-                )
-                connection.commit()
-                print("✅ Listing added successfully!")
-            except Exception as e:
-                print(f"Error adding listing: {e}")
-                connection.rollback()
-            finally:
-                cursor.close()
-
-        elif choice == '3':
-            cursor = connection.cursor()
-            try:
-                listing_id = input("Enter Inventory ID to update: ")
-                new_price = input("Enter new price (leave blank to skip): ")
-                new_stock = input("Enter new stock (leave blank to skip): ")
-                
-                if new_price.strip():
-                    cursor.execute("UPDATE Inventory SET price = %s WHERE inventory_id = %s AND seller_id = %s",
-                                 (float(new_price), int(listing_id), user_id))
-                if new_stock.strip():
-                    cursor.execute("UPDATE Inventory SET stock_quantity = %s WHERE inventory_id = %s AND seller_id = %s",
-                                 (int(new_stock), int(listing_id), user_id))
-                
-                connection.commit()
-                print("✅ Listing updated!")
-            except Exception as e:
-                 print(f"Error updating listing: {e}")
-                 connection.rollback()
-            finally:
-                cursor.close()
-
-        elif choice == '4':
-            cursor = connection.cursor()
-            try:
-                listing_id = input("Enter Inventory ID of the listing to remove: ")
-                # The 'AND seller_id = %s' is a crucial security check
-                query = "DELETE FROM Inventory WHERE inventory_id = %s AND seller_id = %s"
-                cursor.execute(query, (int(listing_id), user_id))
-                
-                if cursor.rowcount > 0:
-                    connection.commit()
-                    print(f"✅ Listing with ID {listing_id} has been removed.")
-                else:
-                    print("Listing ID not found or you do not have permission to remove it.")
-            except Exception as e:
-                print(f"Error removing listing: {e}")
-                connection.rollback()
-            finally:
-                cursor.close()
-
-        elif choice == '5':
-            print("Logging out...")
-            break
-        else:
-            print("Invalid choice.")
\ No newline at end of file
+        with track_action(SELLER_ACTIONS.get(choice)):
+            if choice == '1':
+                try:
+                    listings = get_seller_listings(connection, user_id)
+                    print("\n--- My Listings ---")
+                    for inv_id, name, price, stock in listings:
+                        print(f"Inventory ID: {inv_id} | {name} | Price: ${price:.2f} | Stock: {stock}")
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+
+            elif choice == '2':
+                try:
+                    prod_id = input("Enter the Master Product ID to list: ")
+                    price = input("Enter your price: ")
+                    stock = input("Enter stock quantity: ")
+                    add_listing(connection, user_id, int(prod_id), float(price), int(stock))
+                    print("✅ Listing added successfully!")
+                except Exception as e:
+                    print(f"Error adding listing: {e}")
+
+            elif choice == '3':
+                try:
+                    listing_id = input("Enter Inventory ID to update: ")
+                    new_price = input("Enter new price (leave blank to skip): ")
+                    new_stock = input("Enter new stock (leave blank to skip): ")
+
+                    if not new_price.strip() and not new_stock.strip():
+                        print("Nothing to update.")
+                        continue
+                    updated = update_listing(
+                        connection, user_id, int(listing_id),
+                        price=float(new_price) if new_price.strip() else None,
+                        stock=int(new_stock) if new_stock.strip() else None,
+                    )
+                    if updated:
+                        print("✅ Listing updated!")
+                    else:
+                        print("Listing ID not found or you do not have permission to update it.")
+                except Exception as e:
+                     print(f"Error updating listing: {e}")
+
+            elif choice == '4':
+                try:
+                    listing_id = input("Enter Inventory ID of the listing to remove: ")
+                    if remove_listing(connection, user_id, int(listing_id)):
+                        print(f"✅ Listing with ID {listing_id} has been removed.")
+                    else:
+                        print("Listing ID not found or you do not have permission to remove it.")
+                except Exception as e:
+                    print(f"Error removing listing: {e}")
+
+            elif choice == '5':
+                bulk_import_listings(connection, user_id)
+
+            elif choice == '6':
+                print("Logging out...")
+                break
+            else:
+                print("Invalid choice.")
@@ -0,0 +1,3 @@
+# benchmarks/__init__.py
+# Load and concurrency benchmarks. Run them from the project root, e.g.
+#   python -m benchmarks.checkout_contention --buyers 64
@@ -0,0 +1,162 @@
+# benchmarks/checkout_contention.py
+"""
+Many buyers check out the same hot listing at the same moment.
+
+Creates a throwaway listing and N throwaway buyers, fills every buyer's cart, releases them
+together from a barrier, and reports orders/sec, retries and whether any stock was oversold.
+Everything it creates is deleted again at the end.
+
+    python -m benchmarks.checkout_contention --buyers 64 --stock 100 --rounds 3
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import percentile
+from checkout_engine import place_order
+from db_connector import ConnectionPool, add_backend_arguments, configure_backend
+
+BENCH_EMAIL = "bench_buyer_{}@bench.local"
+SELLER_ID = 3    # Charlie, from the sample data
+PRODUCT_ID = 1   # Air Jordan 4, from the sample data
+
+
+def setup(connection, buyers, stock):
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+        (SELLER_ID, PRODUCT_ID, 199.00, stock)
+    )
+    inventory_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)",
+        [("Bench", f"Buyer{i}", BENCH_EMAIL.format(i), "x", "customer") for i in range(buyers)]
+    )
+    cursor.execute("SELECT user_id FROM Users WHERE email LIKE 'bench_buyer_%@bench.local' ORDER BY user_id")
+    buyer_ids = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+    cursor.close()
+    return inventory_id, buyer_ids
+
+
+def fill_carts(connection, inventory_id, buyer_ids, max_qty):
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM Cart WHERE inventory_id = %s", (inventory_id,))
+    cursor.executemany(
+        "INSERT INTO Cart (customer_id, inventory_id, quantity) VALUES (%s, %s, %s)",
+        [(uid, inventory_id, random.randint(1, max_qty)) for uid in buyer_ids]
+    )
+    connection.commit()
+    cursor.close()
+
+
+def teardown(connection, inventory_id, buyer_ids):
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(buyer_ids))
+    cursor.execute(f"DELETE FROM Cart WHERE customer_id IN ({placeholders})", buyer_ids)
+    cursor.execute(
+        f"DELETE FROM OrderItems WHERE order_id IN "
+        f"(SELECT order_id FROM Orders WHERE customer_id IN ({placeholders}))", buyer_ids
+    )
+    cursor.execute(
+        f"DELETE FROM OrderOutbox WHERE order_id IN "
+        f"(SELECT order_id FROM Orders WHERE customer_id IN ({placeholders}))", buyer_ids
+    )
+    cursor.execute(f"DELETE FROM Orders WHERE customer_id IN ({placeholders})", buyer_ids)
+    cursor.execute(f"DELETE FROM Addresses WHERE user_id IN ({placeholders})", buyer_ids)
+    cursor.execute(f"DELETE FROM Users WHERE user_id IN ({placeholders})", buyer_ids)
+    cursor.execute("DELETE FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+    connection.commit()
+    cursor.close()
+
+
+def run_round(pool, buyer_ids):
+    barrier = threading.Barrier(len(buyer_ids))
+    results = []
+    errors = []
+    lock = threading.Lock()
+
+    def buyer(uid):
+        with pool.connection() as conn:
+            barrier.wait()
+            started = time.perf_counter()
+            try:
+                result = place_order(conn, uid, ("1 Bench St", "Benchville", "BS", "00000"))
+                with lock:
+                    results.append((result, time.perf_counter() - started))
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=buyer, args=(uid,)) for uid in buyer_ids]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors, time.perf_counter() - started
+
+
+def check_stock(connection, inventory_id):
+    cursor = connection.cursor()
+    cursor.execute("SELECT stock_quantity FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+    final_stock = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM OrderItems WHERE inventory_id = %s", (inventory_id,))
+    sold = int(cursor.fetchone()[0])
+    connection.commit()
+    cursor.close()
+    return final_stock, sold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=64)
+    parser.add_argument("--stock", type=int, default=100, help="units on the hot listing per round")
+    parser.add_argument("--max-qty", type=int, default=3, help="each buyer wants 1..max-qty pairs")
+    parser.add_argument("--rounds", type=int, default=3)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    pool = ConnectionPool(min_size=args.buyers + 1, max_size=args.buyers + 1, checkout_timeout=60)
+    admin = pool.acquire()
+    inventory_id, buyer_ids = setup(admin, args.buyers, args.stock)
+    oversold = False
+    try:
+        for rnd in range(1, args.rounds + 1):
+            cursor = admin.cursor()
+            cursor.execute("UPDATE Inventory SET stock_quantity = %s WHERE inventory_id = %s", (args.stock, inventory_id))
+            cursor.execute("DELETE FROM OrderItems WHERE inventory_id = %s", (inventory_id,))
+            admin.commit()
+            cursor.close()
+            fill_carts(admin, inventory_id, buyer_ids, args.max_qty)
+
+            results, errors, elapsed = run_round(pool, buyer_ids)
+            final_stock, sold = check_stock(admin, inventory_id)
+
+            placed = [r for r, _ in results if r.status == "placed"]
+            failed = [r for r, _ in results if r.status == "failed"]
+            retries = sum(r.attempts - 1 for r, _ in results)
+            latencies = sorted(lat for _, lat in results)
+            p95 = percentile(latencies, 95)
+            round_oversold = final_stock < 0 or sold != args.stock - final_stock or sold > args.stock
+            oversold = oversold or round_oversold
+
+            print(f"Round {rnd}: {len(placed)} orders in {elapsed:.3f}s "
+                  f"({len(placed) / elapsed:.1f} orders/sec) | sold out for {len(failed)} buyers | "
+                  f"retries {retries} | errors {len(errors)} | p95 {p95 * 1000:.1f} ms")
+            print(f"         stock {args.stock} -> {final_stock}, units sold {sold} | "
+                  f"{'OVERSOLD!' if round_oversold else 'no oversell'}")
+            for e in errors[:3]:
+                print(f"         error: {e}")
+    finally:
+        teardown(admin, inventory_id, buyer_ids)
+        pool.release(admin)
+        pool.close()
+
+    print("FAIL: stock was oversold." if oversold else "OK: zero oversell across all rounds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# benchmarks/checkout_modes.py
+"""
+Client-side vs server-side (stored procedure) cart and checkout over a slow link.
+
+Each simulated buyer repeatedly fills a cart with --lines listings and checks out, first with
+checkout_engine.CHECKOUT_MODE = "client" and then "server". Every round trip to the database
+is delayed by --latency-ms to stand in for a distant database. The report gives round trips
+per cart add and per checkout, checkout latency and orders/sec for each mode.
+
+The database needs migration 3 (python migrate.py) so the procedures are current. Everything
+the benchmark creates is deleted again at the end.
+
+    python -m benchmarks.checkout_modes --latency-ms 20 --buyers 8 --orders 25 --lines 3
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.common import SlowLinkConnection, percentile
+from checkout_engine import CHECKOUT_MODES, configure_checkout, place_order
+from db_connector import ConnectionPool
+import order_book
+from services import add_cart_item
+
+BENCH_EMAIL = "bench_mode_buyer_{}@bench.local"
+SELLER_ID = 3    # Charlie, from the sample data
+PRODUCT_ID = 1   # Air Jordan 4, from the sample data
+BENCH_ADDRESS = ("1 Bench St", "Benchville", "BS", "00000")
+
+
+def setup(connection, buyers, lines, stock):
+    cursor = connection.cursor()
+    cursor.executemany(
+        "INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+        [(SELLER_ID, PRODUCT_ID, 100.00 + i, stock) for i in range(lines)]
+    )
+    cursor.execute("SELECT inventory_id FROM Inventory WHERE seller_id = %s AND product_id = %s "
+                   "ORDER BY inventory_id DESC LIMIT %s", (SELLER_ID, PRODUCT_ID, lines))
+    inventory_ids = sorted(row[0] for row in cursor.fetchall())
+    cursor.executemany(
+        "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)",
+        [("Bench", f"Buyer{i}", BENCH_EMAIL.format(i), "x", "customer") for i in range(buyers)]
+    )
+    cursor.execute("SELECT user_id FROM Users WHERE email LIKE 'bench_mode_buyer_%@bench.local' ORDER BY user_id")
+    buyer_ids = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+    cursor.close()
+    return inventory_ids, buyer_ids
+
+
+def teardown(connection, inventory_ids, buyer_ids):
+    cursor = connection.cursor()
+    buyers = ", ".join(["%s"] * len(buyer_ids))
+    listings = ", ".join(["%s"] * len(inventory_ids))
+    cursor.execute(f"DELETE FROM Cart WHERE customer_id IN ({buyers})", buyer_ids)
+    cursor.execute(
+        f"DELETE oi FROM OrderItems oi JOIN Orders o ON oi.order_id = o.order_id WHERE o.customer_id IN ({buyers})",
+        buyer_ids
+    )
+    cursor.execute(
+        f"DELETE ob FROM OrderOutbox ob JOIN Orders o ON ob.order_id = o.order_id WHERE o.customer_id IN ({buyers})",
+        buyer_ids
+    )
+    cursor.execute(f"DELETE FROM Orders WHERE customer_id IN ({buyers})", buyer_ids)
+    cursor.execute(f"DELETE FROM Addresses WHERE user_id IN ({buyers})", buyer_ids)
+    cursor.execute(f"DELETE FROM Users WHERE user_id IN ({buyers})", buyer_ids)
+    cursor.execute(f"DELETE FROM Inventory WHERE inventory_id IN ({listings})", inventory_ids)
+    connection.commit()
+    cursor.close()
+    order_book.invalidate_products(connection, [PRODUCT_ID])   # drop the summary that pointed at our listings
+
+
+def run_mode(pool, mode, buyer_ids, inventory_ids, orders, delay):
+    """ Every buyer places `orders` orders. Returns per-mode totals. """
+    configure_checkout(mode)
+    barrier = threading.Barrier(len(buyer_ids))
+    lock = threading.Lock()
+    totals = {"orders": 0, "errors": [], "latencies": [], "cart_trips": 0, "checkout_trips": 0, "cart_adds": 0}
+
+    def buyer(uid):
+        local = {"orders": 0, "errors": [], "latencies": [], "cart_trips": 0, "checkout_trips": 0, "cart_adds": 0}
+        with pool.connection() as raw:
+            conn = SlowLinkConnection(raw, delay)
+            barrier.wait()
+            for _ in range(orders):
+                try:
+                    before = conn.round_trips
+                    for inventory_id in inventory_ids:
+                        add_cart_item(conn, uid, inventory_id, 1)
+                    local["cart_trips"] += conn.round_trips - before
+                    local["cart_adds"] += len(inventory_ids)
+
+                    before = conn.round_trips
+                    started = time.perf_counter()
+                    result = place_order(conn, uid, BENCH_ADDRESS)
+                    local["latencies"].append(time.perf_counter() - started)
+                    local["checkout_trips"] += conn.round_trips - before
+                    if result.status == "placed":
+                        local["orders"] += 1
+                except Exception as e:
+                    local["errors"].append(e)
+        with lock:
+            for key, value in local.items():
+                totals[key] += value
+
+    threads = [threading.Thread(target=buyer, args=(uid,)) for uid in buyer_ids]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    totals["elapsed"] = time.perf_counter() - started
+    return totals
+
+
+def print_report(mode, totals):
+    checkouts = len(totals["latencies"])
+    latencies = sorted(totals["latencies"])
+    print(f"{mode:<7} {totals['orders']:>7} {totals['orders'] / totals['elapsed']:>9.1f} "
+          f"{totals['cart_trips'] / max(totals['cart_adds'], 1):>10.1f} "
+          f"{totals['checkout_trips'] / max(checkouts, 1):>14.1f} "
+          f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+          f"{len(totals['errors']):>7}")
+    for e in totals["errors"][:3]:
+        print(f"        error: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="added delay per round trip")
+    parser.add_argument("--buyers", type=int, default=8, help="concurrent buyers")
+    parser.add_argument("--orders", type=int, default=25, help="orders per buyer per mode")
+    parser.add_argument("--lines", type=int, default=3, help="listings in every cart")
+    parser.add_argument("--modes", default=",".join(CHECKOUT_MODES), help="modes to compare, in order")
+    args = parser.parse_args()
+    modes = [m.strip() for m in args.modes.split(",")]
+
+    stock = args.buyers * args.orders * len(modes) + 1
+    pool = ConnectionPool(min_size=args.buyers + 1, max_size=args.buyers + 1, checkout_timeout=60)
+    admin = pool.acquire()
+    inventory_ids, buyer_ids = setup(admin, args.buyers, args.lines, stock)
+    try:
+        print(f"\n{args.buyers} buyers x {args.orders} orders x {args.lines} lines, "
+              f"{args.latency_ms:.0f} ms per round trip\n")
+        print(f"{'mode':<7} {'orders':>7} {'orders/s':>9} {'trips/add':>10} {'trips/checkout':>14} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for mode in modes:
+            totals = run_mode(pool, mode, buyer_ids, inventory_ids, args.orders, args.latency_ms / 1000.0)
+            print_report(mode, totals)
+    finally:
+        configure_checkout("client")
+        teardown(admin, inventory_ids, buyer_ids)
+        pool.release(admin)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/common.py
+""" Small helpers shared by the benchmark scripts. """
+import time
+
+
+class CountingConnection:
+    """ Wraps a connection and counts every execute/executemany/callproc made through its cursors. """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self.round_trips = 0
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self, self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class _CountingCursor:
+    def __init__(self, owner, cursor):
+        self._owner = owner
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        self._owner.round_trips += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._owner.round_trips += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        self._owner.round_trips += 1
+        return self._cursor.callproc(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class SlowLinkConnection:
+    """ Wraps a connection as if it sat behind a slow network link.
+
+    Every client/server round trip sleeps `delay` seconds first and is counted. That covers
+    statements, commit, rollback and start_transaction. callproc with arguments costs two
+    round trips (it SETs the arguments as session variables, then sends the CALL).
+    """
+
+    def __init__(self, connection, delay):
+        self._connection = connection
+        self.delay = delay
+        self.round_trips = 0
+
+    def trip(self, count=1):
+        self.round_trips += count
+        if self.delay:
+            time.sleep(self.delay * count)
+
+    def cursor(self, *args, **kwargs):
+        return _SlowLinkCursor(self, self._connection.cursor(*args, **kwargs))
+
+    def commit(self):
+        self.trip()
+        return self._connection.commit()
+
+    def rollback(self):
+        self.trip()
+        return self._connection.rollback()
+
+    def start_transaction(self, *args, **kwargs):
+        self.trip()
+        return self._connection.start_transaction(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class _SlowLinkCursor:
+    def __init__(self, owner, cursor):
+        self._owner = owner
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        self._owner.trip()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._owner.trip()
+        return self._cursor.executemany(*args, **kwargs)
+
+    def callproc(self, procname, args=(), *more, **kwargs):
+        self._owner.trip(2 if args else 1)
+        return self._cursor.callproc(procname, args, *more, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def percentile(sorted_values, pct):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
@@ -0,0 +1,185 @@
+# benchmarks/fulfilment_pipeline.py
+"""
+Drains a burst of orders through the payment and fulfilment workers.
+
+Places --orders orders for throwaway buyers on one throwaway listing, recording checkout
+latency, which no longer includes payment. It then starts --workers workers with a
+FakePaymentProcessor (--decline-rate, --outage-rate, --latency-ms) and no shipping delays,
+and every second reports queue depth and lag until every order is Delivered or Failed.
+At the end it checks the invariants:
+
+  * every order ended Delivered or Failed, and none is stuck,
+  * no order was charged twice (duplicate charges are replayed, not re-charged),
+  * the listing's stock equals its starting stock minus the units of the Delivered orders,
+    so every Failed order gave its stock back.
+
+The workers also pick up any other due jobs in the database, so run this on a test database.
+Everything the benchmark creates is deleted again at the end.
+
+    python -m benchmarks.fulfilment_pipeline --orders 500 --workers 4 --decline-rate 0.1
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.common import percentile
+from checkout_engine import place_order
+from db_connector import ConnectionPool, add_backend_arguments, configure_backend
+import fulfilment
+import order_book
+from services import add_cart_item
+
+BENCH_EMAIL = "bench_fulfil_buyer_{}@bench.local"
+SELLER_ID = 3    # Charlie, from the sample data
+PRODUCT_ID = 1   # Air Jordan 4, from the sample data
+BENCH_ADDRESS = ("1 Bench St", "Benchville", "BS", "00000")
+
+
+def setup(connection, buyers, stock):
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+                   (SELLER_ID, PRODUCT_ID, 150.00, stock))
+    inventory_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)",
+        [("Bench", f"Buyer{i}", BENCH_EMAIL.format(i), "x", "customer") for i in range(buyers)]
+    )
+    cursor.execute("SELECT user_id FROM Users WHERE email LIKE 'bench_fulfil_buyer_%@bench.local' ORDER BY user_id")
+    buyer_ids = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+    cursor.close()
+    return inventory_id, buyer_ids
+
+
+def teardown(connection, inventory_id, buyer_ids):
+    cursor = connection.cursor()
+    buyers = ", ".join(["%s"] * len(buyer_ids))
+    cursor.execute(f"DELETE FROM Cart WHERE customer_id IN ({buyers})", buyer_ids)
+    cursor.execute(
+        f"DELETE FROM OrderItems WHERE order_id IN (SELECT order_id FROM Orders WHERE customer_id IN ({buyers}))",
+        buyer_ids
+    )
+    cursor.execute(
+        f"DELETE FROM OrderOutbox WHERE order_id IN (SELECT order_id FROM Orders WHERE customer_id IN ({buyers}))",
+        buyer_ids
+    )
+    cursor.execute(f"DELETE FROM Orders WHERE customer_id IN ({buyers})", buyer_ids)
+    cursor.execute(f"DELETE FROM Addresses WHERE user_id IN ({buyers})", buyer_ids)
+    cursor.execute(f"DELETE FROM Users WHERE user_id IN ({buyers})", buyer_ids)
+    cursor.execute("DELETE FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+    connection.commit()
+    cursor.close()
+    order_book.invalidate_products(connection, [PRODUCT_ID])
+
+
+def place_orders(pool, buyer_ids, inventory_id, orders):
+    """ Spreads `orders` checkouts of 1-2 units over the buyers. Returns (order_ids, latencies). """
+    order_ids, latencies, lock = [], [], threading.Lock()
+
+    def buyer(index, uid):
+        with pool.connection() as connection:
+            for n in range(index, orders, len(buyer_ids)):
+                add_cart_item(connection, uid, inventory_id, 1 + n % 2)
+                started = time.perf_counter()
+                result = place_order(connection, uid, BENCH_ADDRESS)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if result.order_id:
+                        order_ids.append(result.order_id)
+
+    threads = [threading.Thread(target=buyer, args=(i, uid)) for i, uid in enumerate(buyer_ids)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return order_ids, sorted(latencies)
+
+
+def order_statuses(connection, order_ids):
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(order_ids))
+    cursor.execute(f"SELECT order_status, COUNT(*) FROM Orders WHERE order_id IN ({placeholders}) "
+                   f"GROUP BY order_status", order_ids)
+    counts = dict(cursor.fetchall())
+    connection.commit()
+    cursor.close()
+    return counts
+
+
+def check_stock(connection, inventory_id, order_ids, stock):
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(order_ids))
+    cursor.execute(
+        f"SELECT COALESCE(SUM(oi.quantity), 0) FROM OrderItems oi JOIN Orders o ON oi.order_id = o.order_id "
+        f"WHERE o.order_id IN ({placeholders}) AND o.order_status = 'Delivered'", order_ids
+    )
+    sold = int(cursor.fetchone()[0])
+    cursor.execute("SELECT stock_quantity FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+    left = cursor.fetchone()[0]
+    connection.commit()
+    cursor.close()
+    return stock - sold, left
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--buyers", type=int, default=8, help="concurrent buyers placing the orders")
+    parser.add_argument("--workers", type=int, default=4, help="fulfilment workers")
+    parser.add_argument("--decline-rate", type=float, default=0.1)
+    parser.add_argument("--outage-rate", type=float, default=0.05)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake processor time per charge")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for the queue to drain")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    stock = args.orders * 2
+    processor = fulfilment.FakePaymentProcessor(args.decline_rate, args.outage_rate, args.latency_ms / 1000.0, seed=7)
+    fulfilment.STEP_DELAYS.update({step: 0.0 for step in fulfilment.STEP_DELAYS})
+    fulfilment.RETRY_BASE_DELAY = 0.05
+    pool = ConnectionPool(min_size=1, max_size=args.buyers + args.workers + 1, checkout_timeout=60)
+    admin = pool.acquire()
+    inventory_id, buyer_ids = setup(admin, args.buyers, stock)
+    workers = None
+    try:
+        order_ids, latencies = place_orders(pool, buyer_ids, inventory_id, args.orders)
+        print(f"\nPlaced {len(order_ids)} orders | checkout p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+              f"p95 {percentile(latencies, 95) * 1000:.1f} ms")
+
+        started = time.perf_counter()
+        workers = fulfilment.FulfilmentWorkers(pool, args.workers, processor).start()
+        print(f"\n{'t (s)':>6} {'pay':>6} {'ship':>6} {'deliver':>8} {'lag (s)':>8} {'delivered':>10} {'failed':>7}")
+        while True:
+            time.sleep(1.0)
+            metrics = fulfilment.pipeline_metrics(admin)
+            counts = order_statuses(admin, order_ids)
+            lag = max(metrics[step]["lag"] for step in fulfilment.STEPS)
+            print(f"{time.perf_counter() - started:>6.1f} {metrics['pay']['queued']:>6} {metrics['ship']['queued']:>6} "
+                  f"{metrics['deliver']['queued']:>8} {lag:>8.2f} {counts.get('Delivered', 0):>10} "
+                  f"{counts.get('Failed', 0):>7}")
+            settled = counts.get("Delivered", 0) + counts.get("Failed", 0)
+            if settled == len(order_ids) or time.perf_counter() - started > args.timeout:
+                break
+        elapsed = time.perf_counter() - started
+        workers.stop()
+
+        expected, left = check_stock(admin, inventory_id, order_ids, stock)
+        stats = fulfilment.worker_stats()
+        print(f"\nDrained {settled}/{len(order_ids)} orders in {elapsed:.1f}s "
+              f"({settled / elapsed:.1f} orders/s, {args.workers} workers)")
+        print(f"Statuses: {counts}")
+        print(f"Processor: {processor.stats} | worker retries: {stats['retries']} | no-op re-runs: {stats['skipped']}")
+        print(f"Stuck orders: {len(order_ids) - settled} | stock left {left}, expected {expected} -> "
+              f"{'OK' if left == expected and settled == len(order_ids) else 'MISMATCH'}")
+    finally:
+        if workers:
+            workers.stop()
+        teardown(admin, inventory_id, buyer_ids)
+        pool.release(admin)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
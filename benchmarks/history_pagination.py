@@ -0,0 +1,153 @@
+# benchmarks/history_pagination.py
+"""
+Order history: the old one-query-per-order loop against the batched, keyset-paginated pages.
+
+For each history size it creates a throwaway buyer with that many orders (3 items each),
+then times reading the whole history both ways and reports round trips and latency. It also
+times page 1 against the last page to show keyset pages cost the same wherever you are.
+
+    python -m benchmarks.history_pagination --sizes 10 100 1000 10000
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import CountingConnection
+from db_connector import create_connection
+from order_history import HISTORY_PAGE_SIZE, fetch_order_history_page
+
+BENCH_EMAIL = "bench_history_{}@bench.local"
+INSERT_BATCH = 1000
+
+
+def legacy_history(connection, user_id):
+    """ The pre-batching view_order_history query pattern, minus the printing. """
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        SELECT o.order_id, o.order_date, o.total_amount, a.address_line1, a.city
+        FROM Orders o JOIN Addresses a ON o.address_id = a.address_id
+        WHERE o.customer_id = %s ORDER BY o.order_date DESC;
+        """,
+        (user_id,)
+    )
+    orders = cursor.fetchall()
+    result = []
+    for order_id, date, total, address, city in orders:
+        item_cursor = connection.cursor()
+        item_cursor.execute(
+            """
+            SELECT p.product_name, u.first_name AS seller_name, oi.quantity, oi.price_per_unit
+            FROM OrderItems oi
+            JOIN Inventory i ON oi.inventory_id = i.inventory_id
+            JOIN Products p ON i.product_id = p.product_id
+            JOIN Users u ON i.seller_id = u.user_id
+            WHERE oi.order_id = %s;
+            """,
+            (order_id,)
+        )
+        result.append((order_id, item_cursor.fetchall()))
+        item_cursor.close()
+    cursor.close()
+    return result
+
+
+def paged_history(connection, user_id, page_size):
+    pages = []
+    after = None
+    while True:
+        page = fetch_order_history_page(connection, user_id, page_size=page_size, after=after)
+        pages.append(page)
+        if page.next_cursor is None:
+            return pages
+        after = page.next_cursor
+
+
+def create_buyer(connection, n_orders, tag):
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)",
+        ("Bench", "History", BENCH_EMAIL.format(tag), "x", "customer")
+    )
+    user_id = cursor.lastrowid
+    cursor.execute(
+        "INSERT INTO Addresses (user_id, address_line1, city, state, postal_code) VALUES (%s, %s, %s, %s, %s)",
+        (user_id, "1 Bench St", "Benchville", "BS", "00000")
+    )
+    address_id = cursor.lastrowid
+    cursor.execute("SELECT inventory_id FROM Inventory ORDER BY inventory_id LIMIT 3")
+    inventory_ids = [row[0] for row in cursor.fetchall()]
+
+    start = datetime(2020, 1, 1)
+    for batch_start in range(0, n_orders, INSERT_BATCH):
+        batch = range(batch_start, min(batch_start + INSERT_BATCH, n_orders))
+        cursor.executemany(
+            "INSERT INTO Orders (customer_id, address_id, order_date, total_amount) VALUES (%s, %s, %s, %s)",
+            [(user_id, address_id, start + timedelta(hours=i), 300.00) for i in batch]
+        )
+        cursor.execute("SELECT order_id FROM Orders WHERE customer_id = %s AND order_id >= LAST_INSERT_ID()",
+                       (user_id,))
+        order_ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany(
+            "INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit) VALUES (%s, %s, %s, %s)",
+            [(oid, inv_id, 1, 100.00) for oid in order_ids for inv_id in inventory_ids]
+        )
+    connection.commit()
+    cursor.close()
+    return user_id
+
+
+def drop_buyer(connection, user_id):
+    cursor = connection.cursor()
+    cursor.execute("DELETE oi FROM OrderItems oi JOIN Orders o ON oi.order_id = o.order_id WHERE o.customer_id = %s",
+                   (user_id,))
+    cursor.execute("DELETE FROM Orders WHERE customer_id = %s", (user_id,))
+    cursor.execute("DELETE FROM Addresses WHERE user_id = %s", (user_id,))
+    cursor.execute("DELETE FROM Users WHERE user_id = %s", (user_id,))
+    connection.commit()
+    cursor.close()
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--page-size", type=int, default=HISTORY_PAGE_SIZE)
+    args = parser.parse_args()
+
+    connection = create_connection()
+    if not connection:
+        return
+
+    print(f"{'orders':>8} | {'legacy trips':>12} {'legacy ms':>10} | {'paged trips':>11} {'paged ms':>9} | "
+          f"{'page 1 ms':>9} {'last page ms':>12}")
+    for n_orders in args.sizes:
+        user_id = create_buyer(connection, n_orders, n_orders)
+        try:
+            counting = CountingConnection(connection)
+            _, legacy_time = timed(legacy_history, counting, user_id)
+            legacy_trips = counting.round_trips
+
+            counting = CountingConnection(connection)
+            pages, paged_time = timed(paged_history, counting, user_id, args.page_size)
+            paged_trips = counting.round_trips
+
+            _, first_page_time = timed(fetch_order_history_page, connection, user_id, args.page_size)
+            last_after = pages[-2].next_cursor if len(pages) > 1 else None
+            _, last_page_time = timed(fetch_order_history_page, connection, user_id, args.page_size, last_after)
+
+            print(f"{n_orders:>8} | {legacy_trips:>12} {legacy_time * 1000:>10.1f} | {paged_trips:>11} "
+                  f"{paged_time * 1000:>9.1f} | {first_page_time * 1000:>9.2f} {last_page_time * 1000:>12.2f}")
+        finally:
+            drop_buyer(connection, user_id)
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/prepared_statements.py
+"""
+Registered reads as text-protocol statements against the query registry's prepared statements.
+
+Runs each hot read from queries.QUERIES --iterations times on one connection, first through a
+plain cursor (MySQL parses and plans the statement on every execution) and then through
+queries.select() (prepared once, then executed with only the parameters sent). The report
+gives the average microseconds per execution for both, the speedup, and the server's
+Com_stmt_prepare / Com_stmt_execute counters to show each statement was prepared once.
+
+Needs the MySQL backend and the sample data (or seed_data.py). It only reads.
+
+    python -m benchmarks.prepared_statements --iterations 2000
+"""
+import argparse
+import sys
+import time
+
+from db_connector import create_connection
+import queries
+
+STATUS_COUNTERS = ("Com_stmt_prepare", "Com_stmt_execute", "Com_select")
+
+
+def sample_params(connection):
+    """ {name: (params, ids)} for the reads to compare, using a customer that has orders. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT customer_id FROM Orders ORDER BY order_id LIMIT 1")
+        row = cursor.fetchone()
+        customer_id = row[0] if row else 1
+        cursor.execute("SELECT order_id FROM Orders WHERE customer_id = %s ORDER BY order_id DESC LIMIT 10",
+                       (customer_id,))
+        order_ids = [r[0] for r in cursor.fetchall()] or [1]
+        cursor.execute("SELECT inventory_id, product_id, seller_id FROM Inventory ORDER BY inventory_id LIMIT 1")
+        inventory_id, product_id, seller_id = cursor.fetchone()
+        cursor.execute("SELECT email, password_hash FROM Users WHERE user_id = %s", (customer_id,))
+        email, password = cursor.fetchone()
+        connection.commit()
+    finally:
+        cursor.close()
+    return {
+        "login": ((email, password), None),
+        "catalog.products_in_category": ((1,), None),
+        "offers.for_product": ((product_id,), None),
+        "offers.listing": ((inventory_id,), None),
+        "cart.lines": ((customer_id,), None),
+        "checkout.cart": ((customer_id,), None),
+        "seller.listings": ((seller_id,), None),
+        "history.items": ((), order_ids),
+    }
+
+
+def server_status(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN (%s, %s, %s)", STATUS_COUNTERS)
+        return {name: int(value) for name, value in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def time_text(connection, name, params, ids, iterations):
+    """ Seconds for `iterations` executions through a plain (text protocol) cursor. """
+    sql = queries.QUERIES[name]
+    if ids is not None:
+        sql = sql.format(ids=", ".join(["%s"] * len(ids)))
+        params = list(params) + list(ids)
+    cursor = connection.cursor()
+    try:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        return time.perf_counter() - started
+    finally:
+        cursor.close()
+
+
+def time_registry(connection, name, params, ids, iterations):
+    """ Seconds for `iterations` executions through the registry's prepared statement. """
+    queries.select(connection, name, params, ids)   # prepare outside the timing
+    started = time.perf_counter()
+    for _ in range(iterations):
+        queries.select(connection, name, params, ids)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="executions per statement and protocol")
+    args = parser.parse_args()
+
+    connection = create_connection()
+    if not connection:
+        sys.exit(1)
+    try:
+        reads = sample_params(connection)
+        print(f"\n{len(reads)} registered reads x {args.iterations} executions\n")
+        print(f"{'statement':<30} {'text µs':>9} {'prepared µs':>12} {'speedup':>8}")
+        totals = {"text": 0.0, "prepared": 0.0}
+        before = server_status(connection)
+        for name, (params, ids) in reads.items():
+            text = time_text(connection, name, params, ids, args.iterations)
+            prepared = time_registry(connection, name, params, ids, args.iterations)
+            totals["text"] += text
+            totals["prepared"] += prepared
+            print(f"{name:<30} {text / args.iterations * 1e6:>9.1f} {prepared / args.iterations * 1e6:>12.1f} "
+                  f"{text / prepared:>7.2f}x")
+        after = server_status(connection)
+        connection.commit()
+        executions = args.iterations * len(reads)
+        print(f"{'all':<30} {totals['text'] / executions * 1e6:>9.1f} "
+              f"{totals['prepared'] / executions * 1e6:>12.1f} {totals['text'] / totals['prepared']:>7.2f}x")
+        print("\nServer counters during the run: "
+              + ", ".join(f"{name} +{after.get(name, 0) - before.get(name, 0)}" for name in STATUS_COUNTERS))
+        queries.print_registry_stats()
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# benchmarks/quantity_sweep.py
+"""
+Buying N pairs across sellers: one seller per browse pass against the best-total-price sweep.
+
+Creates a throwaway product with --listings competing listings (random prices, 1..--max-stock
+pairs each) and a throwaway buyer. For each --quantities value it puts that many pairs in the
+cart twice and reports round trips and milliseconds:
+
+  per-seller  the old flow: re-read every seller, add the cheapest one not yet in the cart, repeat
+  sweep       services.add_best_price: split over the in-memory order book, one batched cart write
+
+It checks both end up with the same cart total, and times order_book.plan_sweep on its own.
+Runs with stock holds as configured (on by default). Everything it creates is deleted at the end.
+
+    python -m benchmarks.quantity_sweep --listings 5000 --quantities 1 10 100 1000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import CountingConnection
+from db_connector import add_backend_arguments, configure_backend, create_connection
+import order_book
+import queries
+from services import add_best_price, add_cart_item
+
+BENCH_EMAIL = "bench_sweep_buyer@bench.local"
+SELLER_ID = 3      # Charlie, from the sample data
+CATEGORY_ID = 1
+INSERT_BATCH = 1000
+
+
+def setup(connection, listings, max_stock, seed):
+    rng = random.Random(seed)
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Products (product_name, brand, category_id) VALUES (%s, %s, %s)",
+                   ("Bench Sweep Runner", "Bench", CATEGORY_ID))
+    product_id = cursor.lastrowid
+    rows = [(SELLER_ID, product_id, round(rng.uniform(80, 400), 2), rng.randint(1, max_stock))
+            for _ in range(listings)]
+    for start in range(0, len(rows), INSERT_BATCH):
+        cursor.executemany("INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+                           rows[start:start + INSERT_BATCH])
+    cursor.execute(
+        "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)",
+        ("Bench", "Sweep", BENCH_EMAIL, "x", "customer")
+    )
+    buyer_id = cursor.lastrowid
+    connection.commit()
+    cursor.close()
+    return product_id, buyer_id
+
+
+def empty_cart(connection, buyer_id):
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM StockReservations WHERE customer_id = %s", (buyer_id,))
+    cursor.execute("DELETE FROM Cart WHERE customer_id = %s", (buyer_id,))
+    connection.commit()
+    cursor.close()
+
+
+def cart_total(connection, buyer_id):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COALESCE(SUM(c.quantity), 0), COALESCE(SUM(c.quantity * i.price), 0) "
+                   "FROM Cart c JOIN Inventory i ON c.inventory_id = i.inventory_id WHERE c.customer_id = %s",
+                   (buyer_id,))
+    pairs, total = cursor.fetchone()
+    connection.commit()
+    cursor.close()
+    return int(pairs), round(float(total), 2)
+
+
+def teardown(connection, product_id, buyer_id):
+    empty_cart(connection, buyer_id)
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM Inventory WHERE product_id = %s", (product_id,))
+    cursor.execute("DELETE FROM Products WHERE product_id = %s", (product_id,))
+    cursor.execute("DELETE FROM Users WHERE user_id = %s", (buyer_id,))
+    connection.commit()
+    cursor.close()
+    order_book.invalidate_products(connection, [product_id])
+
+
+def per_seller(connection, buyer_id, product_id, quantity):
+    """ The browse -> add loop a buyer had to repeat: one full seller read and one add per seller. """
+    taken = set()
+    remaining = quantity
+    while remaining > 0 and len(taken) < order_book.SWEEP_MAX_LINES:
+        offers = sorted((row for row in queries.select(connection, "offers.for_product", (product_id,))
+                         if row[0] not in taken), key=lambda row: (row[4], row[0]))
+        if not offers:
+            break
+        inventory_id, stock = offers[0][0], offers[0][5]
+        add_cart_item(connection, buyer_id, inventory_id, min(stock, remaining))
+        taken.add(inventory_id)
+        remaining -= min(stock, remaining)
+
+
+def timed(connection, run):
+    counting = CountingConnection(connection)
+    started = time.perf_counter()
+    run(counting)
+    return (time.perf_counter() - started) * 1000, counting.round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=5000, help="competing listings for the product")
+    parser.add_argument("--max-stock", type=int, default=5, help="each listing has 1..max-stock pairs")
+    parser.add_argument("--quantities", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--seed", type=int, default=42)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    connection = create_connection()
+    if not connection:
+        return
+    product_id, buyer_id = setup(connection, args.listings, args.max_stock, args.seed)
+    failed = False
+    try:
+        started = time.perf_counter()
+        order_book.get_offers(connection, product_id)   # load the book once, as the first browse would
+        print(f"\nProduct with {args.listings} listings; book loaded in {(time.perf_counter() - started) * 1000:.1f} ms\n")
+        print(f"{'pairs':>6} {'sellers':>8} {'plan ms':>8} {'per-seller ms':>14} {'trips':>6} "
+              f"{'sweep ms':>9} {'trips':>6}  cart")
+        for quantity in args.quantities:
+            started = time.perf_counter()
+            plan = order_book.plan_sweep(connection, product_id, quantity)
+            plan_ms = (time.perf_counter() - started) * 1000
+
+            empty_cart(connection, buyer_id)
+            slow_ms, slow_trips = timed(connection, lambda conn: per_seller(conn, buyer_id, product_id, quantity))
+            slow_cart = cart_total(connection, buyer_id)
+            empty_cart(connection, buyer_id)
+            fast_ms, fast_trips = timed(connection, lambda conn: add_best_price(conn, buyer_id, product_id, quantity))
+            fast_cart = cart_total(connection, buyer_id)
+
+            same = slow_cart == fast_cart
+            failed = failed or not same
+            print(f"{quantity:>6} {len(plan.fills):>8} {plan_ms:>8.2f} {slow_ms:>14.1f} {slow_trips:>6} "
+                  f"{fast_ms:>9.1f} {fast_trips:>6}  {fast_cart[0]} pairs ${fast_cart[1]:.2f}"
+                  f"{'' if same else f' (per-seller: {slow_cart[0]} pairs ${slow_cart[1]:.2f})'}")
+    finally:
+        teardown(connection, product_id, buyer_id)
+        connection.close()
+
+    print("\nFAIL: the two flows filled different carts." if failed else "\nOK: both flows filled the same cart.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/replica_routing.py
+"""
+Read-your-writes check for the replica routing in read_routing.py.
+
+Each round adds a listing to a throwaway buyer's cart on the primary, commits, and at once
+reads the cart count back through the routed connection, the way the cart screen does.
+A read that misses the write just made is counted as stale. The script runs once per
+read-your-writes mode and reports stale reads, where reads went (replica vs primary) and
+read latency. "off" shows how stale the replica really is; "pin" and "wait" should report 0.
+
+It needs a primary and at least one replica. Two local MySQL instances work:
+
+    # primary on 3306 and replica on 3307, both with gtid_mode=ON and enforce_gtid_consistency=ON
+    # on the replica:  CHANGE REPLICATION SOURCE TO SOURCE_HOST='127.0.0.1', SOURCE_PORT=3306,
+    #                  SOURCE_USER='root', SOURCE_PASSWORD='...', SOURCE_AUTO_POSITION=1;
+    #                  START REPLICA;
+    # add artificial lag to make staleness visible:  CHANGE REPLICATION SOURCE TO SOURCE_DELAY=1;
+
+    python -m benchmarks.replica_routing --replica 127.0.0.1:3307 --rounds 200
+
+Pointing --replica at the primary itself exercises the routing with zero lag.
+"""
+import argparse
+import time
+
+from benchmarks.common import percentile
+import db_connector
+import read_routing
+from services import add_cart_item, cart_item_count
+
+BENCH_EMAIL = "bench_replica_buyer@bench.local"
+SELLER_ID = 3    # Charlie, from the sample data
+PRODUCT_ID = 1   # Air Jordan 4, from the sample data
+
+
+def setup(connection):
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+                   (SELLER_ID, PRODUCT_ID, 100.00, 1000000))
+    inventory_id = cursor.lastrowid
+    cursor.execute("INSERT INTO Users (first_name, last_name, email, password_hash, user_role) "
+                   "VALUES ('Bench', 'Replica', %s, 'x', 'customer')", (BENCH_EMAIL,))
+    buyer_id = cursor.lastrowid
+    connection.commit()
+    cursor.close()
+    return inventory_id, buyer_id
+
+
+def teardown(connection, inventory_id, buyer_id):
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM Cart WHERE customer_id = %s", (buyer_id,))
+    cursor.execute("DELETE FROM Users WHERE user_id = %s", (buyer_id,))
+    cursor.execute("DELETE FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+    connection.commit()
+    cursor.close()
+
+
+def run_mode(pool, mode, inventory_id, buyer_id, rounds):
+    read_routing.configure_routing(mode)
+    before = read_routing.routing_stats()
+    consistency = read_routing.SessionConsistency()
+    stale = 0
+    latencies = []
+    with read_routing.session_connection(pool, consistency) as connection:
+        expected = cart_item_count(connection, buyer_id)
+        connection.commit()
+        for _ in range(rounds):
+            add_cart_item(connection, buyer_id, inventory_id, 1)
+            expected += 1
+            started = time.perf_counter()
+            seen = cart_item_count(connection, buyer_id)
+            latencies.append(time.perf_counter() - started)
+            if seen != expected:
+                stale += 1
+            # Wait out the pin so every round starts with reads on the replica again.
+            consistency.last_write_at = None
+    after = read_routing.routing_stats()
+    routed = {key: after[key] - before[key] for key in ("replica_reads", "primary_reads", "pinned_reads",
+                                                        "waited_reads", "wait_timeouts")}
+    return stale, sorted(latencies), routed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replica", action="append", required=True, metavar="HOST:PORT",
+                        help="replica endpoint (repeat for several)")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--modes", default="off,pin,wait", help="read-your-writes modes to run, in order")
+    args = parser.parse_args()
+
+    db_connector.REPLICA_CONFIGS = [{"host": host, "port": int(port)}
+                                    for host, _, port in (r.rpartition(":") for r in args.replica)]
+    pool = db_connector.get_pool()
+    with pool.connection() as admin:
+        inventory_id, buyer_id = setup(admin)
+    try:
+        print(f"\n{args.rounds} write-then-read rounds per mode\n")
+        print(f"{'mode':<6} {'stale':>6} {'replica':>8} {'primary':>8} {'pinned':>7} {'waited':>7} "
+              f"{'timeouts':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        for mode in (m.strip() for m in args.modes.split(",")):
+            stale, latencies, routed = run_mode(pool, mode, inventory_id, buyer_id, args.rounds)
+            print(f"{mode:<6} {stale:>6} {routed['replica_reads']:>8} {routed['primary_reads']:>8} "
+                  f"{routed['pinned_reads']:>7} {routed['waited_reads']:>7} {routed['wait_timeouts']:>9} "
+                  f"{percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 95) * 1000:>8.2f}")
+    finally:
+        with pool.connection() as admin:
+            teardown(admin, inventory_id, buyer_id)
+        read_routing.close_replicas()
+        db_connector.close_pool()
+
+
+if __name__ == "__main__":
+    main()
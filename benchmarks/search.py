@@ -0,0 +1,84 @@
+# benchmarks/search.py
+"""
+Product search latency on a large catalog.
+
+Builds a ProductIndex from --products synthetic products (the same names seed_data.py
+generates) and times a mix of queries: whole words, prefixes as typed keystroke by keystroke,
+typos and multi-word queries. With --from-db the index is built from the live Products table
+instead. Reports build time and p50/p95/max latency per query kind. No database round trips
+happen while querying.
+
+    python -m benchmarks.search --products 300000
+    python -m benchmarks.search --from-db
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import percentile
+from product_search import ProductIndex, build_index, search_products, search_stats
+import seed_data
+
+QUERIES = {
+    "word": ["nike", "samba", "dunk", "panda", "salomon"],
+    "keystrokes": ["n", "ne", "new", "new b", "new ba", "new bal", "new bala", "new balan", "new balanc"],
+    "typo": ["adidsa", "jordn", "conversse", "retor", "gel-lite"],
+    "multi": ["nike dunk low", "air max bred", "adidas forum og", "new balance 990 premium", "vans old skool"],
+}
+
+
+def synthetic_index(count, seed):
+    offsets = {table: 0 for table in seed_data.LOADED_TABLES}
+    scale = count / seed_data.BASE_COUNTS["products"]
+    plan = seed_data.SeedPlan(scale, seed, offsets)
+    index = ProductIndex()
+    for row in seed_data.gen_products(plan, random.Random(seed), list(range(1, len(seed_data.CATEGORIES) + 1))):
+        index.add(*row)
+    return index
+
+
+def time_queries(search, rounds):
+    results = {}
+    for kind, queries in QUERIES.items():
+        latencies = []
+        for _ in range(rounds):
+            for query in queries:
+                started = time.perf_counter()
+                search(query)
+                latencies.append(time.perf_counter() - started)
+        results[kind] = sorted(latencies)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=300000, help="synthetic catalog size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--rounds", type=int, default=20, help="times each query is repeated")
+    parser.add_argument("--from-db", action="store_true", help="index the live Products table instead")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.from_db:
+        from db_connector import create_connection
+        connection = create_connection()
+        build_index(connection)
+        count = search_stats()["products"]
+        search = lambda query: search_products(connection, query)
+    else:
+        index = synthetic_index(args.products, args.seed)
+        count = len(index)
+        search = index.search
+    print(f"\nIndexed {count} products in {time.perf_counter() - started:.1f}s\n")
+
+    print(f"{'queries':<11} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for kind, latencies in time_queries(search, args.rounds).items():
+        print(f"{kind:<11} {percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 95) * 1000:>8.2f} "
+              f"{latencies[-1] * 1000:>8.2f}")
+
+    if args.from_db:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
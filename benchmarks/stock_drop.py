@@ -0,0 +1,200 @@
+# benchmarks/stock_drop.py
+"""
+A limited drop: far more buyers than pairs, with and without stock holds at add-to-cart.
+
+Creates one throwaway listing with --stock pairs and --buyers throwaway buyers. When the drop
+opens, every buyer adds 1..--max-qty pairs to their cart, spends up to --think-ms entering
+an address, then checks out. This runs once with holds off (the cart promises nothing) and
+once with them on (stock_holds.py). For each mode the report gives adds refused up front,
+the checkout success rate, the checkouts that rolled back (sold out at checkout, plus deadlock
+retries) and checks that nothing was oversold. Everything it creates is deleted at the end.
+
+    python -m benchmarks.stock_drop --buyers 200 --stock 50 --think-ms 200
+"""
+import argparse
+import queue
+import random
+import threading
+import time
+
+from benchmarks.common import percentile
+from checkout_engine import place_order
+from db_connector import ConnectionPool, add_backend_arguments, configure_backend
+import order_book
+from services import add_cart_item
+import stock_holds
+
+BENCH_EMAIL = "bench_drop_buyer_{}@bench.local"
+SELLER_ID = 3    # Charlie, from the sample data
+PRODUCT_ID = 1   # Air Jordan 4, from the sample data
+BENCH_ADDRESS = ("1 Drop St", "Benchville", "BS", "00000")
+
+
+def setup(connection, buyers, stock):
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+        (SELLER_ID, PRODUCT_ID, 299.00, stock)
+    )
+    inventory_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)",
+        [("Bench", f"Drop{i}", BENCH_EMAIL.format(i), "x", "customer") for i in range(buyers)]
+    )
+    cursor.execute("SELECT user_id FROM Users WHERE email LIKE 'bench_drop_buyer_%@bench.local' ORDER BY user_id")
+    buyer_ids = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+    cursor.close()
+    return inventory_id, buyer_ids
+
+
+def reset(connection, inventory_id, buyer_ids, stock):
+    """ Empties the buyers' carts, holds and orders and puts the stock back. """
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(buyer_ids))
+    orders = f"SELECT order_id FROM Orders WHERE customer_id IN ({placeholders})"
+    cursor.execute("DELETE FROM StockReservations WHERE inventory_id = %s", (inventory_id,))
+    cursor.execute(f"DELETE FROM Cart WHERE customer_id IN ({placeholders})", buyer_ids)
+    cursor.execute(f"DELETE FROM OrderItems WHERE order_id IN ({orders})", buyer_ids)
+    cursor.execute(f"DELETE FROM OrderOutbox WHERE order_id IN ({orders})", buyer_ids)
+    cursor.execute(f"DELETE FROM Orders WHERE customer_id IN ({placeholders})", buyer_ids)
+    cursor.execute(f"DELETE FROM Addresses WHERE user_id IN ({placeholders})", buyer_ids)
+    cursor.execute("UPDATE Inventory SET stock_quantity = %s WHERE inventory_id = %s", (stock, inventory_id))
+    connection.commit()
+    cursor.close()
+
+
+def teardown(connection, inventory_id, buyer_ids):
+    reset(connection, inventory_id, buyer_ids, 0)
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(buyer_ids))
+    cursor.execute(f"DELETE FROM Users WHERE user_id IN ({placeholders})", buyer_ids)
+    cursor.execute("DELETE FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+    connection.commit()
+    cursor.close()
+    order_book.invalidate_products(connection, [PRODUCT_ID])   # drop the summary that pointed at our listing
+
+
+def run_drop(pool, inventory_id, buyer_ids, threads, max_qty, think, seed):
+    """ Every buyer adds, thinks, and checks out. Returns the totals for one mode. """
+    rng = random.Random(seed)
+    plans = [(uid, rng.randint(1, max_qty), rng.uniform(0, think)) for uid in buyer_ids]
+    pending = queue.Queue()
+    for plan in plans:
+        pending.put(plan)
+    lock = threading.Lock()
+    totals = {"added": 0, "refused": 0, "checkouts": 0, "placed": 0, "sold_out": 0, "retries": 0,
+              "latencies": [], "errors": []}
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        local = {key: [] if isinstance(value, list) else 0 for key, value in totals.items()}
+        barrier.wait()
+        while True:
+            try:
+                uid, qty, pause = pending.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                with pool.connection() as conn:
+                    add_cart_item(conn, uid, inventory_id, qty)
+                local["added"] += 1
+            except stock_holds.StockUnavailable:
+                local["refused"] += 1
+                continue
+            except Exception as e:
+                local["errors"].append(e)
+                continue
+            time.sleep(pause)   # the buyer types in an address
+            try:
+                with pool.connection() as conn:
+                    started = time.perf_counter()
+                    result = place_order(conn, uid, BENCH_ADDRESS)
+                    local["latencies"].append(time.perf_counter() - started)
+                local["checkouts"] += 1
+                local["retries"] += result.attempts - 1
+                if result.status == "placed":
+                    local["placed"] += 1
+                elif result.status == "failed":
+                    local["sold_out"] += 1
+            except Exception as e:
+                local["errors"].append(e)
+        with lock:
+            for key, value in local.items():
+                totals[key] += value
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    totals["elapsed"] = time.perf_counter() - started
+    return totals
+
+
+def units_sold(connection, inventory_id):
+    cursor = connection.cursor()
+    cursor.execute("SELECT stock_quantity FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+    final_stock = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM OrderItems WHERE inventory_id = %s", (inventory_id,))
+    sold = int(cursor.fetchone()[0])
+    connection.commit()
+    cursor.close()
+    return final_stock, sold
+
+
+def print_report(mode, totals, stock, final_stock, sold):
+    checkouts = totals["checkouts"]
+    rollbacks = totals["sold_out"] + totals["retries"]
+    latencies = sorted(totals["latencies"])
+    oversold = final_stock < 0 or sold != stock - final_stock
+    print(f"{mode:<6} {totals['added']:>6} {totals['refused']:>8} {checkouts:>10} {totals['placed']:>7} "
+          f"{totals['placed'] / max(checkouts, 1):>8.1%} {rollbacks:>10} {sold:>5}/{stock:<5} "
+          f"{percentile(latencies, 50) * 1000:>7.1f} {percentile(latencies, 95) * 1000:>7.1f} "
+          f"{len(totals['errors']):>6}  {'OVERSOLD!' if oversold else ''}")
+    for e in totals["errors"][:3]:
+        print(f"       error: {e}")
+    return oversold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=50, help="pairs in the drop")
+    parser.add_argument("--max-qty", type=int, default=2, help="each buyer wants 1..max-qty pairs")
+    parser.add_argument("--threads", type=int, default=32, help="buyers shopping at the same time")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="longest pause between add and checkout")
+    parser.add_argument("--hold-ttl", type=float, default=stock_holds.HOLD_TTL, help="hold lifetime in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    pool = ConnectionPool(min_size=args.threads + 1, max_size=args.threads + 1, checkout_timeout=60)
+    admin = pool.acquire()
+    inventory_id, buyer_ids = setup(admin, args.buyers, args.stock)
+    oversold = False
+    print(f"\nDrop of {args.stock} pairs, {args.buyers} buyers wanting 1..{args.max_qty}, "
+          f"{args.threads} at a time, up to {args.think_ms:.0f} ms between add and checkout\n")
+    print(f"{'holds':<6} {'added':>6} {'refused':>8} {'checkouts':>10} {'placed':>7} {'success':>8} "
+          f"{'rollbacks':>10} {'sold':>11} {'p50 ms':>7} {'p95 ms':>7} {'errors':>6}")
+    try:
+        for mode, enabled in (("off", False), ("on", True)):
+            stock_holds.configure_holds(enabled=enabled, ttl=args.hold_ttl)
+            reset(admin, inventory_id, buyer_ids, args.stock)
+            totals = run_drop(pool, inventory_id, buyer_ids, args.threads, args.max_qty,
+                              args.think_ms / 1000.0, args.seed)
+            final_stock, sold = units_sold(admin, inventory_id)
+            oversold = print_report(mode, totals, args.stock, final_stock, sold) or oversold
+    finally:
+        stock_holds.configure_holds(enabled=True)
+        teardown(admin, inventory_id, buyer_ids)
+        pool.release(admin)
+        pool.close()
+
+    print("\nFAIL: stock was oversold." if oversold else "\nOK: no oversell in either mode.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# benchmarks/workload.py
+"""
+Headless workload driver for the customer, seller and admin flows.
+
+Simulates many concurrent users, each with its own pooled connection, calling the same
+functions the menus use. Every operation is timed; the run reports throughput and
+p50/p95/p99 latency per operation and can save them as JSON for later comparison.
+
+    python -m benchmarks.workload --users 32 --duration 30 --output run.json
+    python -m benchmarks.workload --users 32 --duration 30 --compare run.json
+
+Checkout drains stock, so a long run also needs seller updates in the mix to restock.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import percentile
+from catalog_cache import get_categories, get_products_in_category
+from checkout_engine import place_order
+from db_connector import ConnectionPool, add_backend_arguments, configure_backend
+from order_book import get_best_offer, get_offers
+from order_history import fetch_order_history_page
+from services import add_cart_item, list_orders, update_listing
+from stock_holds import StockUnavailable
+
+# Relative weights of each operation in the default mix.
+DEFAULT_MIX = {
+    "browse": 30,
+    "view_sellers": 25,
+    "add_to_cart": 15,
+    "checkout": 5,
+    "order_history": 10,
+    "seller_update": 10,
+    "admin_listing": 5,
+}
+BENCH_ADDRESS = ("1 Bench St", "Benchville", "BS", "00000")
+
+
+class WorkloadContext:
+    """ Ids the simulated users pick from, loaded once before the run. """
+
+    def __init__(self, connection, sample_size):
+        cursor = connection.cursor()
+        cursor.execute("SELECT user_id FROM Users WHERE user_role = 'customer' ORDER BY user_id LIMIT %s",
+                       (sample_size,))
+        self.customers = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT seller_id, inventory_id FROM Inventory ORDER BY inventory_id LIMIT %s",
+                       (sample_size,))
+        self.listings = cursor.fetchall()
+        cursor.execute("SELECT DISTINCT product_id FROM Inventory ORDER BY product_id LIMIT %s", (sample_size,))
+        self.products = [row[0] for row in cursor.fetchall()]
+        connection.commit()
+        cursor.close()
+        if not (self.customers and self.listings and self.products):
+            raise SystemExit("The database needs customers, products and listings to run a workload.")
+
+
+# Each operation returns an outcome label (recorded as a count) or None.
+
+def op_browse(conn, ctx, rng):
+    categories = get_categories(conn)
+    if categories:
+        get_products_in_category(conn, rng.choice(categories)[0])
+
+
+def op_view_sellers(conn, ctx, rng):
+    product_id = rng.choice(ctx.products)
+    get_best_offer(conn, product_id)
+    get_offers(conn, product_id)
+
+
+def op_add_to_cart(conn, ctx, rng):
+    best = get_best_offer(conn, rng.choice(ctx.products)).best
+    if best is None:
+        return "out_of_stock"
+    try:
+        add_cart_item(conn, rng.choice(ctx.customers), best.inventory_id, 1)
+    except StockUnavailable:
+        return "held_by_others"
+    return "added"
+
+
+def op_checkout(conn, ctx, rng):
+    return place_order(conn, rng.choice(ctx.customers), BENCH_ADDRESS, allow_partial=True).status
+
+
+def op_order_history(conn, ctx, rng):
+    fetch_order_history_page(conn, rng.choice(ctx.customers))
+
+
+def op_seller_update(conn, ctx, rng):
+    seller_id, inventory_id = rng.choice(ctx.listings)
+    update_listing(conn, seller_id, inventory_id, stock=rng.randint(5, 50))
+
+
+def op_admin_listing(conn, ctx, rng):
+    list_orders(conn)
+
+
+OPERATIONS = {
+    "browse": op_browse,
+    "view_sellers": op_view_sellers,
+    "add_to_cart": op_add_to_cart,
+    "checkout": op_checkout,
+    "order_history": op_order_history,
+    "seller_update": op_seller_update,
+    "admin_listing": op_admin_listing,
+}
+
+
+def run_workload(pool, ctx, users, duration, mix, seed):
+    """ Runs `users` threads for `duration` seconds. Returns {op: {"latencies", "errors", "outcomes"}}. """
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    results = {name: {"latencies": [], "errors": 0, "outcomes": {}, "error_samples": []} for name in names}
+    lock = threading.Lock()
+    deadline = [None]
+    # The barrier action runs once, just before every user is released.
+    start_barrier = threading.Barrier(users, action=lambda: deadline.__setitem__(0, time.perf_counter() + duration))
+
+    def user(index):
+        rng = random.Random(seed * 1000003 + index)
+        local = {name: {"latencies": [], "errors": 0, "outcomes": {}, "error_samples": []} for name in names}
+        with pool.connection() as conn:
+            start_barrier.wait()
+            while time.perf_counter() < deadline[0]:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    outcome = OPERATIONS[name](conn, ctx, rng)
+                    local[name]["latencies"].append(time.perf_counter() - started)
+                    if outcome:
+                        local[name]["outcomes"][outcome] = local[name]["outcomes"].get(outcome, 0) + 1
+                except Exception as e:
+                    local[name]["errors"] += 1
+                    if len(local[name]["error_samples"]) < 3:
+                        local[name]["error_samples"].append(str(e))
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+        with lock:
+            for name, data in local.items():
+                merged = results[name]
+                merged["latencies"].extend(data["latencies"])
+                merged["errors"] += data["errors"]
+                merged["error_samples"] = (merged["error_samples"] + data["error_samples"])[:3]
+                for outcome, count in data["outcomes"].items():
+                    merged["outcomes"][outcome] = merged["outcomes"].get(outcome, 0) + count
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summarize(results, duration):
+    """ Turns raw latencies into the per-operation numbers that get printed and saved. """
+    summary = {}
+    for name, data in results.items():
+        latencies = sorted(data["latencies"])
+        count = len(latencies)
+        summary[name] = {
+            "count": count,
+            "errors": data["errors"],
+            "throughput": count / duration,
+            "mean_ms": (sum(latencies) / count * 1000) if count else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "outcomes": data["outcomes"],
+            "error_samples": data["error_samples"],
+        }
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    header = f"{'operation':<15} {'ops':>7} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    if baseline:
+        header += f"  {'Δ ops/s':>8} {'Δ p95':>8}"
+    print(header)
+    total_ops = 0
+    for name, s in summary.items():
+        total_ops += s["count"]
+        line = (f"{name:<15} {s['count']:>7} {s['throughput']:>9.1f} {s['p50_ms']:>8.2f} "
+                f"{s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['errors']:>7}")
+        base = (baseline or {}).get(name)
+        if base:
+            line += f"  {_delta(s['throughput'], base['throughput']):>8} {_delta(s['p95_ms'], base['p95_ms']):>8}"
+        print(line)
+        if s["outcomes"]:
+            print(f"{'':<15} outcomes: {s['outcomes']}")
+        for sample in s["error_samples"]:
+            print(f"{'':<15} error: {sample}")
+    return total_ops
+
+
+def _delta(new, old):
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def parse_mix(text):
+    """ "browse=30,checkout=5" -> {"browse": 30, "checkout": 5} """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=16, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="operation weights, e.g. browse=30,checkout=5 (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sample-size", type=int, default=5000, help="how many ids of each kind to draw from")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    pool = ConnectionPool(min_size=args.users + 1, max_size=args.users + 1, checkout_timeout=60)
+    try:
+        with pool.connection() as conn:
+            ctx = WorkloadContext(conn, args.sample_size)
+        started = time.perf_counter()
+        results = run_workload(pool, ctx, args.users, args.duration, args.mix, args.seed)
+        elapsed = time.perf_counter() - started
+        pool_stats = pool.stats()
+    finally:
+        pool.close()
+
+    summary = summarize(results, args.duration)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["operations"]
+
+    print(f"\n{args.users} users for {args.duration:.0f}s (wall {elapsed:.1f}s), seed {args.seed}\n")
+    total_ops = print_summary(summary, baseline)
+    print(f"\nTotal: {total_ops} ops, {total_ops / args.duration:.1f} ops/s | "
+          f"pool wait avg {pool_stats['wait_time_avg'] * 1000:.2f} ms")
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "users": args.users,
+                "duration": args.duration,
+                "seed": args.seed,
+                "mix": args.mix,
+            },
+            "totals": {"ops": total_ops, "throughput": total_ops / args.duration},
+            "operations": summary,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
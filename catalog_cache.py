@@ -0,0 +1,133 @@
+# catalog_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import queries
+
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL = 300.0                 # seconds before an entry is re-read regardless of version
+VERSION_CHECK_INTERVAL = 2.0      # seconds between CatalogVersion polls
+
+
+class CatalogCache:
+    """ TTL + LRU cache for Categories/Products reads, invalidated by a shared version stamp.
+
+    Admin writes bump CatalogVersion in the same transaction as the catalog change. Every
+    process polls that single row at most once per VERSION_CHECK_INTERVAL and drops its
+    cache when the number has moved, so changes made elsewhere show up within that window.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, version_check_interval=VERSION_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()   # key -> (value, loaded_at), least recently used first
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _check_version(self, connection):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._version_checked_at < self.version_check_interval:
+                return
+            self._version_checked_at = now
+        row = queries.select_one(connection, "catalog.version")
+        version = row[0] if row else None
+        with self._lock:
+            if self._version is not None and version != self._version:
+                self._clear()
+            self._version = version
+
+    def get(self, connection, key, loader):
+        """ Returns the cached value for `key`, calling loader(connection) on a miss. """
+        self._check_version(connection)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, loaded_at = entry
+                if now - loaded_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+
+        value = loader(connection)
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return value
+
+    def _clear(self):
+        if self._entries:
+            self._entries.clear()
+        self._stats["invalidations"] += 1
+
+    def invalidate(self):
+        """ Drops every entry and forces a version re-check on the next read. """
+        with self._lock:
+            self._clear()
+            self._version = None
+            self._version_checked_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+            snapshot["max_entries"] = self.max_entries
+            snapshot["version"] = self._version
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+
+_cache = CatalogCache()
+
+
+def _load_categories(connection):
+    return queries.select(connection, "catalog.categories")
+
+
+def get_categories(connection):
+    """ [(category_id, category_name)] """
+    return _cache.get(connection, ("categories",), _load_categories)
+
+
+def get_products_in_category(connection, category_id):
+    """ [(product_id, product_name)] for one category. """
+    def load(conn):
+        return queries.select(conn, "catalog.products_in_category", (category_id,))
+    return _cache.get(connection, ("products", category_id), load)
+
+
+def bump_catalog_version(cursor):
+    """ Marks the catalog as changed. Run it inside the transaction that changes the catalog. """
+    cursor.execute("UPDATE CatalogVersion SET version = version + 1 WHERE id = 1")
+
+
+def invalidate_catalog():
+    """ Drops this process's cached catalog. Other processes notice through CatalogVersion. """
+    _cache.invalidate()
+
+
+def cache_stats():
+    """ Snapshot of the catalog cache counters. """
+    return _cache.stats()
+
+
+def print_cache_stats():
+    """ Prints the catalog cache counters. """
+    s = cache_stats()
+    print("\n--- 🗂️  Catalog Cache ---")
+    print(f"Entries: {s['entries']} / {s['max_entries']} | Catalog version: {s['version']}")
+    print(f"Hits: {s['hits']} | Misses: {s['misses']} | Hit rate: {s['hit_rate'] * 100:.1f}%")
+    print(f"Evictions (LRU): {s['evictions']} | Expirations (TTL): {s['expirations']} | Invalidations: {s['invalidations']}")
@@ -0,0 +1,344 @@
+# change_feed.py
+"""
+Change feed: an append-only log of Inventory, Products and Orders changes, and the consumers
+that tail it.
+
+Triggers on the three tables append a ChangeLog row in the same transaction as the change
+(hypeculture.sql), so every write path feeds the log. That includes the app, the stored
+procedures, seller imports and the user purge. ChangeLog.seq only grows. A consumer
+remembers the last seq it handled and reads on from there, so no cache ever has to rescan
+Inventory to find out what moved.
+
+seq is an auto-increment value handed out at insert, before commit. A transaction still in
+flight can therefore hold a lower seq than one that is already visible, and a rolled-back
+one leaves a gap that never fills. A tail (ChangeTail) stops at a gap and notes which InnoDB
+transactions with writes were open just after the read that found it
+(information_schema.innodb_trx). A missing seq was handed out before that read, so its
+writer is one of them or already finished. Once none of them is open, the tail reads again
+and passes whatever is still missing. There is no limit on how long a writer may run: an
+import chunk, an archive batch or a purge waiting on locks holds the feed back for as long
+as it stays open, which shows as lag in --status, and its changes are never skipped. The
+MySQL user needs the PROCESS privilege to read innodb_trx. On SQLite there is one writer at
+a time, so a visible seq means every lower one has finished and gaps pass at once.
+
+Two kinds of consumer:
+
+    in-process   start_cache_invalidator() tails from the newest seq at startup and pushes
+                 each batch into this process's order books, catalog cache and search index
+                 (apply_to_caches). Nothing is stored; a restarted process loads fresh anyway.
+    durable      ChangeConsumer keeps its offset in ChangeConsumers and moves it in the same
+                 transaction as the handler's own writes, so each change is handled exactly once.
+                 The offset row is locked while a batch runs, so on MySQL only one instance of
+                 a consumer works at a time. price_watch.py is one.
+
+prune_changes() deletes rows every durable consumer has passed once they are older than
+FEED_RETENTION seconds. From the command line:
+
+    python change_feed.py --status      # newest seq and how far behind each consumer is
+    python change_feed.py --tail        # print changes as they are committed
+    python change_feed.py --prune       # delete old, fully consumed changes
+"""
+import argparse
+import threading
+import time
+from collections import namedtuple
+
+import catalog_cache
+from db_connector import add_backend_arguments, configure_backend, create_connection
+import order_book
+import product_search
+import queries
+from sql_dialect import dialect
+
+FEED_BATCH = 500              # changes read per poll
+FEED_POLL_INTERVAL = 0.5      # seconds between polls when the feed is quiet
+FEED_RETENTION = 86400        # seconds consumed changes are kept before prune_changes() deletes them
+PRUNE_BATCH = 5000            # changes deleted per transaction
+
+Change = namedtuple("Change", ["seq", "entity", "entity_id", "op", "product_id", "price_before", "price_after",
+                               "stock_before", "stock_after", "order_status", "changed_at"])
+ConsumerLag = namedtuple("ConsumerLag", ["consumer", "last_seq", "behind", "updated_at"])
+
+
+def latest_seq(connection):
+    """ The newest seq in the log (0 when it is empty). """
+    seq = queries.select_one(connection, "changes.latest")[0]
+    connection.commit()
+    return int(seq)
+
+
+def read_changes(connection, after, limit=FEED_BATCH):
+    """ Up to `limit` [Change] with seq > after, in seq order, in the caller's transaction. """
+    return [Change(*row) for row in queries.select(connection, "changes.after", (after, limit))]
+
+
+def _open_writers(connection, trx_ids=None):
+    """ ids of the open InnoDB transactions that have written rows, other than this connection's.
+
+    With `trx_ids`, only those of them still open.
+    """
+    sql = ("SELECT trx_id FROM information_schema.innodb_trx "
+           "WHERE trx_rows_modified > 0 AND trx_mysql_thread_id <> CONNECTION_ID()")
+    if trx_ids:
+        sql += f" AND trx_id IN ({', '.join(['%s'] * len(trx_ids))})"
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, list(trx_ids or ()))
+        return frozenset(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+class ChangeTail:
+    """ Position in the log, held back at gaps that may still fill. """
+
+    def __init__(self, after=0):
+        self.after = after
+        self._settled = after     # a seq at or below this that isn't visible yet never will be
+        self._pending = None      # (highest seq read at a gap, ids of the writers open just after that read)
+
+    def settle(self, connection):
+        """ Passes the pending gap once every writer open when it was found has finished.
+
+        Ends the caller's transaction, so the next read takes its snapshot after the check.
+        """
+        try:
+            if self._pending is not None:
+                seq, writers = self._pending
+                if not writers or not _open_writers(connection, writers):
+                    self._settled = max(self._settled, seq)
+                    self._pending = None
+        finally:
+            connection.commit()
+
+    def read(self, connection, limit=FEED_BATCH):
+        """ The next changes that can be handed on, read in the caller's transaction; moves past them. """
+        changes = read_changes(connection, self.after, limit)
+        no_gaps = dialect().name != "mysql"
+        accepted = []
+        for change in changes:
+            if change.seq != self.after + 1 and change.seq - 1 > self._settled and not no_gaps:
+                if self._pending is None:
+                    self._pending = (changes[-1].seq, _open_writers(connection))
+                break
+            accepted.append(change)
+            self.after = change.seq
+        return accepted
+
+    def seek(self, after):
+        """ Moves to a stored offset, e.g. one another instance of the consumer advanced. """
+        self.after = after
+
+    def poll(self, connection, limit=FEED_BATCH):
+        """ Reads the next changes that can be handed on, ending the read transaction. """
+        self.settle(connection)
+        try:
+            changes = self.read(connection, limit)
+        finally:
+            connection.commit()   # a fresh snapshot next time, so new changes are seen (REPEATABLE READ)
+        return changes
+
+
+class ChangeConsumer:
+    """ A named consumer whose offset lives in ChangeConsumers.
+
+    handler(connection, changes) runs inside the batch's transaction; whatever it writes
+    commits together with the new offset, or not at all. A new consumer starts at the newest
+    seq when start_at_latest is set, otherwise at the beginning of the log.
+    """
+
+    def __init__(self, name, handler, start_at_latest=True, batch_size=FEED_BATCH):
+        self.name = name
+        self.handler = handler
+        self.start_at_latest = start_at_latest
+        self.batch_size = batch_size
+        self._tail = ChangeTail(0)
+
+    def _register(self, connection):
+        start = latest_seq(connection) if self.start_at_latest else 0
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"{dialect().insert_ignore} INTO ChangeConsumers (consumer, last_seq) VALUES (%s, %s)",
+                           (self.name, start))
+            connection.commit()
+        finally:
+            cursor.close()
+
+    def run_once(self, connection):
+        """ Handles the next batch. Returns the number of changes handled (0 when caught up). """
+        cursor = connection.cursor()
+        try:
+            if connection.in_transaction:
+                connection.commit()
+            self._tail.settle(connection)
+            connection.start_transaction()
+            # Locking the offset serialises instances; the loser waits, then reads on from the new offset.
+            cursor.execute("SELECT last_seq FROM ChangeConsumers WHERE consumer = %s FOR UPDATE", (self.name,))
+            row = cursor.fetchone()
+            if row is None:
+                connection.rollback()
+                self._register(connection)
+                return 0
+            self._tail.seek(row[0])
+            changes = self._tail.read(connection, self.batch_size)
+            if not changes:
+                connection.rollback()
+                return 0
+            self.handler(connection, changes)
+            cursor.execute("UPDATE ChangeConsumers SET last_seq = %s, updated_at = NOW(3) WHERE consumer = %s",
+                           (changes[-1].seq, self.name))
+            connection.commit()
+            return len(changes)
+        except Exception:
+            connection.rollback()
+            self._tail.seek(-1)   # re-read the stored offset next time
+            raise
+        finally:
+            cursor.close()
+
+    def catch_up(self, connection):
+        """ Handles batches until nothing is ready. Returns the number of changes handled. """
+        handled = 0
+        while True:
+            count = self.run_once(connection)
+            handled += count
+            if count < self.batch_size:
+                return handled
+
+
+def start_consumer(pool, consumer, interval=FEED_POLL_INTERVAL):
+    """ Runs a ChangeConsumer every `interval` seconds on a daemon thread, borrowing a pooled connection each time. """
+    def run():
+        while True:
+            try:
+                with pool.connection() as connection:
+                    consumer.catch_up(connection)
+            except Exception as e:
+                print(f"⚠️  Change consumer {consumer.name} failed: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name=f"change-consumer-{consumer.name}", daemon=True)
+    thread.start()
+    return thread
+
+
+# ---------------------------------
+# In-process cache invalidation
+# ---------------------------------
+
+def apply_to_caches(connection, changes):
+    """ Pushes a batch of changes into this process's order books, catalog cache and search index. """
+    order_book.apply_changes(connection, changes)
+    products = {change.entity_id for change in changes if change.entity == "product"}
+    if products:
+        catalog_cache.invalidate_catalog()
+        product_search.refresh_products(connection, products)
+
+
+def start_cache_invalidator(pool, interval=FEED_POLL_INTERVAL):
+    """ Tails the feed from its newest seq on a daemon thread, applying each batch to this process's caches. """
+    def run():
+        tail = None
+        while True:
+            try:
+                with pool.connection() as connection:
+                    if tail is None:
+                        tail = ChangeTail(latest_seq(connection))
+                    while True:
+                        changes = tail.poll(connection)
+                        if changes:
+                            apply_to_caches(connection, changes)
+                            connection.commit()
+                        if len(changes) < FEED_BATCH:
+                            break
+            except Exception as e:
+                print(f"⚠️  Cache invalidation from the change feed failed: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name="change-feed-caches", daemon=True)
+    thread.start()
+    return thread
+
+
+# ---------------------------------
+# Housekeeping
+# ---------------------------------
+
+def consumer_lags(connection):
+    """ [ConsumerLag] for every durable consumer. """
+    newest = latest_seq(connection)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT consumer, last_seq, updated_at FROM ChangeConsumers ORDER BY consumer")
+        rows = cursor.fetchall()
+        connection.commit()
+    finally:
+        cursor.close()
+    return [ConsumerLag(name, last_seq, max(newest - last_seq, 0), updated_at) for name, last_seq, updated_at in rows]
+
+
+def prune_changes(connection, retention=FEED_RETENTION, batch_size=PRUNE_BATCH):
+    """ Deletes changes every durable consumer has handled and that are older than `retention` seconds.
+
+    One batch per transaction. Returns the number of changes deleted.
+    """
+    older_than, retention_param = dialect().now_plus(-retention)
+    deleted = 0
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT MIN(last_seq) FROM ChangeConsumers")
+        floor = cursor.fetchone()[0]
+        if floor is None:
+            floor = latest_seq(connection)
+        while True:
+            cursor.execute(f"SELECT seq FROM ChangeLog WHERE seq <= %s AND changed_at < {older_than} "
+                           f"ORDER BY seq LIMIT %s", (floor, retention_param, batch_size))
+            seqs = [row[0] for row in cursor.fetchall()]
+            if not seqs:
+                connection.commit()
+                return deleted
+            cursor.execute(f"DELETE FROM ChangeLog WHERE seq IN ({', '.join(['%s'] * len(seqs))})", seqs)
+            deleted += cursor.rowcount
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="show the newest seq and each consumer's lag")
+    parser.add_argument("--tail", action="store_true", help="print changes as they are committed (Ctrl-C stops)")
+    parser.add_argument("--prune", action="store_true", help="delete consumed changes older than the retention")
+    parser.add_argument("--retention", type=float, default=FEED_RETENTION, help="seconds to keep consumed changes")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    connection = create_connection()
+    if not connection:
+        return
+    try:
+        if args.prune:
+            print(f"Deleted {prune_changes(connection, args.retention)} consumed change(s).")
+        if args.tail:
+            tail = ChangeTail(latest_seq(connection))
+            print(f"Tailing the change feed after seq {tail.after}...")
+            while True:
+                for c in tail.poll(connection):
+                    detail = (f"price {c.price_before} -> {c.price_after}, stock {c.stock_before} -> {c.stock_after}"
+                              if c.entity == "inventory" else c.order_status or f"product {c.product_id}")
+                    print(f"{c.seq:>10} {c.changed_at} {c.entity:<9} {c.entity_id:>8} {c.op:<6} {detail}")
+                time.sleep(FEED_POLL_INTERVAL)
+        if args.status or not args.prune:
+            print(f"Newest change: seq {latest_seq(connection)}")
+            for lag in consumer_lags(connection):
+                print(f"  {lag.consumer:<20} at seq {lag.last_seq} ({lag.behind} behind, updated {lag.updated_at})")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# checkout_engine.py
+import random
+import time
+from collections import namedtuple
+
+from mysql.connector import Error, errorcode
+
+from fulfilment import enqueue_step
+import order_book
+import queries
+import stock_holds
+from sql_dialect import dialect
+
+# Deadlocks and lock-wait timeouts are safe to retry: InnoDB has already rolled the work back.
+RETRYABLE_ERRNOS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.02  # seconds; doubled on every retry, with jitter
+
+# Where cart adds and checkout run, per deployment:
+#   "client" -> one SQL statement per step from Python (the default)
+#   "server" -> the AddToCart and PlaceOrder stored procedures in hypeculture.sql, so a whole
+#               checkout is a single CALL; worth it when the database is far away
+CHECKOUT_MODES = ("client", "server")
+CHECKOUT_MODE = "client"
+
+# status is one of 'placed', 'partial', 'failed' or 'empty'.
+#   placed  -> every cart line was ordered
+#   partial -> some lines were ordered, the `short` ones stay in the cart
+#   failed  -> nothing was ordered (out of stock, or partial orders not allowed)
+#   empty   -> the cart had nothing in it
+CheckoutResult = namedtuple(
+    "CheckoutResult",
+    ["status", "order_id", "total_amount", "placed", "short", "attempts"],
+)
+# placed: list of (inventory_id, quantity, price_per_unit)
+# short:  list of (inventory_id, requested_quantity, available_stock)
+
+CartLine = namedtuple("CartLine", ["inventory_id", "quantity", "price", "stock"])
+
+
+class StockChanged(Exception):
+    """ The guarded stock decrement matched fewer listings than it locked. Nothing was written;
+    the checkout is retried, and the retry sees the real stock and reports short lines. """
+
+
+def read_cart(connection, user_id):
+    """ Non-locking preview of the cart for showing totals before input. Cart has one row per listing.
+    With stock holds on, `stock` is what this buyer may take: the stock less other buyers' holds. """
+    name = "checkout.cart_available" if stock_holds.HOLDS_ENABLED else "checkout.cart"
+    return [CartLine(*row) for row in queries.select(connection, name, (user_id,))]
+
+
+def configure_checkout(mode):
+    """ Selects client- or server-side cart and checkout for this process. """
+    global CHECKOUT_MODE
+    if mode not in CHECKOUT_MODES:
+        raise ValueError(f"Unknown checkout mode {mode!r}; choose from {', '.join(CHECKOUT_MODES)}.")
+    if mode == "server" and not dialect().supports_procedures:
+        raise ValueError("The server checkout mode uses stored procedures and needs the MySQL backend.")
+    CHECKOUT_MODE = mode
+
+
+def place_order(connection, user_id, address, allow_partial=False, max_attempts=MAX_ATTEMPTS, mode=None):
+    """ Turns the user's cart into an order in one short transaction, retrying on deadlock or StockChanged.
+
+    `address` is a tuple of (address_line1, city, state, postal_code). All interactive input
+    must be collected before calling this; nothing here waits on the user. `mode` overrides
+    CHECKOUT_MODE for this call.
+    """
+    place_once = _place_order_via_procedure if (mode or CHECKOUT_MODE) == "server" else _place_order_once
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return place_once(connection, user_id, address, allow_partial, attempt)
+        except (Error, StockChanged) as e:
+            _rollback_quietly(connection)
+            retryable = isinstance(e, StockChanged) or e.errno in RETRYABLE_ERRNOS
+            if not retryable or attempt >= max_attempts:
+                raise
+            delay = RETRY_BASE_DELAY * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay))
+        except Exception:
+            _rollback_quietly(connection)
+            raise
+
+
+def _place_order_once(connection, user_id, address, allow_partial, attempt):
+    cursor = connection.cursor()
+    try:
+        # Close any read snapshot left open by earlier SELECTs on this connection.
+        if connection.in_transaction:
+            connection.commit()
+        connection.start_transaction()
+
+        # 1. Lock this customer's cart rows so two sessions can't check out the same cart twice.
+        wanted = {}
+        for inv_id, qty in queries.select(connection, "checkout.lock_cart", (user_id,)):
+            wanted[inv_id] = wanted.get(inv_id, 0) + qty
+        if not wanted:
+            connection.rollback()
+            return CheckoutResult("empty", None, 0, [], [], attempt)
+
+        # 2. Lock the listings in ascending inventory_id order. Every checkout takes its
+        #    locks in the same order, which keeps deadlocks between buyers rare.
+        inv_ids = sorted(wanted)
+        listings = {inv_id: (price, stock)
+                    for inv_id, price, stock in queries.select(connection, "checkout.lock_listings", ids=inv_ids)}
+
+        # 3. A line with an unexpired hold was checked against other buyers' holds when it was
+        #    added, so it only needs the stock. Other lines may not take stock someone else holds.
+        held = stock_holds.held_quantities(connection, user_id) if stock_holds.HOLDS_ENABLED else {}
+        unheld = [inv_id for inv_id in inv_ids if held.get(inv_id, 0) < wanted[inv_id]]
+        available = stock_holds.available_to(connection, user_id, unheld) if stock_holds.HOLDS_ENABLED else {}
+
+        placed = []
+        short = []
+        for inv_id in inv_ids:
+            qty = wanted[inv_id]
+            price, stock = listings.get(inv_id, (None, 0))
+            stock = min(stock, available.get(inv_id, stock))
+            if price is None or qty > stock:
+                short.append((inv_id, qty, stock))
+            else:
+                placed.append((inv_id, qty, price))
+
+        if not placed or (short and not allow_partial):
+            connection.rollback()
+            return CheckoutResult("failed", None, 0, [], short, attempt)
+
+        total_amount = sum(qty * price for _, qty, price in placed)
+
+        # 4. Address and order header.
+        address_id = queries.write(connection, "checkout.insert_address", (user_id,) + tuple(address)).lastrowid
+        order_id = queries.write(connection, "checkout.insert_order", (user_id, address_id, total_amount)).lastrowid
+
+        # 5. All order lines in one multi-row INSERT (executemany batches INSERT ... VALUES).
+        cursor.executemany(
+            "INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit) VALUES (%s, %s, %s, %s)",
+            [(order_id, inv_id, qty, price) for inv_id, qty, price in placed]
+        )
+
+        # 6. One set-based, relative stock decrement. The stock guard is redundant while we
+        #    hold the row locks, but it makes an oversell impossible rather than unlikely.
+        case_sql = " ".join(["WHEN %s THEN %s"] * len(placed))
+        case_params = [v for inv_id, qty, _ in placed for v in (inv_id, qty)]
+        placed_ids = [inv_id for inv_id, _, _ in placed]
+        id_placeholders = ", ".join(["%s"] * len(placed_ids))
+        cursor.execute(
+            f"UPDATE Inventory SET stock_quantity = stock_quantity - CASE inventory_id {case_sql} END "
+            f"WHERE inventory_id IN ({id_placeholders}) "
+            f"AND stock_quantity >= CASE inventory_id {case_sql} END",
+            case_params + placed_ids + case_params
+        )
+        if cursor.rowcount != len(placed):
+            raise StockChanged("Stock changed during checkout; order was not placed.")
+
+        # 7. Clear only the lines we ordered, and turn their holds into the sale; short lines stay in the cart.
+        cursor.execute(
+            f"DELETE FROM Cart WHERE customer_id = %s AND inventory_id IN ({id_placeholders})",
+            [user_id] + placed_ids
+        )
+        stock_holds.release(connection, user_id, [inv_id for inv_id in placed_ids if inv_id in held])
+
+        # 8. Queue payment in the same transaction, so every placed order reaches the fulfilment workers.
+        enqueue_step(cursor, order_id, "pay")
+
+        connection.commit()
+        try:
+            order_book.record_sale(connection, placed)
+        except Error:
+            pass  # the order stands; the best-offer summary row catches up on the next listing write
+        status = "partial" if short else "placed"
+        return CheckoutResult(status, order_id, total_amount, placed, short, attempt)
+    finally:
+        cursor.close()
+
+
+def _place_order_via_procedure(connection, user_id, address, allow_partial, attempt):
+    """ The same checkout as _place_order_once, run inside the database by PlaceOrder. """
+    cursor = connection.cursor()
+    try:
+        if connection.in_transaction:
+            connection.commit()
+        # PlaceOrder manages its own transaction and rolls back before raising.
+        cursor.callproc("PlaceOrder", (user_id,) + tuple(address) + (bool(allow_partial),))
+        result_sets = [result.fetchall() for result in cursor.stored_results()]
+    finally:
+        cursor.close()
+
+    # The last result set is (status, order_id, total_amount); the cart lines come before it.
+    status, order_id, total_amount = result_sets[-1][0]
+    placed = []
+    short = []
+    for inv_id, qty, price, stock in (result_sets[0] if len(result_sets) > 1 else []):
+        if qty > stock:
+            short.append((inv_id, qty, stock))
+        else:
+            placed.append((inv_id, qty, price))
+
+    if status in ("failed", "empty"):
+        return CheckoutResult(status, None, 0, [], short, attempt)
+    try:
+        order_book.record_sale(connection, placed)
+    except Error:
+        pass  # the order stands; the best-offer summary row catches up on the next listing write
+    return CheckoutResult(status, order_id, total_amount, placed, short, attempt)
+
+
+def _rollback_quietly(connection):
+    try:
+        connection.rollback()
+    except Error:
+        pass
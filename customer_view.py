@@ -1,37 +1,68 @@
 # customer_view.py (Corrected Version)
-import time
+from datetime import datetime, timedelta
+
+from catalog_cache import get_categories, get_products_in_category
+from checkout_engine import read_cart, place_order
+from order_book import get_best_offer, get_offers, plan_sweep
+from order_history import fetch_order_history_page
+from price_watch import list_watches, take_unseen_alerts, unseen_alert_count, unwatch_product, watch_product
+from product_search import search_products
+from query_stats import track_action
+from session_cart import SessionCart
+from stock_holds import StockUnavailable
+
+# Menu choice -> action name used by the query stats for round trips per action
+CUSTOMER_ACTIONS = {'1': "customer.browse", '2': "customer.view_cart", '3': "customer.checkout",
+                    '4': "customer.order_history", '5': "customer.search", '6': "customer.price_watches"}
 
 def show_customer_menu(connection, user_id):
     """ Main menu for the logged-in customer. """
+    cart = SessionCart(user_id)
+    show_price_alerts(connection, user_id)
+    try:
+        _customer_menu_loop(connection, cart)
+    finally:
+        # Buffered cart adds are written at logout (and if the menu fails), never silently dropped.
+        try:
+            cart.flush(connection)
+        except Exception as e:
+            print(f"❌ Could not save your cart: {e}")
+
+def _customer_menu_loop(connection, cart):
     while True:
         print("\n--- 👟 Customer Menu ---")
         print("1. Browse Products by Category")
         print("2. View My Cart")
         print("3. Checkout")
         print("4. View My Order History")
-        print("5. Logout")
+        print("5. Search Products")
+        print("6. My Price Watches")
+        print("7. Logout") # Re-numbered
         choice = input("Enter your choice: ")
 
-        if choice == '1':
-            browse_products(connection, user_id)
-        elif choice == '2':
-            view_cart(connection, user_id)
-        elif choice == '3':
-            checkout(connection, user_id)
-        elif choice == '4':
-            view_order_history(connection, user_id)
-        elif choice == '5':
-            print("Logging out...")
-            break
-        else:
-            print("Invalid choice. Please try again.")
-
-def browse_products(connection, user_id):
+        with track_action(CUSTOMER_ACTIONS.get(choice)):
+            if choice == '1':
+                browse_products(connection, cart)
+            elif choice == '2':
+                view_cart(connection, cart)
+            elif choice == '3':
+                checkout(connection, cart)
+            elif choice == '4':
+                view_order_history(connection, cart.user_id)
+            elif choice == '5':
+                search_products_menu(connection, cart)
+            elif choice == '6':
+                manage_price_watches(connection, cart.user_id)
+            elif choice == '7': # Re-numbered
+                print("Logging out...")
+                break
+            else:
+                print("Invalid choice. Please try again.")
+
+def browse_products(connection, cart):
     """ Allows customer to browse categories and then products. """
-    cursor = connection.cursor()
     try:
-        cursor.execute("SELECT category_id, category_name FROM Categories")
-        categories = cursor.fetchall()
+        categories = get_categories(connection)
         print("\n--- Select a Category ---")
         for cat_id, cat_name in categories:
             print(f"{cat_id}. {cat_name}")
@@ -41,9 +72,7 @@ def browse_products(connection, user_id):
             print("Invalid category.")
             return
 
-        query = "SELECT product_id, product_name FROM Products WHERE category_id = %s"
-        cursor.execute(query, (chosen_cat_id,))
-        products = cursor.fetchall()
+        products = get_products_in_category(connection, chosen_cat_id)
         print(f"\n--- Shoes in {dict(categories)[chosen_cat_id]} ---")
         for prod_id, prod_name in products:
             print(f"{prod_id}. {prod_name}")
@@ -53,55 +82,76 @@ def browse_products(connection, user_id):
             print("Invalid shoe.")
             return
         
-        view_product_sellers(connection, user_id, chosen_prod_id)
+        view_product_sellers(connection, cart, chosen_prod_id)
 
     except (ValueError, TypeError):
         print("Invalid input. Please enter a number.")
-    finally:
-        cursor.close()
 
-def view_product_sellers(connection, user_id, product_id):
-    """ View sellers for a specific product, cheapest first. """
-    cursor = connection.cursor()
+def search_products_menu(connection, cart):
+    """ Free-text search over shoe names and brands; typos and partial words are fine. """
+    query = input("Search for (name or brand): ").strip()
+    if not query:
+        return
     try:
-        query = """
-        SELECT sp.inventory_id, u.first_name, u.last_name, sp.price, sp.stock_quantity
-        FROM Inventory sp
-        JOIN Users u ON sp.seller_id = u.user_id
-        WHERE sp.product_id = %s AND sp.stock_quantity > 0
-        ORDER BY sp.price ASC;
-        """
-        cursor.execute(query, (product_id,))
-        sellers = cursor.fetchall()
-    finally:
-        cursor.close()
+        hits = search_products(connection, query)
+        if not hits:
+            print(f"No shoes match '{query}'.")
+            return
+
+        print(f"\n--- Results for '{query}' ---")
+        for i, hit in enumerate(hits):
+            print(f"{i+1}. {hit.product_name} ({hit.brand})")
+
+        chosen = int(input("Enter result number to see sellers (or 0 to go back): "))
+        if chosen == 0:
+            return
+        if not 1 <= chosen <= len(hits):
+            print("Invalid result number.")
+            return
+
+        view_product_sellers(connection, cart, hits[chosen-1].product_id)
+
+    except ValueError:
+        print("Invalid input. Please enter a number.")
+    except Exception as e:
+        print(f"An error occurred while searching: {e}")
 
-    if not sellers:
+def view_product_sellers(connection, cart, product_id):
+    """ View sellers for a specific product, cheapest first. """
+    cheapest_seller, offer_count, total_stock = get_best_offer(connection, product_id)
+
+    if cheapest_seller is None:
         print("Sorry, this product is currently out of stock or not sold.")
         return
 
     print("\n--- Sellers for this Shoe (Cheapest First) ---")
-    cheapest_seller = sellers[0]
-    print(f"**Best Price**: ${cheapest_seller[3]:.2f} from {cheapest_seller[1]} {cheapest_seller[2]} (Stock: {cheapest_seller[4]})")
+    print(f"**Best Price**: ${cheapest_seller.price:.2f} from {cheapest_seller.first_name} {cheapest_seller.last_name} "
+          f"(Stock: {cheapest_seller.stock}) | {offer_count} seller(s), {total_stock} pair(s) available")
 
     while True:
         print("\nOptions:")
         print("1. Add to Cart (Best Price)")
-        print("2. View all sellers")
-        print("3. Back to main menu")
+        print("2. Buy several pairs at the best total price")
+        print("3. View all sellers") # Re-numbered
+        print("4. Watch this shoe for a price drop")
+        print("5. Back to main menu") # Re-numbered
         choice = input("Enter your choice: ")
         if choice == '1':
-            add_to_cart(connection, user_id, cheapest_seller[0])
+            add_to_cart(connection, cart, cheapest_seller.inventory_id)
             break
         elif choice == '2':
+            buy_best_price(connection, cart, product_id)
+            break
+        elif choice == '3': # Re-numbered
+            sellers = get_offers(connection, product_id)
             print("\n--- All Available Sellers ---")
             for i, seller in enumerate(sellers):
-                print(f"{i+1}. Seller: {seller[1]} {seller[2]}, Price: ${seller[3]:.2f}, Stock: {seller[4]}")
+                print(f"{i+1}. Seller: {seller.first_name} {seller.last_name}, Price: ${seller.price:.2f}, Stock: {seller.stock}")
             
             try:
                 seller_choice = int(input("Enter seller number to add to cart (or 0 to go back): "))
                 if 1 <= seller_choice <= len(sellers):
-                    add_to_cart(connection, user_id, sellers[seller_choice-1][0])
+                    add_to_cart(connection, cart, sellers[seller_choice-1].inventory_id)
                     break
                 elif seller_choice == 0:
                     continue
@@ -109,71 +159,117 @@ def view_product_sellers(connection, user_id, product_id):
                     print("Invalid seller number.")
             except ValueError:
                 print("Invalid input.")
-        elif choice == '3':
+        elif choice == '4':
+            watch_price(connection, cart.user_id, product_id, cheapest_seller.price)
+            break
+        elif choice == '5': # Re-numbered
             break
         else:
             print("Invalid choice.")
 
-def add_to_cart(connection, user_id, inventory_id):
-    """ Adds a selected product from a seller to the user's cart. """
-    cursor = connection.cursor()
+def watch_price(connection, user_id, product_id, best_price):
+    """ Asks for a target price and watches the product for an offer below it. """
     try:
-        quantity = int(input("Enter quantity: "))
+        entered = input(f"Alert me below what price? (Enter for anything under ${best_price:.2f}): ").strip()
+        target = watch_product(connection, user_id, product_id, float(entered) if entered else None)
+        print(f"👀 Watching: you'll be told at login when it's offered below ${target:.2f}.")
+    except ValueError as e:
+        print(f"❌ {e}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def show_price_alerts(connection, user_id):
+    """ Shows the price drops found for the customer's watches since they last looked. """
+    try:
+        if not unseen_alert_count(connection, user_id):
+            return
+        print("\n--- 🔔 Price Drops on Shoes You Watch ---")
+        for alert in take_unseen_alerts(connection, user_id):
+            was = f"was ${alert.old_price:.2f}" if alert.old_price is not None else "new listing"
+            print(f"- {alert.product_name} (ID {alert.product_id}): now ${alert.new_price:.2f} ({was}), "
+                  f"item ID {alert.inventory_id}")
+    except Exception as e:
+        print(f"Could not load your price alerts: {e}")
+
+def manage_price_watches(connection, user_id):
+    """ Lists the customer's price watches and lets them stop one. """
+    try:
+        watches = list_watches(connection, user_id)
+        if not watches:
+            print("You aren't watching any shoes. Open a shoe's sellers to watch its price.")
+            return
+        print("\n--- 👀 My Price Watches ---")
+        for i, watch in enumerate(watches):
+            best = f"${watch.best_price:.2f}" if watch.best_price is not None else "sold out"
+            print(f"{i+1}. {watch.product_name}: alert below ${watch.target_price:.2f} | best now {best}")
+        choice = int(input("Enter a number to stop watching it (or 0 to go back): "))
+        if 1 <= choice <= len(watches):
+            unwatch_product(connection, user_id, watches[choice-1].product_id)
+            print("✅ No longer watching that shoe.")
+        elif choice != 0:
+            print("Invalid number.")
+    except ValueError:
+        print("Invalid input.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def buy_best_price(connection, cart, product_id):
+    """ Splits a quantity across the cheapest sellers and adds every line to the cart at once. """
+    try:
+        quantity = int(input("How many pairs? "))
         if quantity <= 0:
             print("Quantity must be positive.")
             return
 
-        cursor.execute(
-            "SELECT cart_id, quantity FROM Cart WHERE customer_id = %s AND inventory_id = %s",
-            (user_id, inventory_id)
-        )
-        item = cursor.fetchone()
+        plan = plan_sweep(connection, product_id, quantity)
+        if not plan.fills:
+            print("Sorry, this product is currently out of stock or not sold.")
+            return
+        print(f"\n--- Best price for {plan.filled} pair(s) ---")
+        for offer, qty in plan.fills:
+            print(f"- {qty} from {offer.first_name} {offer.last_name} @ ${offer.price:.2f} each")
+        print(f"TOTAL: ${plan.total_price:.2f} (${plan.total_price / plan.filled:.2f} a pair)")
+        if plan.filled < quantity:
+            print(f"⚠️  Only {plan.filled} pair(s) are available across all sellers.")
+
+        if input("Add these to your cart? (y/n): ").lower() != 'y':
+            return
+        added = cart.add_best_price(connection, product_id, plan.filled)
+        if not added.fills:
+            print("❌ Sorry, those pairs were just taken by other buyers.")
+            return
+        if added.fills != plan.fills:
+            print("Other buyers got there first, so the split changed:")
+            for offer, qty in added.fills:
+                print(f"- {qty} from {offer.first_name} {offer.last_name} @ ${offer.price:.2f} each")
+        print(f"✅ {added.filled} pair(s) added to cart for ${added.total_price:.2f}!")
 
-        if item:
-            cart_id, current_quantity = item
-            new_quantity = current_quantity + quantity
-            cursor.execute("UPDATE Cart SET quantity = %s WHERE cart_id = %s", (new_quantity, cart_id))
-        else:
-            cursor.execute(
-                "INSERT INTO Cart (customer_id, inventory_id, quantity) VALUES (%s, %s, %s)",
-                (user_id, inventory_id, quantity)
-            )
-        
-        connection.commit()
+    except ValueError:
+        print("Invalid quantity.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def add_to_cart(connection, cart, inventory_id):
+    """ Adds a selected product from a seller to the user's cart. """
+    try:
+        quantity = int(input("Enter quantity: "))
+        if quantity <= 0:
+            print("Quantity must be positive.")
+            return
+        cart.add(connection, inventory_id, quantity)
         print("✅ Item added to cart successfully!")
 
+    except StockUnavailable as e:
+        print(f"❌ {e}")
     except ValueError:
         print("Invalid quantity.")
     except Exception as e:
         print(f"An error occurred: {e}")
-        connection.rollback()
-    finally:
-        cursor.close()
 
-def view_cart(connection, user_id):
+def view_cart(connection, cart):
     """ Displays the contents of the user's cart, updated for the new schema. """
-    cursor = connection.cursor()
-    query = """
-    SELECT
-        p.product_name,
-        u.first_name AS seller_name,
-        i.price,
-        c.quantity,
-        (i.price * c.quantity) AS subtotal
-    FROM
-        Cart AS c
-    JOIN
-        Inventory AS i ON c.inventory_id = i.inventory_id
-    JOIN
-        Products AS p ON i.product_id = p.product_id
-    JOIN
-        Users AS u ON i.seller_id = u.user_id
-    WHERE
-        c.customer_id = %s;
-    """
     try:
-        cursor.execute(query, (user_id,))
-        cart_items = cursor.fetchall()
+        cart_items = cart.items(connection)
         
         if not cart_items:
             print("\nYour cart is empty.")
@@ -189,137 +285,133 @@ def view_cart(connection, user_id):
 
     except Exception as e:
         print(f"An error occurred while viewing cart: {e}")
-    finally:
-        cursor.close()
-
-def checkout(connection, user_id):
-    """ Guides the user through the checkout process using a transaction. """
-    cursor = connection.cursor(buffered=True) # Buffered cursor is good for multiple queries
 
+def checkout(connection, cart):
+    """ Collects shipping details first, then places the order in one short transaction. """
+    user_id = cart.user_id
     try:
-        # 1. Get all cart items for the user
-        cart_query = """
-        SELECT c.inventory_id, c.quantity, i.price, i.stock_quantity
-        FROM Cart c JOIN Inventory i ON c.inventory_id = i.inventory_id
-        WHERE c.customer_id = %s;
-        """
-        cursor.execute(cart_query, (user_id,))
-        cart_items = cursor.fetchall()
-
+        # 1. Write any buffered adds, then preview the cart (no locks are held while the buyer is typing)
+        cart.flush(connection)
+        cart_items = read_cart(connection, user_id)
         if not cart_items:
             print("\nYour cart is empty. Nothing to check out.")
             return
 
-        # 2. Check if there is enough stock for all items BEFORE starting
         total_amount = 0
         for inv_id, qty, price, stock in cart_items:
             if qty > stock:
-                print(f"❌ Checkout failed: Not enough stock for item ID {inv_id}. Only {stock} left.")
-                return
+                print(f"⚠️  Only {stock} left for item ID {inv_id} (you have {qty} in your cart).")
             total_amount += (qty * price)
-        
+
         print(f"\nYour order total is: ${total_amount:.2f}")
 
-        # 3. Get shipping details from the user
+        # 2. Get shipping details from the user
         print("Please enter your shipping details:")
         address_line = input("Address Line 1: ")
         city = input("City: ")
         state = input("State: ")
         postal_code = input("Postal Code: ")
-        
+
         if not all([address_line, city, state, postal_code]):
             print("All fields are required. Checkout cancelled.")
             return
 
+        allow_partial = False
+        if len(cart_items) > 1:
+            allow_partial = input("If some items sell out, order the rest anyway? (y/n): ").lower() == 'y'
+
         confirm = input("Confirm and 'Pay Now'? (y/n): ").lower()
         if confirm != 'y':
             print("Checkout cancelled.")
             return
 
-        # --- START TRANSACTION ---
-        # 4. Create a new address entry
-        cursor.execute(
-            "INSERT INTO Addresses (user_id, address_line1, city, state, postal_code) VALUES (%s, %s, %s, %s, %s)",
-            (user_id, address_line, city, state, postal_code)
-        )
-        address_id = cursor.lastrowid
-
-        # 5. Create the main order entry
-        cursor.execute(
-            "INSERT INTO Orders (customer_id, address_id, total_amount) VALUES (%s, %s, %s)",
-            (user_id, address_id, total_amount)
-        )
-        order_id = cursor.lastrowid
-
-        # 6. Loop through cart items again to create OrderItems and update stock
-        for inv_id, qty, price, stock in cart_items:
-            # Add to OrderItems
-            cursor.execute(
-                "INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit) VALUES (%s, %s, %s, %s)",
-                (order_id, inv_id, qty, price)
-            )
-            # Update stock in Inventory
-            new_stock = stock - qty
-            cursor.execute("UPDATE Inventory SET stock_quantity = %s WHERE inventory_id = %s", (new_stock, inv_id))
-
-        # 7. Clear the user's cart
-        cursor.execute("DELETE FROM Cart WHERE customer_id = %s", (user_id,))
-        
-        # --- COMMIT TRANSACTION ---
-        connection.commit()
-        print(f"\nProcessing payment...")
-        time.sleep(1)
-        print(f"✅ Payment successful! Your order #{order_id} has been placed.")
-
+        # 3. One short transaction: lock, decrement, insert, clear cart, commit
+        result = place_order(connection, user_id, (address_line, city, state, postal_code), allow_partial)
+        cart.invalidate()
     except Exception as e:
-        # --- ROLLBACK TRANSACTION ---
-        connection.rollback()
         print(f"❌ An error occurred during checkout: {e}. The transaction has been rolled back.")
-    finally:
-        cursor.close()
-        
+        return
+
+    if result.status == 'empty':
+        print("\nYour cart is empty. Nothing to check out.")
+        return
+
+    for inv_id, requested, available in result.short:
+        print(f"❌ Not enough stock for item ID {inv_id}. Only {available} left (you wanted {requested}).")
+
+    if result.status == 'failed':
+        print("Checkout failed. Nothing was charged and your cart is unchanged.")
+        return
+
+    if result.status == 'partial':
+        print("The items above were left in your cart; everything else was ordered.")
+
+    # Payment runs in the background (fulfilment.py); the status shows up in Order History.
+    print(f"✅ Your order #{result.order_id} has been placed. Total: ${result.total_amount:.2f}")
+    print("Your payment is being processed. Check Order History for its status.")
+
+
+def _read_date_range():
+    """ Asks for an optional date range. Returns (date_from, date_to) with date_to exclusive. """
+    raw_from = input("From date (YYYY-MM-DD, blank for no limit): ").strip()
+    raw_to = input("To date (YYYY-MM-DD, blank for no limit): ").strip()
+    date_from = datetime.strptime(raw_from, "%Y-%m-%d") if raw_from else None
+    date_to = datetime.strptime(raw_to, "%Y-%m-%d") + timedelta(days=1) if raw_to else None
+    return date_from, date_to
+
 
 def view_order_history(connection, user_id):
-    """ Displays the user's past orders and the items in each order. """
-    cursor = connection.cursor()
+    """ Displays the user's past orders page by page, newest first. """
+    date_from = date_to = None
+    after = None
+    shown = 0
     try:
-        # First, get all orders for this user
-        orders_query = """
-        SELECT o.order_id, o.order_date, o.total_amount, a.address_line1, a.city
-        FROM Orders o JOIN Addresses a ON o.address_id = a.address_id
-        WHERE o.customer_id = %s ORDER BY o.order_date DESC;
-        """
-        cursor.execute(orders_query, (user_id,))
-        orders = cursor.fetchall()
-
-        if not orders:
-            print("\nYou have no past orders.")
-            return
+        while True:
+            page = fetch_order_history_page(connection, user_id, after=after,
+                                            date_from=date_from, date_to=date_to)
 
-        print("\n--- 📜 Your Order History ---")
-        for order_id, date, total, address, city in orders:
-            print(f"\nOrder #{order_id} | Date: {date.strftime('%Y-%m-%d')} | Total: ${total:.2f}")
-            print(f"  Shipped to: {address}, {city}")
-            
-            # Now, for each order, get its items
-            items_query = """
-            SELECT p.product_name, u.first_name AS seller_name, oi.quantity, oi.price_per_unit
-            FROM OrderItems oi
-            JOIN Inventory i ON oi.inventory_id = i.inventory_id
-            JOIN Products p ON i.product_id = p.product_id
-            JOIN Users u ON i.seller_id = u.user_id
-            WHERE oi.order_id = %s;
-            """
-            # Use a new cursor for this nested query
-            item_cursor = connection.cursor()
-            item_cursor.execute(items_query, (order_id,))
-            items = item_cursor.fetchall()
-            item_cursor.close()
-
-            for name, seller, qty, price in items:
-                print(f"  - {name} (Sold by {seller}) | Qty: {qty} @ ${price:.2f} each")
+            if not page.orders and shown == 0:
+                if date_from or date_to:
+                    print("\nYou have no orders in that date range.")
+                else:
+                    print("\nYou have no past orders.")
+                    return
+            elif shown == 0:
+                print("\n--- 📜 Your Order History ---")
+
+            for order in page.orders:
+                print(f"\nOrder #{order.order_id} | Date: {order.order_date.strftime('%Y-%m-%d')} | "
+                      f"Total: ${order.total_amount:.2f} | Status: {order.order_status}")
+                print(f"  Shipped to: {order.address_line1}, {order.city}")
+                for name, seller, qty, price in order.items:
+                    print(f"  - {name} (Sold by {seller}) | Qty: {qty} @ ${price:.2f} each")
+            shown += len(page.orders)
+
+            choice = None
+            while choice is None:
+                print("\nOptions:")
+                if page.next_cursor:
+                    print("n. Next page")
+                print("f. Filter by date range")
+                print("b. Back to menu")
+                choice = input("Enter your choice: ").lower()
+                if choice == 'f':
+                    try:
+                        date_from, date_to = _read_date_range()
+                    except ValueError:
+                        print("Invalid date. Please use YYYY-MM-DD.")
+                        choice = None
+                elif choice != 'b' and not (choice == 'n' and page.next_cursor):
+                    print("Invalid choice.")
+                    choice = None
+
+            if choice == 'b':
+                break
+            if choice == 'n':
+                after = page.next_cursor
+            else:
+                after = None
+                shown = 0
 
     except Exception as e:
         print(f"An error occurred while fetching order history: {e}")
-    finally:
-        cursor.close()
\ No newline at end of file
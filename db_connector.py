@@ -1,20 +1,314 @@
 # db_connector.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import mysql.connector
 from mysql.connector import Error
 
+from query_stats import instrument
+
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",  # <-- CHANGE THIS to your MySQL username
+    "password": "newpassword",  # <-- CHANGE THIS to your MySQL password
+    "database": "hypeculture_db",
+}
+
+# Database engine: "mysql" (production) or "sqlite", an embedded database file at SQLITE_PATH
+# that needs no server (demos, local runs, tests and benchmarks; see sqlite_backend.py).
+# Switch with configure_backend() before the first connection.
+DB_BACKENDS = ("mysql", "sqlite")
+DB_BACKEND = "mysql"
+SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hypeculture.db")
+SQLITE_BUSY_TIMEOUT = 10.0     # seconds a SQLite writer waits for the write lock
+
+# Read replicas of the primary above, e.g. [{"host": "replica1"}, {"host": "127.0.0.1", "port": 3307}].
+# Each entry overrides DB_CONFIG keys. Empty means every statement goes to the primary;
+# see read_routing.py for how reads are split when replicas are listed.
+REPLICA_CONFIGS = []
+
+# Pool sizing. Override these with configure_pool() before the first borrow.
+POOL_MIN_SIZE = 2
+POOL_MAX_SIZE = 10
+POOL_CHECKOUT_TIMEOUT = 10.0   # seconds to wait for a free connection
+POOL_IDLE_TIMEOUT = 300.0      # seconds an idle connection is kept above min size
+POOL_VALIDATE_AFTER = 5.0      # only ping connections that sat idle longer than this
+
+
+def configure_backend(backend, sqlite_path=None):
+    """ Selects the database engine (and the SQLite file) for this process. """
+    global DB_BACKEND, SQLITE_PATH
+    if backend not in DB_BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; choose from {', '.join(DB_BACKENDS)}.")
+    DB_BACKEND = backend
+    if sqlite_path:
+        SQLITE_PATH = sqlite_path
+
+
+def add_backend_arguments(parser):
+    """ Adds --backend and --sqlite-path to a command-line parser; pass them to configure_backend(). """
+    parser.add_argument("--backend", choices=DB_BACKENDS, default=DB_BACKEND,
+                        help="database engine: the MySQL server in DB_CONFIG, or an embedded SQLite file")
+    parser.add_argument("--sqlite-path", default=None, help=f"SQLite database file (default {SQLITE_PATH})")
+
+
+def open_connection():
+    """ A new, uninstrumented connection to the configured backend. """
+    if DB_BACKEND == "sqlite":
+        from sqlite_backend import connect_sqlite
+        return connect_sqlite(SQLITE_PATH, SQLITE_BUSY_TIMEOUT)
+    return mysql.connector.connect(**DB_CONFIG)
+
+
 def create_connection():
-    """ Create a database connection to the MySQL database """
+    """ Create a database connection to the configured database """
     connection = None
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",  # <-- CHANGE THIS to your MySQL username
-            password="newpassword",  # <-- CHANGE THIS to your MySQL password
-            database="hypeculture_db"
-        )
+        connection = instrument(open_connection())
         if connection.is_connected():
             # print("Successfully connected to the database")
             pass
     except Error as e:
-        print(f"Error while connecting to MySQL: {e}")
-    return connection
\ No newline at end of file
+        print(f"Error while connecting to the database: {e}")
+    return connection
+
+
+class PoolTimeoutError(Error):
+    """ Raised when no pooled connection becomes free within the checkout timeout. """
+
+
+class ConnectionPool:
+    """ A bounded pool of database connections with validate-on-borrow and idle eviction. """
+
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, idle_timeout=POOL_IDLE_TIMEOUT,
+                 validate_after=POOL_VALIDATE_AFTER, connect=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1.")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self._connect = connect or (lambda: instrument(open_connection()))
+
+        self._lock = threading.Condition()
+        self._idle = []          # list of (connection, returned_at), most recently returned last
+        self._size = 0           # idle + in use
+        self._closed = False
+
+        self._stats = {
+            "borrows": 0,
+            "timeouts": 0,
+            "created": 0,
+            "reconnects": 0,
+            "evicted": 0,
+            "discarded": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+        for _ in range(min_size):
+            conn = self._open()
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+                self._size += 1
+
+    def _open(self):
+        conn = self._connect()
+        with self._lock:
+            self._stats["created"] += 1
+        return conn
+
+    def _validate(self, conn, idle_for):
+        """ Cheap health check. Reconnects in place if the server went away. """
+        if idle_for < self.validate_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Error:
+            pass
+        try:
+            conn.reconnect(attempts=2, delay=0.5)
+            with self._lock:
+                self._stats["reconnects"] += 1
+            return True
+        except Error:
+            return False
+
+    def _evict_idle(self, now):
+        """ Close connections idle longer than idle_timeout, never dropping below min_size. Caller holds the lock. """
+        keep = []
+        stale = []
+        for conn, returned_at in self._idle:
+            if now - returned_at > self.idle_timeout and self._size - len(stale) > self.min_size:
+                stale.append(conn)
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+        self._size -= len(stale)
+        self._stats["evicted"] += len(stale)
+        return stale
+
+    def acquire(self, timeout=None):
+        """ Borrow a connection. Blocks up to `timeout` seconds, then raises PoolTimeoutError. """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            idle_for = 0.0
+            stale = []
+            with self._lock:
+                if self._closed:
+                    raise Error("Connection pool is closed.")
+                while True:
+                    now = time.monotonic()
+                    stale = self._evict_idle(now)
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        idle_for = now - returned_at
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1  # reserve the slot; opened outside the lock
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(f"No database connection available after {timeout:.1f}s "
+                                               f"(pool max_size={self.max_size}).")
+                    self._lock.wait(remaining)
+
+            for s in stale:
+                self._close_quietly(s)
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._validate(conn, idle_for):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._lock:
+                self._stats["borrows"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return conn
+
+    def release(self, conn):
+        """ Return a borrowed connection. Any open transaction is rolled back first. """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def _discard(self, conn):
+        """ Drop a broken connection and free its slot. """
+        self._close_quietly(conn)
+        with self._lock:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._lock.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """ Context manager that borrows a connection and always returns it. """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """ Snapshot of pool counters for sizing under load. """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["size"] = self._size
+            snapshot["idle"] = len(self._idle)
+            snapshot["in_use"] = self._size - len(self._idle)
+            snapshot["min_size"] = self.min_size
+            snapshot["max_size"] = self.max_size
+        borrows = snapshot["borrows"]
+        snapshot["wait_time_avg"] = snapshot["wait_time_total"] / borrows if borrows else 0.0
+        return snapshot
+
+    def close(self):
+        """ Close every idle connection. Borrowed ones are closed as they come back. """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+_pool = None
+_pool_settings = {}
+_pool_lock = threading.Lock()
+
+
+def configure_pool(**settings):
+    """ Set ConnectionPool keyword arguments used when the shared pool is first created. """
+    global _pool_settings
+    with _pool_lock:
+        if _pool is not None:
+            raise RuntimeError("The connection pool has already been created.")
+        _pool_settings = dict(settings)
+
+
+def get_pool():
+    """ Return the process-wide connection pool, creating it on first use. """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(**_pool_settings)
+        return _pool
+
+
+def close_pool():
+    """ Close the shared pool (if any) so the next get_pool() starts fresh. """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def print_pool_stats():
+    """ Prints the shared pool's counters. """
+    if _pool is None:
+        print("\nThe connection pool has not been started.")
+        return
+    s = _pool.stats()
+    print("\n--- 🔌 Connection Pool ---")
+    print(f"Size: {s['size']} (min {s['min_size']}, max {s['max_size']}) | In use: {s['in_use']} | Idle: {s['idle']}")
+    print(f"Borrows: {s['borrows']} | Timeouts: {s['timeouts']}")
+    print(f"Wait time: avg {s['wait_time_avg'] * 1000:.2f} ms, max {s['wait_time_max'] * 1000:.2f} ms")
+    print(f"Created: {s['created']} | Reconnects: {s['reconnects']} | Evicted idle: {s['evicted']} | Discarded: {s['discarded']}")
@@ -0,0 +1,222 @@
+# explain_check.py
+"""
+EXPLAIN regression check for the queries the views issue.
+
+Runs EXPLAIN on every statement in the queries.py registry, with the SQL the registry sends
+and the representative parameters in REGISTRY_PLANS, and on the other hot statements in
+OTHER_CHECKS. It reports any table accessed with a full scan (type = ALL) or any step that
+needs a filesort, unless the query explicitly allows it. A registry statement without an
+entry in REGISTRY_PLANS is reported too.
+Run it against a realistically sized database (see seed_data.py); on the five-row sample data
+MySQL will happily choose table scans because they are cheaper there.
+
+    python explain_check.py
+"""
+import sys
+from collections import namedtuple
+
+from db_connector import create_connection
+from order_history import history_page_query
+import queries
+
+# allow_full_scan: tables a query is meant to read completely (e.g. the tiny Categories list)
+PlanCheck = namedtuple("PlanCheck", ["name", "sql", "params", "allow_full_scan", "allow_filesort"])
+# Representative parameters for one queries.py registry entry: its params, the {ids} list, and
+# what its plan is allowed to do.
+RegistryPlan = namedtuple("RegistryPlan", ["params", "ids", "allow_full_scan", "allow_filesort"])
+
+
+def _check(name, sql, params=(), allow_full_scan=(), allow_filesort=False):
+    return PlanCheck(name, sql, params, tuple(allow_full_scan), allow_filesort)
+
+
+def _plan(params=(), ids=None, allow_full_scan=(), allow_filesort=False):
+    return RegistryPlan(tuple(params), ids, tuple(allow_full_scan), allow_filesort)
+
+
+# Every statement in queries.QUERIES is checked with the SQL the registry actually sends. An
+# entry without parameters here is reported as a problem, so a new statement can't skip the gate.
+REGISTRY_PLANS = {
+    "login": _plan(("alice@email.com", "pass123")),
+    "catalog.version": _plan(),
+    "catalog.categories": _plan(allow_full_scan=["Categories"]),
+    "catalog.products_in_category": _plan((1,)),
+    "offers.for_product": _plan((1,)),
+    "offers.best": _plan((1,)),
+    "offers.listing": _plan((1,)),
+    "offers.listings": _plan(ids=[1, 2]),
+    "cart.count": _plan((1,)),
+    "cart.lines": _plan((1,)),
+    "listing.details": _plan(ids=[1, 2]),
+    "checkout.cart": _plan((1,)),
+    "checkout.cart_available": _plan((1,)),
+    "checkout.lock_cart": _plan((1,)),
+    "checkout.lock_listings": _plan(ids=[1, 2]),
+    # EXPLAIN reports INSERT ... VALUES as type ALL on the target table; nothing is scanned.
+    "checkout.insert_address": _plan((1, "1 Main St", "Pune", "MH", "411001"), allow_full_scan=["Addresses"]),
+    "checkout.insert_order": _plan((1, 1, 100), allow_full_scan=["Orders"]),
+    # Stock holds: one listing's unexpired holds come from the covering index.
+    "holds.check": _plan((1,), ids=[1, 2]),
+    "holds.available": _plan((1,), ids=[1, 2]),
+    "holds.for_customer": _plan((1,)),
+    "history.items": _plan(ids=[1, 2, 3]),
+    "seller.listings": _plan((3,)),
+    "seller.listing_product": _plan((1, 3)),
+    # Change feed: tails read the log by primary key; the watch consumer finds watches by product.
+    "changes.after": _plan((0, 500)),
+    "changes.latest": _plan(),
+    "watches.for_products": _plan(ids=[1, 2]),
+    "alerts.unseen_count": _plan((1,)),
+}
+
+# Statements built outside the registry (keyset pages, analytics, background jobs).
+OTHER_CHECKS = [
+    _check("admin products page",
+           "SELECT product_id, product_name, brand, category_id FROM Products "
+           "WHERE product_id > %s ORDER BY product_id LIMIT %s", (0, 25)),
+    # The history pages are checked with the SQL order_history.py builds, not a copy of it.
+    _check("order history page", *history_page_query(1)),
+    _check("order history next page", *history_page_query(1, after=("2030-01-01", 1000000))),
+    _check("admin users page",
+           "SELECT user_id, first_name, last_name, email, user_role FROM Users "
+           "WHERE deleted_at IS NULL AND user_role = %s AND user_id > %s ORDER BY user_id LIMIT %s",
+           ("seller", 0, 25)),
+    _check("admin orders page",
+           "SELECT order_id, customer_id, total_amount, order_status, order_date FROM Orders "
+           "WHERE order_date >= %s AND order_id > %s ORDER BY order_id LIMIT %s", ("2024-01-01", 0, 25)),
+    # Analytics: range scans on the rollup primary keys; ranking the grouped totals needs a sort.
+    _check("analytics seller revenue",
+           """SELECT s.seller_id, u.first_name, u.last_name, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+              FROM SalesDailySeller s LEFT JOIN Users u ON s.seller_id = u.user_id
+              WHERE s.sale_date BETWEEN %s AND %s
+              GROUP BY s.seller_id, u.first_name, u.last_name
+              ORDER BY revenue DESC, s.seller_id LIMIT %s""", ("2024-12-01", "2024-12-31", 20),
+           allow_filesort=True),
+    _check("analytics top products",
+           """SELECT s.product_id, p.product_name, p.brand, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+              FROM SalesDailyProduct s LEFT JOIN Products p ON s.product_id = p.product_id
+              WHERE s.sale_date BETWEEN %s AND %s
+              GROUP BY s.product_id, p.product_name, p.brand
+              ORDER BY units DESC, s.product_id LIMIT %s""", ("2024-12-01", "2024-12-31", 20),
+           allow_filesort=True),
+    _check("analytics daily series",
+           "SELECT sale_date, SUM(units), SUM(revenue) FROM SalesDailyProduct "
+           "WHERE sale_date BETWEEN %s AND %s GROUP BY sale_date", ("2024-10-01", "2024-12-31")),
+    _check("rollup catch-up batch",
+           """SELECT DATE(o.order_date), i.seller_id, SUM(oi.quantity), SUM(oi.quantity * oi.price_per_unit)
+              FROM OrderItems oi
+              JOIN Orders o ON oi.order_id = o.order_id
+              JOIN Inventory i ON oi.inventory_id = i.inventory_id
+              WHERE oi.order_item_id > %s AND oi.order_item_id <= %s AND o.order_status <> 'Failed'
+              GROUP BY DATE(o.order_date), i.seller_id""", (0, 50000),
+           allow_filesort=True),
+    # Fulfilment: claiming and the queue metrics touch only pending jobs, via idx_outbox_status_available.
+    _check("fulfilment claim",
+           "SELECT job_id, order_id, step, attempts, created_at FROM OrderOutbox "
+           "WHERE status = 'pending' AND available_at <= NOW(3) ORDER BY available_at LIMIT %s", (10,)),
+    _check("fulfilment queue depth",
+           "SELECT step, COUNT(*) FROM OrderOutbox WHERE status = 'pending' GROUP BY step",
+           allow_filesort=True),
+    # Stock holds: the sweeper reads expiries in order.
+    _check("hold sweep batch",
+           "SELECT reservation_id FROM StockReservations WHERE expires_at <= NOW(3) "
+           "ORDER BY expires_at LIMIT %s", (500,)),
+    # User purge: removed users come off idx_users_purge; each batch is an index lookup on the user's rows.
+    _check("purge pending users",
+           "SELECT user_id FROM Users WHERE purged_at IS NULL AND deleted_at IS NOT NULL "
+           "ORDER BY deleted_at LIMIT %s", (100,)),
+    _check("purge carts holding a seller's listings",
+           """SELECT c.cart_id FROM Cart c JOIN Inventory i ON c.inventory_id = i.inventory_id
+              WHERE i.seller_id = %s LIMIT %s""", (3, 200)),
+    _check("purge unsold listings",
+           """SELECT i.inventory_id FROM Inventory i
+              WHERE i.seller_id = %s AND NOT EXISTS (SELECT 1 FROM OrderItems oi WHERE oi.inventory_id = i.inventory_id)
+              LIMIT %s""", (3, 200)),
+    # Archival walks Orders by primary key; history finds a customer's archive segments by index.
+    _check("archive batch",
+           "SELECT order_id, customer_id, order_date FROM Orders "
+           "WHERE order_id > %s AND order_date < %s AND order_status IN ('Delivered', 'Failed') "
+           "ORDER BY order_id LIMIT %s", (0, "2024-01-01", 1000)),
+    _check("archive segments for customer",
+           "SELECT archive_file, member_offset, member_length, last_order_date FROM OrderArchiveIndex "
+           "WHERE customer_id = %s ORDER BY last_order_date DESC", (1,)),
+]
+
+
+def registry_checks():
+    """ ([PlanCheck] for every registry statement, [(name, problem)] for entries without plan parameters). """
+    checks, problems = [], []
+    for name in queries.QUERIES:
+        plan = REGISTRY_PLANS.get(name)
+        if plan is None:
+            problems.append((name, "no representative parameters in explain_check.REGISTRY_PLANS"))
+            continue
+        sql, params = queries.statement(name, plan.params, plan.ids)
+        checks.append(PlanCheck(name, sql, params, plan.allow_full_scan, plan.allow_filesort))
+    for name in REGISTRY_PLANS:
+        if name not in queries.QUERIES:
+            problems.append((name, "in explain_check.REGISTRY_PLANS but not in the queries.py registry"))
+    return checks, problems
+
+
+def explain(connection, sql, params):
+    """ Returns the EXPLAIN rows for a query as dicts. """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("EXPLAIN " + sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def all_checks():
+    """ ([PlanCheck] to run: the whole registry plus OTHER_CHECKS, [(name, problem)] found before running). """
+    checks, problems = registry_checks()
+    return checks + OTHER_CHECKS, problems
+
+
+def check_plans(connection, checks=None):
+    """ Returns a list of (query name, problem) for every plan that regressed. """
+    problems = []
+    if checks is None:
+        checks, problems = all_checks()
+    for check in checks:
+        try:
+            rows = explain(connection, check.sql, check.params)
+        except Exception as e:
+            problems.append((check.name, f"EXPLAIN failed: {e}"))
+            continue
+        for row in rows:
+            table = row.get("table")
+            extra = row.get("Extra") or ""
+            if row.get("type") == "ALL" and table not in check.allow_full_scan:
+                problems.append((check.name, f"full table scan on {table} (rows ~{row.get('rows')})"))
+            if "Using filesort" in extra and not check.allow_filesort:
+                problems.append((check.name, f"filesort on {table}"))
+    connection.commit()
+    return problems
+
+
+def print_report(problems, checks=None):
+    print(f"\nEXPLAIN check: {len(checks if checks is not None else all_checks()[0])} queries")
+    if not problems:
+        print("OK: no full table scans or filesorts outside the allowed list.")
+        return
+    for name, problem in problems:
+        print(f"REGRESSION  {name}: {problem}")
+
+
+def main():
+    connection = create_connection()
+    if not connection:
+        sys.exit(1)
+    try:
+        problems = check_plans(connection)
+    finally:
+        connection.close()
+    print_report(problems)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
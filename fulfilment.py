@@ -0,0 +1,485 @@
+# fulfilment.py
+"""
+Background payment and fulfilment for placed orders.
+
+Checkout writes an OrderOutbox row (step 'pay') in the same transaction as the order, so
+every committed order has its job and a rolled-back order has none. Workers then move
+the order along:
+
+    Placed --pay--> Paid --ship--> Shipped --deliver--> Delivered
+      \\--(payment declined, or still failing after MAX_ATTEMPTS)--> Failed
+
+A Failed order puts its stock back on sale and is taken out of the sales rollups.
+
+Every step is one outbox row, and finishing a step queues the next one. Rules:
+
+  * Concurrent workers: a worker claims due rows with SELECT ... FOR UPDATE SKIP LOCKED and
+    pushes their available_at forward by CLAIM_LEASE in the same short transaction. Other
+    workers skip those rows. If a worker dies, its rows become due again when the lease ends.
+  * Idempotency: (order_id, step) is unique, so a step is queued at most once. A step only
+    applies while the order is still in the state the step starts from, checked under a
+    row lock, so re-running a job that already took effect changes nothing. Payment uses
+    the order id as its idempotency key, so a retried charge never charges twice.
+  * Failures: a temporary error sets the job back with exponential backoff. After
+    MAX_ATTEMPTS a payment fails the order; a shipping step is marked 'dead' for an operator.
+
+    python fulfilment.py --workers 4                 # run workers in the foreground
+    python fulfilment.py --backfill                  # queue jobs for orders that have none
+    python fulfilment.py --workers 4 --decline-rate 0.2   # exercise the Failed path
+"""
+import argparse
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from mysql.connector import Error
+
+from db_connector import add_backend_arguments, close_pool, configure_backend, get_pool
+import order_book
+from sales_rollups import retract_order
+from sql_dialect import dialect
+
+FULFILMENT_WORKERS = 2
+POLL_INTERVAL = 0.5          # seconds an idle worker waits before looking for due jobs again
+CLAIM_BATCH = 10             # jobs claimed per round trip
+CLAIM_LEASE = 30.0           # seconds a claimed job is hidden from other workers
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0       # seconds; doubled on every retry
+
+# step -> (order status it starts from, status it leads to, next step)
+STEPS = {
+    "pay": ("Placed", "Paid", "ship"),
+    "ship": ("Paid", "Shipped", "deliver"),
+    "deliver": ("Shipped", "Delivered", None),
+}
+# Seconds between finishing one step and the next one becoming due (a stand-in for the warehouse and carrier).
+STEP_DELAYS = {"pay": 0.0, "ship": 5.0, "deliver": 30.0}
+
+Job = namedtuple("Job", ["job_id", "order_id", "step", "attempts", "created_at"])
+
+
+class PaymentDeclined(Exception):
+    """ The processor refused the charge. Final: the order fails. """
+
+
+class PaymentUnavailable(Exception):
+    """ The processor could not be reached. Temporary: the job is retried. """
+
+
+class FakePaymentProcessor:
+    """ Local stand-in for a card processor, deterministic for a given seed.
+
+    charge() sleeps `latency`, then declines `decline_rate` of orders and fails with
+    PaymentUnavailable for `outage_rate` of calls. Results are remembered per idempotency
+    key: a repeated charge returns the first outcome and is counted in stats["duplicates"].
+    """
+
+    def __init__(self, decline_rate=0.02, outage_rate=0.01, latency=0.05, seed=None):
+        self.decline_rate = decline_rate
+        self.outage_rate = outage_rate
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._results = {}
+        self._lock = threading.Lock()
+        self.stats = {"charges": 0, "declines": 0, "outages": 0, "duplicates": 0}
+
+    def charge(self, idempotency_key, amount):
+        """ Returns a payment reference, or raises PaymentDeclined / PaymentUnavailable. """
+        with self._lock:
+            if idempotency_key in self._results:
+                self.stats["duplicates"] += 1
+                return self._outcome(self._results[idempotency_key])
+            roll = self._rng.random()
+        time.sleep(self.latency)
+        with self._lock:
+            if idempotency_key in self._results:   # a concurrent retry got there first
+                self.stats["duplicates"] += 1
+                return self._outcome(self._results[idempotency_key])
+            if roll < self.outage_rate:
+                self.stats["outages"] += 1
+                raise PaymentUnavailable("payment processor timed out")
+            if roll < self.outage_rate + self.decline_rate:
+                self.stats["declines"] += 1
+                result = PaymentDeclined(f"card declined for {amount}")
+            else:
+                self.stats["charges"] += 1
+                result = f"fake_{uuid.uuid4().hex[:16]}"
+            self._results[idempotency_key] = result
+            return self._outcome(result)
+
+    @staticmethod
+    def _outcome(result):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+_processor = None
+
+
+def get_payment_processor():
+    """ The processor workers charge; a FakePaymentProcessor unless one was configured. """
+    global _processor
+    if _processor is None:
+        _processor = FakePaymentProcessor()
+    return _processor
+
+
+def configure_payment_processor(processor):
+    """ Use `processor` (anything with charge(idempotency_key, amount)) for payments. """
+    global _processor
+    _processor = processor
+
+
+_stats = {"processed": {step: 0 for step in STEPS}, "skipped": 0, "retries": 0, "failed_orders": 0, "dead": 0,
+          "busy_time": 0.0, "busy_time_max": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+# ---------------------------------
+# Queueing
+# ---------------------------------
+
+def enqueue_step(cursor, order_id, step, delay=0.0):
+    """ Queues `step` for an order inside the caller's transaction. A step already queued is left alone. """
+    available_at, delay = dialect().now_plus(delay)
+    cursor.execute(
+        f"INSERT IGNORE INTO OrderOutbox (order_id, step, available_at) VALUES (%s, %s, {available_at})",
+        (order_id, step, delay)
+    )
+
+
+def backfill(connection):
+    """ Queues the next step for every Placed/Paid/Shipped order without one (e.g. from before the pipeline). """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT IGNORE INTO OrderOutbox (order_id, step)
+            SELECT order_id, CASE order_status WHEN 'Placed' THEN 'pay' WHEN 'Paid' THEN 'ship' ELSE 'deliver' END
+            FROM Orders
+            WHERE order_status IN ('Placed', 'Paid', 'Shipped')
+            """
+        )
+        queued = cursor.rowcount
+        connection.commit()
+        return queued
+    finally:
+        cursor.close()
+
+
+# ---------------------------------
+# Workers
+# ---------------------------------
+
+def _claim(connection, worker_id, batch):
+    """ Takes up to `batch` due jobs for this worker. Returns [Job]. """
+    cursor = connection.cursor()
+    try:
+        if connection.in_transaction:
+            connection.commit()
+        connection.start_transaction()
+        cursor.execute(
+            """
+            SELECT job_id, order_id, step, attempts, created_at FROM OrderOutbox
+            WHERE status = 'pending' AND available_at <= NOW(3)
+            ORDER BY available_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (batch,)
+        )
+        rows = cursor.fetchall()
+        if rows:
+            job_ids = [row[0] for row in rows]
+            placeholders = ", ".join(["%s"] * len(job_ids))
+            lease_end, lease = dialect().now_plus(CLAIM_LEASE)
+            cursor.execute(
+                f"UPDATE OrderOutbox SET attempts = attempts + 1, claimed_by = %s, "
+                f"available_at = {lease_end} WHERE job_id IN ({placeholders})",
+                [worker_id, lease] + job_ids
+            )
+        connection.commit()
+        return [Job(job_id, order_id, step, attempts + 1, created_at)
+                for job_id, order_id, step, attempts, created_at in rows]
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _lock_order(cursor, order_id):
+    cursor.execute("SELECT order_status, total_amount FROM Orders WHERE order_id = %s FOR UPDATE", (order_id,))
+    return cursor.fetchone() or (None, None)
+
+
+def _finish_job(cursor, job, detail=None, status="done"):
+    cursor.execute("UPDATE OrderOutbox SET status = %s, detail = %s, finished_at = NOW(3) WHERE job_id = %s",
+                   (status, detail, job.job_id))
+
+
+def _advance(connection, job, detail=None):
+    """ Moves the order one state forward and queues the next step, if it is still where the step starts. """
+    from_status, to_status, next_step = STEPS[job.step]
+    cursor = connection.cursor()
+    try:
+        connection.start_transaction()
+        status, _ = _lock_order(cursor, job.order_id)
+        if status == from_status:
+            cursor.execute("UPDATE Orders SET order_status = %s WHERE order_id = %s", (to_status, job.order_id))
+            if next_step:
+                enqueue_step(cursor, job.order_id, next_step, STEP_DELAYS[next_step])
+        else:
+            _count("skipped")   # already done by an earlier run of this job
+        _finish_job(cursor, job, detail)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def fail_order(connection, job, reason):
+    """ Marks a Placed order Failed, puts its stock back and takes it out of the sales rollups. """
+    cursor = connection.cursor()
+    try:
+        connection.start_transaction()
+        status, _ = _lock_order(cursor, job.order_id)
+        restored = []
+        if status == "Placed":
+            cursor.execute("UPDATE Orders SET order_status = 'Failed' WHERE order_id = %s", (job.order_id,))
+            cursor.execute(
+                """
+                UPDATE Inventory
+                SET stock_quantity = stock_quantity + (
+                    SELECT SUM(oi.quantity) FROM OrderItems oi
+                    WHERE oi.order_id = %s AND oi.inventory_id = Inventory.inventory_id)
+                WHERE inventory_id IN (SELECT inventory_id FROM OrderItems WHERE order_id = %s)
+                """,
+                (job.order_id, job.order_id)
+            )
+            cursor.execute("SELECT inventory_id FROM OrderItems WHERE order_id = %s", (job.order_id,))
+            restored = [row[0] for row in cursor.fetchall()]
+            retract_order(cursor, job.order_id)
+        _finish_job(cursor, job, str(reason)[:255])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    if restored:
+        _count("failed_orders")
+        for inventory_id in restored:
+            try:
+                order_book.refresh_listing(connection, inventory_id)
+            except Error:
+                pass  # the stock is back; the best-offer summary catches up on the next listing write
+
+
+def _retry_later(connection, job, error):
+    """ Backs off a job after a temporary error, or gives up on it after MAX_ATTEMPTS. """
+    if job.attempts >= MAX_ATTEMPTS:
+        if job.step == "pay":
+            fail_order(connection, job, f"payment failed after {job.attempts} attempts: {error}")
+        else:
+            cursor = connection.cursor()
+            try:
+                _finish_job(cursor, job, str(error)[:255], status="dead")
+                connection.commit()
+            finally:
+                cursor.close()
+            _count("dead")
+        return
+    available_at, delay = dialect().now_plus(RETRY_BASE_DELAY * (2 ** (job.attempts - 1)))
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"UPDATE OrderOutbox SET available_at = {available_at}, detail = %s WHERE job_id = %s",
+                       (delay, str(error)[:255], job.job_id))
+        connection.commit()
+    finally:
+        cursor.close()
+    _count("retries")
+
+
+def process_job(connection, job, processor=None):
+    """ Runs one claimed job to completion (or schedules its retry). """
+    started = time.perf_counter()
+    try:
+        detail = None
+        if job.step == "pay":
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT order_status, total_amount FROM Orders WHERE order_id = %s", (job.order_id,))
+                status, amount = cursor.fetchone() or (None, None)
+                connection.commit()
+            finally:
+                cursor.close()
+            if status == "Placed":
+                try:
+                    detail = (processor or get_payment_processor()).charge(f"order-{job.order_id}", amount)
+                except PaymentDeclined as e:
+                    fail_order(connection, job, e)
+                    return
+        _advance(connection, job, detail)
+        with _stats_lock:
+            _stats["processed"][job.step] += 1
+    except (PaymentUnavailable, Error) as e:
+        try:
+            connection.rollback()
+            _retry_later(connection, job, e)
+        except Error:
+            pass  # the lease runs out and another worker picks the job up
+    finally:
+        elapsed = time.perf_counter() - started
+        with _stats_lock:
+            _stats["busy_time"] += elapsed
+            _stats["busy_time_max"] = max(_stats["busy_time_max"], elapsed)
+
+
+def run_once(connection, worker_id, processor=None, batch=CLAIM_BATCH):
+    """ Claims and processes one batch of due jobs. Returns how many there were. """
+    jobs = _claim(connection, worker_id, batch)
+    for job in jobs:
+        process_job(connection, job, processor)
+    return len(jobs)
+
+
+class FulfilmentWorkers:
+    """ A set of worker threads, each borrowing a pooled connection per batch. """
+
+    def __init__(self, pool, count=FULFILMENT_WORKERS, processor=None):
+        self.pool = pool
+        self.count = count
+        self.processor = processor
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        prefix = f"{socket.gethostname()}:{uuid.uuid4().hex[:6]}"
+        for i in range(self.count):
+            thread = threading.Thread(target=self._run, args=(f"{prefix}:{i}",), name=f"fulfilment-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                with self.pool.connection() as connection:
+                    done = run_once(connection, worker_id, self.processor)
+            except Exception as e:
+                print(f"⚠️  Fulfilment worker {worker_id}: {e}")
+                done = 0
+            if not done:
+                self._stop.wait(POLL_INTERVAL)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+# ---------------------------------
+# Metrics
+# ---------------------------------
+
+def worker_stats():
+    """ This process's counters. """
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["processed"] = dict(_stats["processed"])
+    total = sum(stats["processed"].values())
+    stats["busy_time_avg"] = stats["busy_time"] / total if total else 0.0
+    return stats
+
+
+def pipeline_metrics(connection):
+    """ Queue depth and lag per step, from the outbox itself (so across every worker process).
+
+    {step: {"queued", "due", "lag"}} plus "dead". `due` counts jobs whose time has come, and
+    `lag` is how long the oldest of them has been waiting, in seconds.
+    """
+    cursor = connection.cursor()
+    try:
+        lag = dialect().seconds_between("MIN(CASE WHEN available_at <= NOW(3) THEN available_at END)", "NOW(3)")
+        cursor.execute(
+            f"""
+            SELECT step, COUNT(*), SUM(available_at <= NOW(3)), {lag}
+            FROM OrderOutbox
+            WHERE status = 'pending'
+            GROUP BY step
+            """
+        )
+        metrics = {step: {"queued": 0, "due": 0, "lag": 0.0} for step in STEPS}
+        for step, queued, due, lag in cursor.fetchall():
+            metrics[step] = {"queued": queued, "due": int(due or 0), "lag": float(lag or 0)}
+        cursor.execute("SELECT COUNT(*) FROM OrderOutbox WHERE status = 'dead'")
+        metrics["dead"] = cursor.fetchone()[0]
+        connection.commit()
+        return metrics
+    finally:
+        cursor.close()
+
+
+def print_pipeline_metrics(connection):
+    metrics = pipeline_metrics(connection)
+    stats = worker_stats()
+    print("\n--- 📦 Payment & Fulfilment Pipeline ---")
+    for step in STEPS:
+        m = metrics[step]
+        print(f"{step:<8} queued: {m['queued']:>6} | due now: {m['due']:>6} | oldest due waiting: {m['lag']:.1f}s")
+    print(f"Dead jobs (need an operator): {metrics['dead']}")
+    processed = ", ".join(f"{step} {count}" for step, count in stats["processed"].items())
+    print(f"This process: processed {processed} | failed orders: {stats['failed_orders']} | "
+          f"retries: {stats['retries']} | no-op re-runs: {stats['skipped']}")
+    print(f"Job time: avg {stats['busy_time_avg'] * 1000:.1f} ms, max {stats['busy_time_max'] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=FULFILMENT_WORKERS)
+    parser.add_argument("--backfill", action="store_true", help="queue jobs for orders that have none, then exit")
+    parser.add_argument("--decline-rate", type=float, default=None, help="fake processor: share of declined payments")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between metric reports")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    pool = get_pool()
+    try:
+        if args.backfill:
+            with pool.connection() as connection:
+                print(f"Queued {backfill(connection)} order(s).")
+            return
+        if args.decline_rate is not None:
+            configure_payment_processor(FakePaymentProcessor(decline_rate=args.decline_rate))
+        workers = FulfilmentWorkers(pool, args.workers).start()
+        print(f"{args.workers} fulfilment worker(s) running. Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(args.report_every)
+                with pool.connection() as connection:
+                    print_pipeline_metrics(connection)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            workers.stop()
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
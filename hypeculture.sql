@@ -14,7 +14,13 @@ CREATE TABLE Users (
     email VARCHAR(100) UNIQUE NOT NULL,
     password_hash VARCHAR(255) NOT NULL, -- In a real app, hash passwords!
     user_role ENUM('customer', 'seller', 'admin') NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Removal (user_purge.py): deleted_at hides the user at once; purged_at is set once the
+    -- background purger has cleared their rows and kept the user only as order history's seller/buyer.
+    deleted_at TIMESTAMP NULL DEFAULT NULL,
+    purged_at TIMESTAMP NULL DEFAULT NULL,
+    -- The purger finds removed users still waiting for it, oldest first
+    INDEX idx_users_purge (purged_at, deleted_at)
 );
 
 -- Categories Table: For shoe types like 'Sneakers', 'Boots', etc.
@@ -40,7 +46,9 @@ CREATE TABLE Inventory (
     price DECIMAL(10, 2) NOT NULL,
     stock_quantity INT NOT NULL,
     FOREIGN KEY (seller_id) REFERENCES Users(user_id),
-    FOREIGN KEY (product_id) REFERENCES Products(product_id)
+    FOREIGN KEY (product_id) REFERENCES Products(product_id),
+    -- Covers the in-stock offers lookup for a product without touching the table rows
+    INDEX idx_inventory_product_stock_price (product_id, stock_quantity, price, seller_id)
 );
 
 -- Addresses Table: To store customer shipping addresses
@@ -63,7 +71,9 @@ CREATE TABLE Orders (
     total_amount DECIMAL(10, 2),
     order_status VARCHAR(20) DEFAULT 'Placed',
     FOREIGN KEY (customer_id) REFERENCES Users(user_id),
-    FOREIGN KEY (address_id) REFERENCES Addresses(address_id)
+    FOREIGN KEY (address_id) REFERENCES Addresses(address_id),
+    -- Order history: one customer's orders, newest first, paged on (order_date, order_id)
+    INDEX idx_orders_customer_date (customer_id, order_date)
 );
 
 -- OrderItems Table: A junction table for items within an order
@@ -74,7 +84,8 @@ CREATE TABLE OrderItems (
     quantity INT NOT NULL,
     price_per_unit DECIMAL(10, 2) NOT NULL,
     FOREIGN KEY (order_id) REFERENCES Orders(order_id),
-    FOREIGN KEY (inventory_id) REFERENCES Inventory(inventory_id)
+    FOREIGN KEY (inventory_id) REFERENCES Inventory(inventory_id),
+    INDEX idx_orderitems_order (order_id)
 );
 
 -- Cart Table: To hold items before checkout
@@ -85,7 +96,175 @@ CREATE TABLE Cart (
     quantity INT NOT NULL,
     added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (customer_id) REFERENCES Users(user_id),
-    FOREIGN KEY (inventory_id) REFERENCES Inventory(inventory_id)
+    FOREIGN KEY (inventory_id) REFERENCES Inventory(inventory_id),
+    -- One row per customer and listing; adding the same listing again updates the quantity
+    UNIQUE INDEX uq_cart_customer_inventory (customer_id, inventory_id)
+);
+
+-- ProductBestOffer Table: Cheapest in-stock offer and book depth per product. Recomputed from
+-- Inventory by order_book.py after every listing change and sale; read on cold start instead of Inventory.
+CREATE TABLE ProductBestOffer (
+    product_id INT PRIMARY KEY,
+    best_inventory_id INT,
+    best_seller_id INT,
+    best_first_name VARCHAR(50),
+    best_last_name VARCHAR(50),
+    best_price DECIMAL(10, 2),
+    best_stock INT,
+    offer_count INT NOT NULL DEFAULT 0,
+    total_stock INT NOT NULL DEFAULT 0,
+    -- Bumped on every recompute, so a process can tell its in-memory book is out of date
+    version BIGINT NOT NULL DEFAULT 0,
+    -- Set by bulk writes (seller imports); the next read recomputes the row
+    stale BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (product_id) REFERENCES Products(product_id)
+);
+
+-- CatalogVersion Table: A single counter bumped by every Categories/Products write, so each
+-- app process can tell when its catalog cache is stale.
+CREATE TABLE CatalogVersion (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+-- SalesDailySeller / SalesDailyProduct Tables: units and revenue per day, pre-aggregated for the
+-- admin analytics screen. Maintained by sales_rollups.py from OrderItems past the high-water
+-- mark in RollupState, never written by checkout itself.
+CREATE TABLE SalesDailySeller (
+    sale_date DATE NOT NULL,
+    seller_id INT NOT NULL,
+    units INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, seller_id)
+);
+
+CREATE TABLE SalesDailyProduct (
+    sale_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    units INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, product_id)
+);
+
+CREATE TABLE RollupState (
+    rollup_name VARCHAR(50) PRIMARY KEY,
+    last_order_item_id INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- OrderOutbox Table: Payment and fulfilment jobs, one per order and step (pay, ship, deliver).
+-- Checkout writes the 'pay' job in the order's own transaction; fulfilment.py workers claim
+-- due jobs and move the order's status along.
+CREATE TABLE OrderOutbox (
+    job_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    order_id INT NOT NULL,
+    step VARCHAR(10) NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',   -- pending, done or dead
+    attempts INT NOT NULL DEFAULT 0,
+    available_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    claimed_by VARCHAR(64),
+    detail VARCHAR(255),                             -- payment reference, or the last error
+    created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    finished_at TIMESTAMP(3) NULL,
+    FOREIGN KEY (order_id) REFERENCES Orders(order_id),
+    UNIQUE INDEX uq_outbox_order_step (order_id, step),
+    -- Workers claim pending jobs oldest-due first
+    INDEX idx_outbox_status_available (status, available_at)
+);
+
+-- OrderArchiveIndex Table: Where archived orders live (order_archive.py). One row per gzip member
+-- of an archive file, holding one customer's orders from one archival batch.
+CREATE TABLE OrderArchiveIndex (
+    segment_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    archive_file VARCHAR(100) NOT NULL,
+    member_offset BIGINT NOT NULL,
+    member_length INT NOT NULL,
+    order_count INT NOT NULL,
+    first_order_date TIMESTAMP NOT NULL,
+    last_order_date TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- A customer's segments, newest first
+    INDEX idx_archive_customer_date (customer_id, last_order_date)
+);
+
+-- StockReservations Table: Stock held for a customer's cart line until expires_at (stock_holds.py).
+-- Adding to the cart takes or extends the hold; checkout turns it into the sale. There are no
+-- foreign keys: a hold on a deleted listing or user just runs out and is swept.
+CREATE TABLE StockReservations (
+    reservation_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    inventory_id INT NOT NULL,
+    quantity INT NOT NULL,
+    expires_at TIMESTAMP(3) NOT NULL,
+    created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    -- One hold per cart line
+    UNIQUE INDEX uq_reservation_customer_inventory (customer_id, inventory_id),
+    -- Sums a listing's unexpired holds from the index alone
+    INDEX idx_reservation_inventory_expiry (inventory_id, expires_at, quantity),
+    -- The sweeper finds expired holds oldest first
+    INDEX idx_reservation_expiry (expires_at)
+);
+
+-- InventoryAvailability View: what a listing can still promise, i.e. its stock less every unexpired hold.
+CREATE VIEW InventoryAvailability AS
+SELECT i.inventory_id, i.stock_quantity,
+       i.stock_quantity - COALESCE((SELECT SUM(r.quantity) FROM StockReservations r
+                                    WHERE r.inventory_id = i.inventory_id AND r.expires_at > NOW(3)), 0)
+           AS available_quantity
+FROM Inventory i;
+
+-- ChangeLog Table: Append-only feed of Inventory, Products and Orders changes, written by the
+-- triggers below in the changing transaction (change_feed.py). seq only grows; consumers tail it.
+CREATE TABLE ChangeLog (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    entity VARCHAR(10) NOT NULL,          -- inventory, product or order
+    entity_id INT NOT NULL,
+    op VARCHAR(6) NOT NULL,               -- insert, update or delete
+    product_id INT,                       -- the listing's product, or the product itself
+    price_before DECIMAL(10, 2),
+    price_after DECIMAL(10, 2),
+    stock_before INT,
+    stock_after INT,
+    order_status VARCHAR(20),             -- an order's status after the change
+    changed_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)
+);
+
+-- ChangeConsumers Table: How far each named durable consumer has read ChangeLog.
+CREATE TABLE ChangeConsumers (
+    consumer VARCHAR(50) PRIMARY KEY,
+    last_seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)
+);
+
+-- PriceWatches Table: A customer waiting for a shoe to be offered below target_price (price_watch.py).
+CREATE TABLE PriceWatches (
+    watch_id INT AUTO_INCREMENT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    product_id INT NOT NULL,
+    target_price DECIMAL(10, 2) NOT NULL,
+    last_alert_price DECIMAL(10, 2),      -- later alerts must beat this
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (customer_id) REFERENCES Users(user_id),
+    FOREIGN KEY (product_id) REFERENCES Products(product_id),
+    UNIQUE INDEX uq_watch_customer_product (customer_id, product_id),
+    -- The watch consumer finds the watches on the products that just got cheaper
+    INDEX idx_watch_product (product_id)
+);
+
+-- PriceAlerts Table: A price drop found for a watch, shown to the customer once.
+CREATE TABLE PriceAlerts (
+    alert_id INT AUTO_INCREMENT PRIMARY KEY,
+    customer_id INT NOT NULL,
+    product_id INT NOT NULL,
+    inventory_id INT NOT NULL,
+    old_price DECIMAL(10, 2),
+    new_price DECIMAL(10, 2) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    seen_at TIMESTAMP NULL DEFAULT NULL,
+    -- A customer's alerts, unseen first and newest first
+    INDEX idx_alert_customer (customer_id, seen_at, alert_id)
 );
 
 -- ---------------------------------
@@ -100,6 +279,10 @@ INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUE
 ('Diana', 'Kicks', 'diana@seller.com', 'pass123', 'seller'),
 ('Edward', 'Admin', 'admin@hypeculture.com', 'adminpass', 'admin');
 
+-- Catalog version counter (exactly one row)
+INSERT INTO CatalogVersion (id, version) VALUES (1, 0);
+INSERT INTO RollupState (rollup_name) VALUES ('sales_daily');
+
 -- Categories
 INSERT INTO Categories (category_name) VALUES ('Sneakers'), ('Boots'), ('Formal Shoes');
 
@@ -121,107 +304,196 @@ INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES
 -- Stored Procedures and Functions
 -- ---------------------------------
 
--- Procedure to add an item to a customer's cart
+-- The app calls these when checkout_engine.CHECKOUT_MODE = "server": a whole checkout is
+-- one CALL instead of a round trip per statement. They follow the same rules as the
+-- client-side path in checkout_engine.py, so either mode can serve the same database.
+
+-- Procedure to add an item to a customer's cart (one atomic upsert on uq_cart_customer_inventory).
+-- With p_hold_seconds > 0 the whole cart line is also held for that long (StockReservations),
+-- or the add fails with 'stock unavailable <inventory_id> <wanted> <available>' and the caller
+-- rolls it back.
 DELIMITER $$
-CREATE PROCEDURE AddToCart(IN p_customer_id INT, IN p_inventory_id INT, IN p_quantity INT)
+CREATE PROCEDURE AddToCart(IN p_customer_id INT, IN p_inventory_id INT, IN p_quantity INT, IN p_hold_seconds INT)
 BEGIN
-    DECLARE existing_quantity INT DEFAULT 0;
-
-    -- Check if the item already exists in the cart
-    SELECT quantity INTO existing_quantity
-    FROM Cart
-    WHERE customer_id = p_customer_id AND inventory_id = p_inventory_id;
-
-    IF existing_quantity > 0 THEN
-        -- Update quantity if item is already in cart
-        UPDATE Cart
-        SET quantity = quantity + p_quantity
-        WHERE customer_id = p_customer_id AND inventory_id = p_inventory_id;
-    ELSE
-        -- Insert new item into cart
-        INSERT INTO Cart(customer_id, inventory_id, quantity)
-        VALUES (p_customer_id, p_inventory_id, p_quantity);
+    DECLARE v_stock INT;
+    DECLARE v_wanted INT;
+    DECLARE v_available INT;
+    DECLARE v_message VARCHAR(128);
+
+    IF p_quantity IS NULL OR p_quantity <= 0 THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Quantity must be positive.';
+    END IF;
+
+    INSERT INTO Cart (customer_id, inventory_id, quantity)
+    VALUES (p_customer_id, p_inventory_id, p_quantity)
+    ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity);
+
+    IF p_hold_seconds > 0 THEN
+        -- Cart row, then listing: the same lock order as checkout.
+        SELECT stock_quantity INTO v_stock FROM Inventory WHERE inventory_id = p_inventory_id FOR UPDATE;
+
+        -- The line may hold what is left after other buyers' unexpired holds; nothing of a
+        -- removed seller's listing can be held.
+        SELECT c.quantity,
+               CASE WHEN EXISTS (SELECT 1 FROM Users u WHERE u.user_id = i.seller_id AND u.deleted_at IS NULL)
+                    THEN a.available_quantity + COALESCE(r.quantity, 0) ELSE 0 END
+        INTO v_wanted, v_available
+        FROM Cart c
+        JOIN Inventory i ON i.inventory_id = c.inventory_id
+        JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+        LEFT JOIN StockReservations r
+          ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
+        WHERE c.customer_id = p_customer_id AND c.inventory_id = p_inventory_id;
+
+        IF v_wanted > v_available THEN
+            SET v_message = CONCAT_WS(' ', 'stock unavailable', p_inventory_id, v_wanted, GREATEST(v_available, 0));
+            SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_message;
+        END IF;
+
+        INSERT INTO StockReservations (customer_id, inventory_id, quantity, expires_at)
+        VALUES (p_customer_id, p_inventory_id, v_wanted, NOW(3) + INTERVAL p_hold_seconds SECOND)
+        ON DUPLICATE KEY UPDATE quantity = VALUES(quantity), expires_at = VALUES(expires_at);
     END IF;
 END$$
 DELIMITER ;
 
 
--- Procedure to place an order from the cart
+-- Procedure to place an order from the cart.
+-- Returns two result sets:
+--   1. the locked cart: (inventory_id, quantity, price, available), one row per line
+--   2. one row (status, order_id, total_amount); status is placed, partial, failed or empty
+-- A line's available is the stock less other buyers' unexpired holds (none if the seller was
+-- removed), and the line is short when its quantity exceeds that. Short lines stay in the cart; with p_allow_partial = FALSE
+-- any short line fails the whole order and nothing changes. Holds on ordered lines are released.
 DELIMITER $$
 CREATE PROCEDURE PlaceOrder(
-    IN p_customer_id INT, 
-    IN p_first_name VARCHAR(50), 
-    IN p_last_name VARCHAR(50), 
-    IN p_address_line1 VARCHAR(255), 
-    IN p_city VARCHAR(100), 
-    IN p_state VARCHAR(100), 
-    IN p_postal_code VARCHAR(20)
+    IN p_customer_id INT,
+    IN p_address_line1 VARCHAR(255),
+    IN p_city VARCHAR(100),
+    IN p_state VARCHAR(100),
+    IN p_postal_code VARCHAR(20),
+    IN p_allow_partial BOOLEAN
 )
-BEGIN
+place_order: BEGIN
     DECLARE v_address_id INT;
-    DECLARE v_order_id INT;
+    DECLARE v_order_id INT DEFAULT NULL;
+    DECLARE v_lines INT DEFAULT 0;
+    DECLARE v_short INT DEFAULT 0;
     DECLARE v_total_amount DECIMAL(10, 2) DEFAULT 0;
-    DECLARE finished INTEGER DEFAULT 0;
-    DECLARE v_inventory_id INT;
-    DECLARE v_quantity INT;
-    DECLARE v_price_per_unit DECIMAL(10, 2);
-
-    -- Cursor to iterate through cart items
-    DECLARE cart_cursor CURSOR FOR
-        SELECT c.inventory_id, c.quantity, i.price
-        FROM Cart c
-        JOIN Inventory i ON c.inventory_id = i.inventory_id
-        WHERE c.customer_id = p_customer_id;
-        
-    DECLARE CONTINUE HANDLER FOR NOT FOUND SET finished = 1;
-
-    -- Add or get address
-    INSERT INTO Addresses(user_id, address_line1, city, state, postal_code)
-    VALUES(p_customer_id, p_address_line1, p_city, p_state, p_postal_code);
-    SET v_address_id = LAST_INSERT_ID();
-    
-    -- Update user's name if it's different (optional)
-    UPDATE Users SET first_name = p_first_name, last_name = p_last_name WHERE user_id = p_customer_id;
+    DECLARE v_status VARCHAR(10);
+
+    -- Any error (including a deadlock) undoes everything and is passed on to the caller,
+    -- which retries deadlocks exactly as it does for the client-side checkout.
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        RESIGNAL;
+    END;
 
-    -- Calculate total amount
-    SELECT SUM(i.price * c.quantity) INTO v_total_amount
+    -- The cart lines as this checkout sees them, worked out once: the first result set, the
+    -- short count, the total and the order lines all come from this table, so a hold that
+    -- expires or appears part-way through can't make them disagree. It lives until the next
+    -- call or the end of the session.
+    DROP TEMPORARY TABLE IF EXISTS PlaceOrderLines;
+    CREATE TEMPORARY TABLE PlaceOrderLines (
+        inventory_id INT PRIMARY KEY,
+        quantity INT NOT NULL,
+        price DECIMAL(10, 2) NOT NULL,
+        available INT NOT NULL
+    );
+
+    START TRANSACTION;
+
+    -- Lock the cart and its listings. The join walks uq_cart_customer_inventory, so listings
+    -- are locked in ascending inventory_id order, the same order the client path uses.
+    SELECT COUNT(*) INTO v_lines
     FROM Cart c
     JOIN Inventory i ON c.inventory_id = i.inventory_id
+    WHERE c.customer_id = p_customer_id
+    FOR UPDATE;
+
+    -- InventoryAvailability subtracts every unexpired hold, so this buyer's own hold is added back.
+    -- A removed seller's listing has nothing available, so its line is short.
+    INSERT INTO PlaceOrderLines (inventory_id, quantity, price, available)
+    SELECT c.inventory_id, c.quantity, i.price,
+           CASE WHEN EXISTS (SELECT 1 FROM Users u WHERE u.user_id = i.seller_id AND u.deleted_at IS NULL)
+                THEN a.available_quantity + COALESCE(r.quantity, 0) ELSE 0 END
+    FROM Cart c
+    JOIN Inventory i ON c.inventory_id = i.inventory_id
+    JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+    LEFT JOIN StockReservations r
+      ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
     WHERE c.customer_id = p_customer_id;
 
-    -- Create a new order
+    SELECT inventory_id, quantity, price, available FROM PlaceOrderLines ORDER BY inventory_id;
+
+    SELECT COALESCE(SUM(quantity > available), 0),
+           COALESCE(SUM(CASE WHEN quantity <= available THEN quantity * price END), 0)
+    INTO v_short, v_total_amount
+    FROM PlaceOrderLines;
+
+    IF v_lines = 0 THEN
+        ROLLBACK;
+        SELECT 'empty' AS status, NULL AS order_id, 0 AS total_amount;
+        LEAVE place_order;
+    END IF;
+
+    IF v_short = v_lines OR (v_short > 0 AND NOT p_allow_partial) THEN
+        ROLLBACK;
+        SELECT 'failed' AS status, NULL AS order_id, 0 AS total_amount;
+        LEAVE place_order;
+    END IF;
+
+    INSERT INTO Addresses (user_id, address_line1, city, state, postal_code)
+    VALUES (p_customer_id, p_address_line1, p_city, p_state, p_postal_code);
+    SET v_address_id = LAST_INSERT_ID();
+
     INSERT INTO Orders (customer_id, address_id, total_amount)
     VALUES (p_customer_id, v_address_id, v_total_amount);
     SET v_order_id = LAST_INSERT_ID();
 
-    -- Open the cursor to move cart items to order items
-    OPEN cart_cursor;
-    
-    get_cart_item: LOOP
-        FETCH cart_cursor INTO v_inventory_id, v_quantity, v_price_per_unit;
-        IF finished = 1 THEN
-            LEAVE get_cart_item;
-        END IF;
+    INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit)
+    SELECT v_order_id, inventory_id, quantity, price
+    FROM PlaceOrderLines
+    WHERE quantity <= available
+    ORDER BY inventory_id;
+
+    -- One guarded, relative decrement for every ordered line. This is the only place stock
+    -- is taken in this mode (there is no AfterOrderItemInsert trigger any more).
+    UPDATE Inventory i
+    JOIN OrderItems oi ON oi.inventory_id = i.inventory_id
+    SET i.stock_quantity = i.stock_quantity - oi.quantity
+    WHERE oi.order_id = v_order_id AND i.stock_quantity >= oi.quantity;
+
+    IF ROW_COUNT() <> v_lines - v_short THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Stock changed during checkout; order was not placed.';
+    END IF;
+
+    -- Clear only the lines that were ordered, and their holds; short lines stay in the cart.
+    DELETE c FROM Cart c
+    JOIN OrderItems oi ON oi.inventory_id = c.inventory_id AND oi.order_id = v_order_id
+    WHERE c.customer_id = p_customer_id;
+
+    DELETE r FROM StockReservations r
+    JOIN OrderItems oi ON oi.inventory_id = r.inventory_id AND oi.order_id = v_order_id
+    WHERE r.customer_id = p_customer_id;
 
-        -- Insert into OrderItems
-        INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit)
-        VALUES (v_order_id, v_inventory_id, v_quantity, v_price_per_unit);
-    END LOOP get_cart_item;
-    
-    CLOSE cart_cursor;
+    -- Queue payment in the same transaction, so every placed order reaches the fulfilment workers.
+    INSERT INTO OrderOutbox (order_id, step) VALUES (v_order_id, 'pay');
 
-    -- Clear the customer's cart
-    DELETE FROM Cart WHERE customer_id = p_customer_id;
+    COMMIT;
 
-    SELECT v_order_id AS new_order_id;
+    SET v_status = IF(v_short > 0, 'partial', 'placed');
+    SELECT v_status AS status, v_order_id AS order_id, v_total_amount AS total_amount;
 END$$
 DELIMITER ;
 
--- Function to calculate total items in a user's cart
+-- Function to calculate total items in a user's cart. It reads the Cart table, so it is
+-- READS SQL DATA rather than DETERMINISTIC (the same input can give a different answer).
 DELIMITER $$
 CREATE FUNCTION GetCartItemCount(p_customer_id INT)
 RETURNS INT
-DETERMINISTIC
+READS SQL DATA
 BEGIN
     DECLARE item_count INT;
     SELECT SUM(quantity) INTO item_count FROM Cart WHERE customer_id = p_customer_id;
@@ -233,14 +505,91 @@ DELIMITER ;
 -- Triggers
 -- ---------------------------------
 
--- Trigger to update inventory stock after an order is placed
+-- Stock is decremented by the write path that sells it: checkout_engine.place_order (with a
+-- guarded relative UPDATE) or the PlaceOrder procedure (likewise guarded). The old AfterOrderItemInsert trigger
+-- decremented a second time on top of the client, so it is gone. On an existing database run:
+--   DROP TRIGGER IF EXISTS AfterOrderItemInsert;
+
+-- Change feed (change_feed.py): every Inventory, Products and Orders change appends a ChangeLog
+-- row in the same transaction, whichever path makes it (app, stored procedures, imports, purges).
+-- Updates that change none of the logged columns are skipped. Bulk loads set
+-- @changelog_off = 1 in their session to skip logging (seed_data.py).
 DELIMITER $$
-CREATE TRIGGER AfterOrderItemInsert
-AFTER INSERT ON OrderItems
+CREATE TRIGGER InventoryChangeInsert AFTER INSERT ON Inventory
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_after, stock_after)
+        VALUES ('inventory', NEW.inventory_id, 'insert', NEW.product_id, NEW.price, NEW.stock_quantity);
+    END IF;
+END$$
+
+CREATE TRIGGER InventoryChangeUpdate AFTER UPDATE ON Inventory
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL AND NOT (NEW.price <=> OLD.price AND NEW.stock_quantity <=> OLD.stock_quantity
+                                       AND NEW.product_id <=> OLD.product_id AND NEW.seller_id <=> OLD.seller_id) THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_before, price_after, stock_before, stock_after)
+        VALUES ('inventory', NEW.inventory_id, 'update', NEW.product_id, OLD.price, NEW.price,
+                OLD.stock_quantity, NEW.stock_quantity);
+    END IF;
+END$$
+
+CREATE TRIGGER InventoryChangeDelete AFTER DELETE ON Inventory
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_before, stock_before)
+        VALUES ('inventory', OLD.inventory_id, 'delete', OLD.product_id, OLD.price, OLD.stock_quantity);
+    END IF;
+END$$
+
+CREATE TRIGGER ProductChangeInsert AFTER INSERT ON Products
 FOR EACH ROW
 BEGIN
-    UPDATE Inventory
-    SET stock_quantity = stock_quantity - NEW.quantity
-    WHERE inventory_id = NEW.inventory_id;
+    IF @changelog_off IS NULL THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', NEW.product_id, 'insert', NEW.product_id);
+    END IF;
+END$$
+
+CREATE TRIGGER ProductChangeUpdate AFTER UPDATE ON Products
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL AND NOT (NEW.product_name <=> OLD.product_name AND NEW.brand <=> OLD.brand
+                                       AND NEW.category_id <=> OLD.category_id) THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', NEW.product_id, 'update', NEW.product_id);
+    END IF;
+END$$
+
+CREATE TRIGGER ProductChangeDelete AFTER DELETE ON Products
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', OLD.product_id, 'delete', OLD.product_id);
+    END IF;
 END$$
-DELIMITER ;
\ No newline at end of file
+
+CREATE TRIGGER OrderChangeInsert AFTER INSERT ON Orders
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', NEW.order_id, 'insert', NEW.order_status);
+    END IF;
+END$$
+
+CREATE TRIGGER OrderChangeUpdate AFTER UPDATE ON Orders
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL AND NOT (NEW.order_status <=> OLD.order_status) THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', NEW.order_id, 'update', NEW.order_status);
+    END IF;
+END$$
+
+CREATE TRIGGER OrderChangeDelete AFTER DELETE ON Orders
+FOR EACH ROW
+BEGIN
+    IF @changelog_off IS NULL THEN
+        INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', OLD.order_id, 'delete', OLD.order_status);
+    END IF;
+END$$
+DELIMITER ;
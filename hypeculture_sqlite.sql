@@ -0,0 +1,340 @@
+-- hypeculture_sqlite.sql
+-- The schema of hypeculture.sql for the embedded SQLite backend (db_connector.DB_BACKEND = "sqlite").
+-- sqlite_backend.py runs this once, when it opens an empty database file; keep it in step with
+-- hypeculture.sql. Differences from MySQL:
+--   * AUTO_INCREMENT -> INTEGER PRIMARY KEY AUTOINCREMENT (ids are never reused, like InnoDB)
+--   * ENUM -> TEXT with a CHECK constraint
+--   * inline INDEX clauses -> CREATE INDEX statements, plus the foreign-key indexes InnoDB
+--     creates implicitly (idx_products_category, idx_inventory_seller, ...)
+--   * ON UPDATE CURRENT_TIMESTAMP -> AFTER UPDATE triggers
+--   * timestamps are local time, like MySQL's NOW(); TIMESTAMP(3) columns keep milliseconds
+--   * no stored procedures or functions: the "server" checkout mode needs MySQL
+
+-- ---------------------------------
+-- DDL (Data Definition Language)
+-- ---------------------------------
+
+CREATE TABLE Users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name VARCHAR(50) NOT NULL,
+    last_name VARCHAR(50) NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    user_role TEXT NOT NULL CHECK (user_role IN ('customer', 'seller', 'admin')),
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    deleted_at TIMESTAMP NULL DEFAULT NULL,
+    purged_at TIMESTAMP NULL DEFAULT NULL
+);
+CREATE INDEX idx_users_purge ON Users (purged_at, deleted_at);
+
+CREATE TABLE Categories (
+    category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category_name VARCHAR(50) NOT NULL UNIQUE
+);
+
+CREATE TABLE Products (
+    product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_name VARCHAR(100) NOT NULL,
+    brand VARCHAR(50),
+    category_id INT REFERENCES Categories(category_id)
+);
+CREATE INDEX idx_products_category ON Products (category_id);
+
+CREATE TABLE Inventory (
+    inventory_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    seller_id INT REFERENCES Users(user_id),
+    product_id INT REFERENCES Products(product_id),
+    price DECIMAL(10, 2) NOT NULL,
+    stock_quantity INT NOT NULL
+);
+CREATE INDEX idx_inventory_product_stock_price ON Inventory (product_id, stock_quantity, price, seller_id);
+CREATE INDEX idx_inventory_seller ON Inventory (seller_id);
+
+CREATE TABLE Addresses (
+    address_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT REFERENCES Users(user_id),
+    address_line1 VARCHAR(255) NOT NULL,
+    city VARCHAR(100) NOT NULL,
+    state VARCHAR(100) NOT NULL,
+    postal_code VARCHAR(20) NOT NULL
+);
+CREATE INDEX idx_addresses_user ON Addresses (user_id);
+
+CREATE TABLE Orders (
+    order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INT REFERENCES Users(user_id),
+    address_id INT REFERENCES Addresses(address_id),
+    order_date TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    total_amount DECIMAL(10, 2),
+    order_status VARCHAR(20) DEFAULT 'Placed'
+);
+CREATE INDEX idx_orders_customer_date ON Orders (customer_id, order_date);
+CREATE INDEX idx_orders_address ON Orders (address_id);
+
+CREATE TABLE OrderItems (
+    order_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INT REFERENCES Orders(order_id),
+    inventory_id INT REFERENCES Inventory(inventory_id),
+    quantity INT NOT NULL,
+    price_per_unit DECIMAL(10, 2) NOT NULL
+);
+CREATE INDEX idx_orderitems_order ON OrderItems (order_id);
+CREATE INDEX idx_orderitems_inventory ON OrderItems (inventory_id);
+
+CREATE TABLE Cart (
+    cart_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INT REFERENCES Users(user_id),
+    inventory_id INT REFERENCES Inventory(inventory_id),
+    quantity INT NOT NULL,
+    added_date TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+CREATE UNIQUE INDEX uq_cart_customer_inventory ON Cart (customer_id, inventory_id);
+CREATE INDEX idx_cart_inventory ON Cart (inventory_id);
+
+CREATE TABLE ProductBestOffer (
+    product_id INTEGER PRIMARY KEY REFERENCES Products(product_id),
+    best_inventory_id INT,
+    best_seller_id INT,
+    best_first_name VARCHAR(50),
+    best_last_name VARCHAR(50),
+    best_price DECIMAL(10, 2),
+    best_stock INT,
+    offer_count INT NOT NULL DEFAULT 0,
+    total_stock INT NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    stale BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE CatalogVersion (
+    id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE SalesDailySeller (
+    sale_date DATE NOT NULL,
+    seller_id INT NOT NULL,
+    units INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, seller_id)
+);
+
+CREATE TABLE SalesDailyProduct (
+    sale_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    units INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, product_id)
+);
+
+CREATE TABLE RollupState (
+    rollup_name VARCHAR(50) PRIMARY KEY,
+    last_order_item_id INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE OrderOutbox (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INT NOT NULL REFERENCES Orders(order_id),
+    step VARCHAR(10) NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at TIMESTAMP(3) NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+    claimed_by VARCHAR(64),
+    detail VARCHAR(255),
+    created_at TIMESTAMP(3) NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+    finished_at TIMESTAMP(3) NULL
+);
+CREATE UNIQUE INDEX uq_outbox_order_step ON OrderOutbox (order_id, step);
+CREATE INDEX idx_outbox_status_available ON OrderOutbox (status, available_at);
+
+CREATE TABLE OrderArchiveIndex (
+    segment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INT NOT NULL,
+    archive_file VARCHAR(100) NOT NULL,
+    member_offset BIGINT NOT NULL,
+    member_length INT NOT NULL,
+    order_count INT NOT NULL,
+    first_order_date TIMESTAMP NOT NULL,
+    last_order_date TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX idx_archive_customer_date ON OrderArchiveIndex (customer_id, last_order_date);
+
+CREATE TABLE StockReservations (
+    reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INT NOT NULL,
+    inventory_id INT NOT NULL,
+    quantity INT NOT NULL,
+    expires_at TIMESTAMP(3) NOT NULL,
+    created_at TIMESTAMP(3) NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+CREATE UNIQUE INDEX uq_reservation_customer_inventory ON StockReservations (customer_id, inventory_id);
+CREATE INDEX idx_reservation_inventory_expiry ON StockReservations (inventory_id, expires_at, quantity);
+CREATE INDEX idx_reservation_expiry ON StockReservations (expires_at);
+
+CREATE TABLE ChangeLog (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity VARCHAR(10) NOT NULL,
+    entity_id INT NOT NULL,
+    op VARCHAR(6) NOT NULL,
+    product_id INT,
+    price_before DECIMAL(10, 2),
+    price_after DECIMAL(10, 2),
+    stock_before INT,
+    stock_after INT,
+    order_status VARCHAR(20),
+    changed_at TIMESTAMP(3) NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+
+CREATE TABLE ChangeConsumers (
+    consumer VARCHAR(50) PRIMARY KEY,
+    last_seq BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(3) NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+
+CREATE TABLE PriceWatches (
+    watch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INT NOT NULL,
+    product_id INT NOT NULL,
+    target_price DECIMAL(10, 2) NOT NULL,
+    last_alert_price DECIMAL(10, 2),
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    FOREIGN KEY (customer_id) REFERENCES Users(user_id),
+    FOREIGN KEY (product_id) REFERENCES Products(product_id)
+);
+CREATE UNIQUE INDEX uq_watch_customer_product ON PriceWatches (customer_id, product_id);
+CREATE INDEX idx_watch_product ON PriceWatches (product_id);
+
+CREATE TABLE PriceAlerts (
+    alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INT NOT NULL,
+    product_id INT NOT NULL,
+    inventory_id INT NOT NULL,
+    old_price DECIMAL(10, 2),
+    new_price DECIMAL(10, 2) NOT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    seen_at TIMESTAMP NULL DEFAULT NULL
+);
+CREATE INDEX idx_alert_customer ON PriceAlerts (customer_id, seen_at, alert_id);
+
+-- NOW() is the app-defined function from sqlite_backend.py
+CREATE VIEW InventoryAvailability AS
+SELECT i.inventory_id, i.stock_quantity,
+       i.stock_quantity - COALESCE((SELECT SUM(r.quantity) FROM StockReservations r
+                                    WHERE r.inventory_id = i.inventory_id AND r.expires_at > NOW(3)), 0)
+           AS available_quantity
+FROM Inventory i;
+
+CREATE TABLE SchemaMigrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- ---------------------------------
+-- Triggers
+-- ---------------------------------
+
+-- ON UPDATE CURRENT_TIMESTAMP
+CREATE TRIGGER ProductBestOfferUpdatedAt AFTER UPDATE ON ProductBestOffer
+FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE ProductBestOffer SET updated_at = datetime('now', 'localtime') WHERE product_id = NEW.product_id;
+END;
+
+CREATE TRIGGER RollupStateUpdatedAt AFTER UPDATE ON RollupState
+FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE RollupState SET updated_at = datetime('now', 'localtime') WHERE rollup_name = NEW.rollup_name;
+END;
+
+-- Change feed (change_feed.py). SQLite has no session variables, so there is no @changelog_off.
+CREATE TRIGGER InventoryChangeInsert AFTER INSERT ON Inventory
+FOR EACH ROW
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_after, stock_after)
+    VALUES ('inventory', NEW.inventory_id, 'insert', NEW.product_id, NEW.price, NEW.stock_quantity);
+END;
+
+CREATE TRIGGER InventoryChangeUpdate AFTER UPDATE ON Inventory
+FOR EACH ROW WHEN NOT (NEW.price IS OLD.price AND NEW.stock_quantity IS OLD.stock_quantity
+                       AND NEW.product_id IS OLD.product_id AND NEW.seller_id IS OLD.seller_id)
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_before, price_after, stock_before, stock_after)
+    VALUES ('inventory', NEW.inventory_id, 'update', NEW.product_id, OLD.price, NEW.price,
+            OLD.stock_quantity, NEW.stock_quantity);
+END;
+
+CREATE TRIGGER InventoryChangeDelete AFTER DELETE ON Inventory
+FOR EACH ROW
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_before, stock_before)
+    VALUES ('inventory', OLD.inventory_id, 'delete', OLD.product_id, OLD.price, OLD.stock_quantity);
+END;
+
+CREATE TRIGGER ProductChangeInsert AFTER INSERT ON Products
+FOR EACH ROW
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', NEW.product_id, 'insert', NEW.product_id);
+END;
+
+CREATE TRIGGER ProductChangeUpdate AFTER UPDATE ON Products
+FOR EACH ROW WHEN NOT (NEW.product_name IS OLD.product_name AND NEW.brand IS OLD.brand
+                       AND NEW.category_id IS OLD.category_id)
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', NEW.product_id, 'update', NEW.product_id);
+END;
+
+CREATE TRIGGER ProductChangeDelete AFTER DELETE ON Products
+FOR EACH ROW
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', OLD.product_id, 'delete', OLD.product_id);
+END;
+
+CREATE TRIGGER OrderChangeInsert AFTER INSERT ON Orders
+FOR EACH ROW
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', NEW.order_id, 'insert', NEW.order_status);
+END;
+
+CREATE TRIGGER OrderChangeUpdate AFTER UPDATE ON Orders
+FOR EACH ROW WHEN NEW.order_status IS NOT OLD.order_status
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', NEW.order_id, 'update', NEW.order_status);
+END;
+
+CREATE TRIGGER OrderChangeDelete AFTER DELETE ON Orders
+FOR EACH ROW
+BEGIN
+    INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', OLD.order_id, 'delete', OLD.order_status);
+END;
+
+-- ---------------------------------
+-- DML (Data Manipulation Language) - Sample Data
+-- ---------------------------------
+
+INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES
+('Alice', 'Wonder', 'alice@email.com', 'pass123', 'customer'),
+('Bob', 'Builder', 'bob@email.com', 'pass123', 'customer'),
+('Charlie', 'Shoes', 'charlie@seller.com', 'pass123', 'seller'),
+('Diana', 'Kicks', 'diana@seller.com', 'pass123', 'seller'),
+('Edward', 'Admin', 'admin@hypeculture.com', 'adminpass', 'admin');
+
+INSERT INTO CatalogVersion (id, version) VALUES (1, 0);
+INSERT INTO RollupState (rollup_name) VALUES ('sales_daily');
+
+INSERT INTO Categories (category_name) VALUES ('Sneakers'), ('Boots'), ('Formal Shoes');
+
+INSERT INTO Products (product_name, brand, category_id) VALUES
+('Air Jordan 4', 'Nike', 1),
+('Panda Dunks', 'Nike', 1),
+('Yeezy Boost 350', 'Adidas', 1),
+('Classic Timberland', 'Timberland', 2);
+
+INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES
+(3, 1, 250.00, 10),
+(4, 1, 245.00, 5),
+(3, 2, 150.00, 20),
+(4, 3, 220.00, 15);
+
@@ -0,0 +1,180 @@
+# inventory_import.py
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from mysql.connector import Error
+
+import order_book
+from sql_dialect import dialect
+
+IMPORT_CHUNK_SIZE = 5000   # rows validated and written per transaction
+
+# errors: list of (line_number, message); a bad row is skipped, the rest of the file still loads
+ImportReport = namedtuple("ImportReport", ["rows_read", "inserted", "updated", "errors", "elapsed"])
+
+
+def iter_import_rows(path):
+    """ Streams (line_number, dict) from a .csv file with a header row, or a JSON-lines file. """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if ext == ".csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, e
+
+
+def parse_import_row(row):
+    """ Validates one raw row. Returns (product_id, price, stock) or raises ValueError. """
+    if isinstance(row, Exception):
+        raise ValueError(f"not valid JSON ({row})")
+    if not isinstance(row, dict):
+        raise ValueError("expected an object with product_id, price and stock")
+    stock_raw = row.get("stock", row.get("stock_quantity"))
+    if row.get("product_id") in (None, "") or row.get("price") in (None, "") or stock_raw in (None, ""):
+        raise ValueError("product_id, price and stock are all required")
+    try:
+        product_id = int(row["product_id"])
+        stock = int(stock_raw)
+        price = Decimal(str(row["price"])).quantize(Decimal("0.01"))
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError("product_id and stock must be whole numbers and price a number")
+    if product_id <= 0:
+        raise ValueError("product_id must be positive")
+    if price <= 0 or price >= Decimal("100000000"):
+        raise ValueError("price must be between 0.01 and 99999999.99")
+    if stock < 0:
+        raise ValueError("stock cannot be negative")
+    return product_id, price, stock
+
+
+def _existing_products(cursor, product_ids, known):
+    """ Adds the product ids that exist in the catalog to the `known` set (one query per chunk). """
+    unknown = [pid for pid in product_ids if pid not in known]
+    if unknown:
+        placeholders = ", ".join(["%s"] * len(unknown))
+        cursor.execute(f"SELECT product_id FROM Products WHERE product_id IN ({placeholders})", unknown)
+        known.update(row[0] for row in cursor.fetchall())
+
+
+def _upsert_chunk(connection, seller_id, rows):
+    """ Writes one validated chunk {product_id: (line, price, stock)} in one transaction.
+
+    The seller's existing listing for a product (the oldest, if there are several) is updated;
+    otherwise a new listing is inserted. Both go through a single multi-row upsert keyed on
+    inventory_id.
+    """
+    cursor = connection.cursor()
+    try:
+        product_ids = list(rows)
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        cursor.execute(
+            f"SELECT product_id, MIN(inventory_id) FROM Inventory "
+            f"WHERE seller_id = %s AND product_id IN ({placeholders}) GROUP BY product_id",
+            [seller_id] + product_ids
+        )
+        existing = dict(cursor.fetchall())
+
+        cursor.executemany(
+            """
+            INSERT INTO Inventory (inventory_id, seller_id, product_id, price, stock_quantity)
+            VALUES (%s, %s, %s, %s, %s)
+            """ + dialect().on_duplicate(["inventory_id"], price="{new}", stock_quantity="{new}"),
+            [(existing.get(pid), seller_id, pid, price, stock) for pid, (_, price, stock) in rows.items()]
+        )
+        connection.commit()
+        updated = sum(1 for pid in product_ids if pid in existing)
+        return len(product_ids) - updated, updated
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _flush(connection, seller_id, chunk, known_products, errors, touched):
+    """ Validates a chunk against the catalog and writes it. Returns (inserted, updated). """
+    if not chunk:
+        return 0, 0
+    cursor = connection.cursor()
+    try:
+        _existing_products(cursor, list(chunk), known_products)
+    finally:
+        cursor.close()
+
+    valid = {}
+    for pid, entry in chunk.items():
+        if pid in known_products:
+            valid[pid] = entry
+        else:
+            errors.append((entry[0], f"product_id {pid} is not in the catalog"))
+    if not valid:
+        return 0, 0
+
+    try:
+        result = _upsert_chunk(connection, seller_id, valid)
+        touched.update(valid)
+        return result
+    except Error:
+        # Find the offending rows one at a time so the rest of the chunk still loads.
+        inserted = updated = 0
+        for pid, entry in valid.items():
+            try:
+                i, u = _upsert_chunk(connection, seller_id, {pid: entry})
+                inserted += i
+                updated += u
+                touched.add(pid)
+            except Error as e:
+                errors.append((entry[0], str(e)))
+        return inserted, updated
+
+
+def import_inventory(connection, seller_id, path, chunk_size=IMPORT_CHUNK_SIZE):
+    """ Bulk-upserts a seller's listings from a CSV or JSON-lines file of (product_id, price, stock).
+
+    Rows are streamed and handled in chunks of `chunk_size`, each in its own transaction.
+    Invalid rows are reported by line number and skipped without aborting the file. When a
+    product appears more than once in a chunk, the later row wins.
+    """
+    started = time.perf_counter()
+    rows_read = inserted = updated = 0
+    errors = []
+    known_products = set()
+    touched = set()
+    chunk = {}
+
+    for line_number, raw in iter_import_rows(path):
+        rows_read += 1
+        try:
+            product_id, price, stock = parse_import_row(raw)
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+            continue
+        chunk[product_id] = (line_number, price, stock)
+        if len(chunk) >= chunk_size:
+            i, u = _flush(connection, seller_id, chunk, known_products, errors, touched)
+            inserted += i
+            updated += u
+            chunk = {}
+
+    i, u = _flush(connection, seller_id, chunk, known_products, errors, touched)
+    inserted += i
+    updated += u
+
+    if touched:
+        order_book.invalidate_products(connection, touched)
+
+    errors.sort()
+    return ImportReport(rows_read, inserted, updated, errors, time.perf_counter() - started)
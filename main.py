@@ -1,9 +1,19 @@
 #main.py
-from db_connector import create_connection
+from mysql.connector import Error
+
+from db_connector import get_pool, close_pool
+from fulfilment import FulfilmentWorkers
 from customer_view import show_customer_menu
 from admin_seller_views import show_admin_menu, show_seller_menu
+from change_feed import start_cache_invalidator
+from price_watch import start_price_watcher
+from product_search import build_index_in_background
+from read_routing import close_replicas, session_connection
+from services import authenticate, create_user
+from stock_holds import start_sweeper
+from user_purge import start_purger
 
-def login(connection, cursor):
+def login(connection):
     """ Handles the user login process. """
     print("\n--- Welcome to HYPEculture Login ---")
 
@@ -14,13 +24,10 @@ def login(connection, cursor):
         last_name = input("Enter your last name: ")
         email = input("Enter your email: ")
         password = input("Enter your password: ")
-        insert_query = "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)"
         try:
-            cursor.execute(insert_query, (first_name, last_name, email, password, 'customer'))
-            connection.commit()
+            user = create_user(connection, first_name, last_name, email, password, 'customer')
             print("Registration successful! You are now logged in.")
-            user_id = cursor.lastrowid
-            return (user_id, 'customer', first_name)
+            return user
         except Exception as e:
             print(f"An error occurred during registration: {e}")
             return None
@@ -29,11 +36,9 @@ def login(connection, cursor):
     email = input("Enter your email: ")
     password = input("Enter your password: ")
 
-    query = "SELECT user_id, user_role, first_name FROM Users WHERE email = %s AND password_hash = %s"
     user = None
     try:
-        cursor.execute(query, (email, password))
-        user = cursor.fetchone()
+        user = authenticate(connection, email, password)
     except Exception as e:
         print(f"An error occurred during login: {e}")
 
@@ -41,11 +46,17 @@ def login(connection, cursor):
 
 def main():
     """ Main function to run the application. """
-    connection = create_connection()
-    if not connection:
+    try:
+        pool = get_pool()
+    except Error as e:
+        print(f"Error while connecting to the database: {e}")
         return
-
-    cursor = connection.cursor()
+    build_index_in_background(pool)   # search is ready by the time anyone reaches the menu
+    workers = FulfilmentWorkers(pool, count=1).start()   # takes payment for orders in the background
+    start_sweeper(pool)   # deletes expired cart holds
+    start_purger(pool)    # clears removed users' rows in small batches
+    start_cache_invalidator(pool)   # other processes' writes reach this one's order books and caches
+    start_price_watcher(pool)       # turns price cuts into alerts for watching customers
 
     print("=" * 40)
     print("👟 WELCOME TO HYPECULTURE 👟")
@@ -53,27 +64,34 @@ def main():
     print("=" * 40)
 
     while True:
-        user_data = login(connection, cursor)
+        # Each login session borrows its own pooled connection and hands it back on logout.
+        # Reads go to a replica when any are configured; the session always sees its own writes.
+        try:
+            with session_connection(pool) as connection:
+                user_data = login(connection)
 
-        if user_data:
-            user_id, role, name = user_data
-            print(f"\nWelcome back, {name}!")
+                if user_data:
+                    user_id, role, name = user_data
+                    print(f"\nWelcome back, {name}!")
 
-            if role == 'customer':
-                show_customer_menu(connection, user_id)
-            elif role == 'seller':
-                show_seller_menu(connection, user_id)
-            elif role == 'admin':
-                show_admin_menu(connection)
-        else:
-            print("Login failed. Invalid email or password.")
+                    if role == 'customer':
+                        show_customer_menu(connection, user_id)
+                    elif role == 'seller':
+                        show_seller_menu(connection, user_id)
+                    elif role == 'admin':
+                        show_admin_menu(connection)
+                else:
+                    print("Login failed. Invalid email or password.")
+        except Error as e:
+            print(f"Database error: {e}")
 
         cont = input("\nReturn to login screen? (y/n): ").lower()
         if cont != 'y':
             break
 
-    cursor.close()
-    connection.close()
+    workers.stop()
+    close_replicas()
+    close_pool()
     print("Thank you for using HYPECULTURE. Goodbye!")
 
 if __name__ == "__main__":
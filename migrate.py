@@ -0,0 +1,1098 @@
+# migrate.py
+"""
+Versioned schema migrations for an existing hypeculture_db.
+
+hypeculture.sql always creates the latest schema. This runner brings a database created
+from an older copy of that script up to date. Every step checks information_schema before
+it acts, so running it on an up-to-date database only records the versions.
+
+The steps are MySQL DDL. An embedded SQLite database (--backend sqlite) is created at the
+latest version from hypeculture_sqlite.sql instead, so there it only reports whether the
+file is current; an outdated file is deleted and recreated.
+
+    python migrate.py             # apply everything pending
+    python migrate.py --status    # list applied / pending versions
+    python migrate.py --check-plans   # also run the EXPLAIN regression check afterwards
+"""
+import argparse
+import sys
+
+import db_connector
+from db_connector import add_backend_arguments, configure_backend, create_connection
+
+
+# ---------------------------------
+# Idempotent migration steps
+# ---------------------------------
+
+def _exists(cursor, query, params):
+    cursor.execute(query, params)
+    found = cursor.fetchone() is not None
+    cursor.fetchall()
+    return found
+
+
+def _table_exists(cursor, table):
+    return _exists(cursor, "SELECT 1 FROM information_schema.tables "
+                           "WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+
+
+def _index_exists(cursor, table, index):
+    return _exists(cursor, "SELECT 1 FROM information_schema.statistics "
+                           "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+                   (table, index))
+
+
+def _column_exists(cursor, table, column):
+    return _exists(cursor, "SELECT 1 FROM information_schema.columns "
+                           "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+                   (table, column))
+
+
+def run_sql(*statements):
+    """ Step that runs statements as-is. They must be safe to repeat (IF [NOT] EXISTS, INSERT IGNORE, ...). """
+    def step(cursor):
+        for statement in statements:
+            cursor.execute(statement)
+    step.description = "; ".join(s.split("\n")[0].strip() for s in statements)
+    return step
+
+
+def create_table(table, ddl):
+    """ Step that creates a table unless it is already there. """
+    def step(cursor):
+        if not _table_exists(cursor, table):
+            cursor.execute(ddl)
+    step.description = f"create table {table}"
+    return step
+
+
+def add_column(table, column, definition):
+    """ Step that adds a column unless the table already has it. """
+    def step(cursor):
+        if not _column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    step.description = f"column {table}.{column} {definition}"
+    return step
+
+
+def create_index(table, name, columns, unique=False):
+    """ Step that adds an index unless one with that name already exists. """
+    def step(cursor):
+        if not _index_exists(cursor, table, name):
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            cursor.execute(f"ALTER TABLE {table} ADD {kind} {name} ({', '.join(columns)})")
+    step.description = f"{'unique ' if unique else ''}index {table}.{name} ({', '.join(columns)})"
+    return step
+
+
+def recreate_routine(kind, name, ddl):
+    """ Step that drops and re-creates a stored routine from the definition it shipped with.
+
+    Each migration carries its own copy of the routine, so replaying an old migration installs
+    what that version ran, whatever hypeculture.sql says today.
+    """
+    def step(cursor):
+        cursor.execute(f"DROP {kind} IF EXISTS {name}")
+        cursor.execute(ddl)
+    step.description = f"re-create {kind.lower()} {name}"
+    return step
+
+
+def merge_duplicate_cart_rows(cursor):
+    """ Folds duplicate (customer_id, inventory_id) Cart rows into the oldest one so a unique key can be added. """
+    cursor.execute(
+        """
+        UPDATE Cart c
+        JOIN (SELECT MIN(cart_id) AS keep_id, SUM(quantity) AS total
+              FROM Cart GROUP BY customer_id, inventory_id HAVING COUNT(*) > 1) d
+          ON c.cart_id = d.keep_id
+        SET c.quantity = d.total
+        """
+    )
+    cursor.execute(
+        """
+        DELETE c FROM Cart c
+        JOIN (SELECT customer_id, inventory_id, MIN(cart_id) AS keep_id
+              FROM Cart GROUP BY customer_id, inventory_id HAVING COUNT(*) > 1) d
+          ON c.customer_id = d.customer_id AND c.inventory_id = d.inventory_id AND c.cart_id <> d.keep_id
+        """
+    )
+merge_duplicate_cart_rows.description = "merge duplicate Cart rows"
+
+
+# ---------------------------------
+# Migrations, in order. Never edit or renumber one that has shipped; add a new one instead.
+# ---------------------------------
+
+MIGRATIONS = [
+    (1, "catch up databases created before the migration runner", [
+        run_sql("DROP TRIGGER IF EXISTS AfterOrderItemInsert"),
+        recreate_routine("PROCEDURE", "PlaceOrder", """
+            CREATE PROCEDURE PlaceOrder(
+                IN p_customer_id INT,
+                IN p_first_name VARCHAR(50),
+                IN p_last_name VARCHAR(50),
+                IN p_address_line1 VARCHAR(255),
+                IN p_city VARCHAR(100),
+                IN p_state VARCHAR(100),
+                IN p_postal_code VARCHAR(20)
+            )
+            BEGIN
+                DECLARE v_address_id INT;
+                DECLARE v_order_id INT;
+                DECLARE v_total_amount DECIMAL(10, 2) DEFAULT 0;
+                DECLARE finished INTEGER DEFAULT 0;
+                DECLARE v_inventory_id INT;
+                DECLARE v_quantity INT;
+                DECLARE v_price_per_unit DECIMAL(10, 2);
+
+                -- Cursor to iterate through cart items
+                DECLARE cart_cursor CURSOR FOR
+                    SELECT c.inventory_id, c.quantity, i.price
+                    FROM Cart c
+                    JOIN Inventory i ON c.inventory_id = i.inventory_id
+                    WHERE c.customer_id = p_customer_id;
+
+                DECLARE CONTINUE HANDLER FOR NOT FOUND SET finished = 1;
+
+                -- Add or get address
+                INSERT INTO Addresses(user_id, address_line1, city, state, postal_code)
+                VALUES(p_customer_id, p_address_line1, p_city, p_state, p_postal_code);
+                SET v_address_id = LAST_INSERT_ID();
+
+                -- Update user's name if it's different (optional)
+                UPDATE Users SET first_name = p_first_name, last_name = p_last_name WHERE user_id = p_customer_id;
+
+                -- Calculate total amount
+                SELECT SUM(i.price * c.quantity) INTO v_total_amount
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                WHERE c.customer_id = p_customer_id;
+
+                -- Create a new order
+                INSERT INTO Orders (customer_id, address_id, total_amount)
+                VALUES (p_customer_id, v_address_id, v_total_amount);
+                SET v_order_id = LAST_INSERT_ID();
+
+                -- Open the cursor to move cart items to order items
+                OPEN cart_cursor;
+
+                get_cart_item: LOOP
+                    FETCH cart_cursor INTO v_inventory_id, v_quantity, v_price_per_unit;
+                    IF finished = 1 THEN
+                        LEAVE get_cart_item;
+                    END IF;
+
+                    -- Insert into OrderItems
+                    INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit)
+                    VALUES (v_order_id, v_inventory_id, v_quantity, v_price_per_unit);
+
+                    -- Decrement stock (this used to happen in the AfterOrderItemInsert trigger)
+                    UPDATE Inventory
+                    SET stock_quantity = stock_quantity - v_quantity
+                    WHERE inventory_id = v_inventory_id;
+                END LOOP get_cart_item;
+
+                CLOSE cart_cursor;
+
+                -- Clear the customer's cart
+                DELETE FROM Cart WHERE customer_id = p_customer_id;
+
+                SELECT v_order_id AS new_order_id;
+            END"""),
+        create_table("ProductBestOffer", """
+            CREATE TABLE ProductBestOffer (
+                product_id INT PRIMARY KEY,
+                best_inventory_id INT,
+                best_seller_id INT,
+                best_first_name VARCHAR(50),
+                best_last_name VARCHAR(50),
+                best_price DECIMAL(10, 2),
+                best_stock INT,
+                offer_count INT NOT NULL DEFAULT 0,
+                total_stock INT NOT NULL DEFAULT 0,
+                version BIGINT NOT NULL DEFAULT 0,
+                stale BOOLEAN NOT NULL DEFAULT FALSE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES Products(product_id)
+            )"""),
+        create_table("CatalogVersion", """
+            CREATE TABLE CatalogVersion (
+                id TINYINT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )"""),
+        run_sql("INSERT IGNORE INTO CatalogVersion (id, version) VALUES (1, 0)"),
+    ]),
+    (2, "covering indexes for hot queries and a unique cart line", [
+        create_index("Inventory", "idx_inventory_product_stock_price",
+                     ["product_id", "stock_quantity", "price", "seller_id"]),
+        merge_duplicate_cart_rows,
+        create_index("Cart", "uq_cart_customer_inventory", ["customer_id", "inventory_id"], unique=True),
+        create_index("Orders", "idx_orders_customer_date", ["customer_id", "order_date"]),
+        create_index("OrderItems", "idx_orderitems_order", ["order_id"]),
+    ]),
+    (3, "stored routines for the server-side checkout mode", [
+        recreate_routine("PROCEDURE", "AddToCart", """
+            CREATE PROCEDURE AddToCart(IN p_customer_id INT, IN p_inventory_id INT, IN p_quantity INT)
+            BEGIN
+                IF p_quantity IS NULL OR p_quantity <= 0 THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Quantity must be positive.';
+                END IF;
+
+                INSERT INTO Cart (customer_id, inventory_id, quantity)
+                VALUES (p_customer_id, p_inventory_id, p_quantity)
+                ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity);
+            END"""),
+        recreate_routine("PROCEDURE", "PlaceOrder", """
+            CREATE PROCEDURE PlaceOrder(
+                IN p_customer_id INT,
+                IN p_address_line1 VARCHAR(255),
+                IN p_city VARCHAR(100),
+                IN p_state VARCHAR(100),
+                IN p_postal_code VARCHAR(20),
+                IN p_allow_partial BOOLEAN
+            )
+            place_order: BEGIN
+                DECLARE v_address_id INT;
+                DECLARE v_order_id INT DEFAULT NULL;
+                DECLARE v_lines INT DEFAULT 0;
+                DECLARE v_short INT DEFAULT 0;
+                DECLARE v_total_amount DECIMAL(10, 2) DEFAULT 0;
+                DECLARE v_status VARCHAR(10);
+
+                -- Any error (including a deadlock) undoes everything and is passed on to the caller,
+                -- which retries deadlocks exactly as it does for the client-side checkout.
+                DECLARE EXIT HANDLER FOR SQLEXCEPTION
+                BEGIN
+                    ROLLBACK;
+                    RESIGNAL;
+                END;
+
+                -- The cart lines as this checkout sees them, worked out once: the first result set, the
+                -- short count, the total and the order lines all come from this table, so they can't
+                -- disagree. It lives until the next call or the end of the session.
+                DROP TEMPORARY TABLE IF EXISTS PlaceOrderLines;
+                CREATE TEMPORARY TABLE PlaceOrderLines (
+                    inventory_id INT PRIMARY KEY,
+                    quantity INT NOT NULL,
+                    price DECIMAL(10, 2) NOT NULL,
+                    stock_quantity INT NOT NULL
+                );
+
+                START TRANSACTION;
+
+                -- Lock the cart and its listings. The join walks uq_cart_customer_inventory, so listings
+                -- are locked in ascending inventory_id order, the same order the client path uses.
+                SELECT COUNT(*) INTO v_lines
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                WHERE c.customer_id = p_customer_id
+                FOR UPDATE;
+
+                INSERT INTO PlaceOrderLines (inventory_id, quantity, price, stock_quantity)
+                SELECT c.inventory_id, c.quantity, i.price, i.stock_quantity
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                WHERE c.customer_id = p_customer_id;
+
+                SELECT inventory_id, quantity, price, stock_quantity FROM PlaceOrderLines ORDER BY inventory_id;
+
+                SELECT COALESCE(SUM(quantity > stock_quantity), 0),
+                       COALESCE(SUM(CASE WHEN quantity <= stock_quantity THEN quantity * price END), 0)
+                INTO v_short, v_total_amount
+                FROM PlaceOrderLines;
+
+                IF v_lines = 0 THEN
+                    ROLLBACK;
+                    SELECT 'empty' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                IF v_short = v_lines OR (v_short > 0 AND NOT p_allow_partial) THEN
+                    ROLLBACK;
+                    SELECT 'failed' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                INSERT INTO Addresses (user_id, address_line1, city, state, postal_code)
+                VALUES (p_customer_id, p_address_line1, p_city, p_state, p_postal_code);
+                SET v_address_id = LAST_INSERT_ID();
+
+                INSERT INTO Orders (customer_id, address_id, total_amount)
+                VALUES (p_customer_id, v_address_id, v_total_amount);
+                SET v_order_id = LAST_INSERT_ID();
+
+                INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit)
+                SELECT v_order_id, inventory_id, quantity, price
+                FROM PlaceOrderLines
+                WHERE quantity <= stock_quantity
+                ORDER BY inventory_id;
+
+                -- One guarded, relative decrement for every ordered line. This is the only place stock
+                -- is taken in this mode (there is no AfterOrderItemInsert trigger any more).
+                UPDATE Inventory i
+                JOIN OrderItems oi ON oi.inventory_id = i.inventory_id
+                SET i.stock_quantity = i.stock_quantity - oi.quantity
+                WHERE oi.order_id = v_order_id AND i.stock_quantity >= oi.quantity;
+
+                IF ROW_COUNT() <> v_lines - v_short THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Stock changed during checkout; order was not placed.';
+                END IF;
+
+                -- Clear only the lines that were ordered; short lines stay in the cart.
+                DELETE c FROM Cart c
+                JOIN OrderItems oi ON oi.inventory_id = c.inventory_id AND oi.order_id = v_order_id
+                WHERE c.customer_id = p_customer_id;
+
+                COMMIT;
+
+                SET v_status = IF(v_short > 0, 'partial', 'placed');
+                SELECT v_status AS status, v_order_id AS order_id, v_total_amount AS total_amount;
+            END"""),
+        recreate_routine("FUNCTION", "GetCartItemCount", """
+            CREATE FUNCTION GetCartItemCount(p_customer_id INT)
+            RETURNS INT
+            READS SQL DATA
+            BEGIN
+                DECLARE item_count INT;
+                SELECT SUM(quantity) INTO item_count FROM Cart WHERE customer_id = p_customer_id;
+                RETURN IFNULL(item_count, 0);
+            END"""),
+    ]),
+    (4, "daily sales rollups per seller and per product", [
+        create_table("SalesDailySeller", """
+            CREATE TABLE SalesDailySeller (
+                sale_date DATE NOT NULL,
+                seller_id INT NOT NULL,
+                units INT NOT NULL DEFAULT 0,
+                revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (sale_date, seller_id)
+            )"""),
+        create_table("SalesDailyProduct", """
+            CREATE TABLE SalesDailyProduct (
+                sale_date DATE NOT NULL,
+                product_id INT NOT NULL,
+                units INT NOT NULL DEFAULT 0,
+                revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (sale_date, product_id)
+            )"""),
+        create_table("RollupState", """
+            CREATE TABLE RollupState (
+                rollup_name VARCHAR(50) PRIMARY KEY,
+                last_order_item_id INT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            )"""),
+        run_sql("INSERT IGNORE INTO RollupState (rollup_name) VALUES ('sales_daily')"),
+    ]),
+    (5, "payment and fulfilment outbox", [
+        create_table("OrderOutbox", """
+            CREATE TABLE OrderOutbox (
+                job_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                order_id INT NOT NULL,
+                step VARCHAR(10) NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                available_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+                claimed_by VARCHAR(64),
+                detail VARCHAR(255),
+                created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+                finished_at TIMESTAMP(3) NULL,
+                FOREIGN KEY (order_id) REFERENCES Orders(order_id),
+                UNIQUE INDEX uq_outbox_order_step (order_id, step),
+                INDEX idx_outbox_status_available (status, available_at)
+            )"""),
+        recreate_routine("PROCEDURE", "PlaceOrder", """
+            CREATE PROCEDURE PlaceOrder(
+                IN p_customer_id INT,
+                IN p_address_line1 VARCHAR(255),
+                IN p_city VARCHAR(100),
+                IN p_state VARCHAR(100),
+                IN p_postal_code VARCHAR(20),
+                IN p_allow_partial BOOLEAN
+            )
+            place_order: BEGIN
+                DECLARE v_address_id INT;
+                DECLARE v_order_id INT DEFAULT NULL;
+                DECLARE v_lines INT DEFAULT 0;
+                DECLARE v_short INT DEFAULT 0;
+                DECLARE v_total_amount DECIMAL(10, 2) DEFAULT 0;
+                DECLARE v_status VARCHAR(10);
+
+                -- Any error (including a deadlock) undoes everything and is passed on to the caller,
+                -- which retries deadlocks exactly as it does for the client-side checkout.
+                DECLARE EXIT HANDLER FOR SQLEXCEPTION
+                BEGIN
+                    ROLLBACK;
+                    RESIGNAL;
+                END;
+
+                -- The cart lines as this checkout sees them, worked out once: the first result set, the
+                -- short count, the total and the order lines all come from this table, so they can't
+                -- disagree. It lives until the next call or the end of the session.
+                DROP TEMPORARY TABLE IF EXISTS PlaceOrderLines;
+                CREATE TEMPORARY TABLE PlaceOrderLines (
+                    inventory_id INT PRIMARY KEY,
+                    quantity INT NOT NULL,
+                    price DECIMAL(10, 2) NOT NULL,
+                    stock_quantity INT NOT NULL
+                );
+
+                START TRANSACTION;
+
+                -- Lock the cart and its listings. The join walks uq_cart_customer_inventory, so listings
+                -- are locked in ascending inventory_id order, the same order the client path uses.
+                SELECT COUNT(*) INTO v_lines
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                WHERE c.customer_id = p_customer_id
+                FOR UPDATE;
+
+                INSERT INTO PlaceOrderLines (inventory_id, quantity, price, stock_quantity)
+                SELECT c.inventory_id, c.quantity, i.price, i.stock_quantity
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                WHERE c.customer_id = p_customer_id;
+
+                SELECT inventory_id, quantity, price, stock_quantity FROM PlaceOrderLines ORDER BY inventory_id;
+
+                SELECT COALESCE(SUM(quantity > stock_quantity), 0),
+                       COALESCE(SUM(CASE WHEN quantity <= stock_quantity THEN quantity * price END), 0)
+                INTO v_short, v_total_amount
+                FROM PlaceOrderLines;
+
+                IF v_lines = 0 THEN
+                    ROLLBACK;
+                    SELECT 'empty' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                IF v_short = v_lines OR (v_short > 0 AND NOT p_allow_partial) THEN
+                    ROLLBACK;
+                    SELECT 'failed' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                INSERT INTO Addresses (user_id, address_line1, city, state, postal_code)
+                VALUES (p_customer_id, p_address_line1, p_city, p_state, p_postal_code);
+                SET v_address_id = LAST_INSERT_ID();
+
+                INSERT INTO Orders (customer_id, address_id, total_amount)
+                VALUES (p_customer_id, v_address_id, v_total_amount);
+                SET v_order_id = LAST_INSERT_ID();
+
+                INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit)
+                SELECT v_order_id, inventory_id, quantity, price
+                FROM PlaceOrderLines
+                WHERE quantity <= stock_quantity
+                ORDER BY inventory_id;
+
+                -- One guarded, relative decrement for every ordered line. This is the only place stock
+                -- is taken in this mode (there is no AfterOrderItemInsert trigger any more).
+                UPDATE Inventory i
+                JOIN OrderItems oi ON oi.inventory_id = i.inventory_id
+                SET i.stock_quantity = i.stock_quantity - oi.quantity
+                WHERE oi.order_id = v_order_id AND i.stock_quantity >= oi.quantity;
+
+                IF ROW_COUNT() <> v_lines - v_short THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Stock changed during checkout; order was not placed.';
+                END IF;
+
+                -- Clear only the lines that were ordered; short lines stay in the cart.
+                DELETE c FROM Cart c
+                JOIN OrderItems oi ON oi.inventory_id = c.inventory_id AND oi.order_id = v_order_id
+                WHERE c.customer_id = p_customer_id;
+
+                -- Queue payment in the same transaction, so every placed order reaches the fulfilment workers.
+                INSERT INTO OrderOutbox (order_id, step) VALUES (v_order_id, 'pay');
+
+                COMMIT;
+
+                SET v_status = IF(v_short > 0, 'partial', 'placed');
+                SELECT v_status AS status, v_order_id AS order_id, v_total_amount AS total_amount;
+            END"""),
+    ]),
+    (6, "index of archived orders", [
+        create_table("OrderArchiveIndex", """
+            CREATE TABLE OrderArchiveIndex (
+                segment_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                customer_id INT NOT NULL,
+                archive_file VARCHAR(100) NOT NULL,
+                member_offset BIGINT NOT NULL,
+                member_length INT NOT NULL,
+                order_count INT NOT NULL,
+                first_order_date TIMESTAMP NOT NULL,
+                last_order_date TIMESTAMP NOT NULL,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_archive_customer_date (customer_id, last_order_date)
+            )"""),
+    ]),
+    (7, "stock holds taken at add-to-cart", [
+        create_table("StockReservations", """
+            CREATE TABLE StockReservations (
+                reservation_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                customer_id INT NOT NULL,
+                inventory_id INT NOT NULL,
+                quantity INT NOT NULL,
+                expires_at TIMESTAMP(3) NOT NULL,
+                created_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+                UNIQUE INDEX uq_reservation_customer_inventory (customer_id, inventory_id),
+                INDEX idx_reservation_inventory_expiry (inventory_id, expires_at, quantity),
+                INDEX idx_reservation_expiry (expires_at)
+            )"""),
+        run_sql("""CREATE OR REPLACE VIEW InventoryAvailability AS
+            SELECT i.inventory_id, i.stock_quantity,
+                   i.stock_quantity - COALESCE((SELECT SUM(r.quantity) FROM StockReservations r
+                                                WHERE r.inventory_id = i.inventory_id AND r.expires_at > NOW(3)), 0)
+                       AS available_quantity
+            FROM Inventory i"""),
+        recreate_routine("PROCEDURE", "AddToCart", """
+            CREATE PROCEDURE AddToCart(IN p_customer_id INT, IN p_inventory_id INT, IN p_quantity INT, IN p_hold_seconds INT)
+            BEGIN
+                DECLARE v_stock INT;
+                DECLARE v_wanted INT;
+                DECLARE v_available INT;
+                DECLARE v_message VARCHAR(128);
+
+                IF p_quantity IS NULL OR p_quantity <= 0 THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Quantity must be positive.';
+                END IF;
+
+                INSERT INTO Cart (customer_id, inventory_id, quantity)
+                VALUES (p_customer_id, p_inventory_id, p_quantity)
+                ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity);
+
+                IF p_hold_seconds > 0 THEN
+                    -- Cart row, then listing: the same lock order as checkout.
+                    SELECT stock_quantity INTO v_stock FROM Inventory WHERE inventory_id = p_inventory_id FOR UPDATE;
+
+                    -- The line may hold what is left after other buyers' unexpired holds.
+                    SELECT c.quantity, a.available_quantity + COALESCE(r.quantity, 0)
+                    INTO v_wanted, v_available
+                    FROM Cart c
+                    JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+                    LEFT JOIN StockReservations r
+                      ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
+                    WHERE c.customer_id = p_customer_id AND c.inventory_id = p_inventory_id;
+
+                    IF v_wanted > v_available THEN
+                        SET v_message = CONCAT_WS(' ', 'stock unavailable', p_inventory_id, v_wanted, GREATEST(v_available, 0));
+                        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_message;
+                    END IF;
+
+                    INSERT INTO StockReservations (customer_id, inventory_id, quantity, expires_at)
+                    VALUES (p_customer_id, p_inventory_id, v_wanted, NOW(3) + INTERVAL p_hold_seconds SECOND)
+                    ON DUPLICATE KEY UPDATE quantity = VALUES(quantity), expires_at = VALUES(expires_at);
+                END IF;
+            END"""),
+        recreate_routine("PROCEDURE", "PlaceOrder", """
+            CREATE PROCEDURE PlaceOrder(
+                IN p_customer_id INT,
+                IN p_address_line1 VARCHAR(255),
+                IN p_city VARCHAR(100),
+                IN p_state VARCHAR(100),
+                IN p_postal_code VARCHAR(20),
+                IN p_allow_partial BOOLEAN
+            )
+            place_order: BEGIN
+                DECLARE v_address_id INT;
+                DECLARE v_order_id INT DEFAULT NULL;
+                DECLARE v_lines INT DEFAULT 0;
+                DECLARE v_short INT DEFAULT 0;
+                DECLARE v_total_amount DECIMAL(10, 2) DEFAULT 0;
+                DECLARE v_status VARCHAR(10);
+
+                -- Any error (including a deadlock) undoes everything and is passed on to the caller,
+                -- which retries deadlocks exactly as it does for the client-side checkout.
+                DECLARE EXIT HANDLER FOR SQLEXCEPTION
+                BEGIN
+                    ROLLBACK;
+                    RESIGNAL;
+                END;
+
+                -- The cart lines as this checkout sees them, worked out once: the first result set, the
+                -- short count, the total and the order lines all come from this table, so a hold that
+                -- expires or appears part-way through can't make them disagree. It lives until the next
+                -- call or the end of the session.
+                DROP TEMPORARY TABLE IF EXISTS PlaceOrderLines;
+                CREATE TEMPORARY TABLE PlaceOrderLines (
+                    inventory_id INT PRIMARY KEY,
+                    quantity INT NOT NULL,
+                    price DECIMAL(10, 2) NOT NULL,
+                    available INT NOT NULL
+                );
+
+                START TRANSACTION;
+
+                -- Lock the cart and its listings. The join walks uq_cart_customer_inventory, so listings
+                -- are locked in ascending inventory_id order, the same order the client path uses.
+                SELECT COUNT(*) INTO v_lines
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                WHERE c.customer_id = p_customer_id
+                FOR UPDATE;
+
+                -- InventoryAvailability subtracts every unexpired hold, so this buyer's own hold is added back.
+                INSERT INTO PlaceOrderLines (inventory_id, quantity, price, available)
+                SELECT c.inventory_id, c.quantity, i.price, a.available_quantity + COALESCE(r.quantity, 0)
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+                LEFT JOIN StockReservations r
+                  ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
+                WHERE c.customer_id = p_customer_id;
+
+                SELECT inventory_id, quantity, price, available FROM PlaceOrderLines ORDER BY inventory_id;
+
+                SELECT COALESCE(SUM(quantity > available), 0),
+                       COALESCE(SUM(CASE WHEN quantity <= available THEN quantity * price END), 0)
+                INTO v_short, v_total_amount
+                FROM PlaceOrderLines;
+
+                IF v_lines = 0 THEN
+                    ROLLBACK;
+                    SELECT 'empty' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                IF v_short = v_lines OR (v_short > 0 AND NOT p_allow_partial) THEN
+                    ROLLBACK;
+                    SELECT 'failed' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                INSERT INTO Addresses (user_id, address_line1, city, state, postal_code)
+                VALUES (p_customer_id, p_address_line1, p_city, p_state, p_postal_code);
+                SET v_address_id = LAST_INSERT_ID();
+
+                INSERT INTO Orders (customer_id, address_id, total_amount)
+                VALUES (p_customer_id, v_address_id, v_total_amount);
+                SET v_order_id = LAST_INSERT_ID();
+
+                INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit)
+                SELECT v_order_id, inventory_id, quantity, price
+                FROM PlaceOrderLines
+                WHERE quantity <= available
+                ORDER BY inventory_id;
+
+                -- One guarded, relative decrement for every ordered line. This is the only place stock
+                -- is taken in this mode (there is no AfterOrderItemInsert trigger any more).
+                UPDATE Inventory i
+                JOIN OrderItems oi ON oi.inventory_id = i.inventory_id
+                SET i.stock_quantity = i.stock_quantity - oi.quantity
+                WHERE oi.order_id = v_order_id AND i.stock_quantity >= oi.quantity;
+
+                IF ROW_COUNT() <> v_lines - v_short THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Stock changed during checkout; order was not placed.';
+                END IF;
+
+                -- Clear only the lines that were ordered, and their holds; short lines stay in the cart.
+                DELETE c FROM Cart c
+                JOIN OrderItems oi ON oi.inventory_id = c.inventory_id AND oi.order_id = v_order_id
+                WHERE c.customer_id = p_customer_id;
+
+                DELETE r FROM StockReservations r
+                JOIN OrderItems oi ON oi.inventory_id = r.inventory_id AND oi.order_id = v_order_id
+                WHERE r.customer_id = p_customer_id;
+
+                -- Queue payment in the same transaction, so every placed order reaches the fulfilment workers.
+                INSERT INTO OrderOutbox (order_id, step) VALUES (v_order_id, 'pay');
+
+                COMMIT;
+
+                SET v_status = IF(v_short > 0, 'partial', 'placed');
+                SELECT v_status AS status, v_order_id AS order_id, v_total_amount AS total_amount;
+            END"""),
+    ]),
+    (8, "soft-deleted users and the background purge", [
+        add_column("Users", "deleted_at", "TIMESTAMP NULL DEFAULT NULL"),
+        add_column("Users", "purged_at", "TIMESTAMP NULL DEFAULT NULL"),
+        create_index("Users", "idx_users_purge", ["purged_at", "deleted_at"]),
+        recreate_routine("PROCEDURE", "AddToCart", """
+            CREATE PROCEDURE AddToCart(IN p_customer_id INT, IN p_inventory_id INT, IN p_quantity INT, IN p_hold_seconds INT)
+            BEGIN
+                DECLARE v_stock INT;
+                DECLARE v_wanted INT;
+                DECLARE v_available INT;
+                DECLARE v_message VARCHAR(128);
+
+                IF p_quantity IS NULL OR p_quantity <= 0 THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Quantity must be positive.';
+                END IF;
+
+                INSERT INTO Cart (customer_id, inventory_id, quantity)
+                VALUES (p_customer_id, p_inventory_id, p_quantity)
+                ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity);
+
+                IF p_hold_seconds > 0 THEN
+                    -- Cart row, then listing: the same lock order as checkout.
+                    SELECT stock_quantity INTO v_stock FROM Inventory WHERE inventory_id = p_inventory_id FOR UPDATE;
+
+                    -- The line may hold what is left after other buyers' unexpired holds; nothing of a
+                    -- removed seller's listing can be held.
+                    SELECT c.quantity,
+                           CASE WHEN EXISTS (SELECT 1 FROM Users u WHERE u.user_id = i.seller_id AND u.deleted_at IS NULL)
+                                THEN a.available_quantity + COALESCE(r.quantity, 0) ELSE 0 END
+                    INTO v_wanted, v_available
+                    FROM Cart c
+                    JOIN Inventory i ON i.inventory_id = c.inventory_id
+                    JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+                    LEFT JOIN StockReservations r
+                      ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
+                    WHERE c.customer_id = p_customer_id AND c.inventory_id = p_inventory_id;
+
+                    IF v_wanted > v_available THEN
+                        SET v_message = CONCAT_WS(' ', 'stock unavailable', p_inventory_id, v_wanted, GREATEST(v_available, 0));
+                        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_message;
+                    END IF;
+
+                    INSERT INTO StockReservations (customer_id, inventory_id, quantity, expires_at)
+                    VALUES (p_customer_id, p_inventory_id, v_wanted, NOW(3) + INTERVAL p_hold_seconds SECOND)
+                    ON DUPLICATE KEY UPDATE quantity = VALUES(quantity), expires_at = VALUES(expires_at);
+                END IF;
+            END"""),
+        recreate_routine("PROCEDURE", "PlaceOrder", """
+            CREATE PROCEDURE PlaceOrder(
+                IN p_customer_id INT,
+                IN p_address_line1 VARCHAR(255),
+                IN p_city VARCHAR(100),
+                IN p_state VARCHAR(100),
+                IN p_postal_code VARCHAR(20),
+                IN p_allow_partial BOOLEAN
+            )
+            place_order: BEGIN
+                DECLARE v_address_id INT;
+                DECLARE v_order_id INT DEFAULT NULL;
+                DECLARE v_lines INT DEFAULT 0;
+                DECLARE v_short INT DEFAULT 0;
+                DECLARE v_total_amount DECIMAL(10, 2) DEFAULT 0;
+                DECLARE v_status VARCHAR(10);
+
+                -- Any error (including a deadlock) undoes everything and is passed on to the caller,
+                -- which retries deadlocks exactly as it does for the client-side checkout.
+                DECLARE EXIT HANDLER FOR SQLEXCEPTION
+                BEGIN
+                    ROLLBACK;
+                    RESIGNAL;
+                END;
+
+                -- The cart lines as this checkout sees them, worked out once: the first result set, the
+                -- short count, the total and the order lines all come from this table, so a hold that
+                -- expires or appears part-way through can't make them disagree. It lives until the next
+                -- call or the end of the session.
+                DROP TEMPORARY TABLE IF EXISTS PlaceOrderLines;
+                CREATE TEMPORARY TABLE PlaceOrderLines (
+                    inventory_id INT PRIMARY KEY,
+                    quantity INT NOT NULL,
+                    price DECIMAL(10, 2) NOT NULL,
+                    available INT NOT NULL
+                );
+
+                START TRANSACTION;
+
+                -- Lock the cart and its listings. The join walks uq_cart_customer_inventory, so listings
+                -- are locked in ascending inventory_id order, the same order the client path uses.
+                SELECT COUNT(*) INTO v_lines
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                WHERE c.customer_id = p_customer_id
+                FOR UPDATE;
+
+                -- InventoryAvailability subtracts every unexpired hold, so this buyer's own hold is added back.
+                -- A removed seller's listing has nothing available, so its line is short.
+                INSERT INTO PlaceOrderLines (inventory_id, quantity, price, available)
+                SELECT c.inventory_id, c.quantity, i.price,
+                       CASE WHEN EXISTS (SELECT 1 FROM Users u WHERE u.user_id = i.seller_id AND u.deleted_at IS NULL)
+                            THEN a.available_quantity + COALESCE(r.quantity, 0) ELSE 0 END
+                FROM Cart c
+                JOIN Inventory i ON c.inventory_id = i.inventory_id
+                JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+                LEFT JOIN StockReservations r
+                  ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
+                WHERE c.customer_id = p_customer_id;
+
+                SELECT inventory_id, quantity, price, available FROM PlaceOrderLines ORDER BY inventory_id;
+
+                SELECT COALESCE(SUM(quantity > available), 0),
+                       COALESCE(SUM(CASE WHEN quantity <= available THEN quantity * price END), 0)
+                INTO v_short, v_total_amount
+                FROM PlaceOrderLines;
+
+                IF v_lines = 0 THEN
+                    ROLLBACK;
+                    SELECT 'empty' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                IF v_short = v_lines OR (v_short > 0 AND NOT p_allow_partial) THEN
+                    ROLLBACK;
+                    SELECT 'failed' AS status, NULL AS order_id, 0 AS total_amount;
+                    LEAVE place_order;
+                END IF;
+
+                INSERT INTO Addresses (user_id, address_line1, city, state, postal_code)
+                VALUES (p_customer_id, p_address_line1, p_city, p_state, p_postal_code);
+                SET v_address_id = LAST_INSERT_ID();
+
+                INSERT INTO Orders (customer_id, address_id, total_amount)
+                VALUES (p_customer_id, v_address_id, v_total_amount);
+                SET v_order_id = LAST_INSERT_ID();
+
+                INSERT INTO OrderItems (order_id, inventory_id, quantity, price_per_unit)
+                SELECT v_order_id, inventory_id, quantity, price
+                FROM PlaceOrderLines
+                WHERE quantity <= available
+                ORDER BY inventory_id;
+
+                -- One guarded, relative decrement for every ordered line. This is the only place stock
+                -- is taken in this mode (there is no AfterOrderItemInsert trigger any more).
+                UPDATE Inventory i
+                JOIN OrderItems oi ON oi.inventory_id = i.inventory_id
+                SET i.stock_quantity = i.stock_quantity - oi.quantity
+                WHERE oi.order_id = v_order_id AND i.stock_quantity >= oi.quantity;
+
+                IF ROW_COUNT() <> v_lines - v_short THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Stock changed during checkout; order was not placed.';
+                END IF;
+
+                -- Clear only the lines that were ordered, and their holds; short lines stay in the cart.
+                DELETE c FROM Cart c
+                JOIN OrderItems oi ON oi.inventory_id = c.inventory_id AND oi.order_id = v_order_id
+                WHERE c.customer_id = p_customer_id;
+
+                DELETE r FROM StockReservations r
+                JOIN OrderItems oi ON oi.inventory_id = r.inventory_id AND oi.order_id = v_order_id
+                WHERE r.customer_id = p_customer_id;
+
+                -- Queue payment in the same transaction, so every placed order reaches the fulfilment workers.
+                INSERT INTO OrderOutbox (order_id, step) VALUES (v_order_id, 'pay');
+
+                COMMIT;
+
+                SET v_status = IF(v_short > 0, 'partial', 'placed');
+                SELECT v_status AS status, v_order_id AS order_id, v_total_amount AS total_amount;
+            END"""),
+    ]),
+    (9, "change feed, its consumers and price watchlists", [
+        create_table("ChangeLog", """
+            CREATE TABLE ChangeLog (
+                seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+                entity VARCHAR(10) NOT NULL,
+                entity_id INT NOT NULL,
+                op VARCHAR(6) NOT NULL,
+                product_id INT,
+                price_before DECIMAL(10, 2),
+                price_after DECIMAL(10, 2),
+                stock_before INT,
+                stock_after INT,
+                order_status VARCHAR(20),
+                changed_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)
+            )"""),
+        create_table("ChangeConsumers", """
+            CREATE TABLE ChangeConsumers (
+                consumer VARCHAR(50) PRIMARY KEY,
+                last_seq BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3)
+            )"""),
+        create_table("PriceWatches", """
+            CREATE TABLE PriceWatches (
+                watch_id INT AUTO_INCREMENT PRIMARY KEY,
+                customer_id INT NOT NULL,
+                product_id INT NOT NULL,
+                target_price DECIMAL(10, 2) NOT NULL,
+                last_alert_price DECIMAL(10, 2),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (customer_id) REFERENCES Users(user_id),
+                FOREIGN KEY (product_id) REFERENCES Products(product_id),
+                UNIQUE INDEX uq_watch_customer_product (customer_id, product_id),
+                INDEX idx_watch_product (product_id)
+            )"""),
+        create_table("PriceAlerts", """
+            CREATE TABLE PriceAlerts (
+                alert_id INT AUTO_INCREMENT PRIMARY KEY,
+                customer_id INT NOT NULL,
+                product_id INT NOT NULL,
+                inventory_id INT NOT NULL,
+                old_price DECIMAL(10, 2),
+                new_price DECIMAL(10, 2) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                seen_at TIMESTAMP NULL DEFAULT NULL,
+                INDEX idx_alert_customer (customer_id, seen_at, alert_id)
+            )"""),
+        # Only changes made after this point reach the feed.
+        recreate_routine("TRIGGER", "InventoryChangeInsert", """
+            CREATE TRIGGER InventoryChangeInsert AFTER INSERT ON Inventory
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_after, stock_after)
+                    VALUES ('inventory', NEW.inventory_id, 'insert', NEW.product_id, NEW.price, NEW.stock_quantity);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "InventoryChangeUpdate", """
+            CREATE TRIGGER InventoryChangeUpdate AFTER UPDATE ON Inventory
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL AND NOT (NEW.price <=> OLD.price AND NEW.stock_quantity <=> OLD.stock_quantity
+                                                   AND NEW.product_id <=> OLD.product_id AND NEW.seller_id <=> OLD.seller_id) THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_before, price_after, stock_before, stock_after)
+                    VALUES ('inventory', NEW.inventory_id, 'update', NEW.product_id, OLD.price, NEW.price,
+                            OLD.stock_quantity, NEW.stock_quantity);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "InventoryChangeDelete", """
+            CREATE TRIGGER InventoryChangeDelete AFTER DELETE ON Inventory
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, product_id, price_before, stock_before)
+                    VALUES ('inventory', OLD.inventory_id, 'delete', OLD.product_id, OLD.price, OLD.stock_quantity);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "ProductChangeInsert", """
+            CREATE TRIGGER ProductChangeInsert AFTER INSERT ON Products
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', NEW.product_id, 'insert', NEW.product_id);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "ProductChangeUpdate", """
+            CREATE TRIGGER ProductChangeUpdate AFTER UPDATE ON Products
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL AND NOT (NEW.product_name <=> OLD.product_name AND NEW.brand <=> OLD.brand
+                                                   AND NEW.category_id <=> OLD.category_id) THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', NEW.product_id, 'update', NEW.product_id);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "ProductChangeDelete", """
+            CREATE TRIGGER ProductChangeDelete AFTER DELETE ON Products
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, product_id) VALUES ('product', OLD.product_id, 'delete', OLD.product_id);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "OrderChangeInsert", """
+            CREATE TRIGGER OrderChangeInsert AFTER INSERT ON Orders
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', NEW.order_id, 'insert', NEW.order_status);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "OrderChangeUpdate", """
+            CREATE TRIGGER OrderChangeUpdate AFTER UPDATE ON Orders
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL AND NOT (NEW.order_status <=> OLD.order_status) THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', NEW.order_id, 'update', NEW.order_status);
+                END IF;
+            END"""),
+        recreate_routine("TRIGGER", "OrderChangeDelete", """
+            CREATE TRIGGER OrderChangeDelete AFTER DELETE ON Orders
+            FOR EACH ROW
+            BEGIN
+                IF @changelog_off IS NULL THEN
+                    INSERT INTO ChangeLog (entity, entity_id, op, order_status) VALUES ('order', OLD.order_id, 'delete', OLD.order_status);
+                END IF;
+            END"""),
+    ]),
+]
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS SchemaMigrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    try:
+        _ensure_version_table(cursor)
+        cursor.execute("SELECT version FROM SchemaMigrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def apply_migrations(connection, verbose=True):
+    """ Applies every pending migration in order. Returns the versions applied. """
+    done = applied_versions(connection)
+    if db_connector.DB_BACKEND == "sqlite":
+        pending = [version for version, _, _ in MIGRATIONS if version not in done]
+        if pending:
+            raise RuntimeError(f"{db_connector.SQLITE_PATH} predates migration(s) {pending}; delete it and "
+                               f"it is recreated from hypeculture_sqlite.sql on the next connection.")
+        return []
+    applied = []
+    cursor = connection.cursor()
+    try:
+        for version, name, steps in MIGRATIONS:
+            if version in done:
+                continue
+            if verbose:
+                print(f"Applying {version:04d}: {name}")
+            # DDL commits implicitly in MySQL, so a migration can't be one transaction.
+            # Each step is idempotent instead; a half-applied migration simply runs again.
+            for step in steps:
+                if verbose:
+                    print(f"  - {step.description}")
+                step(cursor)
+                connection.commit()
+            cursor.execute("INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s)", (version, name))
+            connection.commit()
+            applied.append(version)
+    finally:
+        cursor.close()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="show migration status and exit")
+    parser.add_argument("--check-plans", action="store_true", help="run the EXPLAIN regression check afterwards")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    connection = create_connection()
+    if not connection:
+        sys.exit(1)
+
+    try:
+        if args.status:
+            done = applied_versions(connection)
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:04d} {'applied' if version in done else 'PENDING'}  {name}")
+            return
+
+        try:
+            applied = apply_migrations(connection)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        print(f"Applied {len(applied)} migration(s)." if applied else "Schema is up to date.")
+
+        if args.check_plans and db_connector.DB_BACKEND != "mysql":
+            print("Skipping the EXPLAIN check: it reads MySQL query plans.")
+        elif args.check_plans:
+            from explain_check import check_plans, print_report
+            problems = check_plans(connection)
+            print_report(problems)
+            if problems:
+                sys.exit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
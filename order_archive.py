@@ -0,0 +1,338 @@
+# order_archive.py
+"""
+Cold storage for old orders, so Orders and OrderItems only hold the recent ones.
+
+archive_orders() moves Delivered and Failed orders older than ARCHIVE_AFTER_DAYS out of
+Orders, OrderItems and OrderOutbox. They go into gzip-compressed JSON-lines files in
+ARCHIVE_DIR, one file per order month (orders-2024-03.jsonl.gz). Each line is a whole order
+as the history screen shows it (address, items with product and seller names), plus the
+ids the sales rollups need. The hot tables, and their indexes, then only grow with recent
+activity.
+
+Each archival batch appends one gzip member per customer to each month file. There is one
+OrderArchiveIndex row per member: customer, file, byte offset and length, and the order
+dates it covers. Reading a customer's archive decompresses only that customer's members,
+newest first, and stops once it has enough orders. fetch_order_history_page() reads the
+archive only when a page reaches back past the customer's newest archived order, so
+recent history never touches the files.
+
+A batch appends and fsyncs its members before the transaction that deletes the hot rows and
+writes the index rows commits. If that transaction never commits, the orders simply stay
+hot and the appended bytes are never referenced; the next run archives them again. Runs
+hold the RollupState lock while they write, so they never append to a file at once. On
+several hosts, ARCHIVE_DIR must be shared storage.
+
+Only orders the sales rollups have already counted are archived. rebuild_rollups() adds the
+archived sales back from the files (archived_sales()).
+
+    python order_archive.py                       # archive orders older than ARCHIVE_AFTER_DAYS
+    python order_archive.py --older-than-days 180
+    python order_archive.py --status
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from db_connector import add_backend_arguments, configure_backend, create_connection
+from order_history import OrderLine, OrderSummary
+from sales_rollups import ROLLUP_NAME
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+ARCHIVE_AFTER_DAYS = 365        # orders older than this leave the hot tables
+ARCHIVE_BATCH = 1000            # orders moved per transaction
+ARCHIVED_STATUSES = ("Delivered", "Failed")   # orders still being fulfilled stay hot
+
+ArchiveStatus = namedtuple("ArchiveStatus", ["hot_orders", "oldest_hot", "archived_orders", "files",
+                                             "archive_bytes"])
+
+
+def configure_archive(archive_dir):
+    """ Keeps the archive files in `archive_dir` (shared by every process that reads history). """
+    global ARCHIVE_DIR
+    ARCHIVE_DIR = archive_dir
+
+
+# ---------------------------------
+# Archiving
+# ---------------------------------
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable")
+
+
+def _append_segments(records):
+    """ Appends one gzip member per (month file, customer) and syncs each file.
+    Returns the index rows: (customer_id, file, offset, length, orders, first date, last date). """
+    by_file = {}
+    for record in records:
+        name = f"orders-{record['order_date']:%Y-%m}.jsonl.gz"
+        by_file.setdefault(name, {}).setdefault(record["customer_id"], []).append(record)
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    segments = []
+    for name, customers in by_file.items():
+        with open(os.path.join(ARCHIVE_DIR, name), "ab") as f:
+            for customer_id, orders in customers.items():
+                lines = "".join(json.dumps(order, default=_encode) + "\n" for order in orders)
+                member = gzip.compress(lines.encode("utf-8"))
+                offset = f.tell()
+                f.write(member)
+                dates = [order["order_date"] for order in orders]
+                segments.append((customer_id, name, offset, len(member), len(orders), min(dates), max(dates)))
+            f.flush()
+            os.fsync(f.fileno())
+    return segments
+
+
+def _archive_batch(connection, cutoff, after_id, batch_size):
+    """ Archives up to batch_size old orders with ids past after_id.
+    Returns (orders archived, last order id looked at), or (0, None) when nothing is left. """
+    cursor = connection.cursor()
+    try:
+        if connection.in_transaction:
+            connection.commit()
+        connection.start_transaction()
+        cursor.execute("SELECT last_order_item_id FROM RollupState WHERE rollup_name = %s FOR UPDATE",
+                       (ROLLUP_NAME,))
+        row = cursor.fetchone()
+        mark = row[0] if row else 0
+
+        statuses = ", ".join(["%s"] * len(ARCHIVED_STATUSES))
+        cursor.execute(
+            f"""
+            SELECT o.order_id, o.customer_id, o.address_id, o.order_date, o.total_amount, o.order_status,
+                   a.address_line1, a.city
+            FROM Orders o LEFT JOIN Addresses a ON o.address_id = a.address_id
+            WHERE o.order_id > %s AND o.order_date < %s AND o.order_status IN ({statuses})
+            ORDER BY o.order_id
+            LIMIT %s
+            """,
+            [after_id, cutoff, *ARCHIVED_STATUSES, batch_size]
+        )
+        orders = cursor.fetchall()
+        if not orders:
+            connection.rollback()
+            return 0, None
+
+        order_ids = [order[0] for order in orders]
+        placeholders = ", ".join(["%s"] * len(order_ids))
+        cursor.execute(
+            f"""
+            SELECT oi.order_id, oi.order_item_id, oi.inventory_id, i.seller_id, i.product_id,
+                   p.product_name, u.first_name, oi.quantity, oi.price_per_unit
+            FROM OrderItems oi
+            JOIN Inventory i ON oi.inventory_id = i.inventory_id
+            JOIN Products p ON i.product_id = p.product_id
+            JOIN Users u ON i.seller_id = u.user_id
+            WHERE oi.order_id IN ({placeholders})
+            ORDER BY oi.order_id, oi.order_item_id
+            """,
+            order_ids
+        )
+        items = {order_id: [] for order_id in order_ids}
+        uncounted = set()
+        for order_id, item_id, inventory_id, seller_id, product_id, name, seller, qty, price in cursor.fetchall():
+            if item_id > mark:
+                uncounted.add(order_id)   # the rollups haven't seen it yet; archive it next time
+            items[order_id].append({"order_item_id": item_id, "inventory_id": inventory_id, "seller_id": seller_id,
+                                    "product_id": product_id, "product_name": name, "seller_name": seller,
+                                    "quantity": qty, "price_per_unit": price})
+        records = [{"order_id": order_id, "customer_id": customer_id, "address_id": address_id,
+                    "order_date": order_date, "total_amount": total, "order_status": status,
+                    "address_line1": address, "city": city, "items": items[order_id]}
+                   for order_id, customer_id, address_id, order_date, total, status, address, city in orders
+                   if order_id not in uncounted]
+
+        if records:
+            segments = _append_segments(records)
+            archived_ids = [record["order_id"] for record in records]
+            placeholders = ", ".join(["%s"] * len(archived_ids))
+            cursor.execute(f"DELETE FROM OrderOutbox WHERE order_id IN ({placeholders})", archived_ids)
+            cursor.execute(f"DELETE FROM OrderItems WHERE order_id IN ({placeholders})", archived_ids)
+            cursor.execute(f"DELETE FROM Orders WHERE order_id IN ({placeholders})", archived_ids)
+            cursor.executemany(
+                "INSERT INTO OrderArchiveIndex (customer_id, archive_file, member_offset, member_length, "
+                "order_count, first_order_date, last_order_date) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                segments
+            )
+        connection.commit()
+        return len(records), orders[-1][0]
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def archive_orders(connection, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH, verbose=False):
+    """ Moves every finished order older than `older_than_days` to the archive. Returns how many moved. """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    archived, after_id = 0, 0
+    while True:
+        moved, after_id = _archive_batch(connection, cutoff, after_id, batch_size)
+        if after_id is None:
+            return archived
+        archived += moved
+        if verbose and moved:
+            print(f"  archived {archived:,} orders (through order #{after_id})")
+
+
+# ---------------------------------
+# Reading
+# ---------------------------------
+
+def _read_segment(archive_file, offset, length):
+    with open(os.path.join(ARCHIVE_DIR, archive_file), "rb") as f:
+        f.seek(offset)
+        member = f.read(length)
+    return [json.loads(line) for line in gzip.decompress(member).decode("utf-8").splitlines()]
+
+
+def _summary(record):
+    items = [OrderLine(item["product_name"], item["seller_name"], item["quantity"], Decimal(item["price_per_unit"]))
+             for item in record["items"]]
+    return OrderSummary(record["order_id"], datetime.fromisoformat(record["order_date"]),
+                        Decimal(record["total_amount"]), record["order_status"], record["address_line1"],
+                        record["city"], items)
+
+
+def newest_archived_date(connection, customer_id):
+    """ Date of the customer's newest archived order, or None if none are archived. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT last_order_date FROM OrderArchiveIndex WHERE customer_id = %s "
+                       "ORDER BY last_order_date DESC LIMIT 1", (customer_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+
+
+def archived_orders(connection, customer_id, limit, before=None, date_from=None, date_to=None):
+    """ Up to `limit` of a customer's archived orders as [OrderSummary], newest first.
+
+    `before` is a (order_date, order_id) history cursor; only older orders are returned.
+    `date_from` is inclusive and `date_to` exclusive, as in fetch_order_history_page().
+    """
+    conditions = ["customer_id = %s"]
+    params = [customer_id]
+    if before is not None:
+        conditions.append("first_order_date <= %s")
+        params.append(before[0])
+    if date_from is not None:
+        conditions.append("last_order_date >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("first_order_date < %s")
+        params.append(date_to)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            f"SELECT archive_file, member_offset, member_length, last_order_date FROM OrderArchiveIndex "
+            f"WHERE {' AND '.join(conditions)} ORDER BY last_order_date DESC",
+            params
+        )
+        segments = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    found = []
+    for archive_file, offset, length, last_date in segments:
+        # Segments come newest first, so once `limit` orders are newer than this one we are done.
+        if len(found) >= limit and last_date < found[limit - 1].order_date:
+            break
+        for order in map(_summary, _read_segment(archive_file, offset, length)):
+            if before is not None and (order.order_date, order.order_id) >= tuple(before):
+                continue
+            if date_from is not None and order.order_date < date_from:
+                continue
+            if date_to is not None and order.order_date >= date_to:
+                continue
+            found.append(order)
+        found.sort(key=lambda order: (order.order_date, order.order_id), reverse=True)
+    return found[:limit]
+
+
+def archived_sales(connection):
+    """ Units and revenue of every archived order the rollups count, keyed as the rollup tables are:
+    ({(sale_date, seller_id): [units, revenue]}, {(sale_date, product_id): [units, revenue]}). """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT archive_file, member_offset, member_length FROM OrderArchiveIndex "
+                       "ORDER BY archive_file, member_offset")
+        segments = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    by_seller, by_product = {}, {}
+    for archive_file, offset, length in segments:
+        for record in _read_segment(archive_file, offset, length):
+            if record["order_status"] == "Failed":
+                continue
+            sale_date = date.fromisoformat(record["order_date"][:10])
+            for item in record["items"]:
+                revenue = item["quantity"] * Decimal(item["price_per_unit"])
+                for totals, key in ((by_seller, item["seller_id"]), (by_product, item["product_id"])):
+                    entry = totals.setdefault((sale_date, key), [0, Decimal(0)])
+                    entry[0] += item["quantity"]
+                    entry[1] += revenue
+    return by_seller, by_product
+
+
+def archive_status(connection):
+    """ Hot order count and age, and how much has been archived. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM Orders")
+        hot_orders = cursor.fetchone()[0]
+        cursor.execute("SELECT order_date FROM Orders ORDER BY order_date LIMIT 1")
+        oldest_hot = (cursor.fetchone() or (None,))[0]
+        cursor.execute("SELECT COALESCE(SUM(order_count), 0) FROM OrderArchiveIndex")
+        archived = int(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+    files = glob.glob(os.path.join(ARCHIVE_DIR, "orders-*.jsonl.gz"))
+    return ArchiveStatus(hot_orders, oldest_hot, archived, len(files), sum(os.path.getsize(f) for f in files))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH, help="orders moved per transaction")
+    parser.add_argument("--archive-dir", default=None, help=f"where the archive files live (default {ARCHIVE_DIR})")
+    parser.add_argument("--status", action="store_true", help="show hot and archived order counts and exit")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+    if args.archive_dir:
+        configure_archive(args.archive_dir)
+
+    connection = create_connection()
+    if not connection:
+        return
+    try:
+        if not args.status:
+            started = time.perf_counter()
+            archived = archive_orders(connection, args.older_than_days, args.batch, verbose=True)
+            print(f"Archived {archived:,} order(s) older than {args.older_than_days} days "
+                  f"in {time.perf_counter() - started:.1f}s.")
+        status = archive_status(connection)
+        print(f"Hot: {status.hot_orders:,} orders (oldest {status.oldest_hot or '-'}) | "
+              f"archived: {status.archived_orders:,} orders in {status.files} file(s), "
+              f"{status.archive_bytes / 1024 / 1024:.1f} MB in {ARCHIVE_DIR}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+# order_book.py
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+import queries
+from sql_dialect import dialect
+
+Offer = namedtuple("Offer", ["inventory_id", "seller_id", "first_name", "last_name", "price", "stock"])
+# best: the cheapest in-stock Offer (or None), offer_count / total_stock: depth of the book
+BestOffer = namedtuple("BestOffer", ["best", "offer_count", "total_stock"])
+# One seller's share of a quantity sweep, and the whole split (filled < requested if the book ran out)
+Fill = namedtuple("Fill", ["offer", "quantity"])
+SweepPlan = namedtuple("SweepPlan", ["fills", "requested", "filled", "total_price"])
+
+SWEEP_MAX_LINES = 100   # most sellers one sweep splits a quantity across (one cart line each)
+BOOK_CHECK_INTERVAL = 2.0   # seconds a loaded book is trusted before its summary row's version is re-read
+
+class ProductBook:
+    """ All in-stock offers for one product, kept sorted by (price, inventory_id). """
+
+    def __init__(self, product_id, offers=(), version=None):
+        self.product_id = product_id
+        self._keys = []      # sorted (price, inventory_id)
+        self._offers = {}    # inventory_id -> Offer
+        self.total_stock = 0
+        self.version = version                 # ProductBestOffer.version the book matches (None: unknown)
+        self.checked_at = time.monotonic()     # when that version was last confirmed
+        for offer in offers:
+            self.upsert(offer)
+
+    def upsert(self, offer):
+        """ Add or replace a listing. Listings with no stock are dropped from the book. """
+        self.remove(offer.inventory_id)
+        if offer.stock <= 0:
+            return
+        self._offers[offer.inventory_id] = offer
+        insort(self._keys, (offer.price, offer.inventory_id))
+        self.total_stock += offer.stock
+
+    def remove(self, inventory_id):
+        old = self._offers.pop(inventory_id, None)
+        if old is None:
+            return
+        idx = bisect_left(self._keys, (old.price, inventory_id))
+        del self._keys[idx]
+        self.total_stock -= old.stock
+
+    def consume(self, inventory_id, quantity):
+        """ Takes sold units off a listing without re-reading it. """
+        old = self._offers.get(inventory_id)
+        if old is not None:
+            self.upsert(old._replace(stock=old.stock - quantity))
+
+    def best(self):
+        return self._offers[self._keys[0][1]] if self._keys else None
+
+    def summary(self):
+        return BestOffer(self.best(), len(self._keys), self.total_stock)
+
+    def offers(self):
+        """ In-stock offers, cheapest first. """
+        return [self._offers[inv_id] for _, inv_id in self._keys]
+
+    def sweep(self, quantity, caps, max_lines):
+        """ [Fill] taking `quantity` units from the cheapest offers up, at most caps[inventory_id] from each.
+
+        Walks the sorted keys only as far as needed, so a deep book costs no more than the
+        offers actually taken.
+        """
+        fills = []
+        remaining = quantity
+        for _, inv_id in self._keys:
+            if remaining <= 0 or len(fills) >= max_lines:
+                break
+            offer = self._offers[inv_id]
+            take = min(offer.stock, remaining, caps.get(inv_id, offer.stock))
+            if take > 0:
+                fills.append(Fill(offer, take))
+                remaining -= take
+        return fills
+
+
+_books = {}         # product_id -> ProductBook
+_product_of = {}    # inventory_id -> product_id, for every listing held in a loaded book
+_lock = threading.RLock()
+
+
+def _install_book(book):
+    with _lock:
+        _drop_book(book.product_id)
+        for inv_id in book._offers:
+            _product_of[inv_id] = book.product_id
+        _books[book.product_id] = book
+        return book
+
+
+def _drop_book(product_id):
+    with _lock:
+        book = _books.pop(product_id, None)
+        if book is not None:
+            for inv_id in book._offers:
+                if _product_of.get(inv_id) == product_id:
+                    del _product_of[inv_id]
+
+
+def _read_offers(connection, product_id):
+    return [Offer(*row) for row in queries.select(connection, "offers.for_product", (product_id,))]
+
+
+def _load_book(connection, product_id):
+    """ Builds one product's book from Inventory, tagged with its summary row's version.
+
+    The version is read first: a write landing in between leaves the book newer than its
+    version, which only costs a reload on the next check.
+    """
+    row = queries.select_one(connection, "offers.best", (product_id,))
+    version = row[8] if row is not None and not row[9] else None
+    return _install_book(ProductBook(product_id, _read_offers(connection, product_id), version))
+
+
+def _current_book(connection, product_id, row=None):
+    """ The loaded book if it still matches its ProductBestOffer row, else None (and it is dropped).
+
+    Another process's write bumps the row's version, so a book built before it stops matching.
+    The row is re-read at most once per BOOK_CHECK_INTERVAL per product; pass it if already read.
+    """
+    with _lock:
+        book = _books.get(product_id)
+    if book is None:
+        return None
+    now = time.monotonic()
+    if row is None:
+        if now - book.checked_at < BOOK_CHECK_INTERVAL:
+            return book
+        row = queries.select_one(connection, "offers.best", (product_id,))
+    if row is not None and not row[9] and row[8] == book.version:
+        book.checked_at = now
+        return book
+    with _lock:
+        if _books.get(product_id) is book:
+            _drop_book(product_id)
+    return None
+
+
+def _get_book(connection, product_id):
+    book = _current_book(connection, product_id)
+    return book if book is not None else _load_book(connection, product_id)
+
+
+def refresh_summaries(connection, product_ids):
+    """ Recomputes the ProductBestOffer rows of `product_ids` from Inventory and reloads their books.
+
+    Runs after the write that changed the listings has committed, in a transaction of its own.
+    The summary rows are locked first, in product order, so recomputes of one product queue
+    up. Each then reads Inventory at READ COMMITTED, i.e. after the one before it committed,
+    so whichever runs last has seen every committed write and no process can put back an
+    older summary. Every recompute bumps the row's version, which tells other processes their
+    copy of the book is out of date. Returns {product_id: BestOffer}.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    if connection.in_transaction:
+        connection.commit()
+    connection.start_transaction(isolation_level="READ COMMITTED")
+    cursor = connection.cursor()
+    try:
+        cursor.executemany("INSERT INTO ProductBestOffer (product_id) VALUES (%s) "
+                           + dialect().on_duplicate(["product_id"], product_id="{new}"),
+                           [(product_id,) for product_id in product_ids])
+        books = [ProductBook(product_id, _read_offers(connection, product_id)) for product_id in product_ids]
+        rows = []
+        for book in books:
+            best, offer_count, total_stock = book.summary()
+            if best is None:
+                rows.append((None, None, None, None, None, None, 0, 0, book.product_id))
+            else:
+                rows.append((best.inventory_id, best.seller_id, best.first_name, best.last_name, best.price,
+                             best.stock, offer_count, total_stock, book.product_id))
+        cursor.executemany(
+            """
+            UPDATE ProductBestOffer
+            SET best_inventory_id = %s, best_seller_id = %s, best_first_name = %s, best_last_name = %s,
+                best_price = %s, best_stock = %s, offer_count = %s, total_stock = %s,
+                version = version + 1, stale = FALSE
+            WHERE product_id = %s
+            """,
+            rows
+        )
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        cursor.execute(f"SELECT product_id, version FROM ProductBestOffer WHERE product_id IN ({placeholders})",
+                       product_ids)
+        versions = dict(cursor.fetchall())
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    summaries = {}
+    for book in books:
+        book.version = versions[book.product_id]
+        _install_book(book)
+        summaries[book.product_id] = book.summary()
+    return summaries
+
+
+def get_best_offer(connection, product_id):
+    """ Cheapest in-stock offer plus book depth, without scanning the product's listings.
+
+    Served from memory when the book is loaded and current, otherwise from the ProductBestOffer
+    summary row (a primary-key lookup). Only a product whose row is missing or marked stale is
+    recomputed from Inventory.
+    """
+    with _lock:
+        book = _books.get(product_id)
+        if book is not None and time.monotonic() - book.checked_at < BOOK_CHECK_INTERVAL:
+            return book.summary()
+
+    row = queries.select_one(connection, "offers.best", (product_id,))
+    if row is None or row[9]:
+        return refresh_summaries(connection, [product_id])[product_id]
+    book = _current_book(connection, product_id, row) if book is not None else None
+    if book is not None:
+        with _lock:
+            return book.summary()
+
+    inv_id, seller_id, first_name, last_name, price, stock, offer_count, total_stock = row[:8]
+    best = Offer(inv_id, seller_id, first_name, last_name, price, stock) if inv_id is not None else None
+    return BestOffer(best, offer_count, total_stock)
+
+
+def get_offers(connection, product_id):
+    """ Every in-stock offer for a product, cheapest first. """
+    book = _get_book(connection, product_id)
+    with _lock:
+        return book.offers()
+
+
+def plan_sweep(connection, product_id, quantity, caps=None, max_lines=SWEEP_MAX_LINES):
+    """ SweepPlan splitting `quantity` units of a product across its cheapest sellers.
+
+    Served from the in-memory book, so it costs no query once the book is loaded. `caps`
+    ({inventory_id: units}) limits what may be taken from particular listings, e.g. the part
+    of their stock other buyers hold. Stock here is as of the book; nothing is reserved.
+    """
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive.")
+    book = _get_book(connection, product_id)
+    with _lock:
+        fills = book.sweep(quantity, caps or {}, max_lines)
+    return SweepPlan(fills, quantity, sum(f.quantity for f in fills),
+                     sum((f.offer.price * f.quantity for f in fills), 0))
+
+
+def refresh_listing(connection, inventory_id, product_id=None):
+    """ Brings a listing's product up to date after a committed seller add/update/remove.
+
+    Pass the listing's product_id when it has just been deleted, so the product's summary
+    row can be corrected even if its book was never loaded in this process.
+    """
+    row = queries.select_one(connection, "offers.listing", (inventory_id,))
+    changed = {product_id} if product_id is not None else set()
+    with _lock:
+        if inventory_id in _product_of:
+            changed.add(_product_of[inventory_id])
+    if row is not None:
+        changed.add(row[0])
+    refresh_summaries(connection, changed)
+
+
+def record_sale(connection, placed):
+    """ Brings the products of committed checkout lines [(inventory_id, quantity, price)] up to date. """
+    inv_ids = sorted({inv_id for inv_id, _, _ in placed})
+    if not inv_ids:
+        return
+    cursor = connection.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(inv_ids))
+        cursor.execute(f"SELECT DISTINCT product_id FROM Inventory WHERE inventory_id IN ({placeholders})", inv_ids)
+        product_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    refresh_summaries(connection, product_ids)
+
+
+def apply_changes(connection, changes):
+    """ Brings loaded books up to date from Inventory changes read off the change feed.
+
+    This is how writes made by other processes (another app instance, a stored procedure,
+    a purge) reach this process's books. Only the newest change per listing matters, and only
+    books already in memory are touched; the others load fresh when first browsed. Known
+    listings take their price and stock straight from the change. Listings a book doesn't
+    hold yet (new, or back in stock) are read in one query. Summary rows are left alone: every
+    writer recomputes its products' rows from Inventory once it has committed (refresh_summaries),
+    so they don't depend on the feed. Returns the products whose books changed.
+    """
+    latest = {}
+    for change in changes:
+        if change.entity == "inventory":
+            latest[change.entity_id] = change
+
+    changed = set()
+    fetch = []
+    with _lock:
+        for inv_id, change in latest.items():
+            old_product = _product_of.get(inv_id)
+            old_offer = _books[old_product]._offers.get(inv_id) if old_product in _books else None
+            if change.op == "delete" or (change.stock_after or 0) <= 0:
+                if old_product in _books:
+                    _books[old_product].remove(inv_id)
+                    changed.add(old_product)
+                _product_of.pop(inv_id, None)
+            elif old_offer is not None and old_product == change.product_id:
+                _books[old_product].upsert(old_offer._replace(price=change.price_after, stock=change.stock_after))
+                changed.add(old_product)
+            elif change.product_id in _books:
+                fetch.append(inv_id)
+
+    if fetch:
+        rows = queries.select(connection, "offers.listings", ids=fetch)
+        with _lock:
+            for row in rows:
+                product_id, offer = row[0], Offer(*row[1:])
+                old_product = _product_of.get(offer.inventory_id)
+                if old_product in _books and old_product != product_id:
+                    _books[old_product].remove(offer.inventory_id)
+                if product_id in _books:
+                    _books[product_id].upsert(offer)
+                    _product_of[offer.inventory_id] = product_id
+                    changed.add(product_id)
+    return changed
+
+
+def invalidate_products(connection, product_ids):
+    """ Marks the summary rows of products changed in bulk (e.g. a seller import) stale.
+
+    Rebuilding thousands of books eagerly would cost one query each; instead the next browse
+    of each product recomputes it once, through the stale-summary path in get_best_offer.
+    The version bump makes every process drop its copy of these books.
+    """
+    product_ids = list(product_ids)
+    with _lock:
+        for product_id in product_ids:
+            _drop_book(product_id)
+    cursor = connection.cursor()
+    try:
+        for start in range(0, len(product_ids), 1000):
+            batch = product_ids[start:start + 1000]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"UPDATE ProductBestOffer SET stale = TRUE, version = version + 1 "
+                           f"WHERE product_id IN ({placeholders})", batch)
+        connection.commit()
+    finally:
+        cursor.close()
@@ -0,0 +1,85 @@
+# order_history.py
+from collections import namedtuple
+
+import queries
+
+HISTORY_PAGE_SIZE = 10
+
+OrderSummary = namedtuple("OrderSummary", ["order_id", "order_date", "total_amount", "order_status",
+                                           "address_line1", "city", "items"])
+OrderLine = namedtuple("OrderLine", ["product_name", "seller_name", "quantity", "price_per_unit"])
+# orders: list of OrderSummary, newest first
+# next_cursor: pass back as `after` to get the following page, or None on the last page
+HistoryPage = namedtuple("HistoryPage", ["orders", "next_cursor"])
+
+
+def history_page_query(user_id, page_size=HISTORY_PAGE_SIZE, after=None, date_from=None, date_to=None):
+    """ The SQL and parameters for one page of a customer's hot orders (explain_check.py checks this). """
+    conditions = ["o.customer_id = %s"]
+    params = [user_id]
+    if date_from is not None:
+        conditions.append("o.order_date >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("o.order_date < %s")
+        params.append(date_to)
+    if after is not None:
+        after_date, after_id = after
+        conditions.append("(o.order_date < %s OR (o.order_date = %s AND o.order_id < %s))")
+        params.extend([after_date, after_date, after_id])
+
+    orders_query = f"""
+    SELECT o.order_id, o.order_date, o.total_amount, o.order_status, a.address_line1, a.city
+    FROM Orders o JOIN Addresses a ON o.address_id = a.address_id
+    WHERE {' AND '.join(conditions)}
+    ORDER BY o.order_date DESC, o.order_id DESC
+    LIMIT %s;
+    """
+    # Ask for one extra row so we know whether another page exists without a COUNT(*).
+    params.append(page_size + 1)
+    return orders_query, params
+
+
+def fetch_order_history_page(connection, user_id, page_size=HISTORY_PAGE_SIZE, after=None,
+                             date_from=None, date_to=None):
+    """ One page of a customer's orders with their items, in three small queries.
+
+    Pages are keyed on (order_date, order_id) rather than OFFSET, so every page costs the
+    same as the first. `after` is the next_cursor of the previous page. `date_from` is
+    inclusive and `date_to` exclusive; either may be None.
+
+    Orders moved to the archive (order_archive.py) are merged in, in date order, only once
+    the page reaches back past the customer's newest archived order.
+    """
+    from order_archive import archived_orders, newest_archived_date   # order_archive imports this module
+
+    orders_query, params = history_page_query(user_id, page_size, after, date_from, date_to)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(orders_query, params)
+        rows = cursor.fetchall()
+
+        newest_archived = newest_archived_date(connection, user_id)
+        if newest_archived is not None and (len(rows) <= page_size or rows[-1][1] <= newest_archived):
+            # Past the hot window: take the newest of both sources.
+            archived = archived_orders(connection, user_id, page_size + 1, after, date_from, date_to)
+            rows = sorted(rows + archived, key=lambda row: (row[1], row[0]), reverse=True)[:page_size + 1]
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if not rows:
+            return HistoryPage([], None)
+
+        # One batched items query for every hot order on the page.
+        order_ids = [row[0] for row in rows if not isinstance(row, OrderSummary)]
+        items_by_order = {order_id: [] for order_id in order_ids}
+        if order_ids:
+            for order_id, name, seller, qty, price in queries.select(connection, "history.items", ids=order_ids):
+                items_by_order[order_id].append(OrderLine(name, seller, qty, price))
+    finally:
+        cursor.close()
+
+    orders = [row if isinstance(row, OrderSummary) else OrderSummary(*row, items_by_order[row[0]]) for row in rows]
+    last = orders[-1]
+    next_cursor = (last.order_date, last.order_id) if has_more else None
+    return HistoryPage(orders, next_cursor)
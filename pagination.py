@@ -0,0 +1,74 @@
+# pagination.py
+
+DEFAULT_PAGE_SIZE = 25
+
+
+def fetch_keyset_page(connection, select_sql, key_column, conditions=(), params=(), after=None,
+                      page_size=DEFAULT_PAGE_SIZE):
+    """ One page of a listing ordered by a unique key. Returns (rows, next_after).
+
+    `select_sql` is a bare "SELECT ... FROM ..." whose first column is `key_column`.
+    `conditions` are SQL filters ANDed into the WHERE clause, with their values in `params`.
+    `after` is the next_after of the previous page (None for the first); next_after is None
+    on the last page. The page is read through an unbuffered cursor.
+    """
+    where = list(conditions)
+    page_params = list(params)
+    if after is not None:
+        where.append(f"{key_column} > %s")
+        page_params.append(after)
+    sql = select_sql
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {key_column} LIMIT %s"
+    page_params.append(page_size)
+
+    cursor = connection.cursor()  # unbuffered: rows arrive from the server as we iterate
+    try:
+        cursor.execute(sql, page_params)
+        rows = [row for row in cursor]
+    finally:
+        cursor.close()
+    next_after = rows[-1][0] if len(rows) == page_size else None
+    return rows, next_after
+
+
+def iter_pages(fetch_page):
+    """ Yields pages from fetch_page(after) -> (rows, next_after) until the last one. """
+    after = None
+    while True:
+        rows, after = fetch_page(after)
+        if rows:
+            yield rows
+        if after is None:
+            return
+
+
+def iter_keyset_pages(connection, select_sql, key_column, conditions=(), params=(), page_size=DEFAULT_PAGE_SIZE):
+    """ Yields a large listing one page (list of rows) at a time, ordered by a unique key.
+
+    Each page is its own `WHERE key > last_key ORDER BY key LIMIT n` query, so only one page
+    is ever held in memory and page N costs the same as page 1 however large the table grows.
+    """
+    return iter_pages(lambda after: fetch_keyset_page(connection, select_sql, key_column, conditions, params,
+                                                      after, page_size))
+
+
+def print_paged(pages, format_row, title, page_size=DEFAULT_PAGE_SIZE):
+    """ Prints pages as they arrive, pausing between them. Returns the number of rows shown. """
+    shown = 0
+    pause = True
+    print(f"\n--- {title} ---")
+    for page in pages:
+        for row in page:
+            print(format_row(row))
+        shown += len(page)
+        if pause and len(page) >= page_size:
+            choice = input(f"-- {shown} shown. Enter for more, 'a' for all, 'q' to stop: ").lower()
+            if choice == 'q':
+                break
+            if choice == 'a':
+                pause = False
+    if shown == 0:
+        print("No matching rows.")
+    return shown
@@ -0,0 +1,179 @@
+# price_watch.py
+"""
+Price-drop watchlists, fed by the change feed (change_feed.py).
+
+A customer watches a shoe with a target price (by default the best price at the time). The
+"price_watch" consumer reads Inventory changes off the feed; nothing polls Inventory. A listing
+that is added, cut in price or restocked may now be the cheapest. For each such product, the
+consumer takes the cheapest of those listings that is still in stock with a live seller. Every
+watch it beats gets a PriceAlert, and the customer sees their alerts once, next time they log
+in. A watch only alerts again for a price below its last alert, so one listing bouncing around
+doesn't spam anyone.
+
+The alerts and the consumer's offset commit together, so each change is looked at once even
+with several app processes running the consumer (see ChangeConsumer).
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from change_feed import ChangeConsumer, start_consumer
+from order_book import get_best_offer
+import queries
+from sql_dialect import dialect
+
+CONSUMER_NAME = "price_watch"
+ALERTS_PAGE_SIZE = 20
+
+Watch = namedtuple("Watch", ["product_id", "product_name", "target_price", "best_price", "created_at"])
+PriceAlert = namedtuple("PriceAlert", ["alert_id", "product_id", "product_name", "inventory_id", "old_price",
+                                       "new_price", "created_at"])
+
+
+def watch_product(connection, customer_id, product_id, target_price=None):
+    """ Watches a product for an offer below `target_price`. Returns the target used.
+
+    Without a target, any offer cheaper than today's best will do. Watching a product again
+    replaces its target and re-arms the alert.
+    """
+    if target_price is None:
+        best = get_best_offer(connection, product_id).best
+        if best is None:
+            raise ValueError("Nobody is selling this shoe right now; give a target price.")
+        target_price = best.price
+    target_price = Decimal(str(target_price))
+    if target_price <= 0:
+        raise ValueError("The target price must be positive.")
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO PriceWatches (customer_id, product_id, target_price) VALUES (%s, %s, %s) "
+            + dialect().on_duplicate(["customer_id", "product_id"], target_price="{new}", last_alert_price="NULL"),
+            (customer_id, product_id, target_price)
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return target_price
+
+
+def unwatch_product(connection, customer_id, product_id):
+    """ Stops watching a product. Returns False if it wasn't watched. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM PriceWatches WHERE customer_id = %s AND product_id = %s", (customer_id, product_id))
+        removed = cursor.rowcount > 0
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return removed
+
+
+def list_watches(connection, customer_id):
+    """ [Watch] for the customer, with each product's current best price (None when sold out). """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT w.product_id, p.product_name, w.target_price, w.created_at
+            FROM PriceWatches w JOIN Products p ON w.product_id = p.product_id
+            WHERE w.customer_id = %s
+            ORDER BY w.created_at, w.product_id
+            """,
+            (customer_id,)
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    watches = []
+    for product_id, product_name, target_price, created_at in rows:
+        best = get_best_offer(connection, product_id).best
+        watches.append(Watch(product_id, product_name, target_price, best.price if best else None, created_at))
+    return watches
+
+
+def unseen_alert_count(connection, customer_id):
+    return int(queries.select_one(connection, "alerts.unseen_count", (customer_id,))[0])
+
+
+def take_unseen_alerts(connection, customer_id, limit=ALERTS_PAGE_SIZE):
+    """ The customer's newest unseen [PriceAlert], marked seen in the same transaction. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT a.alert_id, a.product_id, p.product_name, a.inventory_id, a.old_price, a.new_price, a.created_at
+            FROM PriceAlerts a JOIN Products p ON a.product_id = p.product_id
+            WHERE a.customer_id = %s AND a.seen_at IS NULL
+            ORDER BY a.alert_id DESC LIMIT %s
+            """,
+            (customer_id, limit)
+        )
+        alerts = [PriceAlert(*row) for row in cursor.fetchall()]
+        cursor.execute("UPDATE PriceAlerts SET seen_at = NOW() WHERE customer_id = %s AND seen_at IS NULL",
+                       (customer_id,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return alerts
+
+
+def _candidates(changes):
+    """ {inventory_id: price before the change} for listings that may have become a product's best offer. """
+    candidates = {}
+    for change in changes:
+        if change.entity != "inventory" or change.op == "delete" or (change.stock_after or 0) <= 0:
+            continue
+        if (change.op == "insert" or (change.stock_before or 0) <= 0
+                or change.price_after < change.price_before):
+            candidates.setdefault(change.entity_id, change.price_before)
+    return candidates
+
+
+def handle_changes(connection, changes):
+    """ ChangeConsumer handler: writes PriceAlerts for watches beaten by this batch's drops. """
+    candidates = _candidates(changes)
+    if not candidates:
+        return
+    # The listings as they are now: still in stock, seller not removed, at their current price.
+    cheapest = {}   # product_id -> (price, inventory_id)
+    for row in queries.select(connection, "offers.listings", ids=list(candidates)):
+        product_id, inventory_id, price, stock = row[0], row[1], row[5], row[6]
+        if stock > 0 and (product_id not in cheapest or (price, inventory_id) < cheapest[product_id]):
+            cheapest[product_id] = (price, inventory_id)
+    if not cheapest:
+        return
+
+    alerts, rearmed = [], []
+    for watch_id, customer_id, product_id, target, last_alert in queries.select(
+            connection, "watches.for_products", ids=list(cheapest)):
+        price, inventory_id = cheapest[product_id]
+        if price < target and (last_alert is None or price < last_alert):
+            alerts.append((customer_id, product_id, inventory_id, candidates[inventory_id], price))
+            rearmed.append((price, watch_id))
+    if not alerts:
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.executemany("INSERT INTO PriceAlerts (customer_id, product_id, inventory_id, old_price, new_price) "
+                           "VALUES (%s, %s, %s, %s, %s)", alerts)
+        cursor.executemany("UPDATE PriceWatches SET last_alert_price = %s WHERE watch_id = %s", rearmed)
+    finally:
+        cursor.close()
+
+
+def price_watch_consumer():
+    return ChangeConsumer(CONSUMER_NAME, handle_changes)
+
+
+def start_price_watcher(pool):
+    """ Runs the price_watch consumer on a daemon thread. """
+    return start_consumer(pool, price_watch_consumer())
@@ -0,0 +1,334 @@
+# product_search.py
+"""
+In-memory product search over Products.product_name and brand.
+
+The index is built once per process (one streaming read of Products) and then answers every
+query from memory. It holds an inverted index (token -> product ids) and a sorted vocabulary
+for prefix matches ("jor" -> "jordan"). It also holds a trigram index over the vocabulary for
+typo-tolerant matches ("jordn" -> "jordan"). Every query word must match the product's name
+or brand. Exact words rank above prefixes, and prefixes rank above fuzzy matches.
+
+add_product() indexes a new product as soon as it is committed. Other processes pick it up
+by polling CatalogVersion at most once per VERSION_CHECK_INTERVAL; when the version moves,
+only the products with a higher product_id are read. Renames and deletions made anywhere
+reach the index through the change feed (change_feed.apply_to_caches -> refresh_products).
+"""
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from catalog_cache import VERSION_CHECK_INTERVAL
+
+SEARCH_LIMIT = 20
+PREFIX_MAX_TOKENS = 64       # vocabulary words a single prefix may expand to
+FUZZY_MIN_LENGTH = 3         # shorter query words only match exactly or by prefix
+
+SearchHit = namedtuple("SearchHit", ["product_id", "product_name", "brand", "category_id", "score"])
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Match weights: one query word scores its best match in the product.
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.6          # plus up to 0.3 for how much of the word was typed
+FUZZY_WEIGHTS = {1: 0.5, 2: 0.3}
+
+
+def tokenize(text):
+    return _TOKEN.findall((text or "").lower())
+
+
+def _trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_typos(token):
+    return 1 if len(token) <= 5 else 2
+
+
+def _edit_distance(a, b, limit):
+    """ Levenshtein distance, or limit + 1 as soon as it is known to exceed `limit`. """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class ProductIndex:
+    """ Inverted + trigram index over product names and brands. """
+
+    def __init__(self):
+        self._products = {}       # product_id -> (product_name, brand, category_id)
+        self._postings = {}       # token -> set of product_ids
+        self._vocabulary = []     # sorted tokens, for prefix lookups
+        self._trigram_index = {}  # trigram -> set of tokens
+        self._by_length = {}      # len(product_name) -> set of product_ids, for tie-breaking
+        self.max_product_id = 0
+
+    def __len__(self):
+        return len(self._products)
+
+    def add(self, product_id, product_name, brand, category_id):
+        """ Indexes one product (re-indexing it if it is already there). """
+        if product_id in self._products:
+            self.remove(product_id)
+        self._products[product_id] = (product_name, brand, category_id)
+        self._by_length.setdefault(len(product_name or ""), set()).add(product_id)
+        for token in set(tokenize(product_name)) | set(tokenize(brand)):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                insort(self._vocabulary, token)
+                for gram in _trigrams(token):
+                    self._trigram_index.setdefault(gram, set()).add(token)
+            postings.add(product_id)
+        if product_id > self.max_product_id:
+            self.max_product_id = product_id
+
+    def remove(self, product_id):
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        product_name, brand, _ = entry
+        bucket = self._by_length[len(product_name or "")]
+        bucket.discard(product_id)
+        if not bucket:
+            del self._by_length[len(product_name or "")]
+        for token in set(tokenize(product_name)) | set(tokenize(brand)):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(product_id)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+                for gram in _trigrams(token):
+                    self._trigram_index[gram].discard(token)
+
+    def _expand(self, word):
+        """ {vocabulary token: weight} for everything the query word can match. """
+        matches = {}
+        if word in self._postings:
+            matches[word] = EXACT_WEIGHT
+
+        start = bisect_left(self._vocabulary, word)
+        for token in self._vocabulary[start:start + PREFIX_MAX_TOKENS]:
+            if not token.startswith(word):
+                break
+            if token not in matches:
+                matches[token] = PREFIX_WEIGHT + 0.3 * len(word) / len(token)
+
+        if len(word) >= FUZZY_MIN_LENGTH:
+            limit = _max_typos(word)
+            grams = _trigrams(word)
+            shared = {}
+            for gram in grams:
+                for token in self._trigram_index.get(gram, ()):
+                    shared[token] = shared.get(token, 0) + 1
+            # One edit changes at most three trigrams, so weaker candidates can't be within the limit.
+            needed = max(1, len(grams) - 3 * limit)
+            for token, count in shared.items():
+                if count < needed or token in matches:
+                    continue
+                distance = _edit_distance(word, token, limit)
+                if distance <= limit:
+                    matches[token] = FUZZY_WEIGHTS[distance]
+        return matches
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """ Ranked [SearchHit] for products matching every word of the query. """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return []
+        expansions = [self._expand(word) for word in words]
+        if any(not matches for matches in expansions):
+            return []
+
+        # Products are kept grouped by total score ({score: set of product_ids}), so scoring is
+        # set intersections rather than a loop over every matching product. Start from the word
+        # with the fewest candidates; within a word stronger matches go first, so each product
+        # is credited with its best match for that word.
+        def candidate_count(matches):
+            return sum(len(self._postings[token]) for token in matches)
+        expansions.sort(key=candidate_count)
+
+        tiers = None
+        for matches in expansions:
+            ordered = sorted(matches.items(), key=lambda item: -item[1])
+            groups = [(0.0, None)] if tiers is None else list(tiers.items())
+            tiers = {}
+            for base, products in groups:
+                remaining = None if products is None else set(products)
+                for token, weight in ordered:
+                    postings = self._postings[token]
+                    if remaining is None:
+                        found = postings.difference(*[tiers[score] for score in tiers])
+                    else:
+                        found = remaining.intersection(postings)
+                        remaining -= found
+                    if found:
+                        score = round(base + weight, 3)
+                        tiers[score] = tiers[score] | found if score in tiers else found
+            if not tiers:
+                return []
+        return self._top(tiers, limit)
+
+    def _top(self, tiers, limit):
+        """ Best score first; among equals, shorter (more specific) names, then lower product_id. """
+        hits = []
+        for score in sorted(tiers, reverse=True):
+            for pid in self._shortest(tiers[score], limit - len(hits)):
+                hits.append(SearchHit(pid, *self._products[pid], score))
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def _shortest(self, products, count):
+        """ The `count` products with the shortest names, walking the name-length buckets upwards. """
+        if len(products) <= count * 4:
+            return sorted(products, key=lambda pid: (len(self._products[pid][0] or ""), pid))[:count]
+        chosen = []
+        for length in sorted(self._by_length):
+            found = products.intersection(self._by_length[length])
+            if found:
+                chosen.extend(sorted(found)[:count - len(chosen)])
+                if len(chosen) >= count:
+                    break
+        return chosen
+
+
+_index = ProductIndex()
+_lock = threading.Lock()
+_build_lock = threading.Lock()   # one first-time build per process, however many searches wait on it
+_state = {"built": False, "version": None, "checked_at": 0.0, "build_seconds": 0.0, "searches": 0,
+          "catch_ups": 0}
+
+
+def _read_version(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT version FROM CatalogVersion WHERE id = 1")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+
+
+def _load_products(connection, after_id=0):
+    """ Streams (product_id, product_name, brand, category_id) with product_id > after_id. """
+    cursor = connection.cursor()  # unbuffered: the catalog is read row by row, not all at once
+    try:
+        cursor.execute("SELECT product_id, product_name, brand, category_id FROM Products "
+                       "WHERE product_id > %s ORDER BY product_id", (after_id,))
+        for row in cursor:
+            yield row
+    finally:
+        cursor.close()
+
+
+def build_index(connection):
+    """ (Re)builds this process's index from Products. Returns the number of products indexed. """
+    started = time.perf_counter()
+    index = ProductIndex()
+    # Loaded outside the lock so searches keep using the old index meanwhile. The version is
+    # read first, so anything committed during the load is picked up by the next catch-up.
+    version = _read_version(connection)
+    for row in _load_products(connection):
+        index.add(*row)
+    connection.commit()
+    global _index
+    with _lock:
+        _index = index
+        _state.update(built=True, version=version, checked_at=time.monotonic(),
+                      build_seconds=time.perf_counter() - started)
+    return len(index)
+
+
+def _ensure_built(connection):
+    with _build_lock:
+        if not _state["built"]:
+            build_index(connection)
+
+
+def build_index_in_background(pool):
+    """ Builds the index on a daemon thread with its own pooled connection, so startup isn't held up. """
+    def build():
+        try:
+            with pool.connection() as connection:
+                _ensure_built(connection)
+        except Exception as e:
+            print(f"⚠️  Product search index could not be built yet: {e}")
+    thread = threading.Thread(target=build, name="product-search-build", daemon=True)
+    thread.start()
+    return thread
+
+
+def _catch_up(connection):
+    """ Indexes products added by other processes since the last check (throttled). """
+    now = time.monotonic()
+    with _lock:
+        if now - _state["checked_at"] < VERSION_CHECK_INTERVAL:
+            return
+        _state["checked_at"] = now
+        version = _read_version(connection)
+        if version != _state["version"]:
+            for row in _load_products(connection, _index.max_product_id):
+                _index.add(*row)
+            _state["version"] = version
+            _state["catch_ups"] += 1
+        connection.commit()
+
+
+def index_product(product_id, product_name, brand, category_id):
+    """ Adds a just-committed product to this process's index (no-op until the index is built). """
+    with _lock:
+        if _state["built"]:
+            _index.add(product_id, product_name, brand, category_id)
+
+
+def refresh_products(connection, product_ids):
+    """ Re-reads changed products (e.g. from the change feed) into the index; deleted ones drop out. """
+    product_ids = sorted(set(product_ids))
+    if not product_ids or not _state["built"]:
+        return
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT product_id, product_name, brand, category_id FROM Products "
+                       f"WHERE product_id IN ({placeholders})", product_ids)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    with _lock:
+        for product_id in set(product_ids) - {row[0] for row in rows}:
+            _index.remove(product_id)
+        for row in rows:
+            _index.add(*row)
+
+
+def search_products(connection, query, limit=SEARCH_LIMIT):
+    """ Ranked [SearchHit] for a free-text query. Builds the index on first use. """
+    if not _state["built"]:
+        _ensure_built(connection)
+    else:
+        _catch_up(connection)
+    with _lock:
+        _state["searches"] += 1
+        return _index.search(query, limit)
+
+
+def search_stats():
+    with _lock:
+        stats = dict(_state)
+        stats["products"] = len(_index)
+        stats["tokens"] = len(_index._vocabulary)
+    return stats
@@ -0,0 +1,275 @@
+# queries.py
+"""
+Named registry of the fixed statements on the hot paths, run as server-side prepared statements.
+
+Every statement here is looked up by name, e.g. select(connection, "cart.lines", (user_id,)).
+On MySQL, each pooled connection prepares a statement the first time it runs it
+(cursor(prepared=True)) and keeps that cursor. Later runs skip parsing and planning and
+only send the parameters, in the binary protocol. The cache is keyed by the connection's
+server thread id, so a connection the pool reconnected prepares again. A statement that
+fails is dropped from the cache and re-prepared on its next run.
+
+Statements whose SQL contains {ids} take a list for an IN (...) filter. The list is padded
+(by repeating its last id) up to the next power of two, so a handful of prepared variants
+cover every list length up to MAX_IN_LIST.
+
+The SQLite backend has no server-side statements to reuse, so there the registry runs each
+statement on a plain cursor. sqlite3 keeps its own cache of compiled statements.
+
+Each pooled connection holds at most one prepared statement per registry entry (and per
+{ids} size). Keep max_prepared_stmt_count above that times the pool sizes.
+"""
+import threading
+import weakref
+from collections import namedtuple
+
+from sql_dialect import dialect
+
+MAX_IN_LIST = 1024
+
+QUERIES = {
+    # Accounts
+    # Removed users (services.delete_user) can't log in, and their listings are neither shown nor sold.
+    "login": """
+        SELECT user_id, user_role, first_name FROM Users
+        WHERE email = %s AND password_hash = %s AND deleted_at IS NULL""",
+
+    # Catalog
+    "catalog.version": "SELECT version FROM CatalogVersion WHERE id = 1",
+    "catalog.categories": "SELECT category_id, category_name FROM Categories",
+    "catalog.products_in_category": "SELECT product_id, product_name FROM Products WHERE category_id = %s",
+
+    # Order book (view_product_sellers)
+    "offers.for_product": """
+        SELECT i.inventory_id, i.seller_id, u.first_name, u.last_name, i.price, i.stock_quantity
+        FROM Inventory i JOIN Users u ON i.seller_id = u.user_id
+        WHERE i.product_id = %s AND i.stock_quantity > 0 AND u.deleted_at IS NULL""",
+    "offers.best": """
+        SELECT best_inventory_id, best_seller_id, best_first_name, best_last_name, best_price,
+               best_stock, offer_count, total_stock, version, stale
+        FROM ProductBestOffer WHERE product_id = %s""",
+    "offers.listing": """
+        SELECT i.product_id, i.inventory_id, i.seller_id, u.first_name, u.last_name, i.price, i.stock_quantity
+        FROM Inventory i JOIN Users u ON i.seller_id = u.user_id
+        WHERE i.inventory_id = %s AND u.deleted_at IS NULL""",
+    "offers.listings": """
+        SELECT i.product_id, i.inventory_id, i.seller_id, u.first_name, u.last_name, i.price, i.stock_quantity
+        FROM Inventory i JOIN Users u ON i.seller_id = u.user_id
+        WHERE i.inventory_id IN ({ids}) AND u.deleted_at IS NULL""",
+
+    # Cart (view_cart)
+    "cart.count": "SELECT COALESCE(SUM(quantity), 0) FROM Cart WHERE customer_id = %s",
+    "cart.lines": """
+        SELECT c.inventory_id, p.product_name, u.first_name AS seller_name, i.price, c.quantity,
+               (i.price * c.quantity) AS subtotal
+        FROM Cart AS c
+        JOIN Inventory AS i ON c.inventory_id = i.inventory_id
+        JOIN Products AS p ON i.product_id = p.product_id
+        JOIN Users AS u ON i.seller_id = u.user_id
+        WHERE c.customer_id = %s""",
+    "listing.details": """
+        SELECT i.inventory_id, p.product_name, u.first_name, i.price
+        FROM Inventory AS i
+        JOIN Products AS p ON i.product_id = p.product_id
+        JOIN Users AS u ON i.seller_id = u.user_id
+        WHERE i.inventory_id IN ({ids})""",
+
+    # Checkout
+    "checkout.cart": """
+        SELECT c.inventory_id, c.quantity, i.price, i.stock_quantity
+        FROM Cart c JOIN Inventory i ON c.inventory_id = i.inventory_id
+        WHERE c.customer_id = %s
+        ORDER BY c.inventory_id""",
+    "checkout.cart_available": """
+        SELECT c.inventory_id, c.quantity, i.price, a.available_quantity + COALESCE(r.quantity, 0)
+        FROM Cart c
+        JOIN Inventory i ON c.inventory_id = i.inventory_id
+        JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+        LEFT JOIN StockReservations r
+          ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
+        WHERE c.customer_id = %s
+        ORDER BY c.inventory_id""",
+    "checkout.lock_cart": "SELECT inventory_id, quantity FROM Cart WHERE customer_id = %s FOR UPDATE",
+    # The seller check is a subquery so it doesn't lock the seller's Users row as well.
+    "checkout.lock_listings": """
+        SELECT inventory_id, price, stock_quantity FROM Inventory i
+        WHERE inventory_id IN ({ids})
+          AND EXISTS (SELECT 1 FROM Users u WHERE u.user_id = i.seller_id AND u.deleted_at IS NULL)
+        ORDER BY inventory_id FOR UPDATE""",
+    "checkout.insert_address": """
+        INSERT INTO Addresses (user_id, address_line1, city, state, postal_code) VALUES (%s, %s, %s, %s, %s)""",
+    "checkout.insert_order": "INSERT INTO Orders (customer_id, address_id, total_amount) VALUES (%s, %s, %s)",
+
+    # Stock holds (stock_holds.py). InventoryAvailability subtracts every unexpired hold, so a
+    # buyer's own hold is added back to get what they may take.
+    "holds.check": """
+        SELECT c.inventory_id, c.quantity, a.available_quantity + COALESCE(r.quantity, 0)
+        FROM Cart c
+        JOIN InventoryAvailability a ON a.inventory_id = c.inventory_id
+        LEFT JOIN StockReservations r
+          ON r.customer_id = c.customer_id AND r.inventory_id = c.inventory_id AND r.expires_at > NOW(3)
+        WHERE c.customer_id = %s AND c.inventory_id IN ({ids})""",
+    "holds.available": """
+        SELECT a.inventory_id, a.available_quantity + COALESCE(r.quantity, 0)
+        FROM InventoryAvailability a
+        LEFT JOIN StockReservations r
+          ON r.inventory_id = a.inventory_id AND r.customer_id = %s AND r.expires_at > NOW(3)
+        WHERE a.inventory_id IN ({ids})""",
+    "holds.for_customer": "SELECT inventory_id, quantity FROM StockReservations WHERE customer_id = %s AND expires_at > NOW(3)",
+
+    # Order history (view_order_history)
+    "history.items": """
+        SELECT oi.order_id, p.product_name, u.first_name AS seller_name, oi.quantity, oi.price_per_unit
+        FROM OrderItems oi
+        JOIN Inventory i ON oi.inventory_id = i.inventory_id
+        JOIN Products p ON i.product_id = p.product_id
+        JOIN Users u ON i.seller_id = u.user_id
+        WHERE oi.order_id IN ({ids})
+        ORDER BY oi.order_id, oi.order_item_id""",
+
+    # Seller
+    "seller.listings": """
+        SELECT i.inventory_id, p.product_name, i.price, i.stock_quantity
+        FROM Inventory AS i
+        JOIN Products AS p ON i.product_id = p.product_id
+        WHERE i.seller_id = %s""",
+    "seller.listing_product": "SELECT product_id FROM Inventory WHERE inventory_id = %s AND seller_id = %s",
+
+    # Change feed (change_feed.py) and price watches (price_watch.py)
+    "changes.after": """
+        SELECT seq, entity, entity_id, op, product_id, price_before, price_after, stock_before, stock_after,
+               order_status, changed_at
+        FROM ChangeLog WHERE seq > %s ORDER BY seq LIMIT %s""",
+    "changes.latest": "SELECT COALESCE(MAX(seq), 0) FROM ChangeLog",
+    "watches.for_products": """
+        SELECT watch_id, customer_id, product_id, target_price, last_alert_price
+        FROM PriceWatches WHERE product_id IN ({ids})""",
+    "alerts.unseen_count": "SELECT COUNT(*) FROM PriceAlerts WHERE customer_id = %s AND seen_at IS NULL",
+}
+
+WriteResult = namedtuple("WriteResult", ["rowcount", "lastrowid"])
+
+_lock = threading.Lock()
+_prepared = weakref.WeakKeyDictionary()   # raw connection -> (server thread id, {(name, size): cursor})
+_expanded = {}                             # (name, size) -> SQL with the IN list spelled out
+_stats = {name: {"executions": 0, "prepares": 0} for name in QUERIES}
+
+
+def _padded(name, ids):
+    """ (cache key, SQL, ids padded to the variant's size) """
+    if ids is None:
+        return (name, None), QUERIES[name], []
+    ids = list(ids)
+    if not ids or len(ids) > MAX_IN_LIST:
+        raise ValueError(f"{name}: IN list of {len(ids)} ids (1..{MAX_IN_LIST} allowed)")
+    size = 1 << (len(ids) - 1).bit_length()
+    key = (name, size)
+    sql = _expanded.get(key)
+    if sql is None:
+        sql = _expanded[key] = QUERIES[name].format(ids=", ".join(["%s"] * size))
+    return key, sql, ids + ids[-1:] * (size - len(ids))
+
+
+def _count(name, field):
+    with _lock:
+        _stats[name][field] += 1
+
+
+def _prepared_cursor(connection, key, name):
+    """ This connection's prepared cursor for `key`, created on first use. """
+    raw = getattr(connection, "raw", connection)
+    thread_id = raw.connection_id
+    with _lock:
+        entry = _prepared.get(raw)
+        if entry is None or entry[0] != thread_id:   # new, or reconnected since
+            entry = _prepared[raw] = (thread_id, {})
+        cursor = entry[1].get(key)
+    if cursor is None:
+        cursor = connection.cursor(prepared=True)
+        with _lock:
+            entry[1][key] = cursor
+        _count(name, "prepares")
+    return cursor, entry[1]
+
+
+def _execute(connection, name, params, ids, fetch):
+    key, sql, id_params = _padded(name, ids)
+    params = list(params) + id_params
+    # A session routed across replicas (read_routing) picks the real connection per statement.
+    route = getattr(connection, "connection_for", None)
+    if route is not None:
+        connection = route(sql)
+    _count(name, "executions")
+
+    if not dialect().prepared_statements:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if fetch else WriteResult(cursor.rowcount, cursor.lastrowid)
+        finally:
+            cursor.close()
+
+    cursor, cache = _prepared_cursor(connection, key, name)
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall() if fetch else WriteResult(cursor.rowcount, cursor.lastrowid)
+    except Exception:
+        with _lock:
+            cache.pop(key, None)
+        try:
+            cursor.close()
+        except Exception:
+            pass
+        raise
+
+
+def statement(name, params=(), ids=None):
+    """ (SQL, parameters) for the registered query `name`, exactly as select()/write() send them. """
+    _, sql, id_params = _padded(name, ids)
+    return sql, list(params) + id_params
+
+
+def select(connection, name, params=(), ids=None):
+    """ Rows of the registered query `name`. `ids` fills its {ids} IN list. """
+    return _execute(connection, name, params, ids, fetch=True)
+
+
+def select_one(connection, name, params=(), ids=None):
+    """ First row of the registered query `name`, or None. """
+    rows = _execute(connection, name, params, ids, fetch=True)
+    return rows[0] if rows else None
+
+
+def write(connection, name, params=()):
+    """ Runs the registered INSERT/UPDATE/DELETE `name` in the caller's transaction. Returns WriteResult. """
+    return _execute(connection, name, params, None, fetch=False)
+
+
+# ---------------------------------
+# Reporting
+# ---------------------------------
+
+def registry_stats():
+    """ {name: {"executions", "prepares"}} for this process. """
+    with _lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def reset_stats():
+    with _lock:
+        for counts in _stats.values():
+            counts["executions"] = counts["prepares"] = 0
+
+
+def print_registry_stats():
+    stats = registry_stats()
+    used = sorted(((name, s) for name, s in stats.items() if s["executions"]), key=lambda item: -item[1]["executions"])
+    print(f"\n--- 📇 Query Registry ({len(QUERIES)} statements, "
+          f"{'prepared per connection' if dialect().prepared_statements else 'plain cursors'}) ---")
+    if not used:
+        print("No registered statements run yet.")
+        return
+    print(f"{'executions':>10} {'prepares':>9} {'reuse':>7}  statement")
+    for name, s in used:
+        reuse = f"{s['executions'] / s['prepares']:>6.0f}x" if s["prepares"] else f"{'-':>7}"
+        print(f"{s['executions']:>10} {s['prepares']:>9} {reuse}  {name}")
@@ -0,0 +1,395 @@
+# query_stats.py
+"""
+Query instrumentation: every statement run through a pooled connection is timed.
+
+Statements are grouped by fingerprint (the SQL with literals and placeholders replaced by ?
+and IN-lists collapsed), and each fingerprint keeps a count, a log-scale latency histogram
+and the rows it returned or changed. Statements are also attributed to the user action that
+issued them (a menu choice or a server op), so "checkout = 9 statements" is visible directly.
+Statements slower than the slow-query threshold are written to the slow-query log with their
+parameters redacted to type names.
+
+Recording costs two perf_counter() calls, a dict lookup and a short lock per statement, so it
+is meant to stay on. Set QUERY_STATS_ENABLED = False to hand out raw connections instead.
+"""
+import json
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+QUERY_STATS_ENABLED = True
+SLOW_QUERY_THRESHOLD = 0.2            # seconds; None turns the slow-query log off
+SLOW_QUERY_LOG_PATH = "slow_queries.log"  # None keeps slow queries in memory only
+SLOW_QUERY_KEEP = 100                 # recent slow queries kept for the admin screen
+
+# Histogram bucket upper bounds in seconds: 0.1 ms doubling up to ~13 s, plus an overflow bucket.
+BUCKET_BOUNDS = [0.0001 * 2 ** k for k in range(18)]
+
+_FINGERPRINT_CACHE_SIZE = 4096
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%(?:\(\w+\))?s")
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\((?:\?, )*\?\))(?:, \((?:\?, )*\?\))+")
+
+
+class _Histogram:
+    __slots__ = ("count", "errors", "total", "max", "rows", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[bisect_left(BUCKET_BOUNDS, elapsed)] += 1
+
+    def percentile(self, pct):
+        """ Upper bound of the bucket holding the pct-th percentile (capped at the observed max). """
+        if not self.count:
+            return 0.0
+        target = pct / 100.0 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": self.total * 1000,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+            "rows": self.rows,
+        }
+
+
+class _ActionStat:
+    __slots__ = ("calls", "statements", "max_statements", "db_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.db_time = 0.0
+
+
+_lock = threading.Lock()
+_slow_lock = threading.Lock()
+_statements = {}                       # fingerprint -> _Histogram
+_actions = {}                          # action name -> _ActionStat
+_slow = deque(maxlen=SLOW_QUERY_KEEP)
+_fingerprints = {}                     # raw SQL -> fingerprint
+_local = threading.local()             # .action = [name, statements, db_time] while inside track_action
+_since = datetime.now(timezone.utc)
+
+
+def fingerprint(sql):
+    """ SQL with literals and placeholders replaced by ?, IN-lists collapsed and whitespace squeezed. """
+    fp = _fingerprints.get(sql)
+    if fp is None:
+        fp = _STRING_LITERAL.sub("?", sql)
+        fp = _PLACEHOLDER.sub("?", fp)
+        fp = _NUMBER.sub("?", fp)
+        fp = _WHITESPACE.sub(" ", fp).strip().rstrip(";").strip()
+        fp = _IN_LIST.sub("IN (...)", fp)
+        fp = _VALUES_ROWS.sub(r"\1, ...", fp)
+        if len(_fingerprints) >= _FINGERPRINT_CACHE_SIZE:
+            _fingerprints.clear()
+        _fingerprints[sql] = fp
+    return fp
+
+
+def redact(params):
+    """ Parameters reduced to their types (and lengths for strings), never their values. """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _redact_value(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_redact_value(value) for value in params]
+    return _redact_value(params)
+
+
+def _redact_value(value):
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    if isinstance(value, (list, tuple)):
+        return f"<{len(value)} values>"
+    return f"<{type(value).__name__}>"
+
+
+def record(sql, elapsed, params=None, failed=False):
+    """ Adds one statement execution to the aggregates. `params` is only looked at if it was slow. """
+    fp = fingerprint(sql) if isinstance(sql, str) else str(sql)
+    with _lock:
+        stat = _statements.get(fp)
+        if stat is None:
+            stat = _statements[fp] = _Histogram()
+        stat.add(elapsed)
+        if failed:
+            stat.errors += 1
+    action = getattr(_local, "action", None)
+    if action is not None:
+        action[1] += 1
+        action[2] += elapsed
+    if SLOW_QUERY_THRESHOLD is not None and elapsed >= SLOW_QUERY_THRESHOLD:
+        _log_slow(fp, elapsed, params, action[0] if action else None)
+
+
+def _add_rows(sql, rows):
+    if rows > 0:
+        fp = fingerprint(sql)
+        with _lock:
+            stat = _statements.get(fp)
+            if stat is not None:
+                stat.rows += rows
+
+
+def _log_slow(fp, elapsed, params, action):
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "ms": round(elapsed * 1000, 2),
+        "action": action,
+        "sql": fp,
+        "params": params() if isinstance(params, _LazyRedact) else redact(params),
+    }
+    with _slow_lock:   # separate from _lock so file I/O never stalls the hot path
+        _slow.append(entry)
+        if SLOW_QUERY_LOG_PATH:
+            try:
+                with open(SLOW_QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError:
+                pass
+
+
+@contextmanager
+def track_action(name):
+    """ Attributes every statement run on this thread inside the block to the action `name`.
+
+    Nested blocks count toward the outermost action only. A None name tracks nothing.
+    """
+    if name is None or getattr(_local, "action", None) is not None:
+        yield
+        return
+    _local.action = action = [name, 0, 0.0]
+    try:
+        yield
+    finally:
+        _local.action = None
+        with _lock:
+            stat = _actions.get(name)
+            if stat is None:
+                stat = _actions[name] = _ActionStat()
+            stat.calls += 1
+            stat.statements += action[1]
+            stat.db_time += action[2]
+            if action[1] > stat.max_statements:
+                stat.max_statements = action[1]
+
+
+# ---------------------------------
+# Connection / cursor wrappers
+# ---------------------------------
+
+class InstrumentedConnection:
+    """ Wraps a connection so every cursor it hands out is timed. Everything else passes through. """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    @property
+    def raw(self):
+        return self._connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class InstrumentedCursor:
+    """ Times execute/executemany/callproc. Rows are counted when the next statement runs or on close. """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._pending_sql = None   # last statement whose rows haven't been counted yet
+
+    def _timed(self, method, sql, params):
+        self._settle_rows()
+        started = time.perf_counter()
+        try:
+            result = method()
+        except Exception:
+            record(sql, time.perf_counter() - started, params=params, failed=True)
+            raise
+        record(sql, time.perf_counter() - started, params=params)
+        self._pending_sql = sql
+        return result
+
+    def _settle_rows(self):
+        # rowcount is only final once an unbuffered result has been read, so count it late.
+        if self._pending_sql is not None:
+            try:
+                rows = self._cursor.rowcount
+            except Exception:
+                rows = -1
+            _add_rows(self._pending_sql, rows if rows and rows > 0 else 0)
+            self._pending_sql = None
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._timed(lambda: self._cursor.execute(operation, params, *args, **kwargs),
+                           operation, _LazyRedact(params))
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        return self._timed(lambda: self._cursor.executemany(operation, seq_params, *args, **kwargs),
+                           operation, _LazyRedact(seq_params, many=True))
+
+    def callproc(self, procname, args=(), *more, **kwargs):
+        return self._timed(lambda: self._cursor.callproc(procname, args, *more, **kwargs),
+                           f"CALL {procname}", _LazyRedact(args))
+
+    def close(self):
+        self._settle_rows()
+        return self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _LazyRedact:
+    """ Defers redaction to the rare case a statement is actually slow. """
+
+    __slots__ = ("params", "many")
+
+    def __init__(self, params, many=False):
+        self.params = params
+        self.many = many
+
+    def __call__(self):
+        if self.many:
+            rows = list(self.params) if not isinstance(self.params, (list, tuple)) else self.params
+            return {"rows": len(rows), "first": redact(rows[0]) if rows else None}
+        return redact(self.params)
+
+
+def instrument(connection):
+    """ Returns the connection wrapped for timing, or unchanged if instrumentation is off. """
+    if connection is None or not QUERY_STATS_ENABLED or isinstance(connection, InstrumentedConnection):
+        return connection
+    return InstrumentedConnection(connection)
+
+
+# ---------------------------------
+# Reporting
+# ---------------------------------
+
+def configure(enabled=None, slow_threshold=False, slow_log_path=False):
+    """ Changes settings at runtime. Pass None as slow_threshold to turn the slow log off. """
+    global QUERY_STATS_ENABLED, SLOW_QUERY_THRESHOLD, SLOW_QUERY_LOG_PATH
+    if enabled is not None:
+        QUERY_STATS_ENABLED = enabled
+    if slow_threshold is not False:
+        SLOW_QUERY_THRESHOLD = slow_threshold
+    if slow_log_path is not False:
+        SLOW_QUERY_LOG_PATH = slow_log_path
+
+
+def reset():
+    global _since
+    with _lock:
+        _statements.clear()
+        _actions.clear()
+        _since = datetime.now(timezone.utc)
+    with _slow_lock:
+        _slow.clear()
+
+
+def snapshot():
+    """ Everything collected so far as plain data, statements sorted by total time. """
+    with _lock:
+        statements = [dict(sql=fp, **stat.summary()) for fp, stat in _statements.items()]
+        actions = {
+            name: {
+                "calls": s.calls,
+                "statements_per_call": s.statements / s.calls if s.calls else 0.0,
+                "max_statements": s.max_statements,
+                "db_ms_per_call": s.db_time / s.calls * 1000 if s.calls else 0.0,
+            }
+            for name, s in _actions.items()
+        }
+        since = _since
+    with _slow_lock:
+        slow = list(_slow)
+    statements.sort(key=lambda s: s["total_ms"], reverse=True)
+    return {
+        "since": since.isoformat(timespec="seconds"),
+        "slow_query_threshold_ms": SLOW_QUERY_THRESHOLD * 1000 if SLOW_QUERY_THRESHOLD is not None else None,
+        "statements": statements,
+        "actions": actions,
+        "slow_queries": slow,
+    }
+
+
+def dump_json(path):
+    """ Writes snapshot() to a JSON file. """
+    data = snapshot()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
+
+
+def print_query_stats(top=15):
+    """ Prints the busiest statements, per-action round trips and the latest slow queries. """
+    data = snapshot()
+    print(f"\n--- ⏱️  Query Stats (since {data['since']}) ---")
+    if not data["statements"]:
+        print("No statements recorded yet.")
+        return
+    print(f"{'calls':>7} {'total ms':>10} {'avg':>7} {'p95':>7} {'max':>8} {'rows':>8}  statement")
+    for s in data["statements"][:top]:
+        sql = s["sql"] if len(s["sql"]) <= 70 else s["sql"][:67] + "..."
+        print(f"{s['count']:>7} {s['total_ms']:>10.1f} {s['avg_ms']:>7.2f} {s['p95_ms']:>7.2f} "
+              f"{s['max_ms']:>8.2f} {s['rows']:>8}  {sql}")
+    if len(data["statements"]) > top:
+        print(f"... {len(data['statements']) - top} more statement shapes (see the JSON dump).")
+
+    if data["actions"]:
+        print("\nRound trips per action:")
+        for name, a in sorted(data["actions"].items(), key=lambda item: -item[1]["statements_per_call"]):
+            print(f"  {name:<28} {a['calls']:>6} calls | {a['statements_per_call']:>6.1f} statements "
+                  f"(max {a['max_statements']}) | {a['db_ms_per_call']:>8.2f} ms in DB")
+
+    if data["slow_queries"]:
+        print(f"\nRecent slow queries (>= {data['slow_query_threshold_ms']:.0f} ms):")
+        for entry in data["slow_queries"][-10:]:
+            print(f"  {entry['at']} {entry['ms']:>9.1f} ms [{entry['action'] or '-'}] {entry['sql'][:80]}")
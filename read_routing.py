@@ -0,0 +1,327 @@
+# read_routing.py
+"""
+Read/write splitting across the primary and the read replicas in db_connector.REPLICA_CONFIGS.
+
+session_connection() hands out one connection-like object per session (a CLI login, or one
+server request). It routes every statement as follows:
+
+  * Plain SELECT / SHOW / EXPLAIN statements go to a replica.
+  * Everything else goes to the primary: writes, CALL, locking reads (FOR UPDATE / FOR SHARE),
+    LAST_INSERT_ID() and session variables. Once a transaction writes or is started explicitly
+    (checkout, rollups), every statement stays on the primary until commit or rollback.
+  * Read-your-writes: after a session commits a write, its reads go to the primary again
+    until a replica is known to have that write. READ_YOUR_WRITES picks how that is known:
+      "pin"  -> reads stay on the primary for REPLICA_PIN_SECONDS after the write
+      "wait" -> the replica waits (up to REPLICA_WAIT_TIMEOUT) for the primary's GTID set
+                as of the write; on timeout the read goes to the primary. Needs gtid_mode=ON.
+      "off"  -> no guarantee (only for measuring how stale reads get)
+
+A session's consistency state (SessionConsistency) outlives the borrowed connection, so the
+server keeps one per client and a write in one request is visible to the next. Replica
+connections run in autocommit mode, so every replica read sees the latest applied data.
+A replica that cannot be reached is skipped for REPLICA_RETRY_AFTER seconds.
+
+With no replicas configured, or on the SQLite backend, session_connection() yields the plain pooled
+primary connection.
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+import db_connector
+from query_stats import instrument
+
+READ_YOUR_WRITES_MODES = ("pin", "wait", "off")
+READ_YOUR_WRITES = "pin"
+REPLICA_PIN_SECONDS = 5.0       # reads stay on the primary this long after a write ("pin")
+REPLICA_WAIT_TIMEOUT = 0.5      # seconds a replica may take to catch up before we read the primary ("wait")
+REPLICA_RETRY_AFTER = 30.0      # seconds an unreachable replica is left alone
+
+_READ_STATEMENT = re.compile(r"^\s*\(*\s*(SELECT|WITH|SHOW|EXPLAIN|DESCRIBE|DESC)\b", re.IGNORECASE)
+# Locking reads, reads with side effects, and WITH ... UPDATE/DELETE all need the primary.
+_PRIMARY_ONLY = re.compile(r"\b(UPDATE|SHARE|DELETE|INSERT|REPLACE|INTO)\b|\bLOCK\s+IN\b|\bLAST_INSERT_ID\s*\("
+                           r"|\bGET_LOCK\s*\(|@", re.IGNORECASE)
+
+_stats = {"replica_reads": 0, "primary_reads": 0, "writes": 0, "pinned_reads": 0, "waited_reads": 0,
+          "wait_timeouts": 0, "replica_failures": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def is_read_only(operation):
+    """ True for statements that are safe on a replica. """
+    return bool(_READ_STATEMENT.match(operation)) and not _PRIMARY_ONLY.search(operation)
+
+
+def configure_routing(mode):
+    """ Selects the read-your-writes strategy for this process. """
+    global READ_YOUR_WRITES
+    if mode not in READ_YOUR_WRITES_MODES:
+        raise ValueError(f"Unknown read-your-writes mode {mode!r}; choose from {', '.join(READ_YOUR_WRITES_MODES)}.")
+    READ_YOUR_WRITES = mode
+
+
+class SessionConsistency:
+    """ What one session has written, so its later reads can see it. """
+
+    def __init__(self):
+        self.last_write_at = None   # time.monotonic() of the last committed write
+        self.gtid_set = None        # primary's gtid_executed right after that write ("wait" mode)
+        self.caught_up = set()      # replica indexes known to have applied gtid_set
+
+    def note_write(self, gtid_set=None):
+        self.last_write_at = time.monotonic()
+        self.gtid_set = gtid_set or None
+        self.caught_up = set()
+
+    def pinned(self):
+        """ True while reads must stay on the primary under "pin" (or "wait" without GTIDs). """
+        return self.last_write_at is not None and time.monotonic() - self.last_write_at < REPLICA_PIN_SECONDS
+
+
+class _Replica:
+    def __init__(self, index, config, pool):
+        self.index = index
+        self.config = config
+        self.pool = pool
+        self.down_until = 0.0
+
+
+_replicas = None
+_replicas_lock = threading.Lock()
+_next_replica = 0
+
+
+def _connect_replica(config):
+    connection = instrument(mysql.connector.connect(**{**db_connector.DB_CONFIG, **config}))
+    connection.autocommit = True
+    return connection
+
+
+def get_replicas():
+    """ One pool per configured replica, created on first use and sized like the primary pool. """
+    global _replicas
+    with _replicas_lock:
+        if _replicas is None:
+            max_size = db_connector.get_pool().max_size
+            _replicas = [_Replica(i, config, db_connector.ConnectionPool(
+                             min_size=0, max_size=max_size, connect=lambda config=config: _connect_replica(config)))
+                         for i, config in enumerate(db_connector.REPLICA_CONFIGS)]
+        return _replicas
+
+
+def close_replicas():
+    global _replicas
+    with _replicas_lock:
+        for replica in _replicas or ():
+            replica.pool.close()
+        _replicas = None
+
+
+def _borrow_replica():
+    """ (replica, connection) from the next healthy replica in turn, or (None, None). """
+    global _next_replica
+    replicas = get_replicas()
+    for _ in range(len(replicas)):
+        with _replicas_lock:
+            replica = replicas[_next_replica % len(replicas)]
+            _next_replica += 1
+        if replica.down_until > time.monotonic():
+            continue
+        try:
+            return replica, replica.pool.acquire()
+        except Error:
+            replica.down_until = time.monotonic() + REPLICA_RETRY_AFTER
+            _count("replica_failures")
+    return None, None
+
+
+class RoutedConnection:
+    """ Looks like one connection; sends each statement to the primary or a replica. """
+
+    def __init__(self, primary, consistency):
+        self._primary = primary
+        self.consistency = consistency
+        self._replica = None
+        self._replica_connection = None
+        self._replica_tried = False
+        self._wrote = False        # the primary transaction has written something
+        self._explicit = False     # start_transaction() was called
+
+    def cursor(self, *args, **kwargs):
+        return RoutedCursor(self, args, kwargs)
+
+    def _route(self, operation):
+        """ The connection `operation` should run on. """
+        if not is_read_only(operation):
+            return self._route_write()
+        replica_connection = None if (self._wrote or self._explicit) else self._readable_replica()
+        if replica_connection is None:
+            _count("primary_reads")
+            return self._primary
+        _count("replica_reads")
+        return replica_connection
+
+    def connection_for(self, operation):
+        """ The physical connection `operation` would run on, for callers that keep per-connection state. """
+        return self._route(operation)
+
+    def _route_write(self):
+        self._wrote = True
+        _count("writes")
+        return self._primary
+
+    def _readable_replica(self):
+        """ A replica connection that already has this session's writes, or None for the primary. """
+        consistency = self.consistency
+        if READ_YOUR_WRITES == "pin" or (READ_YOUR_WRITES == "wait" and consistency.gtid_set is None):
+            if consistency.pinned():
+                _count("pinned_reads")
+                return None
+        if self._replica_connection is None:
+            if self._replica_tried:
+                return None
+            self._replica_tried = True
+            self._replica, self._replica_connection = _borrow_replica()
+            if self._replica_connection is None:
+                return None
+        if READ_YOUR_WRITES == "wait" and consistency.gtid_set and self._replica.index not in consistency.caught_up:
+            if not self._wait_for(consistency.gtid_set):
+                _count("wait_timeouts")
+                return None
+            consistency.caught_up.add(self._replica.index)
+            _count("waited_reads")
+        return self._replica_connection
+
+    def _wait_for(self, gtid_set):
+        cursor = self._replica_connection.cursor()
+        try:
+            cursor.execute("SELECT WAIT_FOR_EXECUTED_GTID_SET(%s, %s)", (gtid_set, REPLICA_WAIT_TIMEOUT))
+            return cursor.fetchone()[0] == 0
+        except Error:
+            return False
+        finally:
+            cursor.close()
+
+    def _primary_gtid_set(self):
+        cursor = self._primary.cursor()
+        try:
+            cursor.execute("SELECT @@GLOBAL.gtid_executed")
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def start_transaction(self, *args, **kwargs):
+        self._explicit = True
+        return self._primary.start_transaction(*args, **kwargs)
+
+    def commit(self):
+        self._primary.commit()
+        if self._wrote:
+            gtid_set = self._primary_gtid_set() if READ_YOUR_WRITES == "wait" else None
+            self.consistency.note_write(gtid_set)
+        self._wrote = self._explicit = False
+
+    def rollback(self):
+        self._wrote = self._explicit = False
+        return self._primary.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._primary.in_transaction
+
+    def release_replica(self):
+        if self._replica_connection is not None:
+            self._replica.pool.release(self._replica_connection)
+            self._replica = self._replica_connection = None
+        self._replica_tried = False
+
+    def __getattr__(self, name):
+        return getattr(self._primary, name)
+
+
+class RoutedCursor:
+    """ Cursor for a RoutedConnection. Holds one real cursor per connection it has used. """
+
+    def __init__(self, owner, args, kwargs):
+        self._owner = owner
+        self._args = args
+        self._kwargs = kwargs
+        self._cursors = {}
+        self._current = None
+
+    def _on(self, connection):
+        cursor = self._cursors.get(id(connection))
+        if cursor is None:
+            cursor = self._cursors[id(connection)] = connection.cursor(*self._args, **self._kwargs)
+        self._current = cursor
+        return cursor
+
+    def execute(self, operation, *args, **kwargs):
+        return self._on(self._owner._route(operation)).execute(operation, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._on(self._owner._route_write()).executemany(*args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        return self._on(self._owner._route_write()).callproc(*args, **kwargs)
+
+    def close(self):
+        for cursor in self._cursors.values():
+            cursor.close()
+        self._cursors = {}
+
+    def __iter__(self):
+        return iter(self._current)
+
+    def __getattr__(self, name):
+        if self._current is None:
+            self._on(self._owner._primary)
+        return getattr(self._current, name)
+
+
+@contextmanager
+def session_connection(pool=None, consistency=None, timeout=None):
+    """ Borrows a primary connection, routed across the replicas when any are configured. """
+    pool = pool or db_connector.get_pool()
+    with pool.connection(timeout) as primary:
+        if not db_connector.REPLICA_CONFIGS or db_connector.DB_BACKEND != "mysql":
+            yield primary
+            return
+        routed = RoutedConnection(primary, consistency or SessionConsistency())
+        try:
+            yield routed
+        finally:
+            routed.release_replica()
+
+
+def routing_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["mode"] = READ_YOUR_WRITES
+    stats["replicas"] = [{"host": r.config.get("host"), "port": r.config.get("port"),
+                          "down": r.down_until > time.monotonic(), "pool": r.pool.stats()}
+                         for r in (_replicas or ())]
+    return stats
+
+
+def print_routing_stats():
+    if not db_connector.REPLICA_CONFIGS:
+        print("\nRead replicas: none configured (every statement goes to the primary).")
+        return
+    s = routing_stats()
+    print(f"\n--- 🔀 Read/Write Routing (read-your-writes: {s['mode']}) ---")
+    print(f"Replica reads: {s['replica_reads']} | Primary reads: {s['primary_reads']} | Writes: {s['writes']}")
+    print(f"Pinned after a write: {s['pinned_reads']} | Waited for replica: {s['waited_reads']} | "
+          f"Wait timeouts: {s['wait_timeouts']} | Replica failures: {s['replica_failures']}")
+    for r in s["replicas"]:
+        print(f"  {r['host']}:{r['port'] or 3306} {'DOWN' if r['down'] else 'up'} | "
+              f"borrows {r['pool']['borrows']} | in use {r['pool']['in_use']}")
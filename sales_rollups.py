@@ -0,0 +1,330 @@
+# sales_rollups.py
+"""
+Pre-aggregated sales per day x seller and per day x product, for the admin analytics screen.
+
+SalesDailySeller and SalesDailyProduct hold units and revenue per day. They are kept current
+by catch_up_rollups(), which folds in every OrderItems row past a high-water mark on
+order_item_id (RollupState). Each batch adds its totals and moves the mark in one transaction,
+so every order item is counted exactly once, however often or wherever the job runs. It runs
+before the analytics screen answers, on a background thread in server.py, and from the
+command line:
+
+    python sales_rollups.py               # catch up once
+    python sales_rollups.py --follow 60   # keep catching up every 60 seconds
+    python sales_rollups.py --rebuild     # recompute everything from OrderItems and the archive
+
+Rows newer than ROLLUP_SETTLE_SECONDS are left for the next run. Auto-increment ids are
+handed out before commit, so a checkout still in flight may hold a lower id than one that
+is already visible. Waiting until orders are this old keeps the mark from passing it.
+Orders with status 'Failed' are not counted. An order that fails after it was counted is
+taken back out by retract_order(), which fulfilment.py calls when it fails the order.
+
+The analytics queries read only the rollups. Their cost depends on the date range and the
+number of sellers/products, never on the size of OrderItems.
+"""
+import argparse
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:   # optional: moving averages fall back to plain Python
+    np = None
+
+from db_connector import add_backend_arguments, configure_backend, create_connection
+from sql_dialect import dialect
+
+ROLLUP_NAME = "sales_daily"
+ROLLUP_BATCH = 50000            # order items folded in per transaction
+ROLLUP_SETTLE_SECONDS = 30      # leave orders younger than this for the next run
+ROLLUP_INTERVAL = 60.0          # seconds between background catch-ups
+MOVING_AVERAGE_DAYS = 7
+
+SellerSales = namedtuple("SellerSales", ["seller_id", "first_name", "last_name", "units", "revenue"])
+ProductSales = namedtuple("ProductSales", ["product_id", "product_name", "brand", "units", "revenue"])
+DailySales = namedtuple("DailySales", ["sale_date", "units", "revenue", "revenue_avg"])
+RollupStatus = namedtuple("RollupStatus", ["last_order_item_id", "pending_items", "updated_at"])
+
+# (table, the Inventory column it is keyed on)
+_ROLLUPS = (("SalesDailySeller", "seller_id"), ("SalesDailyProduct", "product_id"))
+
+
+def _rollup_sql(table, key):
+    """ Adds the order items in (mark, upper] to one rollup table. """
+    return f"""
+    INSERT INTO {table} (sale_date, {key}, units, revenue)
+    SELECT DATE(o.order_date), i.{key}, SUM(oi.quantity), SUM(oi.quantity * oi.price_per_unit)
+    FROM OrderItems oi
+    JOIN Orders o ON oi.order_id = o.order_id
+    JOIN Inventory i ON oi.inventory_id = i.inventory_id
+    WHERE oi.order_item_id > %s AND oi.order_item_id <= %s AND o.order_status <> 'Failed'
+    GROUP BY DATE(o.order_date), i.{key}
+    """ + dialect().on_duplicate(["sale_date", key], units="units + {new}", revenue="revenue + {new}")
+
+
+# ---------------------------------
+# Maintenance
+# ---------------------------------
+
+def _roll_up_batch(connection, batch_size, settle_seconds):
+    """ Folds in up to batch_size order items past the mark. Returns (old_mark, new_mark). """
+    cursor = connection.cursor()
+    try:
+        if connection.in_transaction:
+            connection.commit()
+        connection.start_transaction()
+        # Locking the mark serialises concurrent catch-ups; the loser waits, then sees the new mark.
+        cursor.execute("SELECT last_order_item_id FROM RollupState WHERE rollup_name = %s FOR UPDATE",
+                       (ROLLUP_NAME,))
+        row = cursor.fetchone()
+        if row is None:
+            raise RuntimeError("RollupState is missing its row; run python migrate.py")
+        mark = row[0]
+
+        cursor.execute("SELECT MAX(order_item_id) FROM (SELECT order_item_id FROM OrderItems "
+                       "WHERE order_item_id > %s ORDER BY order_item_id LIMIT %s) batch", (mark, batch_size))
+        upper = cursor.fetchone()[0]
+        if upper is not None:
+            # Stop just before the first order that is still inside the settle window.
+            settled_before, settle_param = dialect().now_plus(-settle_seconds)
+            cursor.execute(
+                f"""
+                SELECT MIN(oi.order_item_id)
+                FROM OrderItems oi JOIN Orders o ON oi.order_id = o.order_id
+                WHERE oi.order_item_id > %s AND oi.order_item_id <= %s
+                  AND o.order_date > {settled_before}
+                """,
+                (mark, upper, settle_param)
+            )
+            recent = cursor.fetchone()[0]
+            if recent is not None:
+                upper = recent - 1
+        if upper is None or upper <= mark:
+            connection.rollback()
+            return mark, mark
+
+        for table, key in _ROLLUPS:
+            cursor.execute(_rollup_sql(table, key), (mark, upper))
+        cursor.execute("UPDATE RollupState SET last_order_item_id = %s WHERE rollup_name = %s",
+                       (upper, ROLLUP_NAME))
+        connection.commit()
+        return mark, upper
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def catch_up_rollups(connection, batch_size=ROLLUP_BATCH, settle_seconds=ROLLUP_SETTLE_SECONDS):
+    """ Folds in every settled order item past the mark. Returns the new mark. """
+    while True:
+        mark, upper = _roll_up_batch(connection, batch_size, settle_seconds)
+        if upper == mark:
+            return upper
+
+
+def rebuild_rollups(connection):
+    """ Empties the rollups and recomputes them from the archived orders and all of OrderItems. """
+    from order_archive import archived_sales   # order_archive imports this module
+    cursor = connection.cursor()
+    try:
+        if connection.in_transaction:
+            connection.commit()
+        connection.start_transaction()
+        cursor.execute("SELECT last_order_item_id FROM RollupState WHERE rollup_name = %s FOR UPDATE",
+                       (ROLLUP_NAME,))
+        cursor.fetchall()
+        cursor.execute("DELETE FROM SalesDailySeller")
+        cursor.execute("DELETE FROM SalesDailyProduct")
+        for (table, key), totals in zip(_ROLLUPS, archived_sales(connection)):
+            cursor.executemany(f"INSERT INTO {table} (sale_date, {key}, units, revenue) VALUES (%s, %s, %s, %s)",
+                               [(day, value, units, revenue) for (day, value), (units, revenue) in totals.items()])
+        cursor.execute("UPDATE RollupState SET last_order_item_id = 0 WHERE rollup_name = %s", (ROLLUP_NAME,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return catch_up_rollups(connection)
+
+
+def retract_order(cursor, order_id):
+    """ Takes back whatever the rollups already counted for an order that has just failed.
+    Runs in the caller's transaction; locks the mark so no catch-up runs in between. """
+    cursor.execute("SELECT last_order_item_id FROM RollupState WHERE rollup_name = %s FOR UPDATE", (ROLLUP_NAME,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    for table, key in _ROLLUPS:
+        # An order touches a handful of rollup rows, so read what was counted and subtract row by row.
+        cursor.execute(
+            f"""
+            SELECT DATE(o.order_date), i.{key}, SUM(oi.quantity), SUM(oi.quantity * oi.price_per_unit)
+            FROM OrderItems oi
+            JOIN Orders o ON oi.order_id = o.order_id
+            JOIN Inventory i ON oi.inventory_id = i.inventory_id
+            WHERE oi.order_id = %s AND oi.order_item_id <= %s
+            GROUP BY DATE(o.order_date), i.{key}
+            """,
+            (order_id, row[0])
+        )
+        for sale_date, key_value, units, revenue in cursor.fetchall():
+            cursor.execute(f"UPDATE {table} SET units = units - %s, revenue = revenue - %s "
+                           f"WHERE sale_date = %s AND {key} = %s", (units, revenue, sale_date, key_value))
+
+
+def rollup_status(connection):
+    """ How far the rollups have got, and roughly how many order items are still to fold in. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT last_order_item_id, updated_at FROM RollupState WHERE rollup_name = %s",
+                       (ROLLUP_NAME,))
+        mark, updated_at = cursor.fetchone()
+        cursor.execute("SELECT MAX(order_item_id) FROM OrderItems")
+        newest = cursor.fetchone()[0] or 0
+        return RollupStatus(mark, max(newest - mark, 0), updated_at)
+    finally:
+        cursor.close()
+
+
+def start_rollup_worker(pool, interval=ROLLUP_INTERVAL):
+    """ Catches up every `interval` seconds on a daemon thread, borrowing a pooled connection each time. """
+    def run():
+        while True:
+            try:
+                with pool.connection() as connection:
+                    catch_up_rollups(connection)
+            except Exception as e:
+                print(f"⚠️  Sales rollup catch-up failed: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name="sales-rollups", daemon=True)
+    thread.start()
+    return thread
+
+
+# ---------------------------------
+# Analytics (rollups only)
+# ---------------------------------
+
+def seller_revenue(connection, date_from, date_to, limit=20):
+    """ [SellerSales] for sale dates date_from..date_to (inclusive), highest revenue first. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT s.seller_id, u.first_name, u.last_name, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+            FROM SalesDailySeller s LEFT JOIN Users u ON s.seller_id = u.user_id
+            WHERE s.sale_date BETWEEN %s AND %s
+            GROUP BY s.seller_id, u.first_name, u.last_name
+            ORDER BY revenue DESC, s.seller_id
+            LIMIT %s
+            """,
+            (date_from, date_to, limit)
+        )
+        return [SellerSales(*row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def top_products(connection, date_from, date_to, limit=20):
+    """ [ProductSales] for sale dates date_from..date_to (inclusive), most units first. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT s.product_id, p.product_name, p.brand, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+            FROM SalesDailyProduct s LEFT JOIN Products p ON s.product_id = p.product_id
+            WHERE s.sale_date BETWEEN %s AND %s
+            GROUP BY s.product_id, p.product_name, p.brand
+            ORDER BY units DESC, s.product_id
+            LIMIT %s
+            """,
+            (date_from, date_to, limit)
+        )
+        return [ProductSales(*row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def moving_average(values, window=MOVING_AVERAGE_DAYS):
+    """ Trailing mean over `window` values; None until a full window is available. """
+    if window <= 0 or len(values) < window:
+        return [None] * len(values)
+    if np is not None:
+        means = np.convolve(np.asarray(values, dtype=float), np.ones(window) / window, mode="valid")
+        return [None] * (window - 1) + means.tolist()
+    means, total = [], 0.0
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        means.append(total / window if i >= window - 1 else None)
+    return means
+
+
+def daily_sales(connection, date_from, date_to, window=MOVING_AVERAGE_DAYS):
+    """ [DailySales], one per calendar day date_from..date_to (days without sales are zero),
+    with a trailing moving average of revenue. """
+    # Read window - 1 extra days so the first day in range already has a full average.
+    read_from = date_from - timedelta(days=max(window - 1, 0))
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT sale_date, SUM(units), SUM(revenue)
+            FROM SalesDailyProduct
+            WHERE sale_date BETWEEN %s AND %s
+            GROUP BY sale_date
+            """,
+            (read_from, date_to)
+        )
+        by_day = {row[0]: (int(row[1]), float(row[2])) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+    days = [read_from + timedelta(days=i) for i in range((date_to - read_from).days + 1)]
+    units = [by_day.get(day, (0, 0.0))[0] for day in days]
+    revenue = [by_day.get(day, (0, 0.0))[1] for day in days]
+    averages = moving_average(revenue, window)
+    skip = len(days) - ((date_to - date_from).days + 1)
+    return [DailySales(*row) for row in zip(days, units, revenue, averages)][skip:]
+
+
+def month_to_date(today=None):
+    """ (first day of this month, today) """
+    today = today or date.today()
+    return today.replace(day=1), today
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="recompute the rollups from scratch")
+    parser.add_argument("--follow", type=float, metavar="SECONDS", help="keep catching up at this interval")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    connection = create_connection()
+    if not connection:
+        return
+    try:
+        while True:
+            started = time.perf_counter()
+            mark = rebuild_rollups(connection) if args.rebuild else catch_up_rollups(connection)
+            args.rebuild = False
+            print(f"Rollups current through order item #{mark} ({time.perf_counter() - started:.1f}s)")
+            if not args.follow:
+                break
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+# seed_data.py
+"""
+Deterministic synthetic data for load testing, at a configurable scale factor.
+
+Scale factor 1 is roughly 4M rows: 100k users, 20k products, 200k listings, 50k cart lines,
+1M orders and ~2.5M order items over three years. Products, sellers and buyers all follow
+a power law, so a few hot sneakers have hundreds of sellers and most have a handful.
+The same --scale and --seed always produce the same data.
+
+Rows are appended after the current maximum ids. On MySQL, secondary indexes are dropped for
+the load and rebuilt once at the end, and foreign key and unique checks are off while loading.
+
+    python seed_data.py --scale 1 --seed 7                   # batched multi-row INSERTs
+    python seed_data.py --scale 3 --method infile            # LOAD DATA LOCAL INFILE
+    python seed_data.py --scale 0.1 --backend sqlite         # into the embedded SQLite database
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+import mysql.connector
+
+import db_connector
+from db_connector import DB_CONFIG, add_backend_arguments, configure_backend, open_connection
+
+# Rows per table at scale factor 1.
+BASE_COUNTS = {
+    "users": 100_000,
+    "products": 20_000,
+    "inventory": 200_000,
+    "cart": 50_000,
+    "orders": 1_000_000,
+}
+SELLER_SHARE = 0.05
+ADMIN_COUNT = 5
+INSERT_BATCH = 5000
+HISTORY_DAYS = 3 * 365
+ZIPF_EXPONENT = 1.1
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn",
+               "Drew", "Reese", "Parker", "Rowan", "Skyler", "Emerson", "Harper", "Kai", "Logan", "Noa"]
+LAST_NAMES = ["Smith", "Lee", "Garcia", "Chen", "Patel", "Kim", "Nguyen", "Brown", "Silva", "Khan",
+              "Müller", "Rossi", "Tanaka", "Okafor", "Novak", "Cohen", "Larsen", "Dubois", "Singh", "Walker"]
+BRANDS = ["Nike", "Adidas", "New Balance", "Jordan", "Asics", "Puma", "Converse", "Vans", "Reebok", "Salomon",
+          "Timberland", "Dr. Martens", "Hoka", "On", "Saucony", "Yeezy", "Birkenstock", "Clarks", "UGG", "Crocs"]
+MODELS = ["Dunk", "Air Max", "Forum", "Samba", "990", "Gel-Lyte", "Suede", "Chuck 70", "Old Skool", "Club C",
+          "XT-6", "6-Inch", "1460", "Clifton", "Cloud", "Jazz", "Boost 350", "Boston", "Wallabee", "Classic"]
+EDITIONS = ["Low", "High", "Mid", "OG", "Retro", "SE", "Premium", "Panda", "Bred", "Triple White"]
+CATEGORIES = ["Sneakers", "Boots", "Formal Shoes", "Running", "Basketball", "Skate", "Hiking", "Sandals"]
+CITIES = [("Austin", "TX"), ("Portland", "OR"), ("Chicago", "IL"), ("Miami", "FL"), ("Denver", "CO"),
+          ("Seattle", "WA"), ("Boston", "MA"), ("Atlanta", "GA"), ("Phoenix", "AZ"), ("Brooklyn", "NY")]
+STATUS_WEIGHTS = [("Delivered", 80), ("Shipped", 8), ("Paid", 4), ("Placed", 6), ("Failed", 2)]
+
+
+def zipf_cum_weights(n, exponent=ZIPF_EXPONENT):
+    """ Cumulative weights for picking index 0..n-1 with probability proportional to 1 / (rank+1)^s. """
+    return list(accumulate(1.0 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class SeedPlan:
+    """ Row counts and id ranges for one run. Ids start after whatever is already in the database. """
+
+    def __init__(self, scale, seed, offsets):
+        self.seed = seed
+        counts = {name: max(1, int(count * scale)) for name, count in BASE_COUNTS.items()}
+        self.n_users = counts["users"]
+        self.n_sellers = max(1, int(self.n_users * SELLER_SHARE))
+        self.n_admins = ADMIN_COUNT
+        self.n_customers = self.n_users - self.n_sellers - self.n_admins
+        self.n_products = counts["products"]
+        self.n_inventory = counts["inventory"]
+        self.n_cart = counts["cart"]
+        self.n_orders = counts["orders"]
+
+        self.user_base = offsets["Users"]
+        self.product_base = offsets["Products"]
+        self.inventory_base = offsets["Inventory"]
+        self.address_base = offsets["Addresses"]
+        self.order_base = offsets["Orders"]
+        self.order_item_base = offsets["OrderItems"]
+        # customers first, then sellers, then admins
+        self.first_seller = self.user_base + self.n_customers + 1
+        self.now = datetime(2025, 1, 1)  # fixed so runs are reproducible
+
+    def customer_id(self, index):
+        return self.user_base + 1 + index
+
+    def seller_id(self, index):
+        return self.first_seller + index
+
+    def address_id(self, customer_index):
+        return self.address_base + 1 + customer_index
+
+
+def gen_users(plan, rng):
+    for i in range(plan.n_users):
+        user_id = plan.user_base + 1 + i
+        if i < plan.n_customers:
+            role = "customer"
+        elif i < plan.n_customers + plan.n_sellers:
+            role = "seller"
+        else:
+            role = "admin"
+        created = plan.now - timedelta(days=rng.randint(0, HISTORY_DAYS), seconds=rng.randint(0, 86399))
+        yield (user_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"user{user_id}@seed.hypeculture",
+               "seedpass", role, created)
+
+
+def gen_products(plan, rng, category_ids):
+    brand_cum = zipf_cum_weights(len(BRANDS))
+    for i in range(plan.n_products):
+        brand = rng.choices(BRANDS, cum_weights=brand_cum)[0]
+        name = f"{brand} {rng.choice(MODELS)} {rng.choice(EDITIONS)} #{plan.product_base + 1 + i}"
+        yield (plan.product_base + 1 + i, name, brand, rng.choice(category_ids))
+
+
+def gen_inventory(plan, rng, prices):
+    """ Listings. Hot products get most sellers; a few big resellers hold most listings. """
+    product_cum = zipf_cum_weights(plan.n_products)
+    seller_cum = zipf_cum_weights(plan.n_sellers)
+    base_price = [round(rng.lognormvariate(5.0, 0.5), 2) for _ in range(plan.n_products)]
+    products = range(plan.n_products)
+    sellers = range(plan.n_sellers)
+    for batch_start in range(0, plan.n_inventory, INSERT_BATCH):
+        k = min(INSERT_BATCH, plan.n_inventory - batch_start)
+        picked_products = rng.choices(products, cum_weights=product_cum, k=k)
+        picked_sellers = rng.choices(sellers, cum_weights=seller_cum, k=k)
+        for j in range(k):
+            p = picked_products[j]
+            price = round(base_price[p] * rng.uniform(0.85, 1.6), 2)
+            stock = 0 if rng.random() < 0.1 else int(rng.paretovariate(1.5))
+            prices.append(price)
+            yield (plan.inventory_base + 1 + batch_start + j, plan.seller_id(picked_sellers[j]),
+                   plan.product_base + 1 + p, price, stock)
+
+
+def gen_addresses(plan, rng):
+    for i in range(plan.n_customers):
+        city, state = rng.choice(CITIES)
+        yield (plan.address_id(i), plan.customer_id(i), f"{rng.randint(1, 9999)} Market St", city, state,
+               f"{rng.randint(10000, 99999)}")
+
+
+def gen_orders_and_items(plan, rng, prices, item_rows):
+    """ Orders spread over HISTORY_DAYS with growth toward the present; heavy buyers order most.
+
+    Yields order rows and appends the matching OrderItems rows to `item_rows` (drained by the caller).
+    """
+    customer_cum = zipf_cum_weights(plan.n_customers, exponent=0.8)
+    inventory_cum = zipf_cum_weights(plan.n_inventory)
+    customers = range(plan.n_customers)
+    listings = range(plan.n_inventory)
+    statuses, status_weights = zip(*STATUS_WEIGHTS)
+    next_item_id = plan.order_item_base + 1
+    for batch_start in range(0, plan.n_orders, INSERT_BATCH):
+        k = min(INSERT_BATCH, plan.n_orders - batch_start)
+        buyers = rng.choices(customers, cum_weights=customer_cum, k=k)
+        for j in range(k):
+            order_id = plan.order_base + 1 + batch_start + j
+            c = buyers[j]
+            # sqrt skews dates toward the present: the marketplace is growing
+            age_days = HISTORY_DAYS * (1 - rng.random() ** 0.5)
+            order_date = (plan.now - timedelta(days=age_days)).replace(microsecond=0)
+            total = 0.0
+            for inv in rng.choices(listings, cum_weights=inventory_cum, k=rng.choice((1, 1, 1, 2, 2, 3, 4))):
+                qty = 1 if rng.random() < 0.85 else rng.randint(2, 3)
+                price = prices[inv]
+                total += qty * price
+                item_rows.append((next_item_id, order_id, plan.inventory_base + 1 + inv, qty, price))
+                next_item_id += 1
+            yield (order_id, plan.customer_id(c), plan.address_id(c), order_date, round(total, 2),
+                   rng.choices(statuses, status_weights)[0])
+
+
+def gen_cart(plan, rng):
+    inventory_cum = zipf_cum_weights(plan.n_inventory)
+    seen = set()
+    listings = range(plan.n_inventory)
+    while len(seen) < plan.n_cart:
+        c = rng.randrange(plan.n_customers)
+        inv = rng.choices(listings, cum_weights=inventory_cum)[0]
+        if (c, inv) in seen:
+            continue
+        seen.add((c, inv))
+        yield (plan.customer_id(c), plan.inventory_base + 1 + inv, rng.randint(1, 3))
+
+
+# ---------------------------------
+# Loaders
+# ---------------------------------
+
+class InsertLoader:
+    """ Loads through executemany, which mysql-connector turns into multi-row INSERT statements. """
+
+    def __init__(self, connection, batch_size=INSERT_BATCH):
+        self.connection = connection
+        self.batch_size = batch_size
+
+    def load(self, table, columns, rows):
+        cursor = self.connection.cursor()
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        count = 0
+        for batch in batched(rows, self.batch_size):
+            cursor.executemany(sql, batch)
+            self.connection.commit()
+            count += len(batch)
+        cursor.close()
+        return count
+
+
+class InfileLoader:
+    """ Writes each table to a tab-separated file and loads it with LOAD DATA LOCAL INFILE. """
+
+    def __init__(self, connection, workdir):
+        self.connection = connection
+        self.workdir = workdir
+
+    def load(self, table, columns, rows):
+        path = os.path.join(self.workdir, f"{table}.tsv")
+        count = 0
+        # Generated values never contain tabs, newlines or backslashes, so no escaping is needed.
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            for row in rows:
+                f.write("\t".join("\\N" if v is None else str(v) for v in row))
+                f.write("\n")
+                count += 1
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(columns)})",
+            (path,)
+        )
+        self.connection.commit()
+        cursor.close()
+        os.remove(path)
+        return count
+
+
+# ---------------------------------
+# Index deferral
+# ---------------------------------
+
+LOADED_TABLES = ["Users", "Products", "Inventory", "Addresses", "Orders", "OrderItems", "Cart"]
+
+
+def drop_secondary_indexes(connection):
+    """ Drops non-unique secondary indexes on the loaded tables. Returns what to rebuild.
+
+    Indexes a foreign key depends on can't be dropped; those are left in place.
+    """
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(LOADED_TABLES))
+    cursor.execute(
+        f"""
+        SELECT table_name, index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index)
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name IN ({placeholders})
+          AND index_name <> 'PRIMARY' AND non_unique = 1
+        GROUP BY table_name, index_name
+        """,
+        LOADED_TABLES
+    )
+    candidates = cursor.fetchall()
+    dropped = []
+    for table, index, columns in candidates:
+        try:
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX {index}")
+            dropped.append((table, index, columns))
+        except mysql.connector.Error:
+            pass  # needed by a foreign key
+    cursor.close()
+    return dropped
+
+
+def rebuild_indexes(connection, dropped):
+    """ Re-adds dropped indexes, one ALTER TABLE per table so each table is rebuilt once. """
+    by_table = {}
+    for table, index, columns in dropped:
+        by_table.setdefault(table, []).append(f"ADD INDEX {index} ({columns})")
+    cursor = connection.cursor()
+    for table, clauses in by_table.items():
+        started = time.perf_counter()
+        cursor.execute(f"ALTER TABLE {table} {', '.join(clauses)}")
+        print(f"  rebuilt {len(clauses)} index(es) on {table} in {time.perf_counter() - started:.1f}s")
+    cursor.close()
+
+
+# ---------------------------------
+# Driver
+# ---------------------------------
+
+def current_offsets(connection):
+    id_columns = {"Users": "user_id", "Products": "product_id", "Inventory": "inventory_id",
+                  "Addresses": "address_id", "Orders": "order_id", "OrderItems": "order_item_id"}
+    cursor = connection.cursor()
+    offsets = {}
+    for table, column in id_columns.items():
+        cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+        offsets[table] = cursor.fetchone()[0]
+    cursor.close()
+    return offsets
+
+
+def ensure_categories(connection):
+    cursor = connection.cursor()
+    cursor.executemany("INSERT IGNORE INTO Categories (category_name) VALUES (%s)", [(c,) for c in CATEGORIES])
+    cursor.execute("SELECT category_id FROM Categories ORDER BY category_id")
+    ids = [row[0] for row in cursor.fetchall()]
+    connection.commit()
+    cursor.close()
+    return ids
+
+
+def seed(connection, scale, seed_value, method="insert", keep_indexes=False):
+    """ Generates and loads one dataset. Returns {table: rows loaded}. """
+    offsets = current_offsets(connection)
+    plan = SeedPlan(scale, seed_value, offsets)
+    category_ids = ensure_categories(connection)
+    mysql_tuning = db_connector.DB_BACKEND == "mysql"
+
+    if mysql_tuning:
+        cursor = connection.cursor()
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        cursor.execute("SET SESSION unique_checks = 0")
+        cursor.execute("SET @changelog_off = 1")   # the change feed triggers skip bulk loads
+        cursor.close()
+    cursor = connection.cursor()
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM ChangeLog")
+    feed_mark = cursor.fetchone()[0]
+    connection.commit()
+    cursor.close()
+
+    dropped = [] if keep_indexes or not mysql_tuning else drop_secondary_indexes(connection)
+    workdir = tempfile.mkdtemp(prefix="hypeculture_seed_") if method == "infile" else None
+    loader = InfileLoader(connection, workdir) if method == "infile" else InsertLoader(connection)
+
+    # Each table gets its own generator stream so changing one table's size
+    # doesn't reshuffle the others.
+    def rng_for(name):
+        return random.Random(f"{seed_value}:{name}")
+
+    loaded = {}
+    prices = array("d")
+    item_rows = []
+
+    def step(table, columns, rows):
+        started = time.perf_counter()
+        count = loader.load(table, columns, rows)
+        elapsed = time.perf_counter() - started
+        loaded[table] = loaded.get(table, 0) + count
+        print(f"  {table:<11} {count:>11,} rows in {elapsed:6.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    try:
+        step("Users", ["user_id", "first_name", "last_name", "email", "password_hash", "user_role", "created_at"],
+             gen_users(plan, rng_for("users")))
+        step("Products", ["product_id", "product_name", "brand", "category_id"],
+             gen_products(plan, rng_for("products"), category_ids))
+        step("Inventory", ["inventory_id", "seller_id", "product_id", "price", "stock_quantity"],
+             gen_inventory(plan, rng_for("inventory"), prices))
+        step("Addresses", ["address_id", "user_id", "address_line1", "city", "state", "postal_code"],
+             gen_addresses(plan, rng_for("addresses")))
+
+        # Orders and their items are generated together; items are flushed after each order batch.
+        orders = gen_orders_and_items(plan, rng_for("orders"), prices, item_rows)
+        order_columns = ["order_id", "customer_id", "address_id", "order_date", "total_amount", "order_status"]
+        item_columns = ["order_item_id", "order_id", "inventory_id", "quantity", "price_per_unit"]
+        chunk = INSERT_BATCH * 20
+        for batch in batched(orders, chunk):
+            step("Orders", order_columns, batch)
+            step("OrderItems", item_columns, item_rows)
+            item_rows.clear()
+
+        step("Cart", ["customer_id", "inventory_id", "quantity"], gen_cart(plan, rng_for("cart")))
+    finally:
+        if workdir:
+            os.rmdir(workdir)
+        if dropped:
+            print("Rebuilding deferred indexes...")
+            rebuild_indexes(connection, dropped)
+        cursor = connection.cursor()
+        if mysql_tuning:
+            cursor.execute("SET SESSION foreign_key_checks = 1")
+            cursor.execute("SET SESSION unique_checks = 1")
+            cursor.execute("SET @changelog_off = NULL")
+        else:
+            # SQLite triggers can't be switched off per session; drop what the load logged.
+            cursor.execute("DELETE FROM ChangeLog WHERE seq > %s", (feed_mark,))
+        # Cached best offers and catalog pages are stale now.
+        cursor.execute("DELETE FROM ProductBestOffer")
+        cursor.execute("UPDATE CatalogVersion SET version = version + 1 WHERE id = 1")
+        connection.commit()
+        cursor.close()
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=0.1, help="scale factor (1 = ~4M rows)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--method", choices=["insert", "infile"], default="insert",
+                        help="batched multi-row INSERTs, or LOAD DATA LOCAL INFILE (needs local_infile=1 on the server)")
+    parser.add_argument("--keep-indexes", action="store_true", help="don't drop secondary indexes during the load")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+    if args.backend == "sqlite" and args.method == "infile":
+        parser.error("--method infile needs the MySQL backend")
+
+    try:
+        if args.backend == "sqlite":
+            connection = open_connection()
+        else:
+            connection = mysql.connector.connect(**DB_CONFIG, allow_local_infile=args.method == "infile")
+    except mysql.connector.Error as e:
+        print(f"Error while connecting to the database: {e}")
+        sys.exit(1)
+
+    print(f"Seeding scale {args.scale} with seed {args.seed} using {args.method}...")
+    started = time.perf_counter()
+    try:
+        loaded = seed(connection, args.scale, args.seed, args.method, args.keep_indexes)
+    finally:
+        connection.close()
+    total = sum(loaded.values())
+    elapsed = time.perf_counter() - started
+    print(f"Done: {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s overall).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,581 @@
+# server.py
+"""
+Network front end for the marketplace: many concurrent sessions over a JSON-lines protocol.
+
+Each line a client sends is one request and each line it reads back is the matching response:
+
+    -> {"id": 1, "op": "login", "args": {"email": "alice@email.com", "password": "pass123"}}
+    <- {"id": 1, "ok": true, "result": {"user_id": 1, "role": "customer", "first_name": "Alice"}}
+    -> {"id": 2, "op": "checkout", "args": {"address_line1": "1 Main St", "city": "Pune", ...}}
+    <- {"id": 2, "ok": false, "error": "server busy", "retry": true}
+
+A session is just a socket and the logged-in user, so thousands can stay connected. Database
+work runs on a fixed set of worker threads, each borrowing a pooled connection for the one
+request it is running. A session handles one request at a time, so a client that pipelines
+waits in its own socket buffer. When every worker is busy and MAX_QUEUED requests are already
+waiting, further requests wait up to QUEUE_TIMEOUT and are then refused with "server busy".
+Money is sent as strings and dates as ISO 8601.
+
+    python server.py --port 7878 --workers 16
+    python server.py --unix /tmp/hypeculture.sock
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from catalog_cache import cache_stats, get_categories, get_products_in_category
+from checkout_engine import CHECKOUT_MODE, CHECKOUT_MODES, configure_checkout, place_order, read_cart
+from db_connector import add_backend_arguments, close_pool, configure_backend, configure_pool, get_pool
+import change_feed
+import fulfilment
+from order_book import get_best_offer, get_offers
+from order_history import HISTORY_PAGE_SIZE, fetch_order_history_page
+import price_watch
+from pagination import DEFAULT_PAGE_SIZE
+import read_routing
+from product_search import SEARCH_LIMIT, build_index_in_background, search_products, search_stats
+import queries
+import query_stats
+import sales_rollups
+import services
+from session_cart import SessionCart
+import stock_holds
+import user_purge
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 7878
+SERVER_WORKERS = 16        # DB worker threads; the connection pool is sized to match
+BACKGROUND_CONNECTIONS = 6 # search index build, rollups, hold sweeper, purger, change-feed caches, price watcher
+MAX_QUEUED = 256           # requests allowed to wait for a worker before new ones are refused
+QUEUE_TIMEOUT = 2.0        # seconds a request may wait for a queue slot
+MAX_LINE = 64 * 1024       # longest request line accepted, in bytes
+MAX_PAGE_SIZE = 500
+
+PUBLIC = ()                               # no login needed
+LOGGED_IN = services.USER_ROLES
+
+
+class ClientError(Exception):
+    """ A request the server refuses: bad arguments, wrong role, unknown op. """
+
+
+class ServerBusy(Exception):
+    """ No queue slot freed up within QUEUE_TIMEOUT. """
+
+
+class Session:
+    """ Per-connection state. Only touched by one request at a time. """
+
+    def __init__(self):
+        self.user = None   # services.User once logged in
+        self.cart = None   # SessionCart for a logged-in customer
+        self.consistency = read_routing.SessionConsistency()   # read-your-writes across requests
+
+    def start(self, user):
+        self.user = user
+        self.cart = SessionCart(user.user_id) if user.role == "customer" else None
+
+
+# ---------------------------------
+# Argument and result helpers
+# ---------------------------------
+
+_REQUIRED = object()
+
+
+def _arg(args, name, convert=str, default=_REQUIRED):
+    value = args.get(name)
+    if value is None or value == "":
+        if default is _REQUIRED:
+            raise ClientError(f"'{name}' is required")
+        return default
+    try:
+        return convert(value)
+    except (TypeError, ValueError, ArithmeticError):
+        raise ClientError(f"'{name}' is not valid")
+
+
+def _date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def _bool(value):
+    """ Only JSON true/false; bool("false") would be True. """
+    if not isinstance(value, bool):
+        raise ValueError(value)
+    return value
+
+
+def _page_size(args, default):
+    return max(1, min(_arg(args, "page_size", int, default), MAX_PAGE_SIZE))
+
+
+def jsonable(value):
+    """ Converts service results (namedtuples, Decimals, datetimes) into JSON-ready values. """
+    if hasattr(value, "_asdict"):
+        return {key: jsonable(item) for key, item in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _page(rows, next_after):
+    return {"rows": rows, "next_after": next_after}
+
+
+# ---------------------------------
+# Operations: handler(connection, session, args) -> result
+# ---------------------------------
+
+def op_login(connection, session, args):
+    user = services.authenticate(connection, _arg(args, "email"), _arg(args, "password"))
+    if user is None:
+        raise ClientError("invalid email or password")
+    _end_session(connection, session)
+    session.start(user)
+    return user
+
+
+def op_register(connection, session, args):
+    try:
+        user = services.create_user(connection, _arg(args, "first_name"), _arg(args, "last_name"),
+                                    _arg(args, "email"), _arg(args, "password"))
+    except ValueError as e:
+        raise ClientError(str(e))
+    _end_session(connection, session)
+    session.start(user)
+    return user
+
+
+def op_logout(connection, session, args):
+    _end_session(connection, session)
+    return None
+
+
+def _end_session(connection, session):
+    """ Writes the session's buffered cart adds and logs it out. """
+    if session.cart is not None:
+        session.cart.flush(connection)
+    session.user = None
+    session.cart = None
+
+
+def op_categories(connection, session, args):
+    return get_categories(connection)
+
+
+def op_products(connection, session, args):
+    return get_products_in_category(connection, _arg(args, "category_id", int))
+
+
+def op_offers(connection, session, args):
+    product_id = _arg(args, "product_id", int)
+    summary = get_best_offer(connection, product_id)
+    result = jsonable(summary)
+    if _arg(args, "all", _bool, False):
+        result["offers"] = get_offers(connection, product_id)
+    return result
+
+
+def op_search(connection, session, args):
+    query = _arg(args, "q", str)
+    limit = min(_arg(args, "limit", int, SEARCH_LIMIT), MAX_PAGE_SIZE)
+    return search_products(connection, query, limit)
+
+
+def op_cart_add(connection, session, args):
+    try:
+        session.cart.add(connection, _arg(args, "inventory_id", int), _arg(args, "quantity", int, 1))
+    except ValueError as e:
+        raise ClientError(str(e))
+    return None
+
+
+def op_cart(connection, session, args):
+    return session.cart.items(connection)
+
+
+def op_cart_count(connection, session, args):
+    session.cart.flush(connection)
+    return services.cart_item_count(connection, session.user.user_id)
+
+
+def op_checkout_preview(connection, session, args):
+    session.cart.flush(connection)
+    return read_cart(connection, session.user.user_id)
+
+
+def op_checkout(connection, session, args):
+    address = (_arg(args, "address_line1"), _arg(args, "city"), _arg(args, "state"), _arg(args, "postal_code"))
+    session.cart.flush(connection)
+    result = place_order(connection, session.user.user_id, address,
+                         allow_partial=_arg(args, "allow_partial", _bool, False))
+    session.cart.invalidate()
+    return result
+
+
+def op_order_history(connection, session, args):
+    after = _arg(args, "after", lambda a: (datetime.fromisoformat(a[0]), int(a[1])), None)
+    date_to = _arg(args, "date_to", _date, None)
+    if date_to is not None:
+        date_to += timedelta(days=1)   # inclusive, as in the CLI
+    return fetch_order_history_page(connection, session.user.user_id, _page_size(args, HISTORY_PAGE_SIZE), after,
+                                    _arg(args, "date_from", _date, None), date_to)
+
+
+def op_watch(connection, session, args):
+    try:
+        target = price_watch.watch_product(connection, session.user.user_id, _arg(args, "product_id", int),
+                                           _arg(args, "target_price", Decimal, None))
+    except ValueError as e:
+        raise ClientError(str(e))
+    return {"target_price": target}
+
+
+def op_unwatch(connection, session, args):
+    if not price_watch.unwatch_product(connection, session.user.user_id, _arg(args, "product_id", int)):
+        raise ClientError("not watching that product")
+    return None
+
+
+def op_watches(connection, session, args):
+    return price_watch.list_watches(connection, session.user.user_id)
+
+
+def op_price_alerts(connection, session, args):
+    return price_watch.take_unseen_alerts(connection, session.user.user_id)
+
+
+def op_listings(connection, session, args):
+    return services.get_seller_listings(connection, session.user.user_id)
+
+
+def op_listing_add(connection, session, args):
+    inventory_id = services.add_listing(connection, session.user.user_id, _arg(args, "product_id", int),
+                                        _arg(args, "price", Decimal), _arg(args, "stock", int))
+    return {"inventory_id": inventory_id}
+
+
+def op_listing_update(connection, session, args):
+    try:
+        found = services.update_listing(connection, session.user.user_id, _arg(args, "inventory_id", int),
+                                        price=_arg(args, "price", Decimal, None), stock=_arg(args, "stock", int, None))
+    except ValueError as e:
+        raise ClientError(str(e))
+    if not found:
+        raise ClientError("listing not found")
+    return None
+
+
+def op_listing_remove(connection, session, args):
+    if not services.remove_listing(connection, session.user.user_id, _arg(args, "inventory_id", int)):
+        raise ClientError("listing not found")
+    return None
+
+
+def op_admin_users(connection, session, args):
+    return _page(*services.list_users(connection, _arg(args, "role", str.lower, None), _arg(args, "after", int, None),
+                                      _page_size(args, DEFAULT_PAGE_SIZE)))
+
+
+def op_admin_products(connection, session, args):
+    return _page(*services.list_products(connection, _arg(args, "category_id", int, None), _arg(args, "brand", str, None),
+                                         _arg(args, "after", int, None), _page_size(args, DEFAULT_PAGE_SIZE)))
+
+
+def op_admin_orders(connection, session, args):
+    return _page(*services.list_orders(connection, _arg(args, "status", str, None),
+                                       _arg(args, "customer_id", int, None), _arg(args, "date_from", _date, None),
+                                       _arg(args, "date_to", _date, None), _arg(args, "after", int, None),
+                                       _page_size(args, DEFAULT_PAGE_SIZE)))
+
+
+def _sales_range(args):
+    """ date_from..date_to (inclusive) from the request; month to date by default. """
+    default_from, default_to = sales_rollups.month_to_date()
+    date_from = _arg(args, "date_from", lambda v: _date(v).date(), default_from)
+    date_to = _arg(args, "date_to", lambda v: _date(v).date(), default_to)
+    if date_from > date_to:
+        raise ClientError("'date_from' is after 'date_to'")
+    return date_from, date_to
+
+
+def op_sales_sellers(connection, session, args):
+    return sales_rollups.seller_revenue(connection, *_sales_range(args), limit=_page_size(args, 20))
+
+
+def op_sales_products(connection, session, args):
+    return sales_rollups.top_products(connection, *_sales_range(args), limit=_page_size(args, 20))
+
+
+def op_sales_daily(connection, session, args):
+    window = _arg(args, "window", int, sales_rollups.MOVING_AVERAGE_DAYS)
+    return sales_rollups.daily_sales(connection, *_sales_range(args), window=max(1, min(window, 366)))
+
+
+def op_fulfilment(connection, session, args):
+    return {"queues": fulfilment.pipeline_metrics(connection), "workers": fulfilment.worker_stats()}
+
+
+def op_add_product(connection, session, args):
+    product_id = services.add_product(connection, _arg(args, "product_name"), _arg(args, "brand"),
+                                      _arg(args, "category_id", int))
+    return {"product_id": product_id}
+
+
+def op_add_user(connection, session, args):
+    try:
+        return services.create_user(connection, _arg(args, "first_name"), _arg(args, "last_name"),
+                                    _arg(args, "email"), _arg(args, "password"), _arg(args, "role", str.lower))
+    except ValueError as e:
+        raise ClientError(str(e))
+
+
+def op_remove_user(connection, session, args):
+    if not services.delete_user(connection, _arg(args, "user_id", int)):
+        raise ClientError("user not found")
+    return None
+
+
+# op name -> (roles allowed, handler). Every handler here runs on a DB worker.
+OPS = {
+    "login": (PUBLIC, op_login),
+    "register": (PUBLIC, op_register),
+    "logout": (PUBLIC, op_logout),
+    "categories": (LOGGED_IN, op_categories),
+    "products": (LOGGED_IN, op_products),
+    "offers": (LOGGED_IN, op_offers),
+    "search": (LOGGED_IN, op_search),
+    "cart_add": (("customer",), op_cart_add),
+    "cart": (("customer",), op_cart),
+    "cart_count": (("customer",), op_cart_count),
+    "checkout_preview": (("customer",), op_checkout_preview),
+    "checkout": (("customer",), op_checkout),
+    "order_history": (("customer",), op_order_history),
+    "watch": (("customer",), op_watch),
+    "unwatch": (("customer",), op_unwatch),
+    "watches": (("customer",), op_watches),
+    "price_alerts": (("customer",), op_price_alerts),
+    "listings": (("seller",), op_listings),
+    "listing_add": (("seller",), op_listing_add),
+    "listing_update": (("seller",), op_listing_update),
+    "listing_remove": (("seller",), op_listing_remove),
+    "admin_users": (("admin",), op_admin_users),
+    "admin_products": (("admin",), op_admin_products),
+    "admin_orders": (("admin",), op_admin_orders),
+    "sales_sellers": (("admin",), op_sales_sellers),
+    "sales_products": (("admin",), op_sales_products),
+    "sales_daily": (("admin",), op_sales_daily),
+    "fulfilment": (("admin",), op_fulfilment),
+    "add_product": (("admin",), op_add_product),
+    "add_user": (("admin",), op_add_user),
+    "remove_user": (("admin",), op_remove_user),
+}
+
+
+def _run_on_worker(pool, op, handler, session, args):
+    """ Runs one handler on a worker thread with a connection borrowed just for it. """
+    with query_stats.track_action(f"server.{op}"), \
+            read_routing.session_connection(pool, session.consistency) as connection:
+        return jsonable(handler(connection, session, args))
+
+
+# ---------------------------------
+# Server
+# ---------------------------------
+
+class MarketplaceServer:
+    """ Accepts sessions and feeds their requests to a bounded pool of DB workers. """
+
+    def __init__(self, pool, workers=SERVER_WORKERS, max_queued=MAX_QUEUED, queue_timeout=QUEUE_TIMEOUT):
+        self.pool = pool
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-worker")
+        self._slots = asyncio.Semaphore(workers + max_queued)
+        self._stats = {"sessions": 0, "sessions_total": 0, "requests": 0, "errors": 0, "busy": 0, "in_flight": 0}
+
+    def stats(self):
+        snapshot = dict(self._stats)
+        snapshot["queued"] = max(0, snapshot["in_flight"] - self.workers)
+        return snapshot
+
+    async def run_db(self, op, handler, session, args):
+        """ Waits for a queue slot (backpressure), then runs the handler on a DB worker. """
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats["busy"] += 1
+            raise ServerBusy()
+        self._stats["in_flight"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, _run_on_worker, self.pool, op, handler, session, args)
+        finally:
+            self._stats["in_flight"] -= 1
+            self._slots.release()
+
+    async def dispatch(self, session, request):
+        """ Runs one decoded request and returns its result. Raises ClientError or ServerBusy. """
+        op = request.get("op")
+        args = request.get("args") or {}
+        if not isinstance(args, dict):
+            raise ClientError("'args' must be an object")
+
+        # Ops that don't touch the database are answered on the event loop.
+        if op == "ping":
+            return "pong"
+        if op == "stats":
+            if session.user is None or session.user.role != "admin":
+                raise ClientError("not allowed")
+            return jsonable({"server": self.stats(), "pool": self.pool.stats(), "catalog_cache": cache_stats(),
+                             "search": search_stats(), "routing": read_routing.routing_stats(),
+                             "fulfilment": fulfilment.worker_stats(),
+                             "queries": query_stats.snapshot(), "prepared": queries.registry_stats()})
+
+        if op not in OPS:
+            raise ClientError(f"unknown op {op!r}")
+        roles, handler = OPS[op]
+        if roles and (session.user is None or session.user.role not in roles):
+            raise ClientError("login required" if session.user is None else "not allowed")
+        return await self.run_db(op, handler, session, args)
+
+    async def handle_line(self, session, line):
+        self._stats["requests"] += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ClientError("a request must be a JSON object")
+            request_id = request.get("id")
+            result = await self.dispatch(session, request)
+            return {"id": request_id, "ok": True, "result": result}
+        except ServerBusy:
+            return {"id": request_id, "ok": False, "error": "server busy", "retry": True}
+        except ValueError as e:   # includes malformed JSON
+            self._stats["errors"] += 1
+            return {"id": request_id, "ok": False, "error": f"bad request: {e}"}
+        except ClientError as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:
+            self._stats["errors"] += 1
+            return {"id": request_id, "ok": False, "error": f"server error: {e}"}
+
+    async def handle_client(self, reader, writer):
+        session = Session()
+        self._stats["sessions"] += 1
+        self._stats["sessions_total"] += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(b'{"id": null, "ok": false, "error": "request line too long"}\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.handle_line(session, line)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()   # a client that stops reading stops being served
+        except ConnectionError:
+            pass
+        finally:
+            self._stats["sessions"] -= 1
+            if session.cart is not None and session.cart.pending:
+                await self._flush_on_disconnect(session)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _flush_on_disconnect(self, session):
+        """ Saves a dropped session's buffered cart. Skips the busy check: this must not be refused. """
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, _run_on_worker, self.pool, "disconnect", op_logout,
+                                       session, {})
+        except Exception as e:
+            print(f"Could not save the cart of user {session.user.user_id if session.user else '?'}: {e}")
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path, limit=MAX_LINE)
+            where = unix_path
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_LINE, backlog=1024)
+            where = f"{host}:{port}"
+        print(f"HYPECULTURE server listening on {where} with {self.workers} DB workers")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="DB worker threads / pooled connections")
+    parser.add_argument("--checkout-mode", choices=CHECKOUT_MODES, default=CHECKOUT_MODE,
+                        help="run cart adds and checkout from Python (client) or as stored procedures (server)")
+    parser.add_argument("--read-your-writes", choices=read_routing.READ_YOUR_WRITES_MODES,
+                        default=read_routing.READ_YOUR_WRITES,
+                        help="with replicas configured: how a session's reads see its own writes")
+    parser.add_argument("--fulfilment-workers", type=int, default=fulfilment.FULFILMENT_WORKERS,
+                        help="payment/fulfilment worker threads (0 if they run elsewhere: python fulfilment.py)")
+    parser.add_argument("--hold-ttl", type=float, default=stock_holds.HOLD_TTL,
+                        help="seconds an add-to-cart holds its stock (0 turns holds off)")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED,
+                        help="requests that may wait for a worker before new ones are refused")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    configure_backend(args.backend, args.sqlite_path)
+    try:
+        configure_checkout(args.checkout_mode)
+    except ValueError as e:
+        parser.error(str(e))
+    read_routing.configure_routing(args.read_your_writes)
+    if args.hold_ttl > 0:
+        stock_holds.configure_holds(enabled=True, ttl=args.hold_ttl)
+    else:
+        stock_holds.configure_holds(enabled=False)
+    # Fulfilment workers and the background threads get connections of their own so they never hold up requests.
+    configure_pool(min_size=min(2, args.workers),
+                   max_size=args.workers + args.fulfilment_workers + BACKGROUND_CONNECTIONS)
+    server = MarketplaceServer(get_pool(), args.workers, args.max_queued)
+    build_index_in_background(server.pool)
+    sales_rollups.start_rollup_worker(server.pool)
+    stock_holds.start_sweeper(server.pool)
+    user_purge.start_purger(server.pool)
+    change_feed.start_cache_invalidator(server.pool)   # other processes' writes reach this one's caches
+    price_watch.start_price_watcher(server.pool)
+    workers = fulfilment.FulfilmentWorkers(server.pool, args.fulfilment_workers).start()
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        workers.stop()
+        server.close()
+        read_routing.close_replicas()
+        close_pool()
+        print("Server stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# services.py
+# Marketplace operations as plain functions: parameters in, data out, no print() or input().
+# The CLI menus and the benchmark workload both call these.
+from collections import namedtuple
+from datetime import timedelta
+
+from mysql.connector import Error
+
+import checkout_engine
+import queries
+import stock_holds
+import user_purge
+from catalog_cache import bump_catalog_version, invalidate_catalog
+from order_book import invalidate_products, plan_sweep, refresh_listing
+from pagination import DEFAULT_PAGE_SIZE, fetch_keyset_page
+from product_search import index_product
+from sql_dialect import dialect
+
+USER_ROLES = ("customer", "seller", "admin")
+
+User = namedtuple("User", ["user_id", "role", "first_name"])
+CartItem = namedtuple("CartItem", ["product_name", "seller_name", "price", "quantity", "subtotal"])
+Listing = namedtuple("Listing", ["inventory_id", "product_name", "price", "stock"])
+
+
+# ---------------------------------
+# Accounts
+# ---------------------------------
+
+def authenticate(connection, email, password):
+    """ User for a matching email and password, or None. """
+    row = queries.select_one(connection, "login", (email, password))
+    return User(*row) if row else None
+
+
+def create_user(connection, first_name, last_name, email, password, role="customer"):
+    """ Inserts a user and returns their User. Raises ValueError for missing fields or a bad role. """
+    if not all([first_name, last_name, email, password]):
+        raise ValueError("All fields are required.")
+    if role not in USER_ROLES:
+        raise ValueError(f"Invalid role {role!r}.")
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO Users (first_name, last_name, email, password_hash, user_role) VALUES (%s, %s, %s, %s, %s)",
+            (first_name, last_name, email, password, role)
+        )
+        user_id = cursor.lastrowid
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return User(user_id, role, first_name)
+
+
+def delete_user(connection, user_id):
+    """ Removes a user at once by soft-deleting them. Returns False if there is no such (live) user.
+
+    One single-row UPDATE: the user can no longer log in and their listings leave browse and
+    checkout straight away. Their carts, listings and addresses are cleared afterwards in small
+    batches by the background purger (user_purge.py), which this wakes.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("UPDATE Users SET deleted_at = NOW() WHERE user_id = %s AND deleted_at IS NULL", (user_id,))
+        removed = cursor.rowcount > 0
+        if removed:
+            cursor.execute("SELECT DISTINCT product_id FROM Inventory WHERE seller_id = %s AND stock_quantity > 0",
+                           (user_id,))
+            product_ids = [row[0] for row in cursor.fetchall()]
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    if removed:
+        # Their offers may be the best price of these products; rebuild those books without them.
+        if product_ids:
+            invalidate_products(connection, product_ids)
+        user_purge.wake()
+    return removed
+
+
+# ---------------------------------
+# Customer: cart
+# ---------------------------------
+
+def add_cart_item(connection, user_id, inventory_id, quantity):
+    """ Adds `quantity` of a listing to the user's cart, merging with an existing line.
+
+    One atomic upsert on uq_cart_customer_inventory, so concurrent adds of the same item
+    add up on a single row instead of racing a SELECT. With stock holds on, the line's stock
+    is held too (stock_holds.py), or StockUnavailable is raised and the cart is unchanged.
+    In the "server" checkout mode the AddToCart procedure does both.
+    """
+    if checkout_engine.CHECKOUT_MODE != "server":
+        add_cart_items(connection, user_id, {inventory_id: quantity})
+        return
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive.")
+    hold_seconds = stock_holds.HOLD_TTL if stock_holds.HOLDS_ENABLED else 0
+    cursor = connection.cursor()
+    try:
+        # AddToCart returns no result set, so a plain CALL does it in one round trip
+        # (callproc would first SET its arguments as session variables).
+        cursor.execute("CALL AddToCart(%s, %s, %s, %s)", (user_id, inventory_id, quantity, int(hold_seconds)))
+        connection.commit()
+    except Error as e:
+        connection.rollback()
+        unavailable = stock_holds.unavailable_from_signal(e)
+        if unavailable is not None:
+            raise unavailable from e
+        raise
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def add_cart_items(connection, user_id, quantities):
+    """ Adds several {inventory_id: quantity} lines to the cart in one transaction.
+
+    With stock holds on, every line is held as well; if any line doesn't fit, StockUnavailable
+    is raised and none are added.
+    """
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise ValueError("Quantity must be positive.")
+    if not quantities:
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(
+            """
+            INSERT INTO Cart (customer_id, inventory_id, quantity) VALUES (%s, %s, %s)
+            """ + dialect().on_duplicate(["customer_id", "inventory_id"], quantity="quantity + {new}"),
+            [(user_id, inventory_id, quantity) for inventory_id, quantity in quantities.items()]
+        )
+        if stock_holds.HOLDS_ENABLED:
+            stock_holds.reserve(connection, user_id, quantities)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def add_best_price(connection, user_id, product_id, quantity):
+    """ Adds `quantity` pairs of a product at the lowest total price, split across sellers.
+
+    The split comes from the product's order book (order_book.plan_sweep) and every line goes
+    into the cart in one add_cart_items() transaction. With stock holds on, listings whose
+    stock other buyers hold are capped and the rest of the quantity moves on to the next
+    sellers. Returns the SweepPlan that was added; its `filled` falls short of `quantity`
+    when the sellers don't have enough left.
+    """
+    caps = {}   # inventory_id -> most this buyer can still add from it
+    while True:
+        plan = plan_sweep(connection, product_id, quantity, caps)
+        lines = {fill.offer.inventory_id: fill.quantity for fill in plan.fills}
+        if not lines:
+            return plan
+        if stock_holds.HOLDS_ENABLED:
+            # One read for the whole split instead of a refused add per held listing
+            available = stock_holds.available_to(connection, user_id, list(lines))
+            short = {inv: max(available.get(inv, 0), 0) for inv, qty in lines.items() if available.get(inv, 0) < qty}
+            if short:
+                caps.update(short)
+                continue
+        try:
+            add_cart_items(connection, user_id, lines)
+            return plan
+        except stock_holds.StockUnavailable as e:
+            # The cart already held some of this listing, so less of it fits than it has free.
+            caps[e.inventory_id] = max(lines[e.inventory_id] - (e.wanted - e.available), 0)
+
+
+def cart_item_count(connection, user_id):
+    """ Total quantity across the user's cart lines. """
+    if checkout_engine.CHECKOUT_MODE != "server":
+        return int(queries.select_one(connection, "cart.count", (user_id,))[0])
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT GetCartItemCount(%s)", (user_id,))
+        return int(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+
+
+def get_cart(connection, user_id):
+    """ [CartItem] for the user's cart. """
+    return list(get_cart_lines(connection, user_id).values())
+
+
+def get_cart_lines(connection, user_id):
+    """ {inventory_id: CartItem} for the user's cart. """
+    return {row[0]: CartItem(*row[1:]) for row in queries.select(connection, "cart.lines", (user_id,))}
+
+
+def get_listing_details(connection, inventory_ids):
+    """ {inventory_id: (product_name, seller_name, price)} for the given listings. """
+    if not inventory_ids:
+        return {}
+    return {row[0]: row[1:] for row in queries.select(connection, "listing.details", ids=inventory_ids)}
+
+
+# ---------------------------------
+# Seller: listings
+# ---------------------------------
+
+def get_seller_listings(connection, seller_id):
+    """ [Listing] for every listing the seller owns. """
+    return [Listing(*row) for row in queries.select(connection, "seller.listings", (seller_id,))]
+
+
+def add_listing(connection, seller_id, product_id, price, stock):
+    """ Creates a listing and returns its inventory_id. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO Inventory (seller_id, product_id, price, stock_quantity) VALUES (%s, %s, %s, %s)",
+            (seller_id, product_id, price, stock)
+        )
+        inventory_id = cursor.lastrowid
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    refresh_listing(connection, inventory_id)
+    return inventory_id
+
+
+def update_listing(connection, seller_id, inventory_id, price=None, stock=None):
+    """ Updates price and/or stock of one of the seller's listings in a single statement.
+
+    Returns False when the listing doesn't exist or belongs to another seller.
+    """
+    assignments, params = [], []
+    if price is not None:
+        assignments.append("price = %s")
+        params.append(price)
+    if stock is not None:
+        assignments.append("stock_quantity = %s")
+        params.append(stock)
+    if not assignments:
+        raise ValueError("Nothing to update.")
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            f"UPDATE Inventory SET {', '.join(assignments)} WHERE inventory_id = %s AND seller_id = %s",
+            params + [inventory_id, seller_id]
+        )
+        # rowcount counts changed rows, so re-setting the same values still reports success
+        cursor.execute("SELECT 1 FROM Inventory WHERE inventory_id = %s AND seller_id = %s",
+                       (inventory_id, seller_id))
+        found = cursor.fetchone() is not None
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    if found:
+        refresh_listing(connection, inventory_id)
+    return found
+
+
+def remove_listing(connection, seller_id, inventory_id):
+    """ Deletes one of the seller's listings. Returns False if it isn't theirs or doesn't exist. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT product_id FROM Inventory WHERE inventory_id = %s AND seller_id = %s",
+                       (inventory_id, seller_id))
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        # The 'AND seller_id = %s' is a crucial security check
+        cursor.execute("DELETE FROM Inventory WHERE inventory_id = %s AND seller_id = %s", (inventory_id, seller_id))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    refresh_listing(connection, inventory_id, product_id=row[0])
+    return True
+
+
+# ---------------------------------
+# Admin: catalog and listings
+# ---------------------------------
+
+def add_product(connection, product_name, brand, category_id):
+    """ Adds a product to the master catalog and returns its product_id. """
+    if not all([product_name, brand, category_id]):
+        raise ValueError("All fields are required.")
+    cursor = connection.cursor()
+    try:
+        cursor.execute("INSERT INTO Products (product_name, brand, category_id) VALUES (%s, %s, %s)",
+                       (product_name, brand, category_id))
+        product_id = cursor.lastrowid
+        bump_catalog_version(cursor)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    invalidate_catalog()
+    index_product(product_id, product_name, brand, category_id)
+    return product_id
+
+
+# Each admin listing below returns one page as (rows, next_after); pass next_after back in
+# as `after` for the following page. next_after is None on the last page.
+
+def list_users(connection, role=None, after=None, page_size=DEFAULT_PAGE_SIZE):
+    """ Rows of (user_id, first_name, last_name, email, user_role). Removed users are left out. """
+    conditions, params = ["deleted_at IS NULL"], []
+    if role:
+        conditions.append("user_role = %s")
+        params.append(role)
+    return fetch_keyset_page(connection, "SELECT user_id, first_name, last_name, email, user_role FROM Users",
+                             "user_id", conditions, params, after, page_size)
+
+
+def list_products(connection, category_id=None, brand=None, after=None, page_size=DEFAULT_PAGE_SIZE):
+    """ Rows of (product_id, product_name, brand, category_id). """
+    conditions, params = [], []
+    if category_id is not None:
+        conditions.append("category_id = %s")
+        params.append(category_id)
+    if brand:
+        conditions.append("brand = %s")
+        params.append(brand)
+    return fetch_keyset_page(connection, "SELECT product_id, product_name, brand, category_id FROM Products",
+                             "product_id", conditions, params, after, page_size)
+
+
+def list_orders(connection, status=None, customer_id=None, date_from=None, date_to=None, after=None,
+                page_size=DEFAULT_PAGE_SIZE):
+    """ Rows of (order_id, customer_id, total_amount, order_status, order_date). date_to is inclusive.
+    Orders moved to the archive (order_archive.py) are not listed. """
+    conditions, params = [], []
+    if status:
+        conditions.append("order_status = %s")
+        params.append(status)
+    if customer_id is not None:
+        conditions.append("customer_id = %s")
+        params.append(customer_id)
+    if date_from:
+        conditions.append("order_date >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("order_date < %s")
+        params.append(date_to + timedelta(days=1))
+    return fetch_keyset_page(connection,
+                             "SELECT order_id, customer_id, total_amount, order_status, order_date FROM Orders",
+                             "order_id", conditions, params, after, page_size)
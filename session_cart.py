@@ -0,0 +1,173 @@
+# session_cart.py
+"""
+A logged-in customer's cart, with optional write-behind.
+
+With write-behind on, add() only updates an in-memory buffer, and items() answers from a
+snapshot of the Cart rows loaded once per session. Browsing and re-viewing the cart
+therefore cost no round trips. Buffered lines reach the Cart table in one batched upsert
+when flush() runs. That happens before checkout, at logout, and automatically once the
+buffer holds CART_FLUSH_MAX_LINES lines or its oldest add is CART_FLUSH_INTERVAL seconds old.
+
+A flush is one transaction, so either every buffered line reaches Cart or none does. The
+buffer is only cleared after the commit succeeds, so a failed flush loses nothing and can be
+retried. A crash loses at most the adds made since the last flush.
+
+Stock holds (stock_holds.py) are taken when an item is added, and a buyer must hear at once
+if the stock isn't there. So while holds are on, add() writes the line and its hold straight
+through, and only the reads are buffered: the committed line is folded into the snapshot, so
+viewing the cart still costs no round trip.
+"""
+import time
+
+from mysql.connector import Error, errorcode
+
+import stock_holds
+from order_book import plan_sweep
+from services import (CartItem, add_best_price, add_cart_item, add_cart_items, get_cart, get_cart_lines,
+                      get_listing_details)
+
+CART_WRITE_BEHIND = True
+CART_FLUSH_MAX_LINES = 20     # flush once this many distinct listings are buffered
+CART_FLUSH_INTERVAL = 30.0    # seconds the oldest buffered add may wait for a flush
+CART_SNAPSHOT_TTL = 60.0      # seconds before the snapshot is re-read (another session may change the cart)
+
+
+class SessionCart:
+    """ The cart as seen by one session. With write_behind off every call goes straight to the DB. """
+
+    def __init__(self, user_id, write_behind=CART_WRITE_BEHIND):
+        self.user_id = user_id
+        self.write_behind = write_behind
+        self._pending = {}          # inventory_id -> quantity added but not yet written
+        self._pending_since = None
+        self._snapshot = None       # {inventory_id: CartItem} as last read from Cart
+        self._snapshot_at = 0.0
+        self._details = {}          # inventory_id -> (product_name, seller_name, price) for lines not in the snapshot
+        self.stats = {"adds": 0, "views": 0, "flushes": 0, "lines_flushed": 0, "snapshot_loads": 0}
+
+    @property
+    def pending(self):
+        """ Buffered {inventory_id: quantity} not yet written to Cart. """
+        return dict(self._pending)
+
+    def add(self, connection, inventory_id, quantity):
+        """ Adds `quantity` of a listing, buffering it when write-behind is on. """
+        if quantity <= 0:
+            raise ValueError("Quantity must be positive.")
+        self.stats["adds"] += 1
+        if not self.write_behind:
+            add_cart_item(connection, self.user_id, inventory_id, quantity)
+            return
+        if stock_holds.HOLDS_ENABLED:
+            add_cart_item(connection, self.user_id, inventory_id, quantity)   # may raise StockUnavailable
+            self._written_through(connection, {inventory_id: quantity})
+            return
+
+        self._buffer(connection, {inventory_id: quantity})
+
+    def add_best_price(self, connection, product_id, quantity):
+        """ Adds `quantity` pairs split across the cheapest sellers (services.add_best_price). Returns the SweepPlan. """
+        self.stats["adds"] += 1
+        if not self.write_behind:
+            return add_best_price(connection, self.user_id, product_id, quantity)
+        if stock_holds.HOLDS_ENABLED:
+            plan = add_best_price(connection, self.user_id, product_id, quantity)
+            self._written_through(connection, {fill.offer.inventory_id: fill.quantity for fill in plan.fills})
+            return plan
+
+        plan = plan_sweep(connection, product_id, quantity)
+        self._buffer(connection, {fill.offer.inventory_id: fill.quantity for fill in plan.fills})
+        return plan
+
+    def items(self, connection):
+        """ [CartItem] for the cart including buffered adds. Prices are as of the snapshot. """
+        self.stats["views"] += 1
+        if not self.write_behind:
+            return get_cart(connection, self.user_id)
+
+        if self._snapshot is None or time.monotonic() - self._snapshot_at > CART_SNAPSHOT_TTL:
+            self._snapshot = get_cart_lines(connection, self.user_id)
+            self._snapshot_at = time.monotonic()
+            self.stats["snapshot_loads"] += 1
+        missing = [inv for inv in self._pending if inv not in self._snapshot and inv not in self._details]
+        if missing:
+            self._details.update(get_listing_details(connection, missing))
+        return list(self._merged().values())
+
+    def flush(self, connection):
+        """ Writes every buffered line in one transaction. Returns the number of lines written. """
+        if not self._pending:
+            return 0
+        pending = dict(self._pending)
+        try:
+            add_cart_items(connection, self.user_id, pending)   # raises (and keeps the buffer) on failure
+        except Error as e:
+            if e.errno != errorcode.ER_NO_REFERENCED_ROW_2:
+                raise
+            # A buffered listing was deleted meanwhile: drop just those lines and write the rest.
+            existing = get_listing_details(connection, list(pending))
+            pending = {inv: qty for inv, qty in pending.items() if inv in existing}
+            add_cart_items(connection, self.user_id, pending)
+            self._snapshot = None
+
+        self._fold(pending)
+        self._pending = {}
+        self._pending_since = None
+        self._details = {}
+        self.stats["flushes"] += 1
+        self.stats["lines_flushed"] += len(pending)
+        return len(pending)
+
+    def _buffer(self, connection, quantities):
+        """ Buffers {inventory_id: quantity} adds, flushing when the buffer is full or old. """
+        if not quantities:
+            return
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        for inventory_id, quantity in quantities.items():
+            self._pending[inventory_id] = self._pending.get(inventory_id, 0) + quantity
+        if (len(self._pending) >= CART_FLUSH_MAX_LINES
+                or time.monotonic() - self._pending_since >= CART_FLUSH_INTERVAL):
+            self.flush(connection)
+
+    def _written_through(self, connection, quantities):
+        """ Folds lines add() wrote straight through into the snapshot, reading the details of new ones. """
+        if self._snapshot is not None:
+            missing = [inv for inv in quantities if inv not in self._snapshot and inv not in self._details]
+            if missing:
+                self._details.update(get_listing_details(connection, missing))
+        self._fold(quantities)
+
+    def _fold(self, quantities):
+        """ Adds committed {inventory_id: quantity} lines to the snapshot, so the next view still
+        needs no query. A line whose details aren't known drops the snapshot instead. """
+        if self._snapshot is None:
+            return
+        for inventory_id, quantity in quantities.items():
+            line = self._snapshot.get(inventory_id)
+            if line is not None:
+                total = line.quantity + quantity
+                self._snapshot[inventory_id] = line._replace(quantity=total, subtotal=line.price * total)
+            elif inventory_id in self._details:
+                product_name, seller_name, price = self._details[inventory_id]
+                self._snapshot[inventory_id] = CartItem(product_name, seller_name, price, quantity, price * quantity)
+            else:
+                self._snapshot = None
+                return
+
+    def invalidate(self):
+        """ Forgets the snapshot, e.g. after checkout changed the Cart rows. """
+        self._snapshot = None
+
+    def _merged(self):
+        """ Snapshot plus buffered quantities. Buffered lines with unknown details are left out. """
+        merged = dict(self._snapshot or {})
+        for inventory_id, quantity in self._pending.items():
+            line = merged.get(inventory_id)
+            if line is not None:
+                total = line.quantity + quantity
+                merged[inventory_id] = line._replace(quantity=total, subtotal=line.price * total)
+            elif inventory_id in self._details:
+                product_name, seller_name, price = self._details[inventory_id]
+                merged[inventory_id] = CartItem(product_name, seller_name, price, quantity, price * quantity)
+        return merged
@@ -0,0 +1,87 @@
+# sql_dialect.py
+"""
+The SQL that differs between the MySQL and SQLite backends (db_connector.DB_BACKEND).
+
+Queries are written in MySQL's dialect with %s placeholders. The SQLite backend rewrites the
+parts that map one-to-one, statement by statement (see SQLiteDialect.translate()):
+
+    %s / %%                          -> ? / %
+    INSERT IGNORE                    -> INSERT OR IGNORE
+    FOR UPDATE [SKIP LOCKED|NOWAIT]  -> dropped: a SQLite transaction that writes holds the
+    LOCK IN SHARE MODE / FOR SHARE      database's write lock from its first statement
+                                        (BEGIN IMMEDIATE), so rows can't change under it
+
+Constructs that are shaped differently are built with the active dialect instead:
+
+    d = dialect()
+    f"INSERT INTO Cart (...) VALUES (%s, %s, %s) {d.on_duplicate(['customer_id', 'inventory_id'], quantity='quantity + {new}')}"
+    sql, param = d.now_plus(30)      # a timestamp 30 seconds from now, for comparisons and defaults
+
+Everything else the app sends (joins, CASE, COALESCE, DATE(), LIMIT, NOW()) runs on both.
+"""
+import re
+from functools import lru_cache
+
+import db_connector
+
+
+class MySQLDialect:
+    name = "mysql"
+    insert_ignore = "INSERT IGNORE"
+    supports_procedures = True
+    prepared_statements = True     # server-side, reused per connection (queries.py)
+
+    def on_duplicate(self, keys, **assignments):
+        """ Upsert tail for an INSERT whose row may collide on the unique key `keys`.
+        Each assignment is an expression in which {new} stands for the value being inserted. """
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(
+            f"{column} = {expr.format(new=f'VALUES({column})')}" for column, expr in assignments.items())
+
+    def now_plus(self, seconds):
+        """ (SQL, parameter) for the current time plus `seconds` (may be negative), to the millisecond. """
+        return "NOW(3) + INTERVAL %s MICROSECOND", int(seconds * 1000000)
+
+    def seconds_between(self, start, end):
+        """ SQL for end - start in (fractional) seconds; both are SQL expressions. """
+        return f"TIMESTAMPDIFF(MICROSECOND, {start}, {end}) / 1000000"
+
+
+_PLACEHOLDER = re.compile(r"%(s|%)")
+_INSERT_IGNORE = re.compile(r"^(\s*)INSERT\s+IGNORE\b", re.IGNORECASE)
+_LOCKING_READ = re.compile(r"\s+(FOR\s+UPDATE(\s+(SKIP\s+LOCKED|NOWAIT))?|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE)\b",
+                           re.IGNORECASE)
+
+
+class SQLiteDialect:
+    name = "sqlite"
+    insert_ignore = "INSERT OR IGNORE"
+    supports_procedures = False
+    prepared_statements = False    # sqlite3 caches compiled statements itself
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def translate(operation, with_params=True):
+        """ The statement rewritten for SQLite. Like mysql-connector, placeholders (and %%) are only
+        interpreted when parameters are passed. Cached, since the app sends the same strings over and over. """
+        if with_params:
+            operation = _PLACEHOLDER.sub(lambda m: "?" if m.group(1) == "s" else "%", operation)
+        operation = _INSERT_IGNORE.sub(r"\1INSERT OR IGNORE", operation)
+        return _LOCKING_READ.sub("", operation)
+
+    def on_duplicate(self, keys, **assignments):
+        return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET " + ", ".join(
+            f"{column} = {expr.format(new=f'excluded.{column}')}" for column, expr in assignments.items())
+
+    def now_plus(self, seconds):
+        return "ADD_SECONDS(NOW(3), %s)", float(seconds)
+
+    def seconds_between(self, start, end):
+        return f"((julianday({end}) - julianday({start})) * 86400.0)"
+
+
+DIALECTS = {"mysql": MySQLDialect(), "sqlite": SQLiteDialect()}
+
+
+def dialect():
+    """ The dialect of the configured backend. """
+    return DIALECTS[db_connector.DB_BACKEND]
@@ -0,0 +1,239 @@
+# sqlite_backend.py
+"""
+Embedded SQLite backend. Its connections behave like mysql-connector's as far as this app
+can tell.
+
+db_connector.open_connection() returns one of these when DB_BACKEND = "sqlite". There is no server to
+start, so local runs, demos and benchmarks are up in well under a second. MySQL remains the
+production target.
+
+  * Creation: the database file is created from hypeculture_sqlite.sql on first open. It
+    runs in WAL mode, so readers and the writer never block each other.
+  * SQL: statements are written for MySQL. SQLiteDialect.translate() rewrites placeholders,
+    INSERT IGNORE and locking reads on the way in. NOW() and ADD_SECONDS() are provided as
+    SQL functions.
+  * Transactions: these work as in mysql-connector with autocommit off. The first write
+    starts a transaction, and it lasts until commit() or rollback(). That first write, or
+    start_transaction(), takes SQLite's single write lock up front (BEGIN IMMEDIATE). It
+    waits up to SQLITE_BUSY_TIMEOUT for the lock, so a transaction that reads and then
+    writes never fails on a stale snapshot. Outside a transaction, each read sees the
+    latest commit.
+  * Errors: errors are raised as mysql.connector errors with the matching MySQL errno
+    (duplicate key, foreign key, lock wait timeout). Callers' retries and messages work
+    unchanged.
+  * Types: DECIMAL, TIMESTAMP and DATE columns come back as Decimal, datetime and date.
+"""
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from mysql.connector import errorcode, errors
+
+from sql_dialect import SQLiteDialect
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hypeculture_sqlite.sql")
+
+_WRITE_STATEMENT = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+_schema_lock = threading.Lock()
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter("DECIMAL", lambda raw: Decimal(raw.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()[:10]))
+
+
+def _now(fsp=0):
+    """ MySQL's NOW([fsp]): local time, with milliseconds when asked for. """
+    now = datetime.now()
+    return now.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if fsp else now.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _add_seconds(timestamp, seconds):
+    if timestamp is None or seconds is None:
+        return None
+    moved = datetime.fromisoformat(timestamp) + timedelta(seconds=seconds)
+    return moved.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _mysql_error(e, operation=""):
+    """ The mysql.connector error a MySQL server would have raised for sqlite3 error `e`. """
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        if "UNIQUE" in message or "PRIMARY KEY" in message:
+            errno = errorcode.ER_DUP_ENTRY
+        elif "FOREIGN KEY" in message:
+            deleting = operation.lstrip().upper().startswith("DELETE")
+            errno = errorcode.ER_ROW_IS_REFERENCED_2 if deleting else errorcode.ER_NO_REFERENCED_ROW_2
+        elif "NOT NULL" in message:
+            errno = errorcode.ER_BAD_NULL_ERROR
+        else:
+            errno = errorcode.ER_CHECK_CONSTRAINT_VIOLATED
+        return errors.IntegrityError(msg=message, errno=errno)
+    if isinstance(e, sqlite3.OperationalError) and ("locked" in message or "busy" in message):
+        return errors.DatabaseError(msg=message, errno=errorcode.ER_LOCK_WAIT_TIMEOUT)
+    if isinstance(e, sqlite3.OperationalError) and "syntax error" in message:
+        return errors.ProgrammingError(msg=message)
+    return errors.DatabaseError(msg=message)
+
+
+def _open(path, busy_timeout):
+    db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False,
+                         detect_types=sqlite3.PARSE_DECLTYPES)
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute("PRAGMA foreign_keys = ON")
+    db.create_function("NOW", -1, _now)
+    db.create_function("ADD_SECONDS", 2, _add_seconds)
+    _ensure_schema(db)
+    return db
+
+
+def _ensure_schema(db):
+    """ Creates the schema in an empty database and records it as fully migrated. """
+    with _schema_lock:
+        if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Users'").fetchone():
+            return
+        from migrate import MIGRATIONS
+        with open(SCHEMA_FILE, encoding="utf-8") as f:
+            schema = f.read()
+        versions = "".join("INSERT INTO SchemaMigrations (version, name) VALUES ({}, '{}');\n".format(
+                           version, name.replace("'", "''")) for version, name, _ in MIGRATIONS)
+        try:
+            db.executescript(f"BEGIN;\n{schema}\n{versions}COMMIT;")
+        except sqlite3.OperationalError as e:
+            if db.in_transaction:
+                db.rollback()
+            if "already exists" not in str(e):   # another process created it first
+                raise _mysql_error(e)
+
+
+class SQLiteCursor:
+    """ DB-API cursor taking MySQL-dialect statements with %s placeholders. """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection._db.cursor()
+
+    def execute(self, operation, params=None, multi=False):
+        self._connection._before(operation)
+        try:
+            self._cursor.execute(SQLiteDialect.translate(operation, params is not None), params or ())
+        except sqlite3.Error as e:
+            raise _mysql_error(e, operation) from e
+
+    def executemany(self, operation, seq_params):
+        self._connection._before(operation)
+        try:
+            self._cursor.executemany(SQLiteDialect.translate(operation), seq_params)
+        except sqlite3.Error as e:
+            raise _mysql_error(e, operation) from e
+
+    def callproc(self, procname, args=()):
+        raise errors.NotSupportedError(msg=f"Stored procedure {procname} needs the MySQL backend.")
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class SQLiteConnection:
+    """ One SQLite connection with mysql-connector's transaction behaviour. """
+
+    def __init__(self, path, busy_timeout):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._db = _open(path, busy_timeout)
+
+    def cursor(self, buffered=None):
+        if self._db is None:
+            raise errors.OperationalError(msg="Connection is closed.")
+        return SQLiteCursor(self)
+
+    def _before(self, operation):
+        if not self._db.in_transaction and _WRITE_STATEMENT.match(operation):
+            self._begin()
+
+    def _begin(self):
+        try:
+            self._db.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def start_transaction(self, consistent_snapshot=False, isolation_level=None, readonly=None):
+        if self._db.in_transaction:
+            raise errors.ProgrammingError(msg="Transaction already in progress")
+        self._begin()
+
+    @property
+    def in_transaction(self):
+        return self._db is not None and self._db.in_transaction
+
+    def commit(self):
+        try:
+            self._db.commit()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def rollback(self):
+        try:
+            self._db.rollback()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def is_connected(self):
+        return self._db is not None
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if self._db is None:
+            if not reconnect:
+                raise errors.InterfaceError(msg="Connection is closed.")
+            self.reconnect()
+        self._db.execute("SELECT 1").fetchone()
+
+    def reconnect(self, attempts=1, delay=0):
+        self.close()
+        try:
+            self._db = _open(self.path, self.busy_timeout)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def connect_sqlite(path, busy_timeout):
+    """ Opens (creating if needed) the database file at `path`. """
+    try:
+        return SQLiteConnection(path, busy_timeout)
+    except sqlite3.Error as e:
+        raise _mysql_error(e) from e
@@ -0,0 +1,227 @@
+# stock_holds.py
+"""
+Time-limited stock holds: what goes into a cart is reserved for HOLD_TTL seconds.
+
+Adding to the cart upserts the Cart line and, in the same transaction, holds the line's whole
+quantity in StockReservations (reserve()). A listing can only promise what the
+InventoryAvailability view reports: its stock_quantity less every unexpired hold. An add that
+would need more is refused with StockUnavailable and changes nothing. During a drop, buyers
+find out at add-to-cart, not after they have typed in an address. Each add renews the line's hold.
+
+Checkout (checkout_engine.place_order) takes a held line as it is: the stock was checked
+against everyone else's holds when the hold was taken. Only lines without an unexpired hold
+are checked against InventoryAvailability again. Ordering a line releases its hold in the
+order's transaction.
+
+An expired hold no longer counts anywhere, so nothing depends on it being deleted on time.
+The sweeper deletes expired holds in small batches to keep the table and the availability
+sums small. It runs on a background thread in server.py and from the command line:
+
+    python stock_holds.py                 # sweep once
+    python stock_holds.py --follow 30     # keep sweeping every 30 seconds
+    python stock_holds.py --status        # active and expired holds
+"""
+import argparse
+import threading
+import time
+from collections import namedtuple
+
+from db_connector import add_backend_arguments, configure_backend, create_connection
+import queries
+from sql_dialect import dialect
+
+HOLDS_ENABLED = True
+HOLD_TTL = 600          # seconds a cart line keeps its stock after the last add
+SWEEP_BATCH = 500       # expired holds deleted per transaction
+SWEEP_INTERVAL = 30     # seconds between sweeps of the background sweeper
+
+# Prefix of the error the AddToCart procedure raises when a hold can't be taken
+UNAVAILABLE_SIGNAL = "stock unavailable"
+
+HoldStatus = namedtuple("HoldStatus", ["active", "held_units", "expired"])
+
+
+class StockUnavailable(ValueError):
+    """ A cart add needs more than the listing has left once other buyers' holds are counted. """
+
+    def __init__(self, inventory_id, wanted, available):
+        super().__init__(f"Only {available} left for item ID {inventory_id} (your cart would hold {wanted}).")
+        self.inventory_id = inventory_id
+        self.wanted = wanted
+        self.available = available
+
+
+def configure_holds(enabled=None, ttl=None):
+    """ Turns holds on or off and/or sets their lifetime in seconds for this process. """
+    global HOLDS_ENABLED, HOLD_TTL
+    if ttl is not None:
+        if ttl <= 0:
+            raise ValueError("The hold TTL must be positive.")
+        HOLD_TTL = ttl
+    if enabled is not None:
+        HOLDS_ENABLED = bool(enabled)
+
+
+def reserve(connection, customer_id, inventory_ids, ttl=None):
+    """ Holds the full cart quantity of the given lines for `ttl` seconds, in the caller's transaction.
+
+    Call it after the Cart upsert, so locks are taken cart row first and listing second, like
+    checkout. Raises StockUnavailable for the first line that doesn't fit; the caller rolls back.
+    """
+    ids = sorted(set(inventory_ids))
+    if not ids:
+        return
+    # Lock the listings (ascending, as checkout does) so two adds can't both take the last pair.
+    # A removed seller's listing isn't returned, and nothing of it can be held.
+    locked = {row[0] for row in queries.select(connection, "checkout.lock_listings", ids=ids)}
+    rows = queries.select(connection, "holds.check", (customer_id,), ids=ids)
+    for inventory_id, wanted, available in rows:
+        if inventory_id not in locked:
+            available = 0
+        if wanted > available:
+            raise StockUnavailable(inventory_id, wanted, max(available, 0))
+
+    expires_sql, expires_param = dialect().now_plus(HOLD_TTL if ttl is None else ttl)
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(
+            f"""
+            INSERT INTO StockReservations (customer_id, inventory_id, quantity, expires_at)
+            VALUES (%s, %s, %s, {expires_sql})
+            """ + dialect().on_duplicate(["customer_id", "inventory_id"], quantity="{new}", expires_at="{new}"),
+            [(customer_id, inventory_id, wanted, expires_param) for inventory_id, wanted, _ in rows]
+        )
+    finally:
+        cursor.close()
+
+
+def unavailable_from_signal(error):
+    """ StockUnavailable for an AddToCart procedure error, or None if `error` is something else. """
+    message = getattr(error, "msg", "") or ""
+    if not message.startswith(UNAVAILABLE_SIGNAL):
+        return None
+    inventory_id, wanted, available = (int(part) for part in message[len(UNAVAILABLE_SIGNAL):].split())
+    return StockUnavailable(inventory_id, wanted, available)
+
+
+def held_quantities(connection, customer_id):
+    """ {inventory_id: quantity} of the customer's unexpired holds. """
+    return dict(queries.select(connection, "holds.for_customer", (customer_id,)))
+
+
+def available_to(connection, customer_id, inventory_ids):
+    """ {inventory_id: units the customer may take}: stock less other buyers' unexpired holds. """
+    if not inventory_ids:
+        return {}
+    return dict(queries.select(connection, "holds.available", (customer_id,), ids=sorted(set(inventory_ids))))
+
+
+def release(connection, customer_id, inventory_ids):
+    """ Drops the customer's holds on these listings, in the caller's transaction (e.g. once ordered). """
+    if not inventory_ids:
+        return
+    cursor = connection.cursor()
+    try:
+        placeholders = ", ".join(["%s"] * len(inventory_ids))
+        cursor.execute(f"DELETE FROM StockReservations WHERE customer_id = %s AND inventory_id IN ({placeholders})",
+                       [customer_id] + list(inventory_ids))
+    finally:
+        cursor.close()
+
+
+# ---------------------------------
+# Sweeper
+# ---------------------------------
+
+def sweep_expired(connection, batch_size=SWEEP_BATCH):
+    """ Deletes expired holds, `batch_size` per transaction. Returns how many were deleted. """
+    swept = 0
+    cursor = connection.cursor()
+    try:
+        while True:
+            cursor.execute("SELECT reservation_id FROM StockReservations WHERE expires_at <= NOW(3) "
+                           "ORDER BY expires_at LIMIT %s", (batch_size,))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                connection.commit()
+                break
+            placeholders = ", ".join(["%s"] * len(ids))
+            # Re-checked on delete: an add may have renewed the hold since it was read.
+            cursor.execute(f"DELETE FROM StockReservations WHERE reservation_id IN ({placeholders}) "
+                           f"AND expires_at <= NOW(3)", ids)
+            swept += cursor.rowcount
+            connection.commit()
+            if len(ids) < batch_size:
+                break
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return swept
+
+
+def start_sweeper(pool, interval=SWEEP_INTERVAL):
+    """ Sweeps every `interval` seconds on a daemon thread, borrowing a pooled connection each time. """
+    def run():
+        while True:
+            try:
+                with pool.connection() as connection:
+                    sweep_expired(connection)
+            except Exception as e:
+                print(f"⚠️  Stock hold sweep failed: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name="stock-hold-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def hold_status(connection):
+    """ HoldStatus: unexpired holds and the units they hold, plus expired holds awaiting the sweeper. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT COALESCE(SUM(expires_at > NOW(3)), 0),
+                   COALESCE(SUM(CASE WHEN expires_at > NOW(3) THEN quantity ELSE 0 END), 0),
+                   COALESCE(SUM(expires_at <= NOW(3)), 0)
+            FROM StockReservations
+            """
+        )
+        active, held_units, expired = cursor.fetchone()
+        connection.commit()
+    finally:
+        cursor.close()
+    return HoldStatus(int(active), int(held_units), int(expired))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--follow", type=float, metavar="SECONDS", help="keep sweeping at this interval")
+    parser.add_argument("--batch", type=int, default=SWEEP_BATCH, help="expired holds deleted per transaction")
+    parser.add_argument("--status", action="store_true", help="show active and expired holds and exit")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    connection = create_connection()
+    if not connection:
+        return
+    try:
+        if args.status:
+            status = hold_status(connection)
+            print(f"Active holds: {status.active} ({status.held_units} units) | expired, not yet swept: {status.expired}")
+            return
+        while True:
+            print(f"Released {sweep_expired(connection, args.batch)} expired hold(s)")
+            if not args.follow:
+                break
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# tests/conftest.py
+"""
+Shared fixtures. Every test gets a fresh SQLite database (db_connector's "sqlite" backend)
+built from hypeculture_sqlite.sql and its sample data, so the suite needs no MySQL server:
+
+    python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_cache
+import db_connector
+import order_book
+import stock_holds
+
+
+@pytest.fixture
+def connection(tmp_path):
+    """ A connection to a new SQLite database holding the sample data. """
+    saved = db_connector.DB_BACKEND, db_connector.SQLITE_PATH, stock_holds.HOLDS_ENABLED
+    db_connector.configure_backend("sqlite", str(tmp_path / "hypeculture.db"))
+    # The process-wide caches would otherwise carry rows over from the previous test's database.
+    catalog_cache.invalidate_catalog()
+    order_book._books.clear()
+    order_book._product_of.clear()
+    connection = db_connector.create_connection()
+    yield connection
+    connection.close()
+    db_connector.DB_BACKEND, db_connector.SQLITE_PATH, stock_holds.HOLDS_ENABLED = saved
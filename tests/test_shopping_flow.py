@@ -0,0 +1,88 @@
+# tests/test_shopping_flow.py
+"""
+A customer's path through the app on the SQLite backend: log in, fill the cart, check out
+and read the order back from the history.
+"""
+import pytest
+
+import checkout_engine
+import services
+import stock_holds
+from order_history import fetch_order_history_page
+
+ADDRESS = ("1 Main St", "Pune", "MH", "411001")
+
+
+def _stock(connection, inventory_id):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT stock_quantity FROM Inventory WHERE inventory_id = %s", (inventory_id,))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def test_login_add_checkout_history(connection):
+    user = services.authenticate(connection, "alice@email.com", "pass123")
+    assert user is not None and user.role == "customer"
+
+    services.add_cart_item(connection, user.user_id, 1, 2)
+    services.add_cart_item(connection, user.user_id, 1, 1)    # merges into the same line
+    services.add_cart_item(connection, user.user_id, 3, 1)
+    assert services.cart_item_count(connection, user.user_id) == 4
+
+    result = checkout_engine.place_order(connection, user.user_id, ADDRESS)
+    assert result.status == "placed"
+    assert sorted(result.placed) == [(1, 3, 250), (3, 1, 150)]
+    assert result.total_amount == 900
+    assert _stock(connection, 1) == 7 and _stock(connection, 3) == 19
+    assert services.cart_item_count(connection, user.user_id) == 0
+
+    page = fetch_order_history_page(connection, user.user_id)
+    assert page.next_cursor is None
+    [order] = page.orders
+    assert order.order_id == result.order_id
+    assert order.total_amount == 900
+    assert order.address_line1 == "1 Main St"
+    assert sorted((line.quantity, line.price_per_unit) for line in order.items) == [(1, 150), (3, 250)]
+
+
+def test_wrong_password_is_refused(connection):
+    assert services.authenticate(connection, "alice@email.com", "wrong") is None
+
+
+def test_hold_refuses_more_than_the_stock(connection):
+    stock_holds.configure_holds(enabled=True)
+    with pytest.raises(stock_holds.StockUnavailable):
+        services.add_cart_item(connection, 1, 2, 6)           # listing 2 has 5 in stock
+    assert services.cart_item_count(connection, 1) == 0
+
+
+def test_short_lines_stay_in_the_cart(connection):
+    stock_holds.configure_holds(enabled=False)
+    services.add_cart_items(connection, 1, {2: 6, 3: 1})
+
+    failed = checkout_engine.place_order(connection, 1, ADDRESS)
+    assert failed.status == "failed" and failed.short == [(2, 6, 5)]
+
+    partial = checkout_engine.place_order(connection, 1, ADDRESS, allow_partial=True)
+    assert partial.status == "partial"
+    assert partial.placed == [(3, 1, 150)] and partial.short == [(2, 6, 5)]
+    assert list(services.get_cart_lines(connection, 1)) == [2]
+    assert _stock(connection, 2) == 5
+
+
+def test_history_pages_follow_the_cursor(connection):
+    order_ids = []
+    for _ in range(3):
+        services.add_cart_item(connection, 2, 3, 1)
+        order_ids.append(checkout_engine.place_order(connection, 2, ADDRESS).order_id)
+
+    seen, after = [], None
+    while True:
+        page = fetch_order_history_page(connection, 2, page_size=2, after=after)
+        seen.extend(order.order_id for order in page.orders)
+        if page.next_cursor is None:
+            break
+        after = page.next_cursor
+    assert seen == sorted(order_ids, reverse=True)
@@ -0,0 +1,86 @@
+# tests/test_sql_dialect.py
+"""
+The dialect layer: the MySQL-to-SQLite rewrite, and the upsert, INSERT IGNORE and lastrowid
+paths run against the SQLite backend.
+"""
+import services
+from sql_dialect import DIALECTS, SQLiteDialect, dialect
+
+
+def _rows(connection, sql, params=()):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def test_translate():
+    translate = SQLiteDialect.translate
+    assert translate("SELECT * FROM Cart WHERE customer_id = %s FOR UPDATE") == \
+        "SELECT * FROM Cart WHERE customer_id = ?"
+    assert translate("SELECT 1 FROM Users WHERE email LIKE %s AND x = '10%%'") == \
+        "SELECT 1 FROM Users WHERE email LIKE ? AND x = '10%'"
+    assert translate("INSERT IGNORE INTO Categories (category_name) VALUES (%s)") == \
+        "INSERT OR IGNORE INTO Categories (category_name) VALUES (?)"
+    assert translate("SELECT job_id FROM OrderOutbox LIMIT 10 FOR UPDATE SKIP LOCKED") == \
+        "SELECT job_id FROM OrderOutbox LIMIT 10"
+    # Without parameters, % is left alone, as mysql-connector does.
+    assert translate("SELECT '100%'", with_params=False) == "SELECT '100%'"
+
+
+def test_on_duplicate():
+    assert DIALECTS["mysql"].on_duplicate(["customer_id", "inventory_id"], quantity="quantity + {new}") == \
+        "ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)"
+    assert DIALECTS["sqlite"].on_duplicate(["customer_id", "inventory_id"], quantity="quantity + {new}") == \
+        "ON CONFLICT (customer_id, inventory_id) DO UPDATE SET quantity = quantity + excluded.quantity"
+
+
+def test_upsert_adds_to_one_row(connection):
+    assert dialect().name == "sqlite"
+    sql = ("INSERT INTO Cart (customer_id, inventory_id, quantity) VALUES (%s, %s, %s) "
+           + dialect().on_duplicate(["customer_id", "inventory_id"], quantity="quantity + {new}"))
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, (1, 1, 2))
+        cursor.executemany(sql, [(1, 1, 3), (1, 2, 1)])
+        connection.commit()
+    finally:
+        cursor.close()
+    assert _rows(connection, "SELECT inventory_id, quantity FROM Cart WHERE customer_id = %s ORDER BY inventory_id",
+                 (1,)) == [(1, 5), (2, 1)]
+
+
+def test_insert_ignore_skips_duplicates(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"{dialect().insert_ignore} INTO Categories (category_name) VALUES (%s)", ("Sneakers",))
+        assert cursor.rowcount == 0
+        cursor.execute(f"{dialect().insert_ignore} INTO Categories (category_name) VALUES (%s)", ("Sandals",))
+        assert cursor.rowcount == 1
+        connection.commit()
+    finally:
+        cursor.close()
+    assert _rows(connection, "SELECT COUNT(*) FROM Categories") == [(4,)]
+
+
+def test_lastrowid(connection):
+    user = services.create_user(connection, "Fay", "Laces", "fay@email.com", "pass123")
+    assert _rows(connection, "SELECT email FROM Users WHERE user_id = %s", (user.user_id,)) == [("fay@email.com",)]
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute("INSERT INTO Categories (category_name) VALUES (%s)", ("Sandals",))
+        category_id = cursor.lastrowid
+        connection.commit()
+    finally:
+        cursor.close()
+    assert _rows(connection, "SELECT category_name FROM Categories WHERE category_id = %s",
+                 (category_id,)) == [("Sandals",)]
+
+
+def test_now_plus(connection):
+    sql, param = dialect().now_plus(60)
+    [(later, now)] = _rows(connection, f"SELECT {sql}, NOW(3)", (param,))
+    assert later > now
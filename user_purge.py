@@ -0,0 +1,252 @@
+# user_purge.py
+"""
+Background purge of removed users, in small throttled batches.
+
+Removing a user (services.delete_user) only sets Users.deleted_at. That hides them at once:
+they can't log in, their listings drop out of browse, the order books and checkout, and the
+admin user list skips them. Their rows in the hot tables are cleared here afterwards, each
+batch of at most PURGE_BATCH rows in its own short transaction with PURGE_PAUSE seconds
+between batches. Locks are only ever held on one batch, and the hot tables never see one
+huge delete.
+
+For each removed user, oldest removal first, the steps run in order (PURGE_STEPS):
+
+    close listings      stock of their listings set to 0
+    carts and holds     other buyers' cart lines and holds on their listings deleted
+    unsold listings     listings that never sold deleted
+    their cart/holds    their own cart lines and holds deleted
+    their watches       their price watches and alerts deleted
+    unused addresses    addresses no order points at deleted
+
+Then the Users row itself goes. If orders or sold listings still point at it (order history
+needs its buyer and seller), it stays instead as a tombstone with its email freed and its
+password cleared, and purged_at is set.
+
+Every step works out what is left from the tables themselves, so an interrupted purge
+(a crash, a deadlock, Ctrl-C) just picks up where it stopped on the next run. It runs on a
+background thread in the app and server.py, and from the command line:
+
+    python user_purge.py                 # purge the removed users waiting (up to 100)
+    python user_purge.py --follow 60     # keep purging every 60 seconds
+    python user_purge.py --status        # removed users still waiting
+"""
+import argparse
+import threading
+import time
+from collections import namedtuple
+
+from db_connector import add_backend_arguments, configure_backend, create_connection
+
+PURGE_BATCH = 200       # rows per transaction
+PURGE_PAUSE = 0.05      # seconds between batches, so live traffic gets the hot tables back
+PURGE_INTERVAL = 60     # seconds between runs of the background purger
+PURGE_USERS_PER_RUN = 100
+TOMBSTONE_EMAIL = "removed-{}@users.invalid"
+
+PurgeResult = namedtuple("PurgeResult", ["user_id", "rows", "outcome"])   # outcome: deleted, tombstoned
+PurgeStatus = namedtuple("PurgeStatus", ["pending", "oldest_deleted_at", "tombstones"])
+
+# (step, SELECT of the next batch of ids for a user, statements run on that batch). Each
+# SELECT takes (user_id, batch size); each statement gets the ids through {ids}.
+PURGE_STEPS = [
+    ("close listings",
+     "SELECT inventory_id FROM Inventory WHERE seller_id = %s AND stock_quantity > 0 LIMIT %s",
+     ["UPDATE Inventory SET stock_quantity = 0 WHERE inventory_id IN ({ids})"]),
+    ("carts holding their listings",
+     """SELECT c.cart_id FROM Cart c JOIN Inventory i ON c.inventory_id = i.inventory_id
+        WHERE i.seller_id = %s LIMIT %s""",
+     ["DELETE FROM Cart WHERE cart_id IN ({ids})"]),
+    ("holds on their listings",
+     """SELECT r.reservation_id FROM StockReservations r JOIN Inventory i ON r.inventory_id = i.inventory_id
+        WHERE i.seller_id = %s LIMIT %s""",
+     ["DELETE FROM StockReservations WHERE reservation_id IN ({ids})"]),
+    ("unsold listings",
+     """SELECT i.inventory_id FROM Inventory i
+        WHERE i.seller_id = %s AND NOT EXISTS (SELECT 1 FROM OrderItems oi WHERE oi.inventory_id = i.inventory_id)
+        LIMIT %s""",
+     # A cart add may have raced the steps above; its line goes with the listing.
+     ["DELETE FROM Cart WHERE inventory_id IN ({ids})",
+      """DELETE FROM Inventory WHERE inventory_id IN ({ids})
+         AND NOT EXISTS (SELECT 1 FROM OrderItems oi WHERE oi.inventory_id = Inventory.inventory_id)"""]),
+    ("their holds",
+     "SELECT reservation_id FROM StockReservations WHERE customer_id = %s LIMIT %s",
+     ["DELETE FROM StockReservations WHERE reservation_id IN ({ids})"]),
+    ("their cart",
+     "SELECT cart_id FROM Cart WHERE customer_id = %s LIMIT %s",
+     ["DELETE FROM Cart WHERE cart_id IN ({ids})"]),
+    ("their price watches",
+     "SELECT watch_id FROM PriceWatches WHERE customer_id = %s LIMIT %s",
+     ["DELETE FROM PriceWatches WHERE watch_id IN ({ids})"]),
+    ("their price alerts",
+     "SELECT alert_id FROM PriceAlerts WHERE customer_id = %s LIMIT %s",
+     ["DELETE FROM PriceAlerts WHERE alert_id IN ({ids})"]),
+    ("unused addresses",
+     """SELECT a.address_id FROM Addresses a
+        WHERE a.user_id = %s AND NOT EXISTS (SELECT 1 FROM Orders o WHERE o.address_id = a.address_id)
+        LIMIT %s""",
+     ["""DELETE FROM Addresses WHERE address_id IN ({ids})
+         AND NOT EXISTS (SELECT 1 FROM Orders o WHERE o.address_id = Addresses.address_id)"""]),
+]
+
+_wake = threading.Event()
+
+
+def wake():
+    """ Starts the background purger's next run now instead of after its interval. """
+    _wake.set()
+
+
+def _run_step(connection, user_id, select_sql, statements, batch_size, pause):
+    """ Runs one step to completion, a batch per transaction. Returns the rows it changed. """
+    changed = 0
+    cursor = connection.cursor()
+    try:
+        while True:
+            cursor.execute(select_sql, (user_id, batch_size))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                connection.commit()
+                return changed
+            placeholders = ", ".join(["%s"] * len(ids))
+            for statement in statements:
+                cursor.execute(statement.format(ids=placeholders), ids)
+            changed += len(ids)
+            connection.commit()
+            if len(ids) < batch_size:
+                return changed
+            time.sleep(pause)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _finish(connection, user_id):
+    """ Deletes the Users row, or tombstones it if order history still points at it. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT EXISTS (SELECT 1 FROM Orders WHERE customer_id = %s)
+                OR EXISTS (SELECT 1 FROM Inventory WHERE seller_id = %s)
+                OR EXISTS (SELECT 1 FROM Addresses WHERE user_id = %s)
+            """,
+            (user_id, user_id, user_id)
+        )
+        if cursor.fetchone()[0]:
+            cursor.execute("UPDATE Users SET email = %s, password_hash = '', purged_at = NOW() "
+                           "WHERE user_id = %s AND deleted_at IS NOT NULL",
+                           (TOMBSTONE_EMAIL.format(user_id), user_id))
+            outcome = "tombstoned"
+        else:
+            cursor.execute("DELETE FROM Users WHERE user_id = %s AND deleted_at IS NOT NULL", (user_id,))
+            outcome = "deleted"
+        connection.commit()
+        return outcome
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def purge_user(connection, user_id, batch_size=PURGE_BATCH, pause=PURGE_PAUSE):
+    """ Runs every purge step for one removed user, then deletes or tombstones them. Returns PurgeResult. """
+    rows = 0
+    for _, select_sql, statements in PURGE_STEPS:
+        rows += _run_step(connection, user_id, select_sql, statements, batch_size, pause)
+    return PurgeResult(user_id, rows, _finish(connection, user_id))
+
+
+def pending_users(connection, limit=PURGE_USERS_PER_RUN):
+    """ Ids of removed users the purger hasn't finished, oldest removal first. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT user_id FROM Users WHERE purged_at IS NULL AND deleted_at IS NOT NULL "
+                       "ORDER BY deleted_at LIMIT %s", (limit,))
+        user_ids = [row[0] for row in cursor.fetchall()]
+        connection.commit()
+    finally:
+        cursor.close()
+    return user_ids
+
+
+def purge_pending(connection, batch_size=PURGE_BATCH, pause=PURGE_PAUSE, limit=PURGE_USERS_PER_RUN):
+    """ Purges up to `limit` removed users. Returns [PurgeResult].
+
+    A user whose purge fails (e.g. a deadlock) is reported and left for the next run, which
+    resumes it; the others still go ahead.
+    """
+    results = []
+    for user_id in pending_users(connection, limit):
+        try:
+            results.append(purge_user(connection, user_id, batch_size, pause))
+        except Exception as e:
+            print(f"⚠️  Purge of user {user_id} stopped, it resumes on the next run: {e}")
+    return results
+
+
+def start_purger(pool, interval=PURGE_INTERVAL):
+    """ Purges every `interval` seconds (or on wake()) on a daemon thread, borrowing a pooled connection each time. """
+    def run():
+        while True:
+            _wake.clear()
+            try:
+                with pool.connection() as connection:
+                    purge_pending(connection)
+            except Exception as e:
+                print(f"⚠️  User purge failed: {e}")
+            _wake.wait(interval)
+    thread = threading.Thread(target=run, name="user-purger", daemon=True)
+    thread.start()
+    return thread
+
+
+def purge_status(connection):
+    """ PurgeStatus: removed users still waiting, the oldest removal among them, and tombstones kept. """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*), MIN(deleted_at) FROM Users WHERE purged_at IS NULL AND deleted_at IS NOT NULL")
+        pending, oldest = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) FROM Users WHERE purged_at IS NOT NULL")
+        tombstones = cursor.fetchone()[0]
+        connection.commit()
+    finally:
+        cursor.close()
+    return PurgeStatus(int(pending), oldest, int(tombstones))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--follow", type=float, metavar="SECONDS", help="keep purging at this interval")
+    parser.add_argument("--batch", type=int, default=PURGE_BATCH, help="rows per transaction")
+    parser.add_argument("--pause", type=float, default=PURGE_PAUSE, help="seconds between batches")
+    parser.add_argument("--status", action="store_true", help="show removed users still waiting and exit")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    configure_backend(args.backend, args.sqlite_path)
+
+    connection = create_connection()
+    if not connection:
+        return
+    try:
+        if args.status:
+            status = purge_status(connection)
+            print(f"Removed users waiting: {status.pending} (oldest removed {status.oldest_deleted_at or '-'}) | "
+                  f"tombstones kept for order history: {status.tombstones}")
+            return
+        while True:
+            for result in purge_pending(connection, args.batch, args.pause):
+                print(f"User {result.user_id}: {result.rows} row(s) cleared, {result.outcome}")
+            if not args.follow:
+                break
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()